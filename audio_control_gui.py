@@ -15,8 +15,11 @@ from tkinter import ttk, scrolledtext, messagebox
 import platform
 # 导入AI响应函数
 from gui_utils.audio_control import call_model_and_get_code, tts_and_play
-from gui_utils.config import AI_API_TOKEN
+from gui_utils.config import AI_API_TOKEN, VAD_CONFIG
 from gui_utils.speech_recognition import create_recognizer
+from gui_utils.retention import remote_record_path
+from gui_utils.record_control import RecordingControl, STOPPED
+from gui_utils.live_capture import write_wav
 import requests
 import tempfile
 # from playsound import playsound
@@ -35,8 +38,8 @@ if system_type == "windows":
     try:
         from gui_utils.audio_control_windows import (
             init_ssh_connection, close_ssh_connection, 
-            ensure_local_directory, record_remote, 
-            process_audio_local, play_remote_audio,
+            ensure_local_directory, record_remote, record_remote_vad, 
+            process_audio_local, play_remote_audio, create_duplex_session,
             run_ssh_command
         )
         print("使用Windows版本音频控制模块")
@@ -46,8 +49,8 @@ if system_type == "windows":
 else:
     try:
         from gui_utils.audio_control_unix import (
-            ensure_local_directory, record_remote,
-            process_audio_local, play_remote_audio,
+            ensure_local_directory, record_remote, record_remote_vad,
+            process_audio_local, play_remote_audio, create_duplex_session,
             test_connection
         )
         print("使用Unix版本音频控制模块")
@@ -64,6 +67,8 @@ class AudioControlGUI:
         
         # 状态变量
         self.is_recording = False
+        self.record_control = None
+        self.duplex_session = None
         self.is_processing = False
         self.ssh_connected = False
         
@@ -121,6 +126,12 @@ class AudioControlGUI:
                                        style="Record.TButton")
         self.record_button.grid(row=0, column=2, padx=(0, 10))
         
+        # 说完自动停止：VAD检测到语音结束后立即结束录音，录音时长作为上限
+        self.vad_var = tk.BooleanVar(value=VAD_CONFIG.get("enabled", True))
+        self.vad_check = ttk.Checkbutton(control_frame, text="说完自动停止",
+                                         variable=self.vad_var)
+        self.vad_check.grid(row=0, column=3, padx=(0, 10))
+        
         self.process_button = ttk.Button(control_frame, text="处理音频", 
                                         command=self.process_audio,
                                         state="disabled")
@@ -131,6 +142,13 @@ class AudioControlGUI:
                                      state="disabled")
         self.play_button.grid(row=0, column=4)
         
+        # 全双工对话：一直在听，AI朗读回应时用户开口即打断，说完自动处理
+        self.duplex_var = tk.BooleanVar(value=False)
+        self.duplex_check = ttk.Checkbutton(control_frame, text="全双工对话",
+                                            variable=self.duplex_var,
+                                            command=self.toggle_duplex)
+        self.duplex_check.grid(row=0, column=5, padx=(10, 0))
+        
         # 语音识别结果
         recognition_frame = ttk.LabelFrame(main_frame, text="语音识别-AI回应结果", padding="5")
         recognition_frame.grid(row=3, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
@@ -204,7 +222,7 @@ class AudioControlGUI:
         def connect():
             try:
                 if system_type == "windows":
-                    success = init_ssh_connection()
+                    success = init_ssh_connection(on_state_change=self.on_ssh_state)
                 else:
                     success = test_connection()
                 
@@ -222,6 +240,21 @@ class AudioControlGUI:
         # 在后台线程中测试连接
         threading.Thread(target=connect, daemon=True).start()
     
+    def on_ssh_state(self, state, stats):
+        """SSH连接状态变化（后台线程回调，切回Tk主线程更新界面）"""
+        def update():
+            if state == "connected":
+                self.ssh_connected = True
+                self.status_label.config(text="✓ 连接正常", foreground="green")
+                if stats["reconnects"]:
+                    self.log(f"SSH已自动重连（第{stats['reconnects']}次，"
+                             f"恢复耗时 {stats['last_recovery']:.2f}秒）")
+            elif state == "reconnecting":
+                self.ssh_connected = False
+                self.status_label.config(text="⟳ 连接中断，正在重连...", foreground="orange")
+                self.log("SSH连接中断，正在后台重连")
+        self.root.after(0, update)
+    
     def toggle_recording(self):
         """切换录音状态"""
         if not self.ssh_connected:
@@ -235,6 +268,9 @@ class AudioControlGUI:
     
     def start_recording(self):
         """开始录音"""
+        control = RecordingControl()
+        self.record_control = control
+
         def record():
             try:
                 self.is_recording = True
@@ -247,7 +283,8 @@ class AudioControlGUI:
                     self.log("录音时长无效，已重置为5秒")
                     duration = 5
                     self.duration_var.set("5")
-                self.record_button.config(text=f"录音中 ({duration}秒)", state="disabled")
+                # 录音过程中按钮用于提前停止
+                self.record_button.config(text=f"停止录音 (最长{duration}秒)", state="normal")
                 self.progress.start()
                 
                 # 确保本地目录存在
@@ -258,17 +295,39 @@ class AudioControlGUI:
                 
                 # 生成带时间戳的文件名
                 timestamp_record = datetime.now().strftime("%Y%m%d_%H%M%S")
-                self.current_remote_raw = f"~/record/test_raw_{timestamp_record}.wav"
+                self.current_remote_raw = remote_record_path(f"test_raw_{timestamp_record}.wav")
                 self.current_local_raw = os.path.join(local_record_dir, f"test_raw_{timestamp_record}.wav")
                 self.current_local_processed = os.path.join(local_record_dir, f"test_{timestamp_record}.wav")
                 
-                self.log(f"开始远程录音 ({duration}秒)...")
-                
                 # 远程录音
-                if system_type == "windows":
-                    success = record_remote(self.current_remote_raw, duration)
+                result = None
+                if self.vad_var.get():
+                    self.log(f"开始远程录音 (说完自动停止，最长{duration}秒)...")
+                    result = record_remote_vad(self.current_local_raw, max_duration=duration,
+                                               control=control,
+                                               processed_path=self.current_local_processed)
+                    if result is None and not control.stopped:
+                        self.log("VAD录音不可用，改为固定时长录音")
+                
+                if result is not None:
+                    self.log(f"录音结束 ({result['reason']})，共{result['duration']:.1f}秒")
+                    # 手动停止时已录到的部分直接处理
+                    if not result["speech"] and result["reason"] != STOPPED:
+                        self.log("未检测到语音")
+                        return
+                    success = True
+                elif control.stopped:
+                    self.log("录音已取消")
+                    return
                 else:
-                    success = record_remote(duration)
+                    self.log(f"开始远程录音 ({duration}秒)...")
+                    # 录音完成时同一次远程执行中取回录音文件，处理时不再单独下载
+                    if system_type == "windows":
+                        success = record_remote(self.current_remote_raw, duration,
+                                                local_path=self.current_local_raw, control=control)
+                    else:
+                        success = record_remote(duration, local_path=self.current_local_raw,
+                                                control=control)
                 
                 if success:
                     self.log("录音完成，自动处理音频...")
@@ -280,6 +339,7 @@ class AudioControlGUI:
                 self.log(f"录音错误: {e}")
             finally:
                 self.is_recording = False
+                self.record_control = None
                 self.record_button.config(text="开始录音", state="normal")
                 self.progress.stop()
         
@@ -287,9 +347,14 @@ class AudioControlGUI:
         threading.Thread(target=record, daemon=True).start()
     
     def stop_recording(self):
-        """停止录音（当前实现中录音是固定5秒）"""
-        # 当前实现中录音时间是事先给定的
-        pass
+        """提前停止录音：结束远程录音，已录到的部分照常取回并处理"""
+        control = self.record_control
+        if control is None or control.stopped:
+            return
+        self.log("正在停止录音...")
+        self.record_button.config(text="正在停止...", state="disabled")
+        # 停止需要一次远程交互，不阻塞界面
+        threading.Thread(target=control.stop, daemon=True).start()
     
     def process_audio(self):
         """处理音频"""
@@ -298,32 +363,7 @@ class AudioControlGUI:
                 self.is_processing = True
                 self.process_button.config(state="disabled")
                 self.progress.start()
-                self.log("开始处理音频...")
-                # 处理音频
-                success = process_audio_local(
-                    self.current_remote_raw,
-                    self.current_local_raw,
-                    self.current_local_processed
-                )
-                if success:
-                    self.log("音频处理完成")
-                    # 进行语音识别
-                    self.log("开始语音识别...")
-                    recognition_result = self.perform_speech_recognition(self.current_local_processed)
-                    if recognition_result:
-                        self.play_button.config(state="normal")
-                        # 自动调用AI响应
-                        self.log("正在请求AI响应...")
-                        ai_code,ai_response = call_model_and_get_code(self.current_local_processed)
-                        self.log(f"AI响应控制代码: {ai_code}")
-                        self.show_recognition_result(recognition_result, ai_response=ai_response)
-                        if ai_response:
-                            self.log("正在将AI回应转换为语音并播放...")
-                            tts_and_play(ai_response)
-                    else:
-                        self.log("语音识别失败")
-                else:
-                    self.log("音频处理失败")
+                self.run_pipeline()
             except Exception as e:
                 self.log(f"处理错误: {e}")
             finally:
@@ -331,6 +371,92 @@ class AudioControlGUI:
                 self.progress.stop()
         threading.Thread(target=process, daemon=True).start()
     
+    def run_pipeline(self, player=None):
+        """处理当前录音：降噪、语音识别、AI回应、朗读回应（player为全双工会话的播放）"""
+        self.log("开始处理音频...")
+        # 处理音频
+        success = process_audio_local(
+            self.current_remote_raw,
+            self.current_local_raw,
+            self.current_local_processed
+        )
+        if success:
+            self.log("音频处理完成")
+            # 进行语音识别
+            self.log("开始语音识别...")
+            recognition_result = self.perform_speech_recognition(self.current_local_processed)
+            if recognition_result:
+                self.play_button.config(state="normal")
+                # 自动调用AI响应
+                self.log("正在请求AI响应...")
+                ai_code,ai_response = call_model_and_get_code(self.current_local_processed)
+                self.log(f"AI响应控制代码: {ai_code}")
+                self.show_recognition_result(recognition_result, ai_response=ai_response)
+                if ai_response:
+                    self.log("正在将AI回应转换为语音并播放...")
+                    if tts_and_play(ai_response, player=player) is False and player is not None:
+                        self.log("回应播放被打断")
+            else:
+                self.log("语音识别失败")
+        else:
+            self.log("音频处理失败")
+    
+    def toggle_duplex(self):
+        """开启/关闭全双工对话"""
+        if not self.duplex_var.get():
+            session, self.duplex_session = self.duplex_session, None
+
+            def stop():
+                # 等常驻录音释放录音设备后才能再用录音按钮
+                if session is not None:
+                    session.stop()
+                    self.log("全双工对话已关闭")
+                self.record_button.config(state="normal")
+            threading.Thread(target=stop, daemon=True).start()
+            return
+        if not self.ssh_connected:
+            messagebox.showerror("错误", "SSH连接未建立，无法开启全双工对话")
+            self.duplex_var.set(False)
+            return
+        
+        def start():
+            session = create_duplex_session(on_utterance=self.on_duplex_utterance)
+            if session is None:
+                self.log("全双工对话不可用")
+                self.duplex_var.set(False)
+                return
+            self.duplex_session = session.start()
+            # 全双工时一直在听，不再需要录音按钮
+            self.record_button.config(state="disabled")
+            self.log("全双工对话已开启：直接说话即可，AI朗读时开口会打断")
+        threading.Thread(target=start, daemon=True).start()
+    
+    def on_duplex_utterance(self, audio, result):
+        """全双工会话中说完一句话：保存录音并走与录音按钮相同的处理流程"""
+        session = self.duplex_session
+        if session is None:
+            return
+        local_record_dir = ensure_local_directory()
+        if not local_record_dir:
+            self.log("无法创建本地目录")
+            return
+        timestamp_record = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.current_remote_raw = remote_record_path(f"test_raw_{timestamp_record}.wav")
+        self.current_local_raw = os.path.join(local_record_dir, f"test_raw_{timestamp_record}.wav")
+        self.current_local_processed = os.path.join(local_record_dir, f"test_{timestamp_record}.wav")
+        write_wav(self.current_local_raw, [audio], result["sample_rate"], 1)
+        interrupted = "（打断了播放）" if result["barge_in"] else ""
+        self.log(f"听到一句话{interrupted}，共{result['saved']:.1f}秒")
+        try:
+            self.is_processing = True
+            self.progress.start()
+            self.run_pipeline(player=session.play)
+        except Exception as e:
+            self.log(f"处理错误: {e}")
+        finally:
+            self.is_processing = False
+            self.progress.stop()
+    
     def perform_speech_recognition(self, audio_file):
         """执行语音识别"""
         try:
@@ -356,7 +482,7 @@ class AudioControlGUI:
                 self.log("播放响应音频...")
                 
                 # 生成响应文件路径
-                remote_response = f"~/record/response_{timestamp_record}.wav"
+                remote_response = remote_record_path(f"response_{timestamp_record}.wav")
                 
                 # 播放处理后的音频作为响应
                 success = play_remote_audio(self.current_local_processed, remote_response)
@@ -377,6 +503,8 @@ class AudioControlGUI:
     
     def on_closing(self):
         """关闭程序时的清理"""
+        if self.duplex_session is not None:
+            self.duplex_session.stop()
         if system_type == "windows":
             close_ssh_connection()
         self.root.destroy()
@@ -7,9 +7,11 @@ import os
 1秒1次，截两张图片
 """
 
-# 尝试导入paramiko进行SSH连接
+# 尝试导入paramiko进行SSH连接（通过gui_utils中的连接池复用同一连接）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 try:
     import paramiko
+    from gui_utils.ssh_pool import get_pool
     PARAMIKO_AVAILABLE = True
 except ImportError:
     PARAMIKO_AVAILABLE = False
@@ -44,30 +46,14 @@ def execute_ssh_paramiko(command, description=""):
         if description:
             print(f"{description}...")
         
-        # 创建SSH客户端
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        # 从连接池获取已认证的连接（首次调用时建立）
+        pool = get_pool(BOARD_HOST, BOARD_USER, BOARD_PASSWORD, BOARD_PORT,
+                        connect_timeout=TIMEOUT)
         
-        # 连接到远程主机
-        ssh.connect(
-            hostname=BOARD_HOST,
-            port=BOARD_PORT,
-            username=BOARD_USER,
-            password=BOARD_PASSWORD,
-            timeout=TIMEOUT
-        )
-        
-        # 执行命令
-        stdin, stdout, stderr = ssh.exec_command(command, timeout=TIMEOUT)
-        
-        # 获取输出
-        output = stdout.read().decode().strip()
-        error = stderr.read().decode().strip()
-        return_code = stdout.channel.recv_exit_status()
+        # 在已有连接上打开通道执行命令
+        result = pool.exec_command(command, timeout=TIMEOUT, text=True)
         
-        ssh.close()
-        
-        return return_code, output, error
+        return result.returncode, result.stdout.strip(), result.stderr.strip()
         
     except Exception as e:
         if description:
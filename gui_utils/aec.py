@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+回声消除（AEC）
+扬声器（hw:1,0）和麦克风（hw:0,0）同时工作时，麦克风会录到机器人自己的朗读，语音识别会把它也转成文字。
+播放的内容本地就有（tts_and_play合成的音频），把它作为参考信号，用频域分块自适应滤波器（PBFDAF，
+overlap-save）估计扬声器到麦克风的回声路径，从麦克风信号中减去估计的回声，再交给VAD/语音识别：
+
+    aec = EchoCanceller(sample_rate=16000)
+    clean = aec.process(mic_frame, ref_frame)    # 帧长是block_size的整数倍，没有额外延迟
+
+滤波器按block_ms分块（默认10ms），长度filter_ms（默认200ms）分成多个分区，每块只做一次参考信号FFT，
+所有分区的卷积和梯度在频域一次向量化计算。用户和机器人同时说话（双讲）时自适应会被用户的声音带偏，
+所以用两个滤波器：后台滤波器一直自适应，输出用的前台滤波器只在后台明显更好时才从后台复制。
+
+参考信号和麦克风之间的整体延迟（网络、设备缓冲、声学）用 estimate_delay()（GCC-PHAT）估计，
+对齐后滤波器只需要覆盖回声的拖尾。全双工会话中的用法见duplex.py。
+"""
+
+import numpy as np
+
+try:
+    from gui_utils.config import AEC_CONFIG
+except ImportError:
+    AEC_CONFIG = {
+        "enabled": True,
+        "block_ms": 10,
+        "filter_ms": 200,
+        "step": 0.5,
+        "copy_ratio": 0.8,
+        "window_ms": 200,
+        "delay_ms": 150,
+        "max_delay_ms": 500
+    }
+
+# 参考信号功率的平滑系数（每块）
+POWER_SMOOTHING = 0.9
+
+# 后台滤波器的误差低于麦克风能量的该比例（至少消除10dB）时才可能复制到前台；
+# 用户说话时误差里主要是用户的声音，达不到这个条件，前台滤波器不会被带偏
+MIN_COPY_RESIDUAL = 0.1
+
+# 归一化的正则项：相当于-50dBFS的参考信号功率，参考信号很安静时不会放大步长
+REGULARIZATION = 1e-5
+
+
+class EchoCanceller:
+    """频域分块自适应回声消除器（单声道）
+
+    process(mic, ref) 的输入可以是int16或-1~1的float，mic为int16时返回int16，否则返回float32。
+    """
+
+    def __init__(self, sample_rate=16000, block_ms=None, filter_ms=None, step=None,
+                 copy_ratio=None, window_ms=None):
+        self.sample_rate = sample_rate
+        self.block_size = sample_rate * (block_ms or AEC_CONFIG["block_ms"]) // 1000
+        filter_ms = filter_ms or AEC_CONFIG["filter_ms"]
+        self.partitions = max(1, -(-sample_rate * filter_ms // 1000 // self.block_size))
+        self.step = AEC_CONFIG["step"] if step is None else step
+        self.copy_ratio = AEC_CONFIG["copy_ratio"] if copy_ratio is None else copy_ratio
+        window_ms = window_ms or AEC_CONFIG["window_ms"]
+        # 比较两个滤波器误差能量的平滑系数（时间常数约window_ms）
+        self._smoothing = 1 - self.block_size * 1000 / (sample_rate * window_ms)
+        self.reset()
+
+    def __repr__(self):
+        return (f"EchoCanceller({self.sample_rate}Hz, block={self.block_size}, "
+                f"partitions={self.partitions})")
+
+    @property
+    def filter_length(self):
+        return self.block_size * self.partitions
+
+    def reset(self):
+        """清空滤波器和参考信号历史（回声路径变化很大时调用）"""
+        bins = self.block_size + 1
+        self._background = np.zeros((self.partitions, bins), dtype=np.complex128)
+        self._foreground = np.zeros((self.partitions, bins), dtype=np.complex128)
+        self._spectra = np.zeros((self.partitions, bins), dtype=np.complex128)
+        self._ref = np.zeros(2 * self.block_size)
+        self._power = np.zeros(bins)
+        self._delta = 2 * self.block_size * REGULARIZATION
+        self._background_error = 0.0
+        self._foreground_error = 0.0
+        self._window_mic = 0.0
+        self._active = 0
+        # 统计
+        self.blocks = 0
+        self.copies = 0
+        self.restores = 0
+        self._mic_energy = 0.0
+        self._out_energy = 0.0
+
+    def process(self, mic, ref):
+        """消除一段麦克风信号中的回声，mic和ref等长且为block_size的整数倍"""
+        mic = np.asarray(mic)
+        ref = np.asarray(ref)
+        if len(mic) != len(ref):
+            raise ValueError(f"麦克风和参考信号长度不同: {len(mic)} != {len(ref)}")
+        if len(mic) % self.block_size:
+            raise ValueError(f"长度 {len(mic)} 不是分块大小 {self.block_size} 的整数倍")
+        is_int = mic.dtype.kind in "iu"
+        m = mic.astype(np.float64) / 32768.0 if is_int else mic.astype(np.float64)
+        r = ref.astype(np.float64) / 32768.0 if ref.dtype.kind in "iu" else ref.astype(np.float64)
+        out = np.empty_like(m)
+        size = self.block_size
+        for pos in range(0, len(m), size):
+            out[pos:pos + size] = self._block(m[pos:pos + size], r[pos:pos + size])
+        if is_int:
+            return np.clip(np.round(out * 32768.0), -32768, 32767).astype(np.int16)
+        return out.astype(np.float32)
+
+    def _block(self, mic, ref):
+        size = self.block_size
+        # 参考信号：最近两块做FFT（overlap-save），新的频谱放在第0个分区
+        self._ref[:size] = self._ref[size:]
+        self._ref[size:] = ref
+        self._spectra = np.roll(self._spectra, 1, axis=0)
+        self._spectra[0] = np.fft.rfft(self._ref)
+        self._active = self.partitions if ref.any() else max(0, self._active - 1)
+        self.blocks += 1
+
+        # 两个滤波器的回声估计一次算出，取后半块
+        echoes = np.fft.irfft(np.einsum("fpk,pk->fk", np.stack([self._background, self._foreground]),
+                                        self._spectra), axis=1)[:, size:]
+        background = mic - echoes[0]
+        foreground = mic - echoes[1]
+
+        mic_energy = float(mic @ mic)
+        out_energy = float(foreground @ foreground)
+        self._mic_energy = 0.95 * self._mic_energy + 0.05 * mic_energy
+        self._out_energy = 0.95 * self._out_energy + 0.05 * out_energy
+        if not self._active:
+            # 最近一个滤波器长度内没有参考信号：没有回声，也不需要自适应
+            return foreground
+
+        # 后台滤波器一直自适应（NLMS，按各频点的参考功率归一化），双讲时可能被带偏
+        self._power = (POWER_SMOOTHING * self._power
+                       + (1 - POWER_SMOOTHING) * (np.abs(self._spectra) ** 2).sum(axis=0))
+        error_spectrum = np.fft.rfft(np.concatenate([np.zeros(size), background]))
+        gradient = np.conj(self._spectra) * (self.step * error_spectrum / (self._power + self._delta))
+        # 梯度约束：时域只保留前半块（线性卷积），所有分区一起做
+        taps = np.fft.irfft(gradient, axis=1)
+        taps[:, size:] = 0
+        self._background += np.fft.rfft(taps, axis=1)
+
+        # 输出用前台滤波器：后台的误差持续明显更小、且确实消掉了大部分麦克风信号时才复制过来
+        # （回声路径变化后重新收敛）；后台明显更差时（双讲中被带偏）恢复成前台
+        a = self._smoothing
+        self._background_error = a * self._background_error + (1 - a) * float(background @ background)
+        self._foreground_error = a * self._foreground_error + (1 - a) * out_energy
+        self._window_mic = a * self._window_mic + (1 - a) * mic_energy
+        if (self._background_error < self.copy_ratio * self._foreground_error
+                and self._background_error < MIN_COPY_RESIDUAL * self._window_mic):
+            self._foreground[:] = self._background
+            self._foreground_error = self._background_error
+            self.copies += 1
+        elif self._background_error > 4 * self._foreground_error + 1e-12:
+            self._background[:] = self._foreground
+            self._background_error = self._foreground_error
+            self.restores += 1
+        return foreground
+
+    @property
+    def erle(self):
+        """近期的回声消除量（dB，麦克风能量/输出能量）"""
+        if self._out_energy <= 0 or self._mic_energy <= 0:
+            return 0.0
+        return float(10 * np.log10(self._mic_energy / self._out_energy))
+
+    def stats(self):
+        return {
+            "blocks": self.blocks,
+            "copies": self.copies,
+            "restores": self.restores,
+            "erle": round(self.erle, 2)
+        }
+
+
+def estimate_delay(mic, ref, sample_rate=16000, max_delay_ms=None):
+    """估计参考信号到麦克风的延迟（GCC-PHAT），返回 (延迟采样数, 置信度)
+
+    置信度是相关峰值与平均值之比，低于约5时说明麦克风里没有明显的回声（或参考信号太安静）。
+    """
+    max_delay_ms = max_delay_ms or AEC_CONFIG["max_delay_ms"]
+    mic = np.asarray(mic, dtype=np.float64)
+    ref = np.asarray(ref, dtype=np.float64)
+    n = 1 << int(np.ceil(np.log2(len(mic) + len(ref))))
+    cross = np.fft.rfft(mic, n) * np.conj(np.fft.rfft(ref, n))
+    cross /= np.abs(cross) + 1e-12
+    corr = np.abs(np.fft.irfft(cross, n))[:sample_rate * max_delay_ms // 1000 + 1]
+    delay = int(np.argmax(corr))
+    confidence = float(corr[delay] / (corr.mean() + 1e-12))
+    return delay, confidence
+
+
+class ReferenceTrack:
+    """按录音位置对齐的参考信号（正在播放的音频），供回声消除取用
+
+    start(position, audio) 在开始发送播放数据时调用，position是当时常驻录音的位置；
+    参考信号第k个采样出现在麦克风的 position + delay + k 处。
+    """
+
+    def __init__(self, sample_rate=16000, delay_ms=None):
+        self.sample_rate = sample_rate
+        self.delay = sample_rate * (AEC_CONFIG["delay_ms"] if delay_ms is None else delay_ms) // 1000
+        self._audio = np.zeros(0, dtype=np.float32)
+        self._start = 0
+        self.estimated = False
+
+    def start(self, position, audio):
+        self._audio = np.asarray(audio, dtype=np.float32)
+        self._start = position
+        self.estimated = False
+
+    @property
+    def position(self):
+        """开始播放时的录音位置"""
+        return self._start
+
+    def stop(self, position):
+        """播放被打断：position之后的参考信号不会再播出"""
+        self._audio = self._audio[:max(0, position - self._start)]
+
+    @property
+    def end(self):
+        """参考信号在麦克风中结束的位置"""
+        return self._start + self.delay + len(self._audio)
+
+    def get(self, position, n):
+        """麦克风[position, position+n)对应的参考信号，完全没有重叠时返回None"""
+        offset = position - self._start - self.delay
+        if offset + n <= 0 or offset >= len(self._audio):
+            return None
+        out = np.zeros(n, dtype=np.float32)
+        lo, hi = max(0, offset), min(len(self._audio), offset + n)
+        out[lo - offset:hi - offset] = self._audio[lo:hi]
+        return out
+
+    def align(self, mic, mic_position, max_delay_ms=None, min_confidence=5.0, margin_ms=5):
+        """用已录到的麦克风信号（从mic_position开始）估计延迟，置信度足够时更新并返回True
+
+        实际使用的延迟比估计值小margin_ms，滤波器是因果的，回声的起点要落在滤波器范围内。
+        """
+        ref = self._audio[:max(0, mic_position + len(mic) - self._start)]
+        if len(ref) == 0:
+            return False
+        lead = mic_position - self._start
+        delay, confidence = estimate_delay(mic, ref[max(0, lead):] if lead > 0 else ref,
+                                           self.sample_rate, max_delay_ms)
+        self.estimated = True
+        if confidence < min_confidence:
+            return False
+        delay = delay + lead if lead < 0 else delay
+        self.delay = max(0, delay - self.sample_rate * margin_ms // 1000)
+        return True
@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+asyncio远程执行与传输接口
+在连接池的通道上提供异步的 run / stream / upload / download，多个远程操作可以在同一个
+事件循环上并发进行，例如边下载原始录音边把已收到的字节喂给本地ffmpeg，同时提前打开播放通道：
+
+    client = AsyncRemoteClient()
+    player = await client.open("aplay -D hw:1,0 -")        # 提前打开播放通道
+    async for chunk in client.stream("cat ~/record/test_raw.wav"):
+        ffmpeg.stdin.write(chunk)                           # 收到首批字节就开始处理
+
+通道等待使用事件循环的add_reader监听paramiko通道的fileno，不支持时（如Windows的
+ProactorEventLoop）在线程中select等待。transfer.py中的同步函数是这里的薄封装。
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import select
+import subprocess
+import threading
+import time
+
+try:
+    from gui_utils.ssh_pool import get_pool, join_command, quote_remote_path
+    from gui_utils.audio_codec import (
+        CODEC_NAME, encode, decode, is_wav, negotiate, forget_negotiation,
+        remote_encode_command, remote_decode_command
+    )
+    from gui_utils.transfer import (
+        TRANSFER_CONFIG, TransferError, checksum_command, parse_checksum_output, check_transfer
+    )
+except ImportError:
+    from ssh_pool import get_pool, join_command, quote_remote_path
+    from audio_codec import (
+        CODEC_NAME, encode, decode, is_wav, negotiate, forget_negotiation,
+        remote_encode_command, remote_decode_command
+    )
+    from transfer import (
+        TRANSFER_CONFIG, TransferError, checksum_command, parse_checksum_output, check_transfer
+    )
+
+DEFAULT_BUFFER_SIZE = TRANSFER_CONFIG.get("buffer_size", 32768)
+
+# 发送窗口已满时的重试间隔（秒）
+SEND_RETRY_INTERVAL = 0.002
+
+# 各主机实测的原始传输速率、远程编解码速率（字节/秒）和压缩比，指数滑动平均，用于判断压缩是否划算
+RATE_ALPHA = 0.3
+_rates = {}
+_rates_lock = threading.Lock()
+
+
+def _note_rate(pool, name, value):
+    key = (pool.host, pool.port, pool.user, name)
+    with _rates_lock:
+        old = _rates.get(key)
+        _rates[key] = value if old is None else old + RATE_ALPHA * (value - old)
+
+
+def _get_rate(pool, name, default=None):
+    with _rates_lock:
+        return _rates.get((pool.host, pool.port, pool.user, name), default)
+
+
+async def _within(awaitable, what):
+    """等待一次通道读写，超过TRANSFER_CONFIG["timeout"]秒没有完成时抛出TransferError（链路卡住时不会一直挂起）"""
+    timeout = TRANSFER_CONFIG.get("timeout")
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise TransferError(f"{what}超时（{timeout}秒没有进展）")
+
+
+def compression_worthwhile(pool):
+    """按实测速率估计压缩是否划算：节省的线路时间要大于远程纯Python编解码的时间
+
+    传输size字节时原始传输耗时 size/link，压缩传输耗时约 size/codec + size*ratio/link，
+    因此只有 link < codec * (1 - ratio) 时压缩更快。还没有测到原始传输速率时不压缩。
+    """
+    link = _get_rate(pool, "link")
+    if not link:
+        return False
+    codec = _get_rate(pool, "codec", TRANSFER_CONFIG.get("compress_codec_bps", 1.5e6))
+    ratio = _get_rate(pool, "ratio", TRANSFER_CONFIG.get("compress_ratio", 0.7))
+    return link < codec * (1 - ratio)
+
+
+def run_sync(coro):
+    """在当前线程中运行协程并返回结果（供同步接口使用，不能在事件循环线程中调用）"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    coro.close()
+    raise RuntimeError("不能在事件循环中调用同步接口，请直接await对应的异步方法")
+
+
+class AsyncChannel:
+    """已在远程启动命令的异步通道"""
+
+    def __init__(self, chan, context, command):
+        self._chan = chan
+        self._context = context
+        self.command = command
+        self._loop = asyncio.get_running_loop()
+        self._use_reader = True
+        self._stderr = []
+
+    async def _wait_readable(self):
+        """等待通道有数据可读或已关闭"""
+        chan = self._chan
+        if chan.recv_ready() or chan.recv_stderr_ready() or chan.eof_received or chan.closed:
+            return
+        if self._use_reader:
+            fd = chan.fileno()
+            future = self._loop.create_future()
+
+            def on_readable():
+                if not future.done():
+                    future.set_result(None)
+
+            try:
+                self._loop.add_reader(fd, on_readable)
+            except NotImplementedError:
+                self._use_reader = False
+            else:
+                try:
+                    await future
+                finally:
+                    self._loop.remove_reader(fd)
+                return
+        await asyncio.to_thread(select.select, [chan], [], [], 0.5)
+
+    async def read(self, size=DEFAULT_BUFFER_SIZE):
+        """读取stdout，远程输出结束时返回b""（期间到达的stderr数据会被保存）"""
+        while True:
+            if self._chan.recv_ready():
+                return self._chan.recv(size)
+            if self._chan.recv_stderr_ready():
+                self._stderr.append(self._chan.recv_stderr(size))
+                continue
+            if self._chan.eof_received or self._chan.closed:
+                if self._chan.recv_ready() or self._chan.recv_stderr_ready():
+                    continue
+                return b""
+            await self._wait_readable()
+
+    async def read_all(self):
+        """读取全部stdout"""
+        parts = []
+        while True:
+            block = await self.read()
+            if not block:
+                return b"".join(parts)
+            parts.append(block)
+
+    async def write(self, data):
+        """写入远程命令的stdin，发送窗口满时让出事件循环"""
+        view = memoryview(data)
+        while view:
+            if not self._chan.send_ready():
+                if self._chan.closed:
+                    raise TransferError("远程通道已关闭")
+                await asyncio.sleep(SEND_RETRY_INTERVAL)
+                continue
+            sent = self._chan.send(view[:DEFAULT_BUFFER_SIZE])
+            view = view[sent:]
+
+    def write_eof(self):
+        """关闭远程命令的stdin"""
+        self._chan.shutdown_write()
+
+    async def wait(self):
+        """等待远程命令退出，返回退出码（尚未读取的stdout会被丢弃，避免远程因缓冲区满而阻塞）"""
+        while not self._chan.exit_status_ready():
+            if await self.read():
+                continue
+            if not self._chan.exit_status_ready():
+                await asyncio.sleep(SEND_RETRY_INTERVAL)
+        return self._chan.recv_exit_status()
+
+    @property
+    def stderr(self):
+        """已收到的stderr数据"""
+        while self._chan.recv_stderr_ready():
+            self._stderr.append(self._chan.recv_stderr(DEFAULT_BUFFER_SIZE))
+        return b"".join(self._stderr)
+
+    def close(self):
+        """关闭通道并归还连接池名额"""
+        if self._context is not None:
+            context, self._context = self._context, None
+            context.__exit__(None, None, None)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        block = await self.read()
+        if not block:
+            raise StopAsyncIteration
+        return block
+
+
+class AsyncRemoteClient:
+    """基于连接池的异步远程客户端"""
+
+    def __init__(self, pool=None):
+        self.pool = pool or get_pool()
+
+    async def open(self, cmd):
+        """打开通道并启动远程命令，返回AsyncChannel（连接和开通道在线程中完成，不阻塞事件循环）"""
+        command = join_command(cmd)
+        context = self.pool.channel()
+
+        def start():
+            chan = context.__enter__()
+            try:
+                chan.exec_command(command)
+            except Exception:
+                context.__exit__(None, None, None)
+                raise
+            return chan
+
+        chan = await asyncio.to_thread(start)
+        return AsyncChannel(chan, context, command)
+
+    async def run(self, cmd, input=None, check=False, timeout=None, text=False):
+        """执行远程命令，返回subprocess.CompletedProcess"""
+        channel = await self.open(cmd)
+        try:
+            if input is not None:
+                await channel.write(input.encode() if isinstance(input, str) else input)
+            channel.write_eof()
+            stdout = await asyncio.wait_for(channel.read_all(), timeout)
+            returncode = await channel.wait()
+            stderr = channel.stderr
+        except asyncio.TimeoutError:
+            raise subprocess.TimeoutExpired(channel.command, timeout)
+        finally:
+            channel.close()
+
+        if text:
+            stdout = stdout.decode("utf-8", errors="replace")
+            stderr = stderr.decode("utf-8", errors="replace")
+        if check and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, stdout, stderr)
+        return subprocess.CompletedProcess(cmd, returncode, stdout, stderr)
+
+    async def stream(self, cmd, size=DEFAULT_BUFFER_SIZE):
+        """异步迭代远程命令的stdout数据块"""
+        channel = await self.open(cmd)
+        try:
+            channel.write_eof()
+            while True:
+                block = await channel.read(size)
+                if not block:
+                    break
+                yield block
+        finally:
+            channel.close()
+
+    # -------------------------------------------------------------------------
+    # 上传
+    # -------------------------------------------------------------------------
+
+    async def _send(self, reader, total, command, buffer_size, progress_callback):
+        """执行command并把reader的内容写入其stdin，返回 (已发送字节数, md5, stdout行)"""
+        md5 = hashlib.md5()
+        sent = 0
+        channel = await self.open(command)
+        try:
+            while True:
+                block = reader.read(buffer_size)
+                if not block:
+                    break
+                await _within(channel.write(block), "远程写入")
+                md5.update(block)
+                sent += len(block)
+                if progress_callback:
+                    progress_callback(sent, total)
+            channel.write_eof()
+            stdout = await _within(channel.read_all(), "等待远程写入完成")
+            returncode = await _within(channel.wait(), "等待远程写入完成")
+            stderr = channel.stderr
+        finally:
+            channel.close()
+
+        if returncode != 0:
+            error = stderr.decode("utf-8", errors="replace").strip()
+            raise TransferError(f"远程写入失败 (返回码 {returncode}): {error}")
+        return sent, md5.hexdigest(), stdout.decode().splitlines()
+
+    async def upload_stream(self, reader, total, remote_path, buffer_size=None,
+                            progress_callback=None, verify=None):
+        """从可读的二进制对象reader上传total字节（原始字节，不压缩）"""
+        buffer_size = buffer_size or DEFAULT_BUFFER_SIZE
+        verify = TRANSFER_CONFIG.get("verify", True) if verify is None else verify
+        target = quote_remote_path(remote_path)
+        command = f"cat > {target}"
+        if verify:
+            command += " && " + checksum_command(target)
+
+        start = time.monotonic()
+        sent, digest, lines = await self._send(reader, total, command, buffer_size,
+                                               progress_callback)
+        if verify:
+            remote_size, remote_md5 = parse_checksum_output(lines)
+            check_transfer(sent, digest, remote_size, remote_md5)
+        seconds = time.monotonic() - start
+        self._note_raw(sent, seconds)
+        return {"bytes": sent, "wire_bytes": sent, "md5": digest, "codec": None,
+                "seconds": seconds}
+
+    def _note_raw(self, size, seconds):
+        """记录原始传输速率（每次原始传输都计入，平常的短录音也能校准压缩门限）"""
+        if size > 0 and seconds > 0:
+            _note_rate(self.pool, "link", size / seconds)
+
+    def _note_encoded(self, size, wire, seconds):
+        """记录压缩比，并从总耗时中扣除线路时间估计远程编解码速率"""
+        _note_rate(self.pool, "ratio", wire / max(1, size))
+        link = _get_rate(self.pool, "link")
+        codec_seconds = seconds - (wire / link if link else 0)
+        if codec_seconds > 0:
+            _note_rate(self.pool, "codec", size / codec_seconds)
+
+    async def _upload_encoded(self, data, remote_path, buffer_size, progress_callback, verify):
+        """KPC1压缩后上传，由远程辅助脚本解码写入目标文件，再校验解码结果"""
+        start = time.monotonic()
+        encoded = encode(data)
+        encoded_at = time.monotonic()
+        target = quote_remote_path(remote_path)
+        command = remote_decode_command(target)
+        if verify:
+            command += " && " + checksum_command(target)
+
+        wire, _, lines = await self._send(io.BytesIO(encoded), len(encoded), command,
+                                          buffer_size, progress_callback)
+        digest = hashlib.md5(data).hexdigest()
+        if verify:
+            remote_size, remote_md5 = parse_checksum_output(lines)
+            check_transfer(len(data), digest, remote_size, remote_md5)
+        self._note_encoded(len(data), wire, time.monotonic() - encoded_at)
+        return {"bytes": len(data), "wire_bytes": wire, "md5": digest, "codec": CODEC_NAME,
+                "seconds": time.monotonic() - start}
+
+    async def _codec_enabled(self, compress, size):
+        """是否对本次传输启用KPC1压缩（需要远程协商通过）
+
+        compress为True/False时按调用方指定；为None时看TRANSFER_CONFIG["compress"]（默认关闭），
+        打开后也只对不小于compress_min_bytes、且按实测速率估计压缩更快的传输启用。
+        """
+        if compress is None:
+            compress = (TRANSFER_CONFIG.get("compress", False)
+                        and size >= TRANSFER_CONFIG.get("compress_min_bytes", 262144)
+                        and compression_worthwhile(self.pool))
+        return bool(compress) and await asyncio.to_thread(negotiate, self.pool)
+
+    async def upload_bytes(self, data, remote_path, buffer_size=None,
+                           progress_callback=None, verify=None, compress=None):
+        """上传内存中的字节，WAV数据在启用压缩且远程支持时压缩传输"""
+        buffer_size = buffer_size or DEFAULT_BUFFER_SIZE
+        verify = TRANSFER_CONFIG.get("verify", True) if verify is None else verify
+        if is_wav(data) and await self._codec_enabled(compress, len(data)):
+            try:
+                return await self._upload_encoded(data, remote_path, buffer_size,
+                                                  progress_callback, verify)
+            except Exception as e:
+                # 远程辅助脚本可能已被清理（如板子重启），重新协商并改用原始传输
+                print(f"⚠ 压缩上传失败，改用原始传输: {e}")
+                forget_negotiation(self.pool)
+        return await self.upload_stream(io.BytesIO(data), len(data), remote_path,
+                                        buffer_size=buffer_size,
+                                        progress_callback=progress_callback, verify=verify)
+
+    async def upload(self, local_path, remote_path, buffer_size=None,
+                     progress_callback=None, verify=None, compress=None):
+        """上传本地文件，WAV文件在启用压缩且远程支持时压缩传输"""
+        total = os.path.getsize(local_path)
+        with open(local_path, "rb") as f:
+            if is_wav(f.read(12)):
+                f.seek(0)
+                return await self.upload_bytes(f.read(), remote_path, buffer_size=buffer_size,
+                                               progress_callback=progress_callback,
+                                               verify=verify, compress=compress)
+            f.seek(0)
+            return await self.upload_stream(f, total, remote_path, buffer_size=buffer_size,
+                                            progress_callback=progress_callback, verify=verify)
+
+    # -------------------------------------------------------------------------
+    # 下载
+    # -------------------------------------------------------------------------
+
+    async def _receive(self, command, sink, buffer_size, progress_callback):
+        """执行command，解析两行校验头后把其余stdout写入sink
+
+        返回 (远程字节数, 远程md5, 接收到的数据字节数, 接收数据的md5)。
+        """
+        md5 = hashlib.md5()
+        received = 0
+        header = b""
+        total = None
+        remote_md5 = None
+        channel = await self.open(command)
+        try:
+            channel.write_eof()
+            while True:
+                block = await _within(channel.read(buffer_size), "远程读取")
+                if not block:
+                    break
+                if total is None:
+                    # 先解析两行头信息
+                    header += block
+                    if header.count(b"\n") < 2:
+                        continue
+                    first, second, block = header.split(b"\n", 2)
+                    total, remote_md5 = parse_checksum_output([first.decode(), second.decode()])
+                if block:
+                    sink.write(block)
+                    md5.update(block)
+                    received += len(block)
+                    if progress_callback:
+                        progress_callback(received, total)
+            returncode = await _within(channel.wait(), "远程读取")
+            stderr = channel.stderr
+        finally:
+            channel.close()
+
+        if returncode != 0 or total is None:
+            error = stderr.decode("utf-8", errors="replace").strip()
+            raise TransferError(f"远程读取失败 (返回码 {returncode}): {error}")
+        return total, remote_md5, received, md5.hexdigest()
+
+    async def _size_for_codec(self, source, compress):
+        """下载前需要按大小判断是否压缩时才查询远程文件大小（压缩默认关闭，不多一次往返）"""
+        if compress is not None or not TRANSFER_CONFIG.get("compress", False) \
+                or not compression_worthwhile(self.pool):
+            return 0
+        result = await self.run(f"wc -c < {source}", text=True)
+        try:
+            return int(result.stdout.strip())
+        except ValueError:
+            return 0
+
+    async def download(self, remote_path, local_path, buffer_size=None,
+                       progress_callback=None, verify=None, compress=None):
+        """下载远程文件到local_path（.wav文件在启用压缩且远程支持时压缩传输），不会留下不完整的本地文件"""
+        buffer_size = buffer_size or DEFAULT_BUFFER_SIZE
+        verify = TRANSFER_CONFIG.get("verify", True) if verify is None else verify
+        source = quote_remote_path(remote_path)
+        start = time.monotonic()
+
+        if remote_path.lower().endswith(".wav") and \
+                await self._codec_enabled(compress, await self._size_for_codec(source, compress)):
+            try:
+                command = f"{checksum_command(source)} && {remote_encode_command(source)}"
+                sink = io.BytesIO()
+                total, remote_md5, wire, _ = await self._receive(command, sink, buffer_size,
+                                                                 progress_callback)
+                data = decode(sink.getvalue())
+                digest = hashlib.md5(data).hexdigest()
+                if verify:
+                    check_transfer(len(data), digest, total, remote_md5)
+                _write_atomic(local_path, data)
+                self._note_encoded(len(data), wire, time.monotonic() - start)
+                return {"bytes": len(data), "wire_bytes": wire, "md5": digest,
+                        "codec": CODEC_NAME, "seconds": time.monotonic() - start}
+            except Exception as e:
+                print(f"⚠ 压缩下载失败，改用原始传输: {e}")
+                forget_negotiation(self.pool)
+
+        command = f"{checksum_command(source)} && cat {source}"
+        tmp_path = local_path + ".part"
+        try:
+            with open(tmp_path, "wb") as f:
+                total, remote_md5, received, digest = await self._receive(
+                    command, f, buffer_size, progress_callback)
+            if verify:
+                check_transfer(received, digest, total, remote_md5)
+            os.replace(tmp_path, local_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        seconds = time.monotonic() - start
+        self._note_raw(received, seconds)
+        return {"bytes": received, "wire_bytes": received, "md5": digest, "codec": None,
+                "seconds": seconds}
+
+
+def _write_atomic(local_path, data):
+    """先写临时文件再替换，避免留下不完整的本地文件"""
+    tmp_path = local_path + ".part"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, local_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
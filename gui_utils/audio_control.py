@@ -33,7 +33,7 @@ import tempfile
 # 导入配置
 try:
     from gui_utils.config import (
-        REMOTE_USER, REMOTE_HOST, REMOTE_PASSWORD,
+        REMOTE_USER, REMOTE_HOST, REMOTE_PASSWORD, REMOTE_PORT,
         AI_API_URL, AI_API_TOKEN, AI_MODEL, SYSTEM_PROMPT as CONFIG_SYSTEM_PROMPT,
         API_PARAMS
     )
@@ -46,6 +46,7 @@ except ImportError:
     REMOTE_USER = "root"
     REMOTE_HOST = "192.168.42.1"
     REMOTE_PASSWORD = "milkv"
+    REMOTE_PORT = 22
     REMOTE_ADDR = f"{REMOTE_USER}@{REMOTE_HOST}"
     
     # 默认AI API配置
@@ -67,8 +68,60 @@ REMOTE_RAW = "/tmp/test_raw.wav"
 REMOTE_PROCESSED = "/tmp/test.wav"
 REMOTE_RESPONSE = "/tmp/response.wav"
 
+# SSH连接池（paramiko可用时所有命令复用同一个已认证的连接）
+try:
+    from gui_utils.ssh_pool import get_pool, PARAMIKO_AVAILABLE
+    from gui_utils.transfer import upload_file, download_file
+except ImportError:
+    try:
+        from ssh_pool import get_pool, PARAMIKO_AVAILABLE
+        from transfer import upload_file, download_file
+    except ImportError:
+        PARAMIKO_AVAILABLE = False
+
+# 远程音频缓存（重复的TTS回复跳过合成和上传）和远程环形录音目录
+try:
+    from gui_utils.remote_cache import get_audio_cache, tts_alias
+    from gui_utils.retention import remote_record_path
+except ImportError:
+    from remote_cache import get_audio_cache, tts_alias
+    from retention import remote_record_path
+
+# 远程命令批处理（上传和播放合并为一次远程执行）
+try:
+    from gui_utils.remote_batch import RemoteBatch, add_upload
+except ImportError:
+    from remote_batch import RemoteBatch, add_upload
+
+# 进程内音频处理（降噪、标准化、放大，参数见AUDIO_PROCESS_PARAMS）
+try:
+    from gui_utils.audio_dsp import process_audio_file
+except ImportError:
+    from audio_dsp import process_audio_file
+
+# 传输方法选择器（按主机测速并缓存最快的方法）
+try:
+    from gui_utils.transfer_selector import TransferSelector, UPLOAD, DOWNLOAD, TRANSFER_CONFIG
+except ImportError:
+    from transfer_selector import TransferSelector, UPLOAD, DOWNLOAD, TRANSFER_CONFIG
+
+# 不经过sshpass的ssh调用（dd、tee、base64上传）：BatchMode禁止交互式密码提示，只用公钥认证，
+# 否则立即失败；选择器在GUI工作线程中自动探测这些方法，不能卡在密码输入上
+SSH_BATCH = ["ssh", "-o", "BatchMode=yes", "-o", "StrictHostKeyChecking=no",
+             "-o", f"ConnectTimeout={TRANSFER_CONFIG.get('timeout', 30)}"]
+SSH_TIMEOUT = TRANSFER_CONFIG.get("timeout", 30)
+
 # SSH helper with password
 def ssh_run(cmd, capture_output=False):
+    if PARAMIKO_AVAILABLE:
+        try:
+            pool = get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD)
+            return pool.exec_command(cmd, capture_output=capture_output, check=True)
+        except subprocess.CalledProcessError:
+            # 命令本身执行失败，不再用其他方式重复执行
+            raise
+        except Exception as e:
+            print(f"连接池执行失败，回退到sshpass: {e}")
     try:
         # 首先尝试使用sshpass
         ssh_cmd = ["sshpass", "-p", REMOTE_PASSWORD, "ssh", "-o", "StrictHostKeyChecking=no", REMOTE_ADDR] + cmd
@@ -134,7 +187,7 @@ def transfer_from_remote_method1(remote_path, local_path):
             result = subprocess.run([
                 "sshpass", "-p", REMOTE_PASSWORD, "ssh", "-o", "StrictHostKeyChecking=no", 
                 REMOTE_ADDR, f"base64 < {remote_path}"
-            ], capture_output=True, text=True, check=True)
+            ], capture_output=True, text=True, check=True, timeout=SSH_TIMEOUT)
         except FileNotFoundError:
             # 备选方案：使用pexpect
             import pexpect
@@ -170,7 +223,7 @@ def transfer_from_remote_method2(remote_path, local_path):
                 subprocess.run([
                     "sshpass", "-p", REMOTE_PASSWORD, "ssh", "-o", "StrictHostKeyChecking=no",
                     REMOTE_ADDR, f"cat {remote_path}"
-                ], stdout=f, check=True)
+                ], stdout=f, check=True, timeout=SSH_TIMEOUT)
             except FileNotFoundError:
                 # pexpect备选方案
                 import pexpect
@@ -190,29 +243,29 @@ def transfer_from_remote_method3(remote_path, local_path):
     print(f"Using SSH+dd to fetch {remote_path}...")
     try:
         with open(local_path, 'wb') as f:
-            subprocess.run([
-                "ssh", REMOTE_ADDR, f"dd if={remote_path} bs=1024"
-            ], stdout=f, check=True)
+            subprocess.run(SSH_BATCH + [
+                REMOTE_ADDR, f"dd if={remote_path} bs=1024"
+            ], stdout=f, check=True, timeout=SSH_TIMEOUT)
         print(f"Successfully transferred {remote_path} to {local_path}")
         return True
     except Exception as e:
         print(f"Method 3 failed: {e}")
         return False
 
+def transfer_from_remote_stream(remote_path, local_path):
+    """方法4: 在连接池的单个通道上流式传输原始字节"""
+    print(f"Using pooled SSH stream to fetch {remote_path}...")
+    try:
+        download_file(remote_path, local_path, pool=get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD))
+        print(f"Successfully transferred {remote_path} to {local_path}")
+        return True
+    except Exception as e:
+        print(f"Method 4 failed: {e}")
+        return False
+
 def scp_from_remote(remote_path, local_path):
-    """尝试多种方法从远程获取文件"""
-    methods = [
-        transfer_from_remote_method1,
-        transfer_from_remote_method3,
-        transfer_from_remote_method2
-    ]
-    
-    for i, method in enumerate(methods, 1):
-        print(f"Trying transfer method {i}...")
-        if method(remote_path, local_path):
-            return
-    
-    raise Exception("All transfer methods failed")
+    """使用当前主机测速最快的方法从远程获取文件，失败时依次降级"""
+    get_transfer_selector().transfer(DOWNLOAD, remote_path, local_path)
 
 
 def transfer_to_remote_method1(local_path, remote_path):
@@ -225,10 +278,10 @@ def transfer_to_remote_method1(local_path, remote_path):
             encoded = base64.b64encode(f.read()).decode()
         
         # 通过ssh传输并解码
-        subprocess.run([
-            "ssh", REMOTE_ADDR, 
+        subprocess.run(SSH_BATCH + [
+            REMOTE_ADDR,
             f"echo '{encoded}' | base64 -d > {remote_path}"
-        ], check=True)
+        ], check=True, timeout=SSH_TIMEOUT)
         print(f"Successfully transferred {local_path} to {remote_path}")
         return True
     except Exception as e:
@@ -241,9 +294,9 @@ def transfer_to_remote_method2(local_path, remote_path):
     try:
         # 使用tee通过ssh传输
         with open(local_path, 'rb') as f:
-            subprocess.run([
-                "ssh", REMOTE_ADDR, f"tee {remote_path} > /dev/null"
-            ], stdin=f, check=True)
+            subprocess.run(SSH_BATCH + [
+                REMOTE_ADDR, f"tee {remote_path} > /dev/null"
+            ], stdin=f, check=True, timeout=SSH_TIMEOUT)
         print(f"Successfully transferred {local_path} to {remote_path}")
         return True
     except Exception as e:
@@ -255,29 +308,54 @@ def transfer_to_remote_method3(local_path, remote_path):
     print(f"Using SSH+dd to send {local_path}...")
     try:
         with open(local_path, 'rb') as f:
-            subprocess.run([
-                "ssh", REMOTE_ADDR, f"dd of={remote_path} bs=1024"
-            ], stdin=f, check=True)
+            subprocess.run(SSH_BATCH + [
+                REMOTE_ADDR, f"dd of={remote_path} bs=1024"
+            ], stdin=f, check=True, timeout=SSH_TIMEOUT)
         print(f"Successfully transferred {local_path} to {remote_path}")
         return True
     except Exception as e:
         print(f"Method 3 failed: {e}")
         return False
 
+def transfer_to_remote_stream(local_path, remote_path):
+    """方法4: 在连接池的单个通道上流式传输原始字节"""
+    print(f"Using pooled SSH stream to send {local_path}...")
+    try:
+        upload_file(local_path, remote_path, pool=get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD))
+        print(f"Successfully transferred {local_path} to {remote_path}")
+        return True
+    except Exception as e:
+        print(f"Method 4 failed: {e}")
+        return False
+
 def scp_to_remote(local_path, remote_path):
-    """尝试多种方法发送文件到远程"""
-    methods = [
-        transfer_to_remote_method1,
-        transfer_to_remote_method3,
-        transfer_to_remote_method2
-    ]
-    
-    for i, method in enumerate(methods, 1):
-        print(f"Trying transfer method {i}...")
-        if method(local_path, remote_path):
-            return
-    
-    raise Exception("All transfer methods failed")
+    """使用当前主机测速最快的方法发送文件到远程，失败时依次降级"""
+    get_transfer_selector().transfer(UPLOAD, local_path, remote_path)
+
+
+_transfer_selector = None
+
+def get_transfer_selector():
+    """获取当前远程主机的传输方法选择器（首次调用时注册所有方法）"""
+    global _transfer_selector
+    if _transfer_selector is None:
+        def run_remote(cmd):
+            output = ssh_run([cmd], capture_output=True).stdout
+            return output.decode() if isinstance(output, bytes) else output
+
+        selector = TransferSelector(REMOTE_ADDR, run_remote)
+        if PARAMIKO_AVAILABLE:
+            selector.register(DOWNLOAD, "stream", transfer_from_remote_stream)
+            selector.register(UPLOAD, "stream", transfer_to_remote_stream)
+        # 探测会执行所有注册的方法：sshpass方法带超时，其余方法用SSH_BATCH，没有公钥时立即失败
+        selector.register(DOWNLOAD, "base64", transfer_from_remote_method1)
+        selector.register(DOWNLOAD, "dd", transfer_from_remote_method3)
+        selector.register(DOWNLOAD, "cat", transfer_from_remote_method2)
+        selector.register(UPLOAD, "base64", transfer_to_remote_method1)
+        selector.register(UPLOAD, "dd", transfer_to_remote_method3)
+        selector.register(UPLOAD, "tee", transfer_to_remote_method2)
+        _transfer_selector = selector
+    return _transfer_selector
 
 
 def record_remote():
@@ -289,17 +367,13 @@ def record_remote():
 
 
 def process_local():
-    """Fetch raw remote, process locally with ffmpeg"""
+    """Fetch raw remote, process locally (see audio_dsp.py)"""
     print("Fetching raw file from robot...")
     scp_from_remote(REMOTE_RAW, LOCAL_RAW)
 
     print("Processing audio (denoise, normalize, amplify)...")
-    ffmpeg_cmd = [
-        "ffmpeg", "-y", "-i", LOCAL_RAW,
-        "-af", "afftdn=nr=12:nt=w, dynaudnorm=f=500:g=15, volume=1000.0",
-        LOCAL_PROCESSED
-    ]
-    subprocess.run(ffmpeg_cmd, check=True)
+    if not process_audio_file(LOCAL_RAW, LOCAL_PROCESSED):
+        raise RuntimeError("音频处理失败")
 
 
 def call_model_and_get_code(wav_path):
@@ -369,23 +443,38 @@ def call_model_and_get_code(wav_path):
 system_type = platform.system().lower()
 if system_type == "windows" or os.name == 'nt':
     try:
-        from gui_utils.audio_control_windows import play_remote_audio, ensure_local_directory
+        from gui_utils.audio_control_windows import play_remote_audio, ensure_local_directory, aplay_args, audio_formats
         _tts_backend = 'windows'
     except ImportError:
         play_remote_audio = None
         ensure_local_directory = None
+        aplay_args = audio_formats = None
         _tts_backend = None
 else:
     try:
-        from gui_utils.audio_control_unix import play_remote_audio, ensure_local_directory
+        from gui_utils.audio_control_unix import play_remote_audio, ensure_local_directory, aplay_args, audio_formats
         _tts_backend = 'unix'
     except ImportError:
         play_remote_audio = None
         ensure_local_directory = None
+        aplay_args = audio_formats = None
         _tts_backend = None
 
-def tts_and_play(text):
-    """将文本转为语音并通过play_remote_audio播放，自动适配平台"""
+def get_tts_cache():
+    """获取远程音频缓存，连接池不可用或缓存被禁用时返回None"""
+    if not PARAMIKO_AVAILABLE:
+        return None
+    try:
+        return get_audio_cache(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD, REMOTE_PORT)
+    except Exception as e:
+        print(f"⚠ 远程音频缓存不可用: {e}")
+        return None
+
+def tts_and_play(text, player=None):
+    """将文本转为语音并通过play_remote_audio播放，自动适配平台
+
+    给出player（如全双工会话的play）时改由player边发边播，返回是否播完（被用户打断时为False）。
+    """
     if play_remote_audio is None or ensure_local_directory is None:
         print("TTS播放功能不可用：未能正确导入平台相关模块。")
         return False
@@ -395,7 +484,7 @@ def tts_and_play(text):
         "input": text,
         "voice": "FunAudioLLM/CosyVoice2-0.5B:diana",
         "response_format": "wav",
-        "sample_rate": 32000,
+        "sample_rate": audio_formats()["playback"]["sample_rate"],
         "stream": False,
         "speed": 1,
         "gain": 0
@@ -406,6 +495,11 @@ def tts_and_play(text):
         "Authorization": f"Bearer {AI_API_TOKEN}",
         "Content-Type": "application/json"
     }
+    # 同样的文本和音色之前已合成并上传过时，直接播放远程缓存，不再调用TTS接口
+    alias = tts_alias(text, **{k: v for k, v in payload.items() if k != "input"})
+    cache = get_tts_cache() if player is None else None
+    if cache is not None and cache.play_alias(alias):
+        return True
     try:
         response = requests.post(url, json=payload, headers=headers)
         if response.status_code == 200:
@@ -416,10 +510,13 @@ def tts_and_play(text):
             with open(temp_audio_path, 'wb') as f:
                 f.write(response.content)
             print(f"TTS音频已保存: {temp_audio_path}")
+            if player is not None:
+                # 边发边播，可以被打断
+                return player(temp_audio_path)
             # 生成远程路径
-            remote_audio_path = f"~/record/tts_{timestamp}.wav"
+            remote_audio_path = remote_record_path(f"tts_{timestamp}.wav")
             # 播放音频（通过远程）
-            play_remote_audio(temp_audio_path, remote_audio_path)
+            play_remote_audio(temp_audio_path, remote_audio_path, alias=alias)
             # 删除临时文件
             # os.remove(temp_audio_path)
             return True
@@ -433,12 +530,28 @@ def tts_and_play(text):
 
 def play_remote(wav_path):
     """Send audio to remote and play"""
+    if aplay_args is None:
+        raise RuntimeError("播放功能不可用：未能正确导入平台相关模块。")
+    aplay_cmd = aplay_args() + [REMOTE_RESPONSE]
+    if PARAMIKO_AVAILABLE:
+        # 上传和播放在连接池上一次远程执行完成
+        print("Transferring response and playing on robot...")
+        with open(wav_path, "rb") as f:
+            data = f.read()
+        try:
+            batch = RemoteBatch(get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD))
+            add_upload(batch, REMOTE_RESPONSE, data)
+            batch.add(aplay_cmd, name="play")
+            batch.run(check=True)
+            return
+        except subprocess.CalledProcessError:
+            raise
+        except Exception as e:
+            print(f"批处理播放失败，改为分步执行: {e}")
     print("Transferring response to robot...")
     scp_to_remote(wav_path, REMOTE_RESPONSE)
     print("Playing audio on robot...")
-    ssh_run([
-        "aplay", "-D", "hw:1,0", "-f", "S16_LE", "-r", "16000", "-c", "1", REMOTE_RESPONSE
-    ])
+    ssh_run(aplay_cmd)
 
 
 def detect_system():
@@ -21,12 +21,94 @@ LOCAL_RAW = "test_raw.wav"
 LOCAL_PROCESSED = "test.wav"
 LOCAL_RESPONSE = "response.wav"
 
-REMOTE_RAW = "~/record/test_raw.wav"
-REMOTE_PROCESSED = "~/record/test.wav"
-REMOTE_RESPONSE = "~/record/response.wav"
+# 远程文件放在板子上的tmpfs环形目录中（见retention.py）
+try:
+    from gui_utils.config import REMOTE_RECORD_DIR
+except ImportError:
+    REMOTE_RECORD_DIR = "/tmp/kos_record"
+
+REMOTE_RAW = f"{REMOTE_RECORD_DIR}/test_raw.wav"
+REMOTE_PROCESSED = f"{REMOTE_RECORD_DIR}/test.wav"
+REMOTE_RESPONSE = f"{REMOTE_RECORD_DIR}/response.wav"
+
+# SSH连接池（paramiko可用时所有命令复用同一个已认证的连接）
+try:
+    from gui_utils.ssh_pool import get_pool, PARAMIKO_AVAILABLE
+    from gui_utils.transfer import upload_file, download_file
+    from gui_utils.remote_cache import get_audio_cache
+except ImportError:
+    try:
+        from ssh_pool import get_pool, PARAMIKO_AVAILABLE
+        from transfer import upload_file, download_file
+        from remote_cache import get_audio_cache
+    except ImportError:
+        PARAMIKO_AVAILABLE = False
+
+# 录音文件保留策略（远程环形目录、本地归档）
+try:
+    from gui_utils.retention import get_remote_ring, enforce_local_retention
+except ImportError:
+    from retention import get_remote_ring, enforce_local_retention
+
+# 实时流式录音（arecord的PCM直接通过通道传回，边录边处理）
+try:
+    from gui_utils.live_capture import stream_record
+    from gui_utils.vad import record_until_silence
+    from gui_utils.capture_ring import record_with_preroll, capture_daemon_running
+    from gui_utils.sound_grpc import record_grpc_vad
+    from gui_utils.config import CAPTURE_DAEMON_CONFIG, SOUND_GRPC_CONFIG
+except ImportError:
+    from live_capture import stream_record
+    from vad import record_until_silence
+    from capture_ring import record_with_preroll, capture_daemon_running, CAPTURE_DAEMON_CONFIG
+    from sound_grpc import record_grpc_vad, SOUND_GRPC_CONFIG
+
+# 录音提前结束（界面上点停止时终止远程arecord，已录到的部分照常处理）
+try:
+    from gui_utils.record_control import stoppable_command, remote_stopper
+except ImportError:
+    from record_control import stoppable_command, remote_stopper
+
+# 全双工对话（边播边录，用户开口即打断播放）
+try:
+    from gui_utils.duplex import DuplexSession
+except ImportError:
+    from duplex import DuplexSession
+
+# 远程命令批处理（一次交互的多个远程步骤合并为一次执行）
+try:
+    from gui_utils.remote_batch import (
+        RemoteBatch, add_upload, fetch_command, save_output
+    )
+except ImportError:
+    from remote_batch import (
+        RemoteBatch, add_upload, fetch_command, save_output
+    )
+
+# 进程内音频处理（降噪、标准化、放大，参数见AUDIO_PROCESS_PARAMS）
+try:
+    from gui_utils.audio_dsp import process_audio_file, is_processed
+except ImportError:
+    from audio_dsp import process_audio_file, is_processed
+
+# 录放音格式协商（板子声卡的能力只查询一次并缓存，录音直接用语音识别的采样率）
+try:
+    from gui_utils.audio_format import negotiate_alsa, alsa_args
+    from gui_utils.config import AUDIO_NEGOTIATION_CONFIG
+except ImportError:
+    from audio_format import negotiate_alsa, alsa_args, AUDIO_NEGOTIATION_CONFIG
 
 def ssh_run(cmd, capture_output=False):
     """执行SSH命令，自动使用密码"""
+    if PARAMIKO_AVAILABLE:
+        try:
+            pool = get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD)
+            return pool.exec_command(cmd, capture_output=capture_output, check=True)
+        except subprocess.CalledProcessError:
+            # 命令本身执行失败，不再用其他方式重复执行
+            raise
+        except Exception as e:
+            print(f"连接池执行失败，回退到sshpass: {e}")
     try:
         # 优先使用sshpass
         ssh_cmd = ["sshpass", "-p", REMOTE_PASSWORD, "ssh", "-o", "StrictHostKeyChecking=no", REMOTE_ADDR] + cmd
@@ -71,6 +153,87 @@ def ssh_run(cmd, capture_output=False):
             print("需要安装 sshpass 或 pexpect: pip install pexpect")
             raise
 
+def remote_batch():
+    """创建远程批处理：优先在连接池上执行，否则通过ssh_run执行（此时步骤不能读取标准输入）"""
+    if PARAMIKO_AVAILABLE:
+        return RemoteBatch(get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD))
+
+    def run(script, input=None):
+        if input is not None:
+            raise RuntimeError("通过sshpass执行的批处理不支持标准输入")
+        result = ssh_run([script], capture_output=True)
+        return result.returncode, result.stdout, getattr(result, "stderr", b"")
+    return RemoteBatch(run)
+
+_audio_formats = None
+
+def audio_formats():
+    """协商好的录音/播放格式（第一次调用时查询板子声卡的能力）"""
+    global _audio_formats
+    if _audio_formats is None:
+        _audio_formats = negotiate_alsa(REMOTE_HOST, remote_batch)
+    return _audio_formats
+
+def arecord_args():
+    """按协商的录音格式生成arecord参数"""
+    return alsa_args("arecord", AUDIO_NEGOTIATION_CONFIG["capture_device"], audio_formats()["capture"])
+
+def aplay_args():
+    """按协商的播放格式生成aplay参数"""
+    return alsa_args("aplay", AUDIO_NEGOTIATION_CONFIG["playback_device"], audio_formats()["playback"])
+
+def add_directory_step(batch, remote_path):
+    """把远程目录的准备并入批处理，返回环形目录对象（不是环形目录时返回None）"""
+    remote_dir = os.path.dirname(remote_path)
+    if PARAMIKO_AVAILABLE and remote_dir == REMOTE_RECORD_DIR:
+        ring = get_remote_ring(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD)
+        ring.batch_prepare(batch)
+        return ring
+    batch.add(["mkdir", "-p", remote_dir], name="mkdir")
+    return None
+
+def report_batch_failure(label, result):
+    """打印批处理中失败的步骤"""
+    failed = result.failed
+    stderr = failed.stderr.decode("utf-8", errors="replace").strip()
+    print(f"✗ {label}失败: 步骤 {failed.name} 退出码 {failed.returncode} {stderr}")
+
+def transfer_from_remote_stream(remote_path, local_path):
+    """在一个SSH通道上直接读取原始字节下载文件（不做base64编码）"""
+    print(f"从远程下载文件 (流式): {remote_path} -> {local_path}")
+    try:
+        pool = get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD)
+        info = download_file(remote_path, local_path, pool=pool)
+        print(f"✓ 成功下载 {info['bytes']} 字节 ({info['seconds']:.2f}秒)")
+        return True
+    except Exception as e:
+        print(f"✗ 流式下载失败: {e}")
+        return False
+
+def transfer_to_remote_stream(local_path, remote_path):
+    """在一个SSH通道上直接写入原始字节上传文件（不做base64编码和分块）"""
+    print(f"上传文件到远程 (流式): {local_path} -> {remote_path}")
+    try:
+        pool = get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD)
+        info = upload_file(local_path, remote_path, pool=pool)
+        print(f"✓ 成功上传 {info['bytes']} 字节 ({info['seconds']:.2f}秒)")
+        return True
+    except Exception as e:
+        print(f"✗ 流式上传失败: {e}")
+        return False
+
+def transfer_from_remote(remote_path, local_path):
+    """下载文件：优先流式传输，不可用时回退到base64"""
+    if PARAMIKO_AVAILABLE and transfer_from_remote_stream(remote_path, local_path):
+        return True
+    return transfer_from_remote_base64(remote_path, local_path)
+
+def transfer_to_remote(local_path, remote_path):
+    """上传文件：优先流式传输，不可用时回退到base64分块"""
+    if PARAMIKO_AVAILABLE and transfer_to_remote_stream(local_path, remote_path):
+        return True
+    return transfer_to_remote_base64(local_path, remote_path)
+
 def transfer_from_remote_base64(remote_path, local_path):
     """使用base64编码从远程下载文件（最可靠的方法）"""
     print(f"从远程下载文件: {remote_path} -> {local_path}")
@@ -127,7 +290,11 @@ def ensure_remote_directory():
         remote_dir = os.path.dirname(REMOTE_RAW)
         
         # 创建目录（如果不存在）
-        result = ssh_run([f"mkdir", "-p", remote_dir])
+        if PARAMIKO_AVAILABLE:
+            # 连接池可用时同时按配置挂载tmpfs
+            get_remote_ring(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD).prepare()
+        else:
+            ssh_run([f"mkdir", "-p", remote_dir])
         print(f"✓ 远程目录准备就绪: {remote_dir}")
         return True
     except Exception as e:
@@ -144,59 +311,156 @@ def ensure_local_directory():
             print(f"✓ 创建本地目录: {local_record_dir}")
         else:
             print(f"✓ 本地目录已存在: {local_record_dir}")
+        # 定期归档/淘汰旧录音，避免本地目录无限增长
+        enforce_local_retention(local_record_dir, background=True)
         return local_record_dir
     except Exception as e:
         print(f"✗ 无法创建本地目录: {e}")
         return None
 
-def record_remote(duration=5):
-    """在远程设备上录音duration秒"""
+def run_stop_command(cmd):
+    """在单独的通道上执行停止命令（录音所在的通道正被批处理占用），返回stdout"""
+    result = ssh_run([cmd], capture_output=True)
+    return result.stdout
+
+def use_capture_daemon():
+    """录音是否应从常驻录音截取：配置开启，或常驻录音（如全双工对话）正占用着录音设备"""
+    return CAPTURE_DAEMON_CONFIG["enabled"] or \
+        capture_daemon_running(get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD))
+
+def record_remote(duration=5, local_path=None, control=None):
+    """在远程设备上录音duration秒
+
+    准备目录、录音和（给出local_path时）取回录音文件在一次远程执行中完成。
+    给出control（RecordingControl）时可以提前停止：arecord收到SIGINT后正常写完文件，
+    取回的是已经录到的部分。常驻录音开启或正在运行（占用录音设备）时给出local_path则直接从
+    环形缓冲截取duration秒，不再单独启动arecord。
+    """
     print(f"开始远程录音 ({duration}秒)...")
     
-    # 先确保目录存在
-    if not ensure_remote_directory():
-        return False
-    
     try:
-        ssh_run([
-            "arecord", "-D", "hw:0,0", "-f", "S16_LE", 
-            "-r", "16000", "-c", "1", "-d", str(duration), REMOTE_RAW
-        ])
-        print("✓ 录音完成")
+        if local_path and PARAMIKO_AVAILABLE and use_capture_daemon():
+            record_with_preroll(local_path, pool=get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD),
+                                duration=duration, use_vad=False, control=control)
+            return True
+        batch = remote_batch()
+        ring = add_directory_step(batch, REMOTE_RAW)
+        record_cmd = arecord_args() + ["-d", str(duration), REMOTE_RAW]
+        stop = None
+        if control is not None:
+            record_cmd = stoppable_command(record_cmd, REMOTE_RAW + ".pid")
+            stop = remote_stopper(run_stop_command, REMOTE_RAW + ".pid")
+        batch.add(record_cmd, name="record")
+        if local_path:
+            batch.add(fetch_command(REMOTE_RAW), name="fetch")
+        if stop is not None:
+            control.register(stop)
+        try:
+            result = batch.run()
+        finally:
+            if stop is not None:
+                control.unregister(stop)
+        if ring is not None:
+            ring.batch_prepared(result)
+        if result.failed:
+            report_batch_failure("录音", result)
+            return False
+        if local_path:
+            size = save_output(result["fetch"], local_path)
+            print(f"✓ 已取回录音 {size} 字节: {local_path}")
+        stopped = " (已提前停止)" if control is not None and control.stopped else ""
+        print(f"✓ 录音完成{stopped} ({len(batch)}个远程步骤, 1次往返, {result.seconds:.2f}秒)")
         return True
     except Exception as e:
         print(f"✗ 录音失败: {e}")
         return False
 
-def process_audio_local():
-    """处理音频：下载、降噪、标准化"""
-    print("处理音频...")
-    
-    # 确保本地record目录存在
-    local_record_dir = ensure_local_directory()
-    if not local_record_dir:
-        print("✗ 无法创建本地目录")
+def record_remote_stream(local_path, duration=5, on_frame=None, processed_path=None):
+    """流式录音：远程arecord输出原始PCM，本地边收边写入local_path
+
+    每收到一帧（np.int16数组）调用on_frame(frame)，降噪、VAD等可以在录音过程中进行。
+    给出processed_path时边录边处理，之后process_audio_local不再处理整段录音。
+    """
+    print(f"开始远程流式录音 ({duration}秒)...")
+    if not PARAMIKO_AVAILABLE:
+        print("✗ 流式录音需要paramiko")
         return False
+    try:
+        stream_record(duration, local_path, pool=get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD), on_frame=on_frame,
+                      processed_path=processed_path)
+        return True
+    except Exception as e:
+        print(f"✗ 流式录音失败: {e}")
+        return False
+
+def record_remote_vad(local_path, max_duration=None, on_frame=None, control=None, processed_path=None):
+    """流式录音，VAD检测到说完后立即结束（最长max_duration秒），录音写入local_path
+
+    返回端点检测结果（reason/speech/duration等），VAD不可用或录音失败时返回None。
+    control.stop()会提前结束录音，此时reason为"stopped"。直接流式录音时给出processed_path
+    会边录边处理（gRPC、常驻录音时仍在录音结束后处理）。
+    """
+    print(f"开始远程录音（说完自动停止，最长{max_duration or '默认'}秒）...")
+    if not PARAMIKO_AVAILABLE:
+        print("✗ 流式录音需要paramiko")
+        return None
+    try:
+        if SOUND_GRPC_CONFIG["enabled"]:
+            # 板子上运行SoundService时录音走gRPC长连接
+            return record_grpc_vad(local_path, max_duration=max_duration, control=control)
+        if use_capture_daemon():
+            # 常驻录音占用着录音设备：从环形缓冲截取（带pre-roll，不会丢掉开头）
+            return record_with_preroll(local_path, pool=get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD), duration=max_duration,
+                                       control=control)
+        return record_until_silence(local_path, pool=get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD), max_duration=max_duration,
+                                    on_frame=on_frame, control=control, processed_path=processed_path)
+    except Exception as e:
+        print(f"✗ VAD录音失败: {e}")
+        return None
+
+def create_duplex_session(on_utterance=None):
+    """创建全双工对话会话（常驻录音 + 可打断的流式播放），不可用时返回None"""
+    if not PARAMIKO_AVAILABLE:
+        print("✗ 全双工对话需要paramiko")
+        return None
+    try:
+        return DuplexSession(get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD), on_utterance=on_utterance,
+                             playback_format=audio_formats()["playback"])
+    except Exception as e:
+        print(f"✗ 全双工对话不可用: {e}")
+        return None
+
+def process_audio_local(remote_raw=None, local_raw=None, local_processed=None):
+    """处理音频：下载、降噪、标准化
+
+    local_raw已由record_remote随录音一起取回时不再下载。
+    """
+    print("处理音频...")
     
-    # 生成带时间戳的本地文件名
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    local_raw = os.path.join(local_record_dir, f"test_raw_{timestamp}.wav")
-    local_processed = os.path.join(local_record_dir, f"test_{timestamp}.wav")
+    if not local_raw or not local_processed:
+        # 确保本地record目录存在
+        local_record_dir = ensure_local_directory()
+        if not local_record_dir:
+            print("✗ 无法创建本地目录")
+            return False
+        
+        # 生成带时间戳的本地文件名
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        local_raw = local_raw or os.path.join(local_record_dir, f"test_raw_{timestamp}.wav")
+        local_processed = local_processed or os.path.join(local_record_dir, f"test_{timestamp}.wav")
     
     # 下载原始录音
-    if not transfer_from_remote_base64(REMOTE_RAW, local_raw):
+    if os.path.exists(local_raw):
+        print(f"✓ 录音已在本地: {local_raw}")
+    elif not transfer_from_remote(remote_raw or REMOTE_RAW, local_raw):
         return False
     
-    # 使用FFmpeg处理音频
+    # 降噪、标准化、放大（进程内处理，参数见AUDIO_PROCESS_PARAMS）；流式录音时已边录边处理
+    if is_processed(local_raw, local_processed):
+        print(f"✓ 录音时已处理: {local_processed}")
+        return local_processed
     try:
-        ffmpeg_cmd = [
-            "ffmpeg", "-y", "-i", local_raw,
-            "-af", "afftdn=nr=12:nt=w, dynaudnorm=f=500:g=15, volume=10000.0",
-            local_processed
-        ]
-        result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"FFmpeg错误: {result.stderr}")
+        if not process_audio_file(local_raw, local_processed):
             return False
         
         print("✓ 音频处理完成")
@@ -205,26 +469,65 @@ def process_audio_local():
         print(f"✗ 音频处理失败: {e}")
         return False
 
-def play_remote_audio(local_wav_path):
-    """播放音频：上传并在远程播放"""
+def play_remote_audio_cached(local_wav_path, alias=None):
+    """通过远程音频缓存播放：内容已在板子上时跳过上传，失败时返回False"""
+    if not PARAMIKO_AVAILABLE:
+        return False
+    try:
+        cache = get_audio_cache(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD)
+        if cache is None:
+            return False
+        if cache.play(local_wav_path, alias=alias):
+            print("✓ 音频播放完成")
+            return True
+    except Exception as e:
+        print(f"⚠ 缓存播放失败，改为直接上传播放: {e}")
+    return False
+
+def play_remote_audio(local_wav_path, remote_wav_path=None, alias=None):
+    """播放音频：优先通过远程缓存播放，否则上传到remote_wav_path后在远程播放"""
     print("播放音频...")
     
+    if play_remote_audio_cached(local_wav_path, alias=alias):
+        return True
+    remote_wav_path = remote_wav_path or REMOTE_RESPONSE
+    
+    # 准备目录、上传和播放在一次远程执行中完成
+    try:
+        return upload_and_play(local_wav_path, remote_wav_path)
+    except Exception as e:
+        print(f"⚠ 批处理播放不可用，改为分步上传播放: {e}")
+    
     # 上传音频文件
-    if not transfer_to_remote_base64(local_wav_path, REMOTE_RESPONSE):
+    if not transfer_to_remote(local_wav_path, remote_wav_path):
         return False
     
     # 远程播放
     try:
-        ssh_run([
-            "aplay", "-D", "hw:1,0", "-f", "S16_LE", 
-            "-r", "16000", "-c", "1", REMOTE_RESPONSE
-        ])
+        ssh_run(aplay_args() + [remote_wav_path])
         print("✓ 音频播放完成")
         return True
     except Exception as e:
         print(f"✗ 音频播放失败: {e}")
         return False
 
+def upload_and_play(local_wav_path, remote_wav_path):
+    """把本地音频写入remote_wav_path并播放，所有远程步骤合并为一次执行"""
+    with open(local_wav_path, "rb") as f:
+        data = f.read()
+    batch = remote_batch()
+    ring = add_directory_step(batch, remote_wav_path)
+    add_upload(batch, remote_wav_path, data)
+    batch.add(aplay_args() + [remote_wav_path], name="play")
+    result = batch.run()
+    if ring is not None:
+        ring.batch_prepared(result)
+    if result.failed:
+        report_batch_failure("音频播放", result)
+        return False
+    print(f"✓ 音频播放完成 (上传 {len(data)} 字节, 1次往返, {result.seconds:.2f}秒)")
+    return True
+
 def simulate_ai_response(input_file):
     """模拟AI响应（替换为真实的AI调用）"""
     print("模拟AI处理...")
@@ -266,7 +569,7 @@ def tts_and_play(text):
         "input": text,
         "voice": "FunAudioLLM/CosyVoice2-0.5B:claire",
         "response_format": "mp3",
-        "sample_rate": 32000,
+        "sample_rate": audio_formats()["playback"]["sample_rate"],
         "stream": False,
         "speed": 1,
         "gain": 0
@@ -323,12 +626,18 @@ def main():
                 print("\n" + "="*30)
                 print("开始音频处理流程...")
                 
-                # 步骤1: 远程录音
-                if not record_remote():
+                # 步骤1: 远程录音（同时取回录音文件）
+                local_record_dir = ensure_local_directory()
+                if not local_record_dir:
+                    continue
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                local_raw = os.path.join(local_record_dir, f"test_raw_{timestamp}.wav")
+                local_processed = os.path.join(local_record_dir, f"test_{timestamp}.wav")
+                if not record_remote(local_path=local_raw):
                     continue
                 
                 # 步骤2: 处理音频
-                processed_file = process_audio_local()
+                processed_file = process_audio_local(REMOTE_RAW, local_raw, local_processed)
                 if not processed_file:
                     continue
                 
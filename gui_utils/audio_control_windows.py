@@ -22,31 +22,106 @@ def get_timestamped_filename(base_name):
     name, ext = os.path.splitext(base_name)
     return f"{name}_{timestamp}{ext}"
 
+# 流式传输（在连接池的单个通道上传输原始字节）
+try:
+    from gui_utils.ssh_pool import get_pool, PARAMIKO_AVAILABLE
+    from gui_utils.transfer import upload_file, download_file
+    from gui_utils.remote_cache import get_audio_cache
+except ImportError:
+    try:
+        from ssh_pool import get_pool, PARAMIKO_AVAILABLE
+        from transfer import upload_file, download_file
+        from remote_cache import get_audio_cache
+    except ImportError:
+        PARAMIKO_AVAILABLE = False
+
+# 录音文件保留策略（远程环形目录、本地归档）
+try:
+    from gui_utils.retention import get_remote_ring, enforce_local_retention, remote_record_path
+    from gui_utils.config import REMOTE_RECORD_DIR
+except ImportError:
+    from retention import get_remote_ring, enforce_local_retention, remote_record_path
+    from retention import REMOTE_RECORD_DIR
+
+# 实时流式录音（arecord的PCM直接通过通道传回，边录边处理）
+try:
+    from gui_utils.live_capture import stream_record
+    from gui_utils.vad import record_until_silence
+    from gui_utils.capture_ring import record_with_preroll, capture_daemon_running
+    from gui_utils.sound_grpc import record_grpc_vad
+    from gui_utils.config import CAPTURE_DAEMON_CONFIG, SOUND_GRPC_CONFIG
+except ImportError:
+    from live_capture import stream_record
+    from vad import record_until_silence
+    from capture_ring import record_with_preroll, capture_daemon_running, CAPTURE_DAEMON_CONFIG
+    from sound_grpc import record_grpc_vad, SOUND_GRPC_CONFIG
+
+# 录音提前结束（界面上点停止时终止远程arecord，已录到的部分照常处理）
+try:
+    from gui_utils.record_control import stoppable_command, remote_stopper
+except ImportError:
+    from record_control import stoppable_command, remote_stopper
+
+# 全双工对话（边播边录，用户开口即打断播放）
+try:
+    from gui_utils.duplex import DuplexSession
+except ImportError:
+    from duplex import DuplexSession
+
+# 远程命令批处理（一次交互的多个远程步骤合并为一次执行）
+try:
+    from gui_utils.remote_batch import (
+        RemoteBatch, add_upload, fetch_command, save_output
+    )
+except ImportError:
+    from remote_batch import (
+        RemoteBatch, add_upload, fetch_command, save_output
+    )
+
+# 进程内音频处理（降噪、标准化、放大，参数见AUDIO_PROCESS_PARAMS）
+try:
+    from gui_utils.audio_dsp import process_audio_file, is_processed
+except ImportError:
+    from audio_dsp import process_audio_file, is_processed
+
+# 录放音格式协商（板子声卡的能力只查询一次并缓存，录音直接用语音识别的采样率）
+try:
+    from gui_utils.audio_format import negotiate_alsa, alsa_args
+    from gui_utils.config import AUDIO_NEGOTIATION_CONFIG
+except ImportError:
+    from audio_format import negotiate_alsa, alsa_args, AUDIO_NEGOTIATION_CONFIG
+
 # 基础文件名
 BASE_RAW = "test_raw.wav"
 BASE_PROCESSED = "test.wav"
 BASE_RESPONSE = "response.wav"
 
-# 全局SSH客户端
-ssh_client = None
+# 受监护的SSH长连接（keepalive、后台探测、断线自动重连）
+try:
+    from gui_utils.ssh_supervisor import SSHSupervisor, ConnectionLost
+except ImportError:
+    from ssh_supervisor import SSHSupervisor, ConnectionLost
+
+ssh_supervisor = None
+
+def init_ssh_connection(on_state_change=None):
+    """初始化SSH连接并启动后台监护
 
-def init_ssh_connection():
-    """初始化SSH连接"""
-    global ssh_client
+    on_state_change(状态, 统计) 在连接断开/恢复时于后台线程中调用。
+    """
+    global ssh_supervisor
     try:
-        import paramiko
-        
-        ssh_client = paramiko.SSHClient()
-        ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh_client.connect(
-            hostname=REMOTE_HOST,
-            port=REMOTE_PORT,
-            username=REMOTE_USER,
-            password=REMOTE_PASSWORD,
-            timeout=10
-        )
-        print("✓ SSH连接建立成功")
-        return True
+        if ssh_supervisor is None:
+            ssh_supervisor = SSHSupervisor(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD,
+                                           port=REMOTE_PORT, on_state_change=on_state_change)
+        elif on_state_change is not None:
+            ssh_supervisor.add_listener(on_state_change)
+        if ssh_supervisor.state == "connected":
+            return True
+        if ssh_supervisor.connect():
+            print("✓ SSH连接建立成功")
+            return True
+        return False
     except ImportError:
         print("错误: 需要安装paramiko库")
         print("安装方法: pip install paramiko")
@@ -57,15 +132,18 @@ def init_ssh_connection():
 
 def close_ssh_connection():
     """关闭SSH连接"""
-    global ssh_client
-    if ssh_client:
-        ssh_client.close()
-        ssh_client = None
-
-def run_ssh_command(cmd, capture_output=False):
-    """执行SSH命令"""
-    global ssh_client
-    if not ssh_client:
+    global ssh_supervisor
+    if ssh_supervisor:
+        ssh_supervisor.close()
+        ssh_supervisor = None
+
+def connection_stats():
+    """返回SSH连接监护统计（重连次数、恢复耗时等），未连接时返回None"""
+    return ssh_supervisor.stats() if ssh_supervisor else None
+
+def run_ssh_command(cmd, capture_output=False, idempotent=None):
+    """执行SSH命令（断线时等待自动重连，幂等命令会在重连后重试）"""
+    if not ssh_supervisor:
         if not init_ssh_connection():
             raise Exception("SSH连接失败")
     
@@ -76,12 +154,11 @@ def run_ssh_command(cmd, capture_output=False):
         else:
             cmd_str = cmd
         
-        stdin, stdout, stderr = ssh_client.exec_command(cmd_str)
+        return_code, stdout, stderr = ssh_supervisor.exec_command(cmd_str, idempotent=idempotent)
         
         if capture_output:
-            output = stdout.read().decode('utf-8')
-            error = stderr.read().decode('utf-8')
-            return_code = stdout.channel.recv_exit_status()
+            output = stdout.decode('utf-8')
+            error = stderr.decode('utf-8')
             
             # 模拟subprocess.run的返回对象
             class SSHResult:
@@ -92,9 +169,6 @@ def run_ssh_command(cmd, capture_output=False):
             
             return SSHResult(output, error, return_code)
         else:
-            # 等待命令完成
-            return_code = stdout.channel.recv_exit_status()
-            
             class SSHResult:
                 def __init__(self, returncode):
                     self.returncode = returncode
@@ -103,10 +177,81 @@ def run_ssh_command(cmd, capture_output=False):
             
             return SSHResult(return_code)
             
+    except ConnectionLost as e:
+        # 非幂等命令执行中断线不会自动重试，由调用方决定是否重新执行
+        print(f"✗ SSH连接断开，命令可能只执行了一部分: {e}")
+        raise
     except Exception as e:
         print(f"SSH命令执行失败: {e}")
         raise
 
+def remote_batch():
+    """创建在受监护连接上执行的远程批处理（批处理包含录音/播放，断线后不自动重试）"""
+    if not ssh_supervisor:
+        if not init_ssh_connection():
+            raise Exception("SSH连接失败")
+
+    def run(script, input=None):
+        return ssh_supervisor.exec_command(script, idempotent=False, input=input)
+    return RemoteBatch(run)
+
+_audio_formats = None
+
+def audio_formats():
+    """协商好的录音/播放格式（第一次调用时查询板子声卡的能力）"""
+    global _audio_formats
+    if _audio_formats is None:
+        _audio_formats = negotiate_alsa(REMOTE_HOST, remote_batch)
+    return _audio_formats
+
+def arecord_args():
+    """按协商的录音格式生成arecord参数"""
+    return alsa_args("arecord", AUDIO_NEGOTIATION_CONFIG["capture_device"], audio_formats()["capture"])
+
+def aplay_args():
+    """按协商的播放格式生成aplay参数"""
+    return alsa_args("aplay", AUDIO_NEGOTIATION_CONFIG["playback_device"], audio_formats()["playback"])
+
+def add_directory_step(batch, remote_path):
+    """把远程目录的准备并入批处理，返回环形目录对象（不是环形目录时返回None）"""
+    remote_dir = os.path.dirname(remote_path)
+    if PARAMIKO_AVAILABLE and remote_dir == REMOTE_RECORD_DIR:
+        ring = get_remote_ring(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD, REMOTE_PORT)
+        ring.batch_prepare(batch)
+        return ring
+    batch.add(f"mkdir -p {remote_dir}", name="mkdir")
+    return None
+
+def report_batch_failure(label, result):
+    """打印批处理中失败的步骤"""
+    failed = result.failed
+    stderr = failed.stderr.decode("utf-8", errors="replace").strip()
+    print(f"✗ {label}失败: 步骤 {failed.name} 退出码 {failed.returncode} {stderr}")
+
+def transfer_from_remote_stream(remote_path, local_path):
+    """在一个SSH通道上直接读取原始字节下载文件（不做base64编码）"""
+    print(f"下载文件 (流式): {remote_path} -> {local_path}")
+    try:
+        pool = get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD, REMOTE_PORT)
+        info = download_file(remote_path, local_path, pool=pool)
+        print(f"✓ 成功下载 {info['bytes']} 字节 ({info['seconds']:.2f}秒)")
+        return True
+    except Exception as e:
+        print(f"✗ 流式下载失败: {e}")
+        return False
+
+def transfer_to_remote_stream(local_path, remote_path):
+    """在一个SSH通道上直接写入原始字节上传文件（不做base64编码和分块）"""
+    print(f"上传文件 (流式): {local_path} -> {remote_path}")
+    try:
+        pool = get_pool(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD, REMOTE_PORT)
+        info = upload_file(local_path, remote_path, pool=pool)
+        print(f"✓ 成功上传 {info['bytes']} 字节 ({info['seconds']:.2f}秒)")
+        return True
+    except Exception as e:
+        print(f"✗ 流式上传失败: {e}")
+        return False
+
 def transfer_from_remote_base64(remote_path, local_path):
     """使用base64从远程下载文件"""
     print(f"下载文件: {remote_path} -> {local_path}")
@@ -135,13 +280,12 @@ def transfer_to_remote_scp(local_path, remote_path):
         from scp import SCPClient
         
         # 使用现有的SSH连接
-        global ssh_client
-        if not ssh_client:
+        if not ssh_supervisor:
             if not init_ssh_connection():
                 return False
         
         # 使用SCP传输
-        with SCPClient(ssh_client.get_transport()) as scp:
+        with SCPClient(ssh_supervisor.get_transport()) as scp:
             scp.put(local_path, remote_path)
         
         print(f"✓ SCP上传成功")
@@ -203,6 +347,12 @@ def ensure_remote_directory(remote_path):
         import os
         remote_dir = os.path.dirname(remote_path)
         
+        # 环形目录由retention按配置创建并挂载tmpfs
+        if PARAMIKO_AVAILABLE and remote_dir == REMOTE_RECORD_DIR:
+            get_remote_ring(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD, REMOTE_PORT).prepare()
+            print(f"✓ 远程目录准备就绪: {remote_dir}")
+            return True
+        
         # 创建目录（如果不存在）
         result = run_ssh_command(f"mkdir -p {remote_dir}")
         if result.returncode == 0:
@@ -225,54 +375,141 @@ def ensure_local_directory():
             print(f"✓ 创建本地目录: {local_record_dir}")
         else:
             print(f"✓ 本地目录已存在: {local_record_dir}")
+        # 定期归档/淘汰旧录音，避免本地目录无限增长
+        enforce_local_retention(local_record_dir, background=True)
         return local_record_dir
     except Exception as e:
         print(f"✗ 无法创建本地目录: {e}")
         return None
 
-def record_remote(remote_path, duration=5):
-    """远程录音duration秒"""
+def run_stop_command(cmd):
+    """在单独的通道上执行停止命令（录音所在的通道正被批处理占用），返回stdout"""
+    returncode, stdout, stderr = ssh_supervisor.exec_command(cmd, timeout=10, idempotent=True)
+    return stdout
+
+def use_capture_daemon():
+    """录音是否应从常驻录音截取：配置开启，或常驻录音（如全双工对话）正占用着录音设备"""
+    return CAPTURE_DAEMON_CONFIG["enabled"] or capture_daemon_running(ssh_supervisor)
+
+def record_remote(remote_path, duration=5, local_path=None, control=None):
+    """远程录音duration秒
+
+    准备目录、录音和（给出local_path时）取回录音文件在一次远程执行中完成。
+    给出control（RecordingControl）时可以提前停止：arecord收到SIGINT后正常写完文件，
+    取回的是已经录到的部分。常驻录音开启或正在运行（占用录音设备）时给出local_path则直接从
+    环形缓冲截取duration秒，不再单独启动arecord。
+    """
     print(f"开始远程录音 ({duration}秒)...")
     
-    # 先确保目录存在
-    if not ensure_remote_directory(remote_path):
-        return False
-    
     try:
-        result = run_ssh_command([
-            "arecord", "-D", "hw:0,0", "-f", "S16_LE", 
-            "-r", "16000", "-c", "1", "-d", str(duration), remote_path
-        ])
-        
-        if result.returncode == 0:
-            print("✓ 录音完成")
+        if local_path and ssh_supervisor and use_capture_daemon():
+            record_with_preroll(local_path, pool=ssh_supervisor, duration=duration, use_vad=False,
+                                control=control)
             return True
-        else:
-            print("✗ 录音失败")
-            print(f"错误信息: {result.stderr if hasattr(result, 'stderr') else '未知错误'}")
+        batch = remote_batch()
+        ring = add_directory_step(batch, remote_path)
+        record_cmd = arecord_args() + ["-d", str(duration), remote_path]
+        stop = None
+        if control is not None:
+            record_cmd = stoppable_command(record_cmd, remote_path + ".pid")
+            stop = remote_stopper(run_stop_command, remote_path + ".pid")
+        batch.add(record_cmd, name="record")
+        if local_path:
+            batch.add(fetch_command(remote_path), name="fetch")
+        if stop is not None:
+            control.register(stop)
+        try:
+            result = batch.run()
+        finally:
+            if stop is not None:
+                control.unregister(stop)
+        if ring is not None:
+            ring.batch_prepared(result)
+        if result.failed:
+            report_batch_failure("录音", result)
             return False
+        if local_path:
+            size = save_output(result["fetch"], local_path)
+            print(f"✓ 已取回录音 {size} 字节: {local_path}")
+        stopped = " (已提前停止)" if control is not None and control.stopped else ""
+        print(f"✓ 录音完成{stopped} ({len(batch)}个远程步骤, 1次往返, {result.seconds:.2f}秒)")
+        return True
     except Exception as e:
         print(f"✗ 录音失败: {e}")
         return False
 
+def record_remote_stream(local_path, duration=5, on_frame=None, processed_path=None):
+    """流式录音：远程arecord输出原始PCM，本地边收边写入local_path
+
+    每收到一帧（np.int16数组）调用on_frame(frame)，降噪、VAD等可以在录音过程中进行。
+    给出processed_path时边录边处理，之后process_audio_local不再处理整段录音。
+    """
+    print(f"开始远程流式录音 ({duration}秒)...")
+    if not ssh_supervisor:
+        if not init_ssh_connection():
+            return False
+    try:
+        stream_record(duration, local_path, pool=ssh_supervisor, on_frame=on_frame,
+                      processed_path=processed_path)
+        return True
+    except Exception as e:
+        print(f"✗ 流式录音失败: {e}")
+        return False
+
+def record_remote_vad(local_path, max_duration=None, on_frame=None, control=None, processed_path=None):
+    """流式录音，VAD检测到说完后立即结束（最长max_duration秒），录音写入local_path
+
+    返回端点检测结果（reason/speech/duration等），VAD不可用或录音失败时返回None。
+    control.stop()会提前结束录音，此时reason为"stopped"。直接流式录音时给出processed_path
+    会边录边处理（gRPC、常驻录音时仍在录音结束后处理）。
+    """
+    print(f"开始远程录音（说完自动停止，最长{max_duration or '默认'}秒）...")
+    if not ssh_supervisor:
+        if not init_ssh_connection():
+            return None
+    try:
+        if SOUND_GRPC_CONFIG["enabled"]:
+            # 板子上运行SoundService时录音走gRPC长连接
+            return record_grpc_vad(local_path, max_duration=max_duration, control=control)
+        if use_capture_daemon():
+            # 常驻录音占用着录音设备：从环形缓冲截取（带pre-roll，不会丢掉开头）
+            return record_with_preroll(local_path, pool=ssh_supervisor, duration=max_duration,
+                                       control=control)
+        return record_until_silence(local_path, pool=ssh_supervisor, max_duration=max_duration,
+                                    on_frame=on_frame, control=control, processed_path=processed_path)
+    except Exception as e:
+        print(f"✗ VAD录音失败: {e}")
+        return None
+
+def create_duplex_session(on_utterance=None):
+    """创建全双工对话会话（常驻录音 + 可打断的流式播放），不可用时返回None"""
+    if not ssh_supervisor:
+        if not init_ssh_connection():
+            return None
+    try:
+        return DuplexSession(ssh_supervisor, on_utterance=on_utterance,
+                             playback_format=audio_formats()["playback"])
+    except Exception as e:
+        print(f"✗ 全双工对话不可用: {e}")
+        return None
+
 def process_audio_local(remote_raw, local_raw, local_processed):
     """处理音频：下载、降噪、标准化"""
     print("处理音频...")
     
-    # 下载原始录音
-    if not transfer_from_remote_base64(remote_raw, local_raw):
-        return False
+    # 下载原始录音（已由record_remote随录音一起取回时跳过，否则优先流式传输）
+    if os.path.exists(local_raw):
+        print(f"✓ 录音已在本地: {local_raw}")
+    elif not (PARAMIKO_AVAILABLE and transfer_from_remote_stream(remote_raw, local_raw)):
+        if not transfer_from_remote_base64(remote_raw, local_raw):
+            return False
     
-    # 使用FFmpeg处理音频
+    # 降噪、标准化、放大（进程内处理，参数见AUDIO_PROCESS_PARAMS）；流式录音时已边录边处理
+    if is_processed(local_raw, local_processed):
+        print(f"✓ 录音时已处理: {local_processed}")
+        return True
     try:
-        ffmpeg_cmd = [
-            "ffmpeg", "-y", "-i", local_raw,
-            "-af", "afftdn=nr=12:nt=w, dynaudnorm=f=500:g=15, volume=1000.0",
-            local_processed
-        ]
-        result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"FFmpeg错误: {result.stderr}")
+        if not process_audio_file(local_raw, local_processed):
             return False
         
         print("✓ 音频处理完成")
@@ -281,20 +518,42 @@ def process_audio_local(remote_raw, local_raw, local_processed):
         print(f"✗ 音频处理失败: {e}")
         return False
 
-def play_remote_audio(local_wav_path, remote_wav_path):
-    """播放音频：上传并在远程播放"""
+def play_remote_audio_cached(local_wav_path, alias=None):
+    """通过远程音频缓存播放：内容已在板子上时跳过上传，失败时返回False"""
+    if not PARAMIKO_AVAILABLE:
+        return False
+    try:
+        cache = get_audio_cache(REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD, REMOTE_PORT)
+        if cache is None:
+            return False
+        if cache.play(local_wav_path, alias=alias):
+            print("✓ 音频播放完成")
+            return True
+    except Exception as e:
+        print(f"⚠ 缓存播放失败，改为直接上传播放: {e}")
+    return False
+
+def play_remote_audio(local_wav_path, remote_wav_path, alias=None):
+    """播放音频：优先通过远程缓存播放，否则上传到remote_wav_path后在远程播放"""
     print("播放音频...")
     
-    # 上传音频文件（优先使用SCP）
-    if not transfer_to_remote_scp(local_wav_path, remote_wav_path):
-        return False
+    if play_remote_audio_cached(local_wav_path, alias=alias):
+        return True
+    
+    # 准备目录、上传和播放在一次远程执行中完成
+    try:
+        return upload_and_play(local_wav_path, remote_wav_path)
+    except Exception as e:
+        print(f"⚠ 批处理播放不可用，改为分步上传播放: {e}")
+    
+    # 上传音频文件（优先流式传输，其次SCP，最后base64）
+    if not (PARAMIKO_AVAILABLE and transfer_to_remote_stream(local_wav_path, remote_wav_path)):
+        if not transfer_to_remote_scp(local_wav_path, remote_wav_path):
+            return False
     
     # 远程播放
     try:
-        result = run_ssh_command([
-            "aplay", "-D", "hw:1,0", "-f", "S16_LE", 
-            "-r", "16000", "-c", "1", remote_wav_path
-        ])
+        result = run_ssh_command(aplay_args() + [remote_wav_path])
         
         if result.returncode == 0:
             print("✓ 音频播放完成")
@@ -306,6 +565,23 @@ def play_remote_audio(local_wav_path, remote_wav_path):
         print(f"✗ 播放失败: {e}")
         return False
 
+def upload_and_play(local_wav_path, remote_wav_path):
+    """把本地音频写入remote_wav_path并播放，所有远程步骤合并为一次执行"""
+    with open(local_wav_path, "rb") as f:
+        data = f.read()
+    batch = remote_batch()
+    ring = add_directory_step(batch, remote_wav_path)
+    add_upload(batch, remote_wav_path, data)
+    batch.add(aplay_args() + [remote_wav_path], name="play")
+    result = batch.run()
+    if ring is not None:
+        ring.batch_prepared(result)
+    if result.failed:
+        report_batch_failure("音频播放", result)
+        return False
+    print(f"✓ 音频播放完成 (上传 {len(data)} 字节, 1次往返, {result.seconds:.2f}秒)")
+    return True
+
 def perform_speech_recognition(audio_file):
     """执行语音识别并输出结果"""
     try:
@@ -415,11 +691,11 @@ def main():
                     local_raw = os.path.join(local_record_dir, f"test_raw_{timestamp}.wav")
                     local_processed = os.path.join(local_record_dir, f"test_{timestamp}.wav")
                     local_response = os.path.join(local_record_dir, f"response_{timestamp}.wav")
-                    remote_raw = f"~/record/test_raw_{timestamp}.wav"
-                    remote_response = f"~/record/response_{timestamp}.wav"
+                    remote_raw = remote_record_path(f"test_raw_{timestamp}.wav", REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD, REMOTE_PORT)
+                    remote_response = remote_record_path(f"response_{timestamp}.wav", REMOTE_HOST, REMOTE_USER, REMOTE_PASSWORD, REMOTE_PORT)
                     
-                    # 步骤1: 远程录音
-                    if not record_remote(remote_raw):
+                    # 步骤1: 远程录音（同时取回录音文件）
+                    if not record_remote(remote_raw, local_path=local_raw):
                         continue
                     
                     # 步骤2: 处理音频
@@ -0,0 +1,938 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程内音频处理（降噪、动态标准化、放大）
+原来每段录音都要启动一次ffmpeg：
+
+    ffmpeg -i raw.wav -af "afftdn=nr=12:nt=w, dynaudnorm=f=500:g=15, volume=1000.0" out.wav
+
+这里用NumPy在内存中完成同样的处理，参数仍然是config.py中AUDIO_PROCESS_PARAMS的ffmpeg滤镜写法：
+
+    afftdn      频域降噪：短时傅里叶变换，按白噪声底噪（nf，默认-50dB）估计各频点信噪比，
+                维纳增益，最多衰减nr分贝
+    dynaudnorm  动态标准化：按f毫秒分帧取峰值增益（最大maxgain倍，erf软限制），
+                g帧最小值滤波 + 高斯平滑，帧内线性过渡
+    volume      固定增益，转16位时削顶
+    agc         自动增益（ffmpeg没有这个滤镜）：按20ms分块测量电平，整段的响度调到target dBFS，
+                再软限幅到limit dBFS以下，不会削顶；统计见 AudioProcessor.metrics
+
+    processor = AudioProcessor()
+    out = processor.process(audio, 16000)             # -1~1的float，单声道或 (采样数, 声道数)
+    process_audio_file("test_raw.wav", "test.wav")    # 失败时返回False
+
+录音过程中边录边处理用 StreamProcessor（任意长度的块进、等长的块出，固定延迟）：
+
+    processor = StreamProcessor(16000)
+    out = processor.process(frame)      # 输出比输入晚processor.latency个采样
+    ProcessedWavWriter(path, 16000)     # 边录边处理，结束时写出WAV（已去掉延迟）
+
+与ffmpeg的差异：afftdn的输出整体延迟半个窗长（16kHz时400个采样），这里没有延迟；降噪的衰减曲线
+按ffmpeg实测标定，逐采样不完全相同。对照测试见 compare_ffmpeg.py。
+滤镜参数超出这里支持的范围、或WAV格式读不了时，process_audio_file() 自动改用ffmpeg
+（经ffmpeg_pool.py的进程池，PCM走管道）。
+"""
+
+import math
+import os
+import subprocess
+import wave
+
+import numpy as np
+
+try:
+    from gui_utils.config import AUDIO_PROCESS_PARAMS, AUDIO_STREAM_CONFIG
+    from gui_utils.audio_format import read_wav
+    from gui_utils.ffmpeg_pool import get_ffmpeg_pool, FFmpegError, FFMPEG_POOL_CONFIG
+except ImportError:
+    AUDIO_PROCESS_PARAMS = {
+        "engine": "numpy",
+        "denoise": "afftdn=nr=12:nt=w",
+        "normalize": "dynaudnorm=f=500:g=15",
+        "amplify": "agc=target=-20:limit=-1"
+    }
+    AUDIO_STREAM_CONFIG = {
+        "enabled": True,
+        "frame_ms": 100,
+        "lookahead_frames": 1
+    }
+    from audio_format import read_wav
+    from ffmpeg_pool import get_ffmpeg_pool, FFmpegError, FFMPEG_POOL_CONFIG
+
+# 滤镜在处理链中的顺序
+CHAIN = ["denoise", "normalize", "amplify"]
+
+# 降噪的短时傅里叶变换：50ms汉宁窗，75%重叠（与afftdn相同的窗长）
+DENOISE_WINDOW_MS = 50
+DENOISE_OVERLAP = 4
+
+# 信噪比估计先在频率上平滑5个频点、时间上平滑3帧，减少“音乐噪声”
+SMOOTH_BINS = 5
+SMOOTH_FRAMES = 3
+
+# 维纳增益 snr / (snr + k) 中的k，按ffmpeg afftdn对白噪声和正弦的实测衰减标定
+WIENER_OFFSET = 2.7
+
+# 自动增益（agc）按20ms分块测量电平；低于-60dBFS的块当作静音，比平均电平低20dB的块
+# （停顿、呼吸声）也不计入响度（与EBU R128的门限做法相同）
+AGC_BLOCK_MS = 20
+AGC_GATE_DB = -60
+AGC_RELATIVE_GATE_DB = 20
+
+# 流式自动增益的响度估计窗口（秒），更早的语音逐渐淡出
+AGC_WINDOW_SECONDS = 10
+
+# 原始录音中削顶采样超过该比例时提示麦克风增益过高
+INPUT_CLIPPING_WARNING = 0.001
+
+# 选项的ffmpeg全名和缩写
+_DENOISE_OPTIONS = {"nr": "noise_reduction", "nf": "noise_floor", "nt": "noise_type"}
+_NORMALIZE_OPTIONS = {"f": "framelen", "g": "gausssize", "p": "peak", "m": "maxgain", "n": "coupling"}
+_AGC_OPTIONS = {"t": "target", "l": "limit", "k": "knee", "m": "maxgain"}
+
+# ffmpeg没有对应滤镜、只能在进程内完成的步骤（engine为"ffmpeg"时在ffmpeg处理之后完成）
+NUMPY_ONLY = {"agc"}
+
+
+def parse_filter(spec):
+    """解析ffmpeg滤镜写法，"afftdn=nr=12:nt=w" -> ("afftdn", {"nr": "12", "nt": "w"})
+
+    第一个选项没有写名字时（"volume=1000.0"）以滤镜名作为选项名。
+    """
+    name, _, args = spec.strip().partition("=")
+    options = {}
+    for item in filter(None, args.replace("\\:", ":").split(":")):
+        key, sep, value = item.partition("=")
+        if not sep:
+            key, value = name, key
+        options[key.strip()] = value.strip()
+    return name.strip(), options
+
+
+def _options(options, aliases, name):
+    """把缩写统一成全名，遇到不支持的选项抛出ValueError"""
+    result = {}
+    for key, value in options.items():
+        full = aliases.get(key, key)
+        if full not in aliases.values():
+            raise ValueError(f"{name}不支持选项: {key}")
+        result[full] = value
+    return result
+
+
+def _stft(x, size, hop, window=None):
+    """x为 (声道数, 采样数)，返回 (频谱, 窗)，频谱形状 (声道数, 帧数, size//2+1)"""
+    if window is None:
+        window = np.hanning(size + 1)[:-1].astype(x.dtype)
+    frames = np.lib.stride_tricks.sliding_window_view(x, size, axis=-1)[:, ::hop]
+    return np.fft.rfft(frames * window, axis=-1), window
+
+
+def _overlap_add(frames, hop):
+    """frames为 (声道数, 帧数, size)，size是hop的整数倍"""
+    channels, count, size = frames.shape
+    parts = size // hop
+    blocks = frames.reshape(channels, count, parts, hop)
+    out = np.zeros((channels, count + parts - 1, hop), dtype=frames.dtype)
+    for j in range(parts):
+        out[:, j:j + count] += blocks[:, :, j]
+    return out.reshape(channels, -1)
+
+
+def _smooth(values, width, axis):
+    """沿axis做宽度为width的滑动平均，边缘按最近值延伸"""
+    if width <= 1:
+        return values
+    half = width // 2
+    v = np.moveaxis(values, axis, -1)
+    padded = np.concatenate([np.repeat(v[..., :1], half, axis=-1), v,
+                             np.repeat(v[..., -1:], half, axis=-1)], axis=-1)
+    length = v.shape[-1]
+    total = padded[..., :length].copy()
+    for i in range(1, width):
+        total += padded[..., i:i + length]
+    return np.moveaxis(total / width, -1, axis)
+
+
+def denoise_frame(sample_rate):
+    """降噪的 (窗长, 帧移)，窗长取帧移的整数倍"""
+    size = sample_rate * DENOISE_WINDOW_MS // 1000
+    size -= size % DENOISE_OVERLAP
+    return size, size // DENOISE_OVERLAP
+
+
+def _denoise_gain(power, noise, noise_reduction):
+    """由平滑后的功率谱计算维纳增益"""
+    snr = power / noise
+    return np.maximum(np.float32(10 ** (-noise_reduction / 20)), snr / (snr + np.float32(WIENER_OFFSET)))
+
+
+def denoise(audio, sample_rate, noise_reduction=12.0, noise_floor=-50.0):
+    """频域降噪（对应afftdn=nr=..:nf=..:nt=w），audio为 (声道数, 采样数)，返回同形状float32"""
+    size, hop = denoise_frame(sample_rate)
+    n = audio.shape[-1]
+    # 单精度计算（NumPy 2的FFT支持float32，误差远小于16位量化）
+    padded = np.pad(audio.astype(np.float32), ((0, 0), (size, size + hop - n % hop)))
+    spectrum, window = _stft(padded, size, hop)
+
+    power = spectrum.real ** 2 + spectrum.imag ** 2
+    power = _smooth(_smooth(power, SMOOTH_BINS, axis=-1), SMOOTH_FRAMES, axis=1)
+    # 白噪声底噪在每个频点上的功率（噪声总功率乘以窗的能量）
+    noise = 10 ** (noise_floor / 10) * float(window @ window)
+    gain = _denoise_gain(power, noise, noise_reduction)
+
+    frames = np.fft.irfft(spectrum * gain, size, axis=-1) * window
+    # 汉宁窗75%重叠时分析窗乘合成窗的叠加为常数1.5
+    out = _overlap_add(frames, hop) / (window @ window / hop)
+    return out[:, size:size + n]
+
+
+def _gaussian(gausssize):
+    """dynaudnorm的高斯权重（中心在gausssize//2）"""
+    half = gausssize // 2
+    sigma = (gausssize / 2.0 - 1.0) / 3.0 + 1.0 / 3.0
+    weights = np.exp(-((np.arange(gausssize) - half) ** 2) / (2 * sigma ** 2))
+    return weights / weights.sum()
+
+
+def _bound(limit, value):
+    """dynaudnorm的软限制：erf(sqrt(pi)/2 * value/limit) * limit，value很小时约等于value"""
+    return math.erf(0.886226925452758 * (value / limit)) * limit
+
+
+def _frame_gain(frame_peak, peak, maxgain):
+    return _bound(maxgain, peak / frame_peak) if frame_peak > 0 else maxgain
+
+
+def frame_size(sample_rate, frame_ms):
+    """dynaudnorm的帧长（采样数，取偶数）"""
+    size = int(round(sample_rate * frame_ms / 1000))
+    return size + size % 2
+
+
+def normalize_gains(audio, sample_rate, framelen=500, gausssize=31, peak=0.95, maxgain=10.0):
+    """计算dynaudnorm每帧的目标增益，audio为 (声道数, 采样数)，返回 (帧长, 平滑后的增益)"""
+    size = frame_size(sample_rate, framelen)
+    count = -(-audio.shape[-1] // size)
+    padded = np.pad(np.abs(audio), ((0, 0), (0, count * size - audio.shape[-1])))
+    peaks = padded.reshape(audio.shape[0], count, size).max(axis=(0, 2))
+    gains = np.array([_frame_gain(p, peak, maxgain) for p in peaks])
+
+    # 开头用1.0补足半个窗口；结尾ffmpeg用接近peak的信号冲刷，增益为bound(maxgain, 1)
+    half = gausssize // 2
+    history = np.concatenate([np.ones(half), gains, np.full(2 * half, _bound(maxgain, 1.0))])
+    windows = np.lib.stride_tricks.sliding_window_view(history, gausssize)
+    minimum = windows.min(axis=1)
+    prefill = np.minimum.accumulate(np.minimum(1.0, history[half + 1:2 * half + 1]))
+    minimum = np.concatenate([prefill, minimum])
+
+    smoothed = np.lib.stride_tricks.sliding_window_view(minimum, gausssize) @ _gaussian(gausssize)
+    return size, smoothed[:count]
+
+
+def normalize(audio, sample_rate, framelen=500, gausssize=31, peak=0.95, maxgain=10.0):
+    """动态标准化（对应dynaudnorm，声道耦合），audio为 (声道数, 采样数)"""
+    n = audio.shape[-1]
+    if n == 0:
+        return audio
+    size, gains = normalize_gains(audio, sample_rate, framelen, gausssize, peak, maxgain)
+    # 帧内从上一帧的增益线性过渡到本帧的增益（最后一帧按实际长度过渡）
+    previous = np.concatenate([[1.0], gains[:-1]])
+    lengths = np.full(len(gains), size)
+    lengths[-1] = n - size * (len(gains) - 1)
+    position = np.arange(n) - np.repeat(np.arange(len(gains)) * size, lengths)
+    fade = (position + 1.0) / np.repeat(lengths, lengths)
+    curve = np.repeat(previous, lengths) * (1 - fade) + np.repeat(gains, lengths) * fade
+    return audio * curve
+
+
+def parse_volume(value):
+    """volume滤镜的值：倍数（"1000.0"）或分贝（"20dB"）"""
+    value = value.strip()
+    if value.lower().endswith("db"):
+        return 10 ** (float(value[:-2]) / 20)
+    return float(value)
+
+
+def amplify(audio, sample_rate, gain=1.0):
+    """固定增益（对应volume）"""
+    return audio * gain
+
+
+def block_levels(audio, sample_rate, block_ms=AGC_BLOCK_MS):
+    """按block_ms分块的 (均方值, 峰值)，audio为 (声道数, 采样数)，各声道合并计算"""
+    size = max(1, sample_rate * block_ms // 1000)
+    channels, n = audio.shape
+    count = -(-n // size)
+    blocks = np.pad(audio, ((0, 0), (0, count * size - n))).reshape(channels, count, size)
+    lengths = np.full(count, size * channels)
+    if count:
+        lengths[-1] = (n - size * (count - 1)) * channels
+    energy = np.einsum("cbs,cbs->b", blocks, blocks) / lengths
+    return energy, np.abs(blocks).max(axis=(0, 2))
+
+
+def loudness(energy):
+    """门限后的平均电平（dBFS，RMS），先去掉静音块，再去掉比平均低AGC_RELATIVE_GATE_DB的块；
+    全是静音时返回None"""
+    active = energy[energy > 10 ** (AGC_GATE_DB / 10)]
+    if not active.size:
+        return None
+    active = active[active > active.mean() * 10 ** (-AGC_RELATIVE_GATE_DB / 10)]
+    return float(10 * np.log10(active.mean()))
+
+
+def soft_limit(audio, limit=0.89, knee=0.45):
+    """软限幅：绝对值不超过knee的采样不变，超过的部分用tanh平滑压缩，输出绝对值始终小于limit"""
+    magnitude = np.abs(audio)
+    over = magnitude > knee
+    if not over.any():
+        return audio
+    span = limit - knee
+    out = audio.copy()
+    out[over] = np.sign(audio[over]) * (knee + span * np.tanh((magnitude[over] - knee) / span))
+    return out
+
+
+def _limiter_levels(limit_db, knee_db):
+    limit = 10 ** (limit_db / 20)
+    return limit, limit * 10 ** (-knee_db / 20)
+
+
+def auto_gain(audio, sample_rate, target=-20.0, limit=-1.0, knee=6.0, maxgain=30.0, stats=None):
+    """自动增益（agc）：整段响度调到target dBFS（增益最多±maxgain分贝），再软限幅到limit dBFS以下
+
+    限幅从limit以下knee分贝处开始起作用。给出stats字典时写入本段的增益和削顶统计。
+    """
+    energy, peaks = block_levels(audio, sample_rate)
+    level = loudness(energy)
+    gain_db = 0.0 if level is None else float(np.clip(target - level, -maxgain, maxgain))
+    scaled = audio * 10 ** (gain_db / 20)
+    ceiling, threshold = _limiter_levels(limit, knee)
+    magnitude = np.abs(scaled)
+    if stats is not None:
+        total = max(1, magnitude.size)
+        stats.update({
+            "gain_db": round(gain_db, 2),
+            "loudness_db": None if level is None else round(level, 2),
+            # 不限幅时超出16位满幅（会削顶）的采样比例
+            "clipping": float(np.count_nonzero(magnitude >= 1.0)) / total,
+            "limited": float(np.count_nonzero(magnitude > threshold)) / total
+        })
+    return soft_limit(scaled, ceiling, threshold)
+
+
+def clipping_ratio(audio):
+    """达到16位满幅（已削顶）的采样比例，audio为-1~1的float"""
+    audio = np.asarray(audio)
+    return float(np.count_nonzero(np.abs(audio) >= 32767 / 32768.0)) / max(1, audio.size)
+
+
+def parse_chain(params=None):
+    """把AUDIO_PROCESS_PARAMS解析成 [(滤镜名, 参数)]，不支持的滤镜或选项抛出ValueError"""
+    params = params or AUDIO_PROCESS_PARAMS
+    chain = []
+    for key in CHAIN:
+        if params.get(key):
+            chain.append(_filter_kwargs(*parse_filter(params[key])))
+    return chain
+
+
+def _filter_kwargs(name, options):
+    if name == "afftdn":
+        options = _options(options, _DENOISE_OPTIONS, name)
+        if options.get("noise_type", "w") not in ("w", "white", "0"):
+            raise ValueError(f"afftdn只支持白噪声模型: nt={options['noise_type']}")
+        return name, {"noise_reduction": float(options.get("noise_reduction", 12)),
+                      "noise_floor": float(options.get("noise_floor", -50))}
+    if name == "dynaudnorm":
+        options = _options(options, _NORMALIZE_OPTIONS, name)
+        if options.pop("coupling", "1") not in ("1", "true"):
+            raise ValueError("dynaudnorm只支持声道耦合")
+        kwargs = {"framelen": int(options.get("framelen", 500)),
+                  "gausssize": int(options.get("gausssize", 31)),
+                  "peak": float(options.get("peak", 0.95)),
+                  "maxgain": float(options.get("maxgain", 10))}
+        if kwargs["gausssize"] % 2 == 0:
+            kwargs["gausssize"] += 1
+        return name, kwargs
+    if name == "volume":
+        options = _options(options, {"volume": "volume"}, name)
+        return name, {"gain": parse_volume(options.get("volume", "1.0"))}
+    if name == "agc":
+        options = _options(options, _AGC_OPTIONS, name)
+        kwargs = {"target": float(options.get("target", -20)), "limit": float(options.get("limit", -1)),
+                  "knee": float(options.get("knee", 6)), "maxgain": float(options.get("maxgain", 30))}
+        if kwargs["limit"] > 0 or kwargs["knee"] <= 0:
+            raise ValueError(f"agc参数超出范围: limit={kwargs['limit']} knee={kwargs['knee']}")
+        return name, kwargs
+    raise ValueError(f"不支持的滤镜: {name}")
+
+
+# 滤镜名 -> 整段处理函数
+_FILTERS = {"afftdn": denoise, "dynaudnorm": normalize, "volume": amplify, "agc": auto_gain}
+
+
+def _run_steps(x, sample_rate, steps, metrics):
+    """依次执行 [(滤镜名, 参数)]，x为 (声道数, 采样数)，agc的统计写入metrics"""
+    for name, kwargs in steps:
+        if name == "agc":
+            kwargs = dict(kwargs, stats=metrics)
+        x = _FILTERS[name](x, sample_rate, **kwargs)
+    return x
+
+
+class AudioProcessor:
+    """按AUDIO_PROCESS_PARAMS组装的处理链，构造时解析参数，不支持的滤镜或选项抛出ValueError
+
+    metrics是最近一次处理的统计：原始录音的削顶比例（input_clipping），有agc时还有
+    增益（gain_db）、响度（loudness_db）、不限幅时会削顶的比例（clipping）和被限幅的比例（limited）。
+    """
+
+    def __init__(self, params=None):
+        self.steps = parse_chain(params)
+        self.metrics = {}
+
+    def __repr__(self):
+        return f"AudioProcessor({', '.join(name for name, _ in self.steps)})"
+
+    def process(self, audio, sample_rate):
+        """处理-1~1的float音频（单声道一维，或 (采样数, 声道数)），返回同形状的float32（未削顶）"""
+        audio = np.asarray(audio)
+        x = np.atleast_2d(audio.astype(np.float64).T)
+        self.metrics = {"input_clipping": clipping_ratio(x)}
+        x = _run_steps(x, sample_rate, self.steps, self.metrics)
+        return x.T.reshape(audio.shape).astype(np.float32)
+
+    def process_file(self, src, dst):
+        """处理WAV文件，输出16位PCM WAV（采样率、声道数不变），返回处理的秒数"""
+        audio, rate = read_wav(src, mono=False)
+        out = self.process(audio, rate)
+        write_pcm16(dst, out, rate)
+        return len(out) / rate
+
+
+# =============================================================================
+# 流式处理
+# =============================================================================
+
+class _DelayLine:
+    """按固定延迟输出：先输出latency个零，之后依次输出处理完的采样"""
+
+    def __init__(self, channels, latency):
+        self._queue = np.zeros((channels, latency), dtype=np.float32)
+
+    def push(self, samples):
+        self._queue = np.concatenate([self._queue, samples.astype(np.float32, copy=False)], axis=1)
+
+    def pop(self, n):
+        out, self._queue = self._queue[:, :n], self._queue[:, n:]
+        return out
+
+
+class StreamDenoiser:
+    """denoise() 的流式版本：任意长度的块进、等长的块出，输出是处理结果整体延迟latency个采样
+
+    除结尾外与整段处理的结果相同。时间平滑要等到下一帧，延迟为窗长加帧移减一（16kHz时999个采样）。
+    块的形状为 (声道数, 采样数)。
+    """
+
+    def __init__(self, sample_rate, channels=1, noise_reduction=12.0, noise_floor=-50.0):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.noise_reduction = noise_reduction
+        self.size, self.hop = denoise_frame(sample_rate)
+        self._window = np.hanning(self.size + 1)[:-1].astype(np.float32)
+        self._noise = 10 ** (noise_floor / 10) * float(self._window @ self._window)
+        self.latency = self.size + self.hop - 1
+        self.reset()
+
+    def __repr__(self):
+        return f"StreamDenoiser({self.sample_rate}Hz, latency={self.latency})"
+
+    def reset(self):
+        # 开头补一个窗长的零（与整段处理相同），这部分输出丢弃
+        self._input = np.zeros((self.channels, self.size), dtype=np.float32)
+        self._discard = self.size
+        self._history = None
+        self._held_spectrum = self._held_power = None
+        self._tail = np.zeros((self.channels, self.size - self.hop), dtype=np.float32)
+        self._output = _DelayLine(self.channels, self.latency)
+
+    def process(self, block):
+        self._input = np.concatenate([self._input, block.astype(np.float32, copy=False)], axis=1)
+        count = (self._input.shape[1] - self.size) // self.hop + 1
+        if count > 0:
+            spectrum, _ = _stft(self._input[:, :(count - 1) * self.hop + self.size], self.size, self.hop,
+                                self._window)
+            self._input = self._input[:, count * self.hop:]
+            self._frames(spectrum)
+        return self._output.pop(block.shape[1])
+
+    def _frames(self, spectrum):
+        power = _smooth(spectrum.real ** 2 + spectrum.imag ** 2, SMOOTH_BINS, axis=-1)
+        half = SMOOTH_FRAMES // 2
+        if self._history is None:
+            # 第一帧之前按第一帧延伸（与整段处理的边缘处理相同）
+            self._history = np.repeat(power[:, :1], half, axis=1)
+            self._held_spectrum, self._held_power = spectrum[:, :0], power[:, :0]
+        spectrum = np.concatenate([self._held_spectrum, spectrum], axis=1)
+        power = np.concatenate([self._held_power, power], axis=1)
+        # 最后half帧要等后面的帧到了才能做时间平滑
+        ready = power.shape[1] - half
+        self._held_spectrum, self._held_power = spectrum[:, ready:], power[:, ready:]
+        if ready <= 0:
+            return
+        full = np.concatenate([self._history, power], axis=1)
+        smoothed = sum(full[:, i:i + ready] for i in range(SMOOTH_FRAMES)) / SMOOTH_FRAMES
+        self._history = full[:, ready:ready + half]
+
+        gain = _denoise_gain(smoothed, self._noise, self.noise_reduction)
+        frames = np.fft.irfft(spectrum[:, :ready] * gain, self.size, axis=-1) * self._window
+        out = _overlap_add(frames, self.hop)
+        out[:, :self.size - self.hop] += self._tail
+        self._tail = out[:, ready * self.hop:]
+        done = out[:, :ready * self.hop] / (self._window @ self._window / self.hop)
+        if self._discard:
+            skip = min(self._discard, done.shape[1])
+            done, self._discard = done[:, skip:], self._discard - skip
+        self._output.push(done)
+
+
+class StreamNormalizer:
+    """dynaudnorm的流式版本，只向后看lookahead帧，输出整体延迟 (1 + lookahead) 帧
+
+    整段处理的dynaudnorm要向后看整个高斯窗（500ms帧、g=15时约7秒），无法用于实时处理。这里：
+    帧长可以缩短为frame_ms（高斯窗的帧数按比例增加，平滑的时间跨度不变）；最小值滤波覆盖过去
+    半个窗口和后面lookahead帧；高斯平滑只用过去和当前的值，结果不超过最小值滤波的结果，
+    所以增益可以立即降低、缓慢升高，lookahead至少为1时输出不会超过peak。
+    """
+
+    def __init__(self, sample_rate, channels=1, framelen=500, gausssize=31, peak=0.95, maxgain=10.0,
+                 frame_ms=None, lookahead=None):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.peak = peak
+        self.maxgain = maxgain
+        frame_ms = frame_ms or AUDIO_STREAM_CONFIG["frame_ms"] or framelen
+        self.lookahead = AUDIO_STREAM_CONFIG["lookahead_frames"] if lookahead is None else lookahead
+        gausssize = max(3, int(round(gausssize * framelen / frame_ms)))
+        gausssize += 1 - gausssize % 2
+        self.half = gausssize // 2
+        self.size = frame_size(sample_rate, frame_ms)
+        weights = _gaussian(gausssize)[:self.half + 1]
+        self._weights = weights / weights.sum()
+        self.latency = (1 + self.lookahead) * self.size
+        self.reset()
+
+    def __repr__(self):
+        return (f"StreamNormalizer(frame={self.size}, lookahead={self.lookahead}, "
+                f"latency={self.latency})")
+
+    def reset(self):
+        self._input = np.zeros((self.channels, 0), dtype=np.float32)
+        self._pending = []
+        # 和dynaudnorm一样，开头的历史按增益1.0补足
+        self._gains = [1.0] * self.half
+        self._minimums = [1.0] * self.half
+        self._previous = 1.0
+        self._output = _DelayLine(self.channels, self.latency)
+
+    def process(self, block):
+        self._input = np.concatenate([self._input, block.astype(np.float32, copy=False)], axis=1)
+        while self._input.shape[1] >= self.size:
+            frame, self._input = self._input[:, :self.size], self._input[:, self.size:]
+            self._gains.append(_frame_gain(float(np.abs(frame).max()), self.peak, self.maxgain))
+            self._pending.append(frame)
+            if len(self._pending) > self.lookahead:
+                self._output.push(self._amplify(self._pending.pop(0)))
+        return self._output.pop(block.shape[1])
+
+    def _amplify(self, frame):
+        # _gains: 过去half帧、当前帧、后面lookahead帧
+        minimum = min(self._gains)
+        self._minimums.append(minimum)
+        gain = min(float(np.dot(self._weights, self._minimums)), minimum)
+        del self._gains[0], self._minimums[0]
+        fade = np.arange(1, self.size + 1, dtype=np.float32) / self.size
+        curve = self._previous * (1 - fade) + gain * fade
+        self._previous = gain
+        return frame * curve
+
+
+class StreamGain:
+    """固定增益（对应volume），没有延迟"""
+
+    latency = 0
+
+    def __init__(self, sample_rate=None, channels=1, gain=1.0):
+        self.gain = np.float32(gain)
+
+    def reset(self):
+        pass
+
+    def process(self, block):
+        return block * self.gain
+
+
+class StreamAutoGain:
+    """auto_gain() 的流式版本，输出整体延迟一个分块（20ms）
+
+    响度按已录到的语音估计（最近约AGC_WINDOW_SECONDS秒，门限与整段处理相同），每块的增益
+    由上一块的增益线性过渡过来，还没有语音时增益为0dB。
+    """
+
+    def __init__(self, sample_rate, channels=1, target=-20.0, limit=-1.0, knee=6.0, maxgain=30.0):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.target = target
+        self.maxgain = maxgain
+        self.ceiling, self.threshold = _limiter_levels(limit, knee)
+        self.size = max(1, sample_rate * AGC_BLOCK_MS // 1000)
+        self.latency = self.size
+        self._blocks = max(1, AGC_WINDOW_SECONDS * 1000 // AGC_BLOCK_MS)
+        self.reset()
+
+    def __repr__(self):
+        return f"StreamAutoGain(target={self.target}dB, latency={self.latency})"
+
+    def reset(self):
+        self._input = np.zeros((self.channels, 0), dtype=np.float32)
+        self._energy = None
+        self._count = 0
+        self._gain = 1.0
+        self._samples = self._clipped = self._limited = 0
+        self._output = _DelayLine(self.channels, self.latency)
+
+    @property
+    def gain_db(self):
+        return float(20 * np.log10(self._gain))
+
+    def process(self, block):
+        self._input = np.concatenate([self._input, block.astype(np.float32, copy=False)], axis=1)
+        count = self._input.shape[1] // self.size
+        if count:
+            frames = self._input[:, :count * self.size]
+            self._input = self._input[:, count * self.size:]
+            energy, _ = block_levels(frames, self.sample_rate)
+            for i, e in enumerate(energy):
+                self._output.push(self._amplify(frames[:, i * self.size:(i + 1) * self.size], e))
+        return self._output.pop(block.shape[1])
+
+    def _amplify(self, frame, energy):
+        if energy > 10 ** (AGC_GATE_DB / 10) and (
+                self._energy is None or energy > self._energy * 10 ** (-AGC_RELATIVE_GATE_DB / 10)):
+            self._count = min(self._count + 1, self._blocks)
+            self._energy = energy if self._energy is None else self._energy + (energy - self._energy) / self._count
+        gain = self._gain
+        if self._energy is not None:
+            level = 10 * np.log10(self._energy)
+            gain = 10 ** (float(np.clip(self.target - level, -self.maxgain, self.maxgain)) / 20)
+        fade = np.arange(1, self.size + 1, dtype=np.float32) / self.size
+        scaled = frame * (self._gain * (1 - fade) + gain * fade)
+        self._gain = gain
+        magnitude = np.abs(scaled)
+        self._samples += magnitude.size
+        self._clipped += int(np.count_nonzero(magnitude >= 1.0))
+        self._limited += int(np.count_nonzero(magnitude > self.threshold))
+        return soft_limit(scaled, self.ceiling, self.threshold)
+
+    def stats(self):
+        total = max(1, self._samples)
+        return {
+            "gain_db": round(self.gain_db, 2),
+            "loudness_db": None if self._energy is None else round(float(10 * np.log10(self._energy)), 2),
+            "clipping": self._clipped / total,
+            "limited": self._limited / total
+        }
+
+
+# 滤镜名 -> 流式处理类
+_STREAM_FILTERS = {"afftdn": StreamDenoiser, "dynaudnorm": StreamNormalizer, "volume": StreamGain,
+                   "agc": StreamAutoGain}
+
+
+class StreamProcessor:
+    """AudioProcessor的流式版本：边录边处理，任意长度的块进、等长的块出
+
+    输出是处理结果整体延迟latency个采样（16kHz、默认参数时约0.28秒），录音结束后调用flush()
+    取回最后latency个采样。块为一维（单声道）或 (采样数, 声道数)；int16输入返回削顶后的int16，
+    float输入返回float32。
+
+        processor = StreamProcessor(16000)
+        for frame in capture:
+            out = processor.process(frame)
+        out = processor.flush()
+    """
+
+    def __init__(self, sample_rate=16000, channels=1, params=None, frame_ms=None, lookahead=None):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.stages = []
+        for name, kwargs in parse_chain(params):
+            if name == "dynaudnorm":
+                kwargs = dict(kwargs, frame_ms=frame_ms, lookahead=lookahead)
+            self.stages.append(_STREAM_FILTERS[name](sample_rate, channels, **kwargs))
+        self._dtype = np.float32
+        self._samples = self._clipped = 0
+
+    def __repr__(self):
+        return f"StreamProcessor({self.sample_rate}Hz, latency={self.latency})"
+
+    @property
+    def latency(self):
+        """总延迟（采样数）"""
+        return sum(stage.latency for stage in self.stages)
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+        self._samples = self._clipped = 0
+
+    @property
+    def metrics(self):
+        """与AudioProcessor.metrics相同的统计（到目前为止的录音）"""
+        metrics = {"input_clipping": self._clipped / max(1, self._samples)}
+        for stage in self.stages:
+            if isinstance(stage, StreamAutoGain):
+                metrics.update(stage.stats())
+        return metrics
+
+    def process(self, block):
+        samples = np.asarray(block)
+        x = samples.astype(np.float32) / 32768.0 if samples.dtype == np.int16 else samples.astype(np.float32)
+        self._samples += x.size
+        self._clipped += int(np.count_nonzero(np.abs(x) >= 32767 / 32768.0))
+        return self._run(samples, x)
+
+    def _run(self, samples, x):
+        self._dtype = samples.dtype
+        # 按声道数reshape：空块（延迟为0时的flush）也能得到 (声道数, 0)
+        x = x.reshape(len(x), self.channels).T
+        for stage in self.stages:
+            x = stage.process(x)
+        out = x.T.reshape(samples.shape)
+        return to_pcm16(out) if samples.dtype == np.int16 else out
+
+    def flush(self):
+        """送入latency个零，返回剩余的处理结果"""
+        shape = self.latency if self.channels == 1 else (self.latency, self.channels)
+        samples = np.zeros(shape, dtype=self._dtype)
+        return self._run(samples, samples.astype(np.float32))
+
+
+class ProcessedWavWriter:
+    """边录边处理，录音结束时写成16位WAV：去掉了处理延迟，与原始录音逐采样对齐
+
+    处理在write()时完成，close()只处理最后latency个采样并写文件。录音末尾的静音被截掉时
+    close(length)只保存前length个采样。close()之后metrics为处理统计（见AudioProcessor.metrics）。
+
+        writer = ProcessedWavWriter("test.wav", 16000)
+        for frame in capture:
+            writer.write(frame)
+        writer.close()
+    """
+
+    def __init__(self, path, sample_rate=16000, channels=1, params=None):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.processor = StreamProcessor(sample_rate, channels, params)
+        self.samples = 0
+        self.metrics = {}
+        self._chunks = []
+        self._closed = False
+
+    def write(self, frame):
+        frame = np.asarray(frame, dtype=np.int16)
+        self._chunks.append(self.processor.process(frame))
+        self.samples += len(frame)
+
+    def close(self, length=None):
+        """写出文件，返回保存的采样数"""
+        if self._closed:
+            return self.samples
+        self._closed = True
+        latency = self.processor.latency
+        out = np.concatenate(self._chunks + [self.processor.flush()])[latency:latency + self.samples]
+        if length is not None:
+            out = out[:length]
+        with wave.open(self.path, "wb") as wav:
+            wav.setnchannels(self.channels)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(np.ascontiguousarray(out).tobytes())
+        self.samples = len(out)
+        self.metrics = self.processor.metrics
+        report_metrics(self.metrics)
+        return self.samples
+
+
+def stream_writer(path, sample_rate=16000, channels=1, params=None):
+    """录音时边录边处理用的ProcessedWavWriter，path为空、流式处理关闭或参数不支持时返回None"""
+    params = params or AUDIO_PROCESS_PARAMS
+    if not path or not AUDIO_STREAM_CONFIG.get("enabled", True) or params.get("engine", "numpy") != "numpy":
+        return None
+    try:
+        return ProcessedWavWriter(path, sample_rate, channels, params)
+    except ValueError as e:
+        print(f"⚠ 无法边录边处理，录音结束后再处理: {e}")
+        return None
+
+
+def is_processed(raw_path, processed_path):
+    """processed_path已在录音时生成（不早于原始录音）"""
+    try:
+        return os.path.getmtime(processed_path) >= os.path.getmtime(raw_path)
+    except OSError:
+        return False
+
+
+def to_pcm16(audio):
+    """-1~1的float转int16（与ffmpeg相同：乘32768后取整并削顶）"""
+    return np.clip(np.rint(np.asarray(audio) * 32768.0), -32768, 32767).astype(np.int16)
+
+
+def write_pcm16(path, audio, sample_rate):
+    audio = np.asarray(audio)
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1 if audio.ndim == 1 else audio.shape[1])
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(to_pcm16(audio).tobytes())
+
+
+def ffmpeg_filter(params=None):
+    """同一组参数对应的ffmpeg -af 参数（不含NUMPY_ONLY中的步骤，见numpy_steps()）"""
+    params = params or AUDIO_PROCESS_PARAMS
+    return ", ".join(params[key] for key in CHAIN
+                     if params.get(key) and parse_filter(params[key])[0] not in NUMPY_ONLY)
+
+
+def numpy_steps(params=None):
+    """ffmpeg做不了、要在ffmpeg之后进程内完成的步骤 [(滤镜名, 参数)]"""
+    params = params or AUDIO_PROCESS_PARAMS
+    steps = []
+    for key in CHAIN:
+        if params.get(key):
+            name, options = parse_filter(params[key])
+            if name in NUMPY_ONLY:
+                steps.append(_filter_kwargs(name, options))
+    return steps
+
+
+def finish_ffmpeg(audio, sample_rate, params=None, metrics=None):
+    """对ffmpeg处理后的音频完成numpy_steps()，输入输出与AudioProcessor.process()相同"""
+    audio = np.asarray(audio)
+    x = np.atleast_2d(audio.astype(np.float64).T)
+    x = _run_steps(x, sample_rate, numpy_steps(params), {} if metrics is None else metrics)
+    return x.T.reshape(audio.shape).astype(np.float32)
+
+
+def finish_ffmpeg_file(path, params=None, metrics=None):
+    """对ffmpeg的输出文件完成numpy_steps()，文件读不了时保留ffmpeg的结果并返回False"""
+    try:
+        if not numpy_steps(params):
+            return True
+        audio, rate = read_wav(path, mono=False)
+    except (ValueError, wave.Error, EOFError) as e:
+        print(f"⚠ 无法在ffmpeg之后完成自动增益: {e}")
+        return False
+    write_pcm16(path, finish_ffmpeg(audio, rate, params, metrics), rate)
+    return True
+
+
+def ffmpeg_command(src, dst, params=None):
+    return ["ffmpeg", "-y", "-i", src, "-af", ffmpeg_filter(params), dst]
+
+
+def run_ffmpeg_pool(src, dst, params=None, metrics=None):
+    """经ffmpeg进程池处理（PCM走管道，不启动新进程、不读写中间文件），成功返回True
+
+    WAV读不了时返回None（改用run_ffmpeg()直接处理文件）。
+    """
+    try:
+        audio, rate = read_wav(src, mono=False)
+    except (ValueError, wave.Error, EOFError):
+        return None
+    audio_filter = ffmpeg_filter(params)
+    if audio_filter:
+        channels = 1 if audio.ndim == 1 else audio.shape[1]
+        try:
+            audio = get_ffmpeg_pool(audio_filter, rate, channels).process(audio)
+        except FFmpegError as e:
+            print(f"✗ ffmpeg处理失败: {e}")
+            return False
+    if metrics is not None:
+        metrics["input_clipping"] = clipping_ratio(audio)
+    write_pcm16(dst, finish_ffmpeg(audio, rate, params, metrics), rate)
+    return True
+
+
+def run_ffmpeg(src, dst, params=None):
+    """用ffmpeg处理文件（每次启动一个ffmpeg进程），成功返回True"""
+    try:
+        result = subprocess.run(ffmpeg_command(src, dst, params), capture_output=True, text=True)
+    except FileNotFoundError:
+        print("✗ 没有找到ffmpeg")
+        return False
+    if result.returncode != 0:
+        print(f"FFmpeg错误: {result.stderr}")
+        return False
+    return True
+
+
+_processors = {}
+
+
+def get_processor(params=None):
+    """按参数缓存的AudioProcessor"""
+    params = params or AUDIO_PROCESS_PARAMS
+    key = tuple((k, params.get(k)) for k in CHAIN)
+    if key not in _processors:
+        _processors[key] = AudioProcessor(params)
+    return _processors[key]
+
+
+def report_metrics(metrics):
+    """打印一段录音的处理统计（增益、削顶）"""
+    if metrics.get("input_clipping", 0) > INPUT_CLIPPING_WARNING:
+        print(f"⚠ 原始录音有 {metrics['input_clipping']:.2%} 的采样削顶，麦克风增益可能过高")
+    if "gain_db" in metrics:
+        loudness = "静音" if metrics["loudness_db"] is None else f"{metrics['loudness_db']:.1f}dBFS"
+        print(f"✓ 自动增益 {metrics['gain_db']:+.1f}dB（响度 {loudness}），"
+              f"削顶 {metrics['clipping']:.2%}，软限幅 {metrics['limited']:.2%}")
+
+
+def process_audio_file(src, dst, params=None, metrics=None):
+    """降噪、标准化、放大src写入dst，成功返回True
+
+    默认在进程内处理（engine为"numpy"），参数或WAV格式不支持时改用ffmpeg；engine为"ffmpeg"时
+    直接调用ffmpeg（经ffmpeg_pool的常驻进程池，WAV读不了时每段启动一次ffmpeg），
+    自动增益（agc）在ffmpeg之后进程内完成。给出metrics字典时写入处理统计
+    （见AudioProcessor.metrics）。
+    """
+    params = params or AUDIO_PROCESS_PARAMS
+    result = None
+    if params.get("engine", "numpy") == "numpy":
+        try:
+            processor = get_processor(params)
+            processor.process_file(src, dst)
+            result = processor.metrics
+        except (ValueError, wave.Error, EOFError) as e:
+            print(f"⚠ 进程内音频处理不可用，改用ffmpeg: {e}")
+        except OSError as e:
+            print(f"✗ 音频处理失败: {e}")
+            return False
+    if result is None:
+        result = {}
+        done = run_ffmpeg_pool(src, dst, params, result) if FFMPEG_POOL_CONFIG.get("enabled", True) else None
+        if done is None:
+            if not run_ffmpeg(src, dst, params):
+                return False
+            finish_ffmpeg_file(dst, params, result)
+        elif not done:
+            return False
+    report_metrics(result)
+    if metrics is not None:
+        metrics.update(result)
+    return True
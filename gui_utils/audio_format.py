@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+录放音格式协商
+每个设备只查询一次能力（SoundService的GetAudioInfo，或板子上 arecord/aplay --dump-hw-params），
+结果缓存到本地文件。之后按用途挑选格式：录音尽量直接用语音识别的采样率（16000Hz），播放尽量
+用TTS的采样率，设备不支持时才选一个最容易转换的格式（优先整数倍），并插入流式重采样：
+
+    formats = negotiate_alsa("192.168.42.1", remote_batch)
+    formats["capture"]   # {"sample_rate": 16000, "channels": 1, "bit_depth": 16, "resample": False}
+
+重采样用NumPy多相FIR实现（有scipy时一次性重采样改用resample_poly），不依赖librosa。
+"""
+
+import json
+import math
+import os
+import re
+import struct
+import threading
+import time
+
+import numpy as np
+
+try:
+    from gui_utils.config import ASR_PARAMS, AUDIO_NEGOTIATION_CONFIG
+except ImportError:
+    ASR_PARAMS = {"sample_rate": 16000}
+    AUDIO_NEGOTIATION_CONFIG = {
+        "enabled": True,
+        "cache": "~/.kos_audio/audio_caps.json",
+        "ttl": 7 * 86400,
+        "capture_device": "hw:0,0",
+        "playback_device": "hw:1,0",
+        "playback_rate": 32000
+    }
+
+# 设备报告采样率范围时，从这些常用采样率中挑选
+STANDARD_RATES = [8000, 11025, 16000, 22050, 24000, 32000, 44100, 48000, 96000]
+
+# ALSA采样格式对应的位深（只处理整数PCM）
+ALSA_FORMAT_BITS = {"S16_LE": 16, "S24_LE": 24, "S32_LE": 32}
+
+# 能力未知时假定的格式（与原来写死的arecord参数一致）
+DEFAULT_CAPS = {"sample_rates": [16000], "bit_depths": [16], "channels": [1], "available": True}
+
+# 多相FIR每个相位的抽头数，越大过渡带越窄、计算越多
+FILTER_TAPS_PER_PHASE = 24
+# 截止频率相对于较低奈奎斯特频率的比例
+FILTER_ROLLOFF = 0.9
+KAISER_BETA = 8.0
+
+# WAV fmt块中的编码标记（EXTENSIBLE的实际编码在SubFormat GUID的前两个字节）
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+RECORDING = "recording"
+PLAYBACK = "playback"
+
+
+# =============================================================================
+# 能力查询
+# =============================================================================
+
+def parse_hw_params(text):
+    """解析 arecord/aplay --dump-hw-params 的输出，返回能力字典，没有找到参数时返回None"""
+    fields = {}
+    for line in text.splitlines():
+        name, sep, value = line.partition(":")
+        if sep and name.strip().isupper():
+            fields[name.strip()] = value.strip()
+    if "RATE" not in fields:
+        return None
+
+    def numbers(value):
+        return [int(float(n)) for n in re.findall(r"\d+(?:\.\d+)?", value)]
+
+    def expand(value, candidates):
+        # "[8000 48000]" 或 "(7999 48001]" 是范围，单个数字是唯一值
+        values = numbers(value)
+        if len(values) == 2 and ("[" in value or "(" in value):
+            low, high = values
+            if value.lstrip().startswith("("):
+                low += 1
+            if value.rstrip().endswith(")"):
+                high -= 1
+            return [c for c in candidates if low <= c <= high]
+        return values
+
+    rates = expand(fields["RATE"], STANDARD_RATES)
+    channels = expand(fields.get("CHANNELS", "1"), list(range(1, 9)))
+    bits = sorted({ALSA_FORMAT_BITS[f] for f in fields.get("FORMAT", "S16_LE").split()
+                   if f in ALSA_FORMAT_BITS})
+    return {"sample_rates": rates, "bit_depths": bits, "channels": channels, "available": True}
+
+
+def hw_params_command(program, device):
+    """输出设备硬件参数的命令（打开设备时打印，随后的1秒录放音丢弃）"""
+    target = "/dev/null" if program == "arecord" else "/dev/zero"
+    return f"{program} -D {device} --dump-hw-params -d 1 -q {target} 2>&1"
+
+
+def query_alsa_caps(batch, capture_device=None, playback_device=None):
+    """在一批远程命令中查询录音和播放设备的能力，返回 {"recording": ..., "playback": ...}"""
+    capture_device = capture_device or AUDIO_NEGOTIATION_CONFIG["capture_device"]
+    playback_device = playback_device or AUDIO_NEGOTIATION_CONFIG["playback_device"]
+    batch.add(hw_params_command("arecord", capture_device), name=RECORDING, check=False)
+    batch.add(hw_params_command("aplay", playback_device), name=PLAYBACK, check=False)
+    result = batch.run()
+    return {RECORDING: parse_hw_params(result[RECORDING].text),
+            PLAYBACK: parse_hw_params(result[PLAYBACK].text)}
+
+
+async def query_grpc_caps(client):
+    """通过SoundService的GetAudioInfo查询能力"""
+    return await client.get_audio_info()
+
+
+# =============================================================================
+# 能力缓存
+# =============================================================================
+
+class CapabilityCache:
+    """按设备保存能力的JSON缓存文件，超过ttl秒的记录重新查询"""
+
+    def __init__(self, cache_path=None, ttl=None):
+        self.cache_path = os.path.expanduser(cache_path or AUDIO_NEGOTIATION_CONFIG["cache"])
+        self.ttl = AUDIO_NEGOTIATION_CONFIG["ttl"] if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._memory = {}
+
+    def _load(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        """取出未过期的能力，没有时返回None"""
+        with self._lock:
+            entry = self._memory.get(key) or self._load().get(key)
+            if not entry or time.time() - entry.get("time", 0) > self.ttl:
+                return None
+            self._memory[key] = entry
+            return entry["caps"]
+
+    def put(self, key, caps):
+        """保存能力（保留其他设备的记录）"""
+        entry = {"time": time.time(), "caps": caps}
+        with self._lock:
+            self._memory[key] = entry
+            try:
+                data = self._load()
+                data[key] = entry
+                os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+                tmp_path = self.cache_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.cache_path)
+            except OSError as e:
+                print(f"⚠ 无法写入音频能力缓存: {e}")
+
+    def invalidate(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_capability_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CapabilityCache()
+        return _cache
+
+
+def get_capabilities(key, query):
+    """取缓存的能力，没有时调用query()查询并缓存；查询失败时返回None（不缓存）"""
+    cache = get_capability_cache()
+    caps = cache.get(key)
+    if caps is None:
+        try:
+            caps = query()
+        except Exception as e:
+            print(f"⚠ 查询音频能力失败: {e}")
+            return None
+        if caps and any(caps.values()):
+            cache.put(key, caps)
+            print(f"✓ 已查询并缓存音频能力: {key}")
+    return caps
+
+
+# =============================================================================
+# 格式选择
+# =============================================================================
+
+def choose_format(caps, sample_rate, channels=1, bit_depth=16):
+    """按目标格式从设备能力中挑选格式，返回格式字典，resample表示是否需要重采样
+
+    采样率优先完全一致，其次是目标的整数倍（整数比降采样最便宜）中最低的，再次是高于目标的
+    最低采样率，都没有时用最高的。
+    """
+    caps = caps or DEFAULT_CAPS
+    rates = sorted(caps.get("sample_rates") or DEFAULT_CAPS["sample_rates"])
+    if sample_rate in rates:
+        rate = sample_rate
+    else:
+        multiples = [r for r in rates if r % sample_rate == 0]
+        higher = [r for r in rates if r > sample_rate]
+        rate = (multiples or higher or rates[-1:])[0]
+    channel_list = sorted(caps.get("channels") or [channels])
+    chosen_channels = channels if channels in channel_list else channel_list[0]
+    bit_list = caps.get("bit_depths") or [bit_depth]
+    bits = bit_depth if bit_depth in bit_list else min(bit_list, key=lambda b: abs(b - bit_depth))
+    return {"sample_rate": rate, "channels": chosen_channels, "bit_depth": bits,
+            "resample": rate != sample_rate}
+
+
+def negotiate(caps, capture_rate=None, playback_rate=None):
+    """为录音和播放分别挑选格式"""
+    caps = caps or {}
+    return {
+        "capture": choose_format(caps.get(RECORDING), capture_rate or ASR_PARAMS["sample_rate"]),
+        "playback": choose_format(caps.get(PLAYBACK),
+                                  playback_rate or AUDIO_NEGOTIATION_CONFIG["playback_rate"])
+    }
+
+
+def negotiate_alsa(host_key, batch_factory, capture_device=None, playback_device=None):
+    """通过 --dump-hw-params 协商板子上ALSA设备的格式（每个设备只查询一次）
+
+    batch_factory() 返回一个空的RemoteBatch。关闭协商或查询失败时返回默认格式。
+    """
+    caps = None
+    if AUDIO_NEGOTIATION_CONFIG.get("enabled", True):
+        capture_device = capture_device or AUDIO_NEGOTIATION_CONFIG["capture_device"]
+        playback_device = playback_device or AUDIO_NEGOTIATION_CONFIG["playback_device"]
+        key = f"alsa:{host_key}:{capture_device}:{playback_device}"
+        caps = get_capabilities(key, lambda: query_alsa_caps(
+            batch_factory(), capture_device, playback_device))
+    formats = negotiate(caps)
+    if formats["capture"]["resample"]:
+        print(f"⚠ 录音设备不支持{ASR_PARAMS['sample_rate']}Hz，"
+              f"以{formats['capture']['sample_rate']}Hz录音后在本地重采样")
+    return formats
+
+
+def alsa_args(program, device, fmt):
+    """按协商的格式生成arecord/aplay参数"""
+    formats = {bits: name for name, bits in ALSA_FORMAT_BITS.items()}
+    return [program, "-D", device, "-f", formats[fmt["bit_depth"]],
+            "-r", str(fmt["sample_rate"]), "-c", str(fmt["channels"])]
+
+
+# =============================================================================
+# 重采样
+# =============================================================================
+
+class StreamResampler:
+    """流式多相FIR重采样（有理数比 up/down），逐块调用process，块与块之间没有接缝
+
+    输入为一维（单声道）或 (n, channels) 的数组；int16输入返回int16，其余返回float32。
+    输出相对输入有固定的群延迟（delay个输出采样）。
+    """
+
+    def __init__(self, from_rate, to_rate, taps_per_phase=None):
+        self.from_rate = from_rate
+        self.to_rate = to_rate
+        g = math.gcd(from_rate, to_rate)
+        self.up = to_rate // g
+        self.down = from_rate // g
+        taps = taps_per_phase or FILTER_TAPS_PER_PHASE
+        # 降采样时按比例加长滤波器，保证抗混叠
+        self.taps = int(math.ceil(taps * max(1.0, self.down / self.up)))
+        self._filters = self._design()
+        self._history = None
+        self._dtype = np.float32
+        self._position = 0  # 下一个输出在上采样域中相对当前块开头的位置
+
+    def _design(self):
+        """加Kaiser窗的sinc低通，按相位拆成 (up, taps) 的多相滤波器"""
+        length = self.taps * self.up
+        cutoff = 0.5 * FILTER_ROLLOFF / max(self.up, self.down)  # 上采样域的归一化截止频率
+        # 中心取在down的整数倍上，群延迟正好是整数个输出采样
+        self._center = int(round((length - 1) / 2 / self.down)) * self.down
+        n = np.arange(length) - self._center
+        h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, KAISER_BETA)
+        h *= self.up / h.sum()
+        return h.reshape(self.taps, self.up).T.astype(np.float32)
+
+    @property
+    def delay(self):
+        """群延迟（输出采样数）"""
+        return self._center // self.down
+
+    def reset(self):
+        self._history = None
+        self._position = 0
+
+    def process(self, block):
+        """重采样一块输入，返回这块输入能产生的全部输出"""
+        samples = np.asarray(block)
+        is_int = samples.dtype == np.int16
+        self._dtype = samples.dtype
+        if self.up == self.down:
+            return samples
+        x = samples.astype(np.float32) / 32768.0 if is_int else samples.astype(np.float32)
+        mono = x.ndim == 1
+        if mono:
+            x = x[:, None]
+        if self._history is None:
+            self._history = np.zeros((self.taps - 1, x.shape[1]), dtype=np.float32)
+        ext = np.concatenate([self._history, x])
+
+        count = len(x) * self.up - self._position
+        n_out = max(0, -(-count // self.down))
+        positions = self._position + np.arange(n_out) * self.down
+        base = positions // self.up
+        phase = positions % self.up
+        # 每个输出对应 taps 个输入：ext[base + taps-1 - k]，k = 0..taps-1
+        index = base[:, None] + (self.taps - 1) - np.arange(self.taps)[None, :]
+        out = np.einsum("nk,nkc->nc", self._filters[phase], ext[index])
+        self._position += n_out * self.down - len(x) * self.up
+        self._history = ext[len(ext) - (self.taps - 1):]
+
+        if mono:
+            out = out[:, 0]
+        if is_int:
+            return np.clip(np.round(out * 32768.0), -32768, 32767).astype(np.int16)
+        return out
+
+    def flush(self):
+        """送入足够的零把滤波器中剩余的输出推出来"""
+        if self._history is None:
+            return np.zeros(0, dtype=np.float32)
+        channels = self._history.shape[1]
+        shape = self.taps if channels == 1 else (self.taps, channels)
+        return self.process(np.zeros(shape, dtype=self._dtype))
+
+
+def resample(audio, from_rate, to_rate):
+    """一次性重采样整段音频（采样率相同直接返回原数组），输出长度为 ceil(n * to / from)"""
+    if from_rate == to_rate:
+        return audio
+    audio = np.asarray(audio)
+    expected = -(-len(audio) * to_rate // from_rate)
+    try:
+        from scipy.signal import resample_poly
+        g = math.gcd(from_rate, to_rate)
+        out = resample_poly(audio.astype(np.float32), to_rate // g, from_rate // g, axis=0)
+        if audio.dtype == np.int16:
+            out = np.clip(np.round(out), -32768, 32767).astype(np.int16)
+        return out[:expected]
+    except ImportError:
+        pass
+    resampler = StreamResampler(from_rate, to_rate)
+    out = np.concatenate([resampler.process(audio), resampler.flush()])
+    skip = resampler.delay
+    return out[skip:skip + expected]
+
+
+def read_wav(path, sample_rate=None, mono=True):
+    """读取PCM WAV为-1~1的float32（可选混成单声道并重采样到sample_rate），返回 (音频, 采样率)
+
+    也支持WAVE_FORMAT_EXTENSIBLE（多声道录音常用）。不是16/32位PCM WAV时抛出ValueError，
+    调用方可以改用通用解码器。
+    """
+    fmt = data = None
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:] != b"WAVE":
+            raise ValueError(f"不是WAV文件: {path}")
+        while data is None:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                break
+            chunk, size = struct.unpack("<4sI", chunk_header)
+            if chunk == b"fmt ":
+                fmt = f.read(size)
+                f.seek(size % 2, 1)
+            elif chunk == b"data":
+                data = f.read(size)
+            else:
+                f.seek(size + size % 2, 1)
+    if fmt is None or len(fmt) < 16 or data is None:
+        raise ValueError(f"WAV缺少fmt或data块: {path}")
+    tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", fmt[:16])
+    if tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        tag = struct.unpack("<H", fmt[24:26])[0]
+    if tag != WAVE_FORMAT_PCM:
+        raise ValueError(f"不支持的WAV编码: 0x{tag:04x}")
+    width = bits // 8
+    dtypes = {2: np.dtype("<i2"), 4: np.dtype("<i4")}
+    if width not in dtypes or not channels:
+        raise ValueError(f"不支持的WAV位深: {bits}bit")
+    frame = width * channels
+    data = data[:len(data) // frame * frame]
+    audio = np.frombuffer(data, dtype=dtypes[width]).astype(np.float32) / float(2 ** (width * 8 - 1))
+    if channels > 1:
+        audio = audio.reshape(-1, channels)
+        if mono:
+            audio = audio.mean(axis=1)
+    if sample_rate and sample_rate != rate:
+        audio = resample(audio, rate, sample_rate)
+        rate = sample_rate
+    return audio, rate
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+回声消除测速
+用sample_audio中的语音作为远端（机器人朗读）信号，经过模拟的回声路径（整体延迟 + 指数衰减的房间
+冲激响应）叠加到麦克风上，按全双工会话中的帧长逐帧送入aec.EchoCanceller，统计单核实时率
+（处理耗时/音频时长）和回声消除量ERLE。场景：
+
+    echo         只有回声（收敛后的ERLE）
+    double_talk  后半段用户同时说话（近端语音的保真度，双讲检测是否生效）
+    path_change  中途回声路径改变（重新收敛）
+
+用法:
+    python gui_utils/bench_aec.py
+    python gui_utils/bench_aec.py --filter-ms 300 --seconds 20 --output aec.json
+"""
+
+import os
+
+# 限制在单核上测量（需在导入NumPy之前设置）
+for _name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_name, "1")
+
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gui_utils.aec import EchoCanceller, estimate_delay
+from gui_utils.audio_format import read_wav
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_audio")
+
+SCENARIOS = ["echo", "double_talk", "path_change"]
+
+
+def room_response(rate, delay_ms, rt60_ms, gain, seed):
+    """模拟的回声路径：整体延迟后接指数衰减的随机冲激响应"""
+    rng = np.random.default_rng(seed)
+    delay = rate * delay_ms // 1000
+    length = rate * rt60_ms // 1000
+    tail = rng.standard_normal(length) * np.exp(-6.9 * np.arange(length) / length)
+    tail *= gain / np.sqrt((tail ** 2).sum())
+    return np.concatenate([np.zeros(delay), tail])
+
+
+def load_speech(path, rate, seconds):
+    """读取语音并循环到seconds秒，归一化到-12dBFS峰值"""
+    audio, _ = read_wav(path, sample_rate=rate)
+    audio = np.tile(audio, int(np.ceil(seconds * rate / len(audio))))[:int(seconds * rate)]
+    return 0.25 * audio / (np.abs(audio).max() + 1e-9)
+
+
+def make_scenario(name, far, near, rate, delay_ms, seed=0):
+    """返回 (麦克风信号, 近端语音)，近端语音只在double_talk中非零"""
+    n = len(far)
+    path = room_response(rate, delay_ms, 150, 0.5, seed)
+    echo = np.convolve(far, path)[:n]
+    if name == "path_change":
+        # 后半段换一个回声路径（机器人转身、有人走近）
+        changed = np.convolve(far, room_response(rate, delay_ms + 5, 150, 0.7, seed + 1))[:n]
+        echo[n // 2:] = changed[n // 2:]
+    speech = np.zeros(n)
+    if name == "double_talk":
+        speech[n // 2:] = near[:n - n // 2]
+    noise = np.random.default_rng(seed + 2).standard_normal(n) * 10 ** (-60 / 20)
+    return echo + speech + noise, speech
+
+
+def erle_db(mic, out):
+    return float(10 * np.log10((mic ** 2).sum() / max((out ** 2).sum(), 1e-20)))
+
+
+def run_scenario(name, far, near, rate, frame_ms, delay_ms, filter_ms, block_ms, step):
+    mic, speech = make_scenario(name, far, near, rate, delay_ms)
+    # 和duplex.py一样先估计整体延迟，滤波器只需覆盖拖尾
+    probe = rate * 2
+    delay, confidence = estimate_delay(mic[:probe], far[:probe], rate)
+    margin = rate * 5 // 1000
+    shift = max(0, delay - margin)
+    ref = np.concatenate([np.zeros(shift), far])[:len(far)]
+
+    aec = EchoCanceller(rate, block_ms=block_ms, filter_ms=filter_ms, step=step)
+    frame = rate * frame_ms // 1000
+    n = len(mic) // frame * frame
+    out = np.empty(n)
+    started = time.perf_counter()
+    for pos in range(0, n, frame):
+        out[pos:pos + frame] = aec.process(mic[pos:pos + frame], ref[pos:pos + frame])
+    seconds = time.perf_counter() - started
+    duration = n / rate
+
+    half = n // 2
+    entry = {
+        "scenario": name,
+        "duration_s": duration,
+        "process_s": round(seconds, 4),
+        "rtf": round(seconds / duration, 4),
+        "per_frame_us": round(seconds / (n // frame) * 1e6, 1),
+        "estimated_delay_ms": round(delay * 1000 / rate, 1),
+        "true_delay_ms": delay_ms,
+        "delay_confidence": round(confidence, 1),
+        "stats": aec.stats()
+    }
+    if name == "echo":
+        entry["erle_db"] = round(erle_db(mic[half:n], out[half:]), 2)
+    elif name == "double_talk":
+        # 前半段只有回声；后半段输出与近端语音越接近越好
+        entry["erle_db"] = round(erle_db(mic[rate:half], out[rate:half]), 2)
+        residual = out[half:] - speech[half:n]
+        entry["near_end_snr_db"] = round(erle_db(speech[half:n], residual), 2)
+        entry["input_snr_db"] = round(erle_db(speech[half:n], mic[half:n] - speech[half:n]), 2)
+    else:
+        # 回声路径改变后第2秒起的消除量
+        entry["erle_db"] = round(erle_db(mic[half + 2 * rate:n], out[half + 2 * rate:]), 2)
+        entry["erle_before_change_db"] = round(erle_db(mic[half - rate:half], out[half - rate:half]), 2)
+    return entry
+
+
+def format_row(entry):
+    row = (f"{entry['scenario']:<12} 实时率 {entry['rtf']:.4f}  每帧 {entry['per_frame_us']:7.1f}us"
+           f"  ERLE {entry['erle_db']:6.2f}dB  延迟 {entry['estimated_delay_ms']:.1f}/"
+           f"{entry['true_delay_ms']}ms")
+    if "near_end_snr_db" in entry:
+        row += f"  近端SNR {entry['input_snr_db']:.2f} -> {entry['near_end_snr_db']:.2f}dB"
+    if "erle_before_change_db" in entry:
+        row += f"  (改变前 {entry['erle_before_change_db']:.2f}dB)"
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="回声消除实时率和ERLE测试（单核）")
+    parser.add_argument("--far", default=os.path.join(SAMPLE_DIR, "example.wav"),
+                        help="远端（播放）语音WAV")
+    parser.add_argument("--near", default=None, help="近端（用户）语音WAV，缺省用远端语音倒放")
+    parser.add_argument("--rate", type=int, default=16000, help="采样率")
+    parser.add_argument("--seconds", type=float, default=12, help="每个场景的时长（秒）")
+    parser.add_argument("--frame-ms", type=int, default=20, help="送入的帧长（毫秒）")
+    parser.add_argument("--delay-ms", type=int, default=120, help="模拟的整体回声延迟（毫秒）")
+    parser.add_argument("--filter-ms", type=int, default=None, help="滤波器长度（毫秒）")
+    parser.add_argument("--block-ms", type=int, default=None, help="分块时长（毫秒）")
+    parser.add_argument("--step", type=float, default=None, help="自适应步长")
+    parser.add_argument("--only", choices=SCENARIOS, action="append", help="只测指定场景")
+    parser.add_argument("--output", help="JSON报告输出路径")
+    args = parser.parse_args(argv)
+
+    try:
+        os.sched_setaffinity(0, {min(os.sched_getaffinity(0))})
+    except (AttributeError, OSError):
+        pass
+
+    far = load_speech(args.far, args.rate, args.seconds)
+    if args.near:
+        near = load_speech(args.near, args.rate, args.seconds)
+    else:
+        near = far[::-1].copy()
+
+    results = []
+    for name in args.only or SCENARIOS:
+        entry = run_scenario(name, far, near, args.rate, args.frame_ms, args.delay_ms,
+                             args.filter_ms, args.block_ms, args.step)
+        print(format_row(entry))
+        results.append(entry)
+
+    report = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "rate": args.rate,
+        "frame_ms": args.frame_ms,
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✓ 报告已写入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
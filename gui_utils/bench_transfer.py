@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件传输测速
+在本机启动SSH服务器替身（local_sshd.py），把audio_control.py、audio_control_unix.py、
+audio_control_windows.py中的所有上传/下载方法指向它，按不同负载大小（默认1KB到10MB）重复传输，
+统计吞吐量、SSH握手次数和p50/p95耗时，输出JSON报告。
+transfer.raw 与 transfer.kpc1 两个路径分别强制原始传输和KPC1压缩传输，用来衡量压缩在当前链路上是否划算。
+指定 --baseline 时与之前的报告比较，吞吐量下降超过容差或握手次数增加时以非零状态退出。
+
+用法:
+    python gui_utils/bench_transfer.py --output bench.json
+    python gui_utils/bench_transfer.py --baseline bench.json --tolerance 0.2
+    python gui_utils/bench_transfer.py --only transfer. --sizes 100K,1M   # 压缩与原始传输对比
+"""
+
+import argparse
+import contextlib
+import functools
+import hashlib
+import importlib
+import io
+import json
+import os
+import platform
+import shutil
+import stat
+import sys
+import tempfile
+import time
+import wave
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gui_utils import ssh_pool
+from gui_utils.local_sshd import LocalSSHServer
+
+UPLOAD = "upload"
+DOWNLOAD = "download"
+
+# (路径名, 模块, 方向, 函数名, 依赖)
+# 依赖: "pool" 需要paramiko连接池, "cli" 需要ssh命令行, "client" 使用windows模块的全局paramiko客户端,
+#       "scp" 还需要scp库
+TRANSFER_PATHS = [
+    ("audio_control.stream", "gui_utils.audio_control", DOWNLOAD, "transfer_from_remote_stream", "pool"),
+    ("audio_control.base64", "gui_utils.audio_control", DOWNLOAD, "transfer_from_remote_method1", "cli"),
+    ("audio_control.cat", "gui_utils.audio_control", DOWNLOAD, "transfer_from_remote_method2", "cli"),
+    ("audio_control.dd", "gui_utils.audio_control", DOWNLOAD, "transfer_from_remote_method3", "cli"),
+    ("audio_control.stream", "gui_utils.audio_control", UPLOAD, "transfer_to_remote_stream", "pool"),
+    ("audio_control.base64", "gui_utils.audio_control", UPLOAD, "transfer_to_remote_method1", "cli"),
+    ("audio_control.tee", "gui_utils.audio_control", UPLOAD, "transfer_to_remote_method2", "cli"),
+    ("audio_control.dd", "gui_utils.audio_control", UPLOAD, "transfer_to_remote_method3", "cli"),
+    ("unix.stream", "gui_utils.audio_control_unix", DOWNLOAD, "transfer_from_remote_stream", "pool"),
+    ("unix.base64", "gui_utils.audio_control_unix", DOWNLOAD, "transfer_from_remote_base64", "pool"),
+    ("unix.stream", "gui_utils.audio_control_unix", UPLOAD, "transfer_to_remote_stream", "pool"),
+    ("unix.base64", "gui_utils.audio_control_unix", UPLOAD, "transfer_to_remote_base64", "pool"),
+    ("windows.stream", "gui_utils.audio_control_windows", DOWNLOAD, "transfer_from_remote_stream", "pool"),
+    ("windows.base64", "gui_utils.audio_control_windows", DOWNLOAD, "transfer_from_remote_base64", "client"),
+    ("windows.stream", "gui_utils.audio_control_windows", UPLOAD, "transfer_to_remote_stream", "pool"),
+    ("windows.scp", "gui_utils.audio_control_windows", UPLOAD, "transfer_to_remote_scp", "scp"),
+    ("windows.base64", "gui_utils.audio_control_windows", UPLOAD, "transfer_to_remote_base64", "client"),
+    # 同一个流式通道分别强制原始传输和KPC1压缩传输，比较压缩在当前链路上是否划算
+    ("transfer.raw", "gui_utils.transfer", DOWNLOAD, "download_file", "pool"),
+    ("transfer.kpc1", "gui_utils.transfer", DOWNLOAD, "download_file", "pool"),
+    ("transfer.raw", "gui_utils.transfer", UPLOAD, "upload_file", "pool"),
+    ("transfer.kpc1", "gui_utils.transfer", UPLOAD, "upload_file", "pool"),
+]
+
+# 传输路径调用时附加的固定参数
+PATH_OPTIONS = {
+    "transfer.raw": {"compress": False},
+    "transfer.kpc1": {"compress": True},
+}
+
+DEFAULT_SIZES = [1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024]
+
+
+def parse_size(text):
+    """解析 1K / 10M / 4096 这样的大小"""
+    text = text.strip().upper().rstrip("B")
+    units = {"K": 1024, "M": 1024 * 1024}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def percentile(values, q):
+    """线性插值的百分位数"""
+    return float(np.percentile(values, q)) if values else None
+
+
+def projected_seconds(points, next_size):
+    """按最近两个负载的耗时估计next_size的单次耗时：固定开销 + 字节数 / 吞吐量
+
+    points为 [(大小, p50秒)]。只有一个点时无法区分固定开销和吞吐量，返回已测到的耗时
+    （只有实测已超出预算才跳过）。
+    """
+    size, seconds = points[-1]
+    if len(points) < 2:
+        return seconds
+    prev_size, prev_seconds = points[-2]
+    per_byte = max(0.0, (seconds - prev_seconds) / (size - prev_size)) if size != prev_size else 0.0
+    fixed = max(0.0, seconds - per_byte * size)
+    return fixed + per_byte * next_size
+
+
+def make_payload(size, kind="wav"):
+    """生成测试负载：wav为类似语音的16kHz单声道WAV（可被KPC1压缩），random为随机字节"""
+    if kind == "random":
+        return os.urandom(size)
+    frames = max(0, (size - 44) // 2)
+    t = np.arange(frames) / 16000.0
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t)
+    signal = envelope * (3000 * np.sin(2 * np.pi * 220 * t) + 800 * np.sin(2 * np.pi * 660 * t))
+    signal += np.random.default_rng(0).normal(0, 200, frames)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(np.clip(signal, -32768, 32767).astype("<i2").tobytes())
+    data = buf.getvalue()
+    return data[:size] if len(data) >= size else data + b"\0" * (size - len(data))
+
+
+@contextlib.contextmanager
+def cli_shims(server, workdir):
+    """在PATH最前面放置ssh/sshpass包装脚本，让命令行方法以公钥认证连接到本地替身"""
+    real_ssh = shutil.which("ssh")
+    if real_ssh is None or os.name == "nt":
+        yield False
+        return
+    bin_dir = os.path.join(workdir, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    config = server.ssh_config(os.path.join(workdir, "ssh_config"))
+    scripts = {
+        "ssh": f'#!/bin/sh\nexec "{real_ssh}" -F "{config}" "$@"\n',
+        # sshpass -p <密码> ssh ...：替身使用公钥认证，直接执行后面的命令
+        "sshpass": '#!/bin/sh\nshift 2\nexec "$@"\n',
+    }
+    for name, body in scripts.items():
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as f:
+            f.write(body)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    old_path = os.environ.get("PATH", "")
+    os.environ["PATH"] = bin_dir + os.pathsep + old_path
+    try:
+        yield True
+    finally:
+        os.environ["PATH"] = old_path
+
+
+def point_modules_at(server):
+    """把各模块的远程设备配置改为本地替身，返回已导入的模块"""
+    ssh_pool.REMOTE_HOST = "127.0.0.1"
+    ssh_pool.REMOTE_PORT = server.port
+    modules = {}
+    for _, module_name, _, _, _ in TRANSFER_PATHS:
+        if module_name in modules:
+            continue
+        module = importlib.import_module(module_name)
+        module.REMOTE_HOST = "127.0.0.1"
+        module.REMOTE_USER = server.user
+        module.REMOTE_PASSWORD = server.password
+        if hasattr(module, "REMOTE_PORT"):
+            module.REMOTE_PORT = server.port
+        modules[module_name] = module
+    return modules
+
+
+def available(requirement, cli_ok):
+    """检查传输路径的依赖，返回不可用的原因或None"""
+    if requirement == "cli" and not cli_ok:
+        return "ssh命令行不可用"
+    if requirement == "scp":
+        try:
+            import scp  # noqa: F401
+        except ImportError:
+            return "未安装scp库"
+    return None
+
+
+def run_path(func, direction, size, payload, workdir, remote_dir, server, repeat, verbose):
+    """对一个传输路径和负载大小重复测速，返回结果字典"""
+    digest = hashlib.md5(payload).hexdigest()
+    # WAV负载用.wav后缀，按后缀判断是否压缩的下载路径才会启用KPC1
+    ext = ".wav" if payload[:4] == b"RIFF" else ".bin"
+    local_src = os.path.join(workdir, f"src_{size}{ext}")
+    remote_src = os.path.join(remote_dir, f"src_{size}{ext}")
+    for path in (local_src, remote_src):
+        with open(path, "wb") as f:
+            f.write(payload)
+
+    durations = []
+    wire_bytes = []
+    handshakes_before = server.handshakes
+    commands_before = server.commands
+    error = None
+    for i in range(repeat):
+        if direction == UPLOAD:
+            src, dst = local_src, os.path.join(remote_dir, f"up_{i}{ext}")
+        else:
+            src, dst = remote_src, os.path.join(workdir, f"down_{i}{ext}")
+        sink = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        start = time.perf_counter()
+        try:
+            with sink:
+                result = func(src, dst)
+            ok = bool(result)
+        except Exception as e:
+            result, ok, error = None, False, str(e)
+        elapsed = time.perf_counter() - start
+        if ok:
+            try:
+                with open(dst, "rb") as f:
+                    ok = hashlib.md5(f.read()).hexdigest() == digest
+                if not ok:
+                    error = "内容校验不一致"
+            except OSError as e:
+                ok, error = False, str(e)
+            os.remove(dst)
+        elif error is None:
+            error = "传输函数返回失败"
+        if not ok:
+            break
+        durations.append(elapsed)
+        if isinstance(result, dict) and "wire_bytes" in result:
+            wire_bytes.append(result["wire_bytes"])
+
+    handshakes = server.handshakes - handshakes_before
+    runs = len(durations)
+    p50 = percentile(durations, 50)
+    return {
+        "size": size,
+        "runs": runs,
+        "ok": error is None,
+        "error": error,
+        "throughput_bps": size / p50 if p50 else None,
+        "p50_s": p50,
+        "p95_s": percentile(durations, 95),
+        "mean_s": float(np.mean(durations)) if durations else None,
+        "handshakes": handshakes,
+        "handshakes_per_transfer": handshakes / max(1, runs),
+        "remote_commands_per_transfer": (server.commands - commands_before) / max(1, runs),
+        # 线路上实际传输的字节数与文件大小之比（只有返回传输详情的路径才有）
+        "wire_ratio": float(np.mean(wire_bytes)) / size if wire_bytes else None,
+    }
+
+
+def run_benchmark(sizes, repeat=5, payload_kind="wav", budget=20.0, only=None, verbose=False):
+    """执行所有传输路径的测速，返回报告字典"""
+    workdir = tempfile.mkdtemp(prefix="kos_bench_")
+    remote_dir = os.path.join(workdir, "remote")
+    os.makedirs(remote_dir)
+    results = []
+    server = LocalSSHServer().start()
+    try:
+        with cli_shims(server, workdir) as cli_ok:
+            modules = point_modules_at(server)
+            payloads = {size: make_payload(size, payload_kind) for size in sizes}
+            for name, module_name, direction, func_name, requirement in TRANSFER_PATHS:
+                if only and not any(pattern in name for pattern in only):
+                    continue
+                func = getattr(modules[module_name], func_name)
+                if name in PATH_OPTIONS:
+                    func = functools.partial(func, **PATH_OPTIONS[name])
+                reason = available(requirement, cli_ok)
+                skip = reason
+                if not skip:
+                    # 预热一次（建立连接、远程协商等），不计入统计
+                    run_path(func, direction, sizes[0], payloads[sizes[0]], workdir,
+                             remote_dir, server, 1, verbose)
+                points = []
+                for index, size in enumerate(sizes):
+                    entry = {"path": name, "module": module_name, "function": func_name,
+                             "direction": direction}
+                    if skip:
+                        entry.update({"size": size, "ok": None, "skipped": skip})
+                        results.append(entry)
+                        continue
+                    entry.update(run_path(func, direction, size, payloads[size], workdir,
+                                          remote_dir, server, repeat, verbose))
+                    results.append(entry)
+                    print(format_row(entry))
+                    # 较慢的方法按最近两个负载估计下一个负载的耗时，超出预算时不再测更大的负载
+                    if not entry["ok"]:
+                        skip = f"{size}B 负载已失败"
+                    else:
+                        points.append((size, entry["p50_s"]))
+                        if index + 1 < len(sizes) and \
+                                projected_seconds(points, sizes[index + 1]) > budget:
+                            skip = f"预计单次耗时超过 {budget} 秒"
+                if skip:
+                    print(f"{name:<22} {direction:<8} 跳过: {skip}")
+    finally:
+        ssh_pool.close_all_pools()
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "payload": payload_kind,
+        "repeat": repeat,
+        "sizes": sizes,
+        "results": results,
+    }
+
+
+def format_row(entry):
+    """格式化一行测速结果"""
+    head = f"{entry['path']:<22} {entry['direction']:<8} {entry['size']:>9}B"
+    if not entry["ok"]:
+        return f"{head}  失败: {entry['error']}"
+    return (f"{head}  {entry['throughput_bps'] / 1024 / 1024:8.2f} MB/s"
+            f"  p50 {entry['p50_s'] * 1000:8.1f}ms  p95 {entry['p95_s'] * 1000:8.1f}ms"
+            f"  握手 {entry['handshakes_per_transfer']:.2f}/次"
+            f"  命令 {entry['remote_commands_per_transfer']:.1f}/次"
+            + (f"  线路字节 {entry['wire_ratio']:.2f}" if entry.get("wire_ratio") is not None else ""))
+
+
+def compare(report, baseline, tolerance):
+    """与基线报告比较，返回回归描述列表"""
+    previous = {(r["path"], r["direction"], r["size"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for entry in report["results"]:
+        old = previous.get((entry["path"], entry["direction"], entry["size"]))
+        if old is None or not old.get("ok"):
+            continue
+        key = f"{entry['path']} {entry['direction']} {entry['size']}B"
+        if entry.get("ok") is False:
+            regressions.append(f"{key}: 基线成功，现在失败 ({entry['error']})")
+            continue
+        if not entry.get("ok"):
+            continue
+        if entry["throughput_bps"] < old["throughput_bps"] * (1 - tolerance):
+            regressions.append(f"{key}: 吞吐量 {old['throughput_bps'] / 1024:.0f} -> "
+                               f"{entry['throughput_bps'] / 1024:.0f} KB/s")
+        if entry["handshakes_per_transfer"] > old["handshakes_per_transfer"]:
+            regressions.append(f"{key}: 每次传输握手 {old['handshakes_per_transfer']:.2f} -> "
+                               f"{entry['handshakes_per_transfer']:.2f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="文件传输方法测速（本地SSH替身）")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="逗号分隔的负载大小，如 1K,100K,10M")
+    parser.add_argument("--repeat", type=int, default=5, help="每个大小重复次数")
+    parser.add_argument("--payload", choices=["wav", "random"], default="wav", help="负载类型")
+    parser.add_argument("--budget", type=float, default=20.0,
+                        help="单次传输超过该秒数后跳过该方法更大的负载")
+    parser.add_argument("--only", action="append", help="只测名称包含该字符串的路径（可重复）")
+    parser.add_argument("--output", help="JSON报告输出路径（默认输出到标准输出）")
+    parser.add_argument("--baseline", help="基线JSON报告，用于回归比较")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的吞吐量下降比例")
+    parser.add_argument("--verbose", action="store_true", help="显示传输函数自身的输出")
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    report = run_benchmark(sizes, repeat=args.repeat, payload_kind=args.payload,
+                           budget=args.budget, only=args.only, verbose=args.verbose)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"✓ 报告已写入 {args.output}")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("✗ 发现性能回归:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("✓ 与基线相比没有回归")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
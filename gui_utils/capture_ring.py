@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常驻录音环形缓冲
+后台一直运行一个远程 arecord -t raw，把麦克风PCM直接拷进预先分配好的NumPy环形缓冲（保存最近N秒）。
+按钮、VAD起点或唤醒词触发时，从触发时刻往前回溯pre-roll截取一段，不会再因为每次重新打开设备
+丢掉开头几百毫秒的语音：
+
+    daemon = CaptureDaemon(pool).start()
+    start = daemon.trigger()                 # 触发：从 pre_roll_ms 之前开始
+    daemon.wait_for(start + 3 * 16000)
+    audio = daemon.cut(start, start + 3 * 16000)
+
+稳态下接收线程只做“收字节 -> 视图 -> 拷进环形缓冲”，缓冲区大小固定，不再分配数组。
+位置都用自启动以来的绝对采样序号表示，已被覆盖的部分截取时会被裁掉。
+"""
+
+import threading
+import time
+
+import numpy as np
+
+try:
+    from gui_utils.ssh_pool import get_pool
+    from gui_utils.live_capture import LiveCapture, SAMPLE_DTYPE, POLL_INTERVAL, write_wav
+except ImportError:
+    from ssh_pool import get_pool
+    from live_capture import LiveCapture, SAMPLE_DTYPE, POLL_INTERVAL, write_wav
+
+try:
+    from gui_utils.record_control import STOPPED
+except ImportError:
+    from record_control import STOPPED
+
+try:
+    from gui_utils.config import AUDIO_FORMAT, CAPTURE_DAEMON_CONFIG, LIVE_CAPTURE_CONFIG
+except ImportError:
+    AUDIO_FORMAT = {"format": "S16_LE", "rate": 16000, "channels": 1, "duration": 5}
+    LIVE_CAPTURE_CONFIG = {"device": "hw:0,0", "frame_ms": 20, "buffer_ms": 2000, "read_size": 4096}
+    CAPTURE_DAEMON_CONFIG = {
+        "enabled": False,
+        "seconds": 30,
+        "pre_roll_ms": 500,
+        "restart_backoff": 1.0
+    }
+
+
+class AudioRing:
+    """固定容量的int16环形缓冲，按绝对采样位置读写"""
+
+    def __init__(self, capacity, channels=1):
+        self.capacity = int(capacity)
+        self.channels = channels
+        self._buf = np.zeros((self.capacity, channels), dtype=SAMPLE_DTYPE)
+        self.written = 0  # 已写入的总采样数（下一个采样的绝对位置）
+
+    @property
+    def oldest(self):
+        """缓冲中仍保留的最早采样位置"""
+        return max(0, self.written - self.capacity)
+
+    def write(self, samples):
+        """写入 (n, channels) 或一维的采样（调用方保证不与读取并发，或自行加锁）"""
+        samples = samples.reshape(-1, self.channels)
+        n = len(samples)
+        if n >= self.capacity:
+            # 一次写入超过容量时只保留最后capacity个
+            samples = samples[-self.capacity:]
+            self.written += n - self.capacity
+            n = self.capacity
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self._buf[start:start + first] = samples[:first]
+        if first < n:
+            self._buf[:n - first] = samples[first:]
+        self.written += n
+
+    def read(self, start, end, out=None):
+        """复制[start, end)范围的采样，已被覆盖的开头部分裁掉；out可传入预分配的数组
+
+        返回 (数据, 实际起始位置)。
+        """
+        end = min(end, self.written)
+        start = max(start, self.oldest)
+        n = max(0, end - start)
+        if out is None:
+            out = np.empty((n, self.channels), dtype=SAMPLE_DTYPE)
+        elif len(out) < n:
+            raise ValueError(f"输出数组太小: 需要 {n} 个采样")
+        begin = start % self.capacity
+        first = min(n, self.capacity - begin)
+        out[:first] = self._buf[begin:begin + first]
+        if first < n:
+            out[first:n] = self._buf[:n - first]
+        return out[:n], start
+
+
+class CaptureDaemon:
+    """常驻远程录音，最近seconds秒保存在AudioRing中
+
+    远程arecord意外退出或连接断开时按restart_backoff间隔自动重启，重启造成的空缺计入gaps。
+    add_listener(func) 注册的回调在接收线程中以 func(采样视图, 起始位置) 调用（如VAD起点检测），
+    回调不能保留采样视图，需要时自行拷贝。
+    """
+
+    def __init__(self, pool=None, seconds=None, pre_roll_ms=None, device=None, rate=None,
+                 channels=None, restart_backoff=None, read_size=None):
+        self.pool = pool or get_pool()
+        self.device = device or LIVE_CAPTURE_CONFIG["device"]
+        self.rate = rate or AUDIO_FORMAT["rate"]
+        self.channels = channels or AUDIO_FORMAT["channels"]
+        self.seconds = seconds or CAPTURE_DAEMON_CONFIG["seconds"]
+        self.pre_roll_ms = (CAPTURE_DAEMON_CONFIG["pre_roll_ms"] if pre_roll_ms is None
+                            else pre_roll_ms)
+        self.restart_backoff = restart_backoff or CAPTURE_DAEMON_CONFIG["restart_backoff"]
+        self.read_size = read_size or LIVE_CAPTURE_CONFIG["read_size"]
+
+        self.ring = AudioRing(self.rate * self.seconds, self.channels)
+        self._sample_bytes = SAMPLE_DTYPE.itemsize * self.channels
+        self._carry = bytearray()
+        self._cond = threading.Condition()
+        self._listeners = []
+        self._thread = None
+        self._stopping = False
+        self._capture = None
+
+        # 统计
+        self.started_at = None
+        self.restarts = 0
+        self.gaps = 0
+        self.bytes_received = 0
+        self.last_error = None
+
+    def __repr__(self):
+        return f"CaptureDaemon({self.device}, {self.seconds}s, {self.ring.written} samples)"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    @property
+    def position(self):
+        """当前（下一个采样）的绝对位置"""
+        return self.ring.written
+
+    @property
+    def running(self):
+        """后台录音线程是否在运行（远程arecord占用着录音设备）"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_listener(self, func):
+        self._listeners.append(func)
+
+    def remove_listener(self, func):
+        if func in self._listeners:
+            self._listeners.remove(func)
+
+    # -------------------------------------------------------------------------
+    # 接收
+    # -------------------------------------------------------------------------
+
+    def start(self):
+        """启动后台录音线程"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self.started_at = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name="capture-daemon", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """停止录音，环形缓冲中的数据仍可读取"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _run(self):
+        """打开远程arecord并持续接收，意外结束时重启"""
+        while not self._stopping:
+            # 借用LiveCapture的命令和通道管理，数据由这里直接读取写入环形缓冲
+            capture = LiveCapture(self.pool, device=self.device, rate=self.rate,
+                                  channels=self.channels)
+            self.last_error = None
+            try:
+                chan = capture._open_channel()
+                capture._chan = chan
+                chan.settimeout(POLL_INTERVAL)
+                chan.exec_command(capture.command())
+                chan.shutdown_write()
+                self._pump(chan)
+            except Exception as e:
+                self.last_error = e
+            finally:
+                capture._close_channel()
+            if self._stopping:
+                break
+            self.restarts += 1
+            self.gaps += 1
+            self._carry.clear()
+            print(f"⚠ 常驻录音中断，{self.restart_backoff}秒后重启: {self.last_error or '远程arecord已退出'}")
+            with self._cond:
+                self._cond.wait(self.restart_backoff)
+
+    def _pump(self, chan):
+        """接收字节并写入环形缓冲（按整采样对齐，不足一个采样的字节留到下次）"""
+        while not self._stopping:
+            try:
+                data = chan.recv(self.read_size)
+            except TimeoutError:
+                continue
+            if not data:
+                return
+            if chan.recv_stderr_ready():
+                chan.recv_stderr(self.read_size)
+            self.bytes_received += len(data)
+            if self._carry:
+                data = bytes(self._carry) + data
+                self._carry.clear()
+            usable = len(data) - len(data) % self._sample_bytes
+            if usable < len(data):
+                self._carry += data[usable:]
+            if not usable:
+                continue
+            samples = np.frombuffer(data, dtype=SAMPLE_DTYPE, count=usable // SAMPLE_DTYPE.itemsize)
+            with self._cond:
+                position = self.ring.written
+                self.ring.write(samples)
+                self._cond.notify_all()
+            for func in list(self._listeners):
+                try:
+                    func(samples, position)
+                except Exception as e:
+                    print(f"⚠ 常驻录音回调出错: {e}")
+
+    # -------------------------------------------------------------------------
+    # 截取
+    # -------------------------------------------------------------------------
+
+    def trigger(self, pre_roll_ms=None):
+        """触发时调用，返回截取的起始位置（当前位置往前回溯pre_roll_ms）"""
+        pre_roll_ms = self.pre_roll_ms if pre_roll_ms is None else pre_roll_ms
+        with self._cond:
+            return max(self.ring.oldest, self.ring.written - self.rate * pre_roll_ms // 1000)
+
+    def wait_for(self, position, timeout=None):
+        """等待录音写到position，返回是否等到（录音停止时提前返回False）"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.ring.written < position:
+                if self._stopping:
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else POLL_INTERVAL * 5)
+            return True
+
+    def cut(self, start, end=None, out=None):
+        """截取[start, end)的音频（end缺省为当前位置），返回int16数组（单声道时为一维）"""
+        with self._cond:
+            if end is None:
+                end = self.ring.written
+            audio, actual_start = self.ring.read(start, end, out)
+        if actual_start > start:
+            print(f"⚠ 截取的开头 {(actual_start - start) / self.rate:.2f}秒 已被覆盖")
+        return audio[:, 0] if self.channels == 1 else audio
+
+    def record(self, duration, pre_roll_ms=None, timeout=None, control=None):
+        """触发并录制duration秒（含回溯的pre-roll），返回int16数组；control.stop()时提前截取"""
+        start = self.trigger(pre_roll_ms)
+        end = self.position + int(self.rate * duration)
+        if control is None:
+            self.wait_for(end, timeout if timeout is not None else duration + 5)
+        else:
+            deadline = time.monotonic() + (timeout if timeout is not None else duration + 5)
+            while not self.wait_for(end, POLL_INTERVAL):
+                if control.stopped or self._stopping or time.monotonic() >= deadline:
+                    end = min(end, self.position)
+                    break
+        return self.cut(start, end)
+
+    def frames_from(self, position, frame_samples=None, timeout=2.0):
+        """从position开始按帧迭代已写入的音频（每帧是新数组），录音停止或超时时结束"""
+        frame_samples = frame_samples or self.rate * LIVE_CAPTURE_CONFIG["frame_ms"] // 1000
+        while True:
+            end = position + frame_samples
+            if not self.wait_for(end, timeout):
+                return
+            frame = self.cut(position, end)
+            position = end
+            yield frame
+
+    def capture_utterance(self, pre_roll_ms=None, max_duration=None, keep_silence_ms=None,
+                          control=None, **endpoint_options):
+        """触发后用VAD等说完，返回 (int16音频, 端点检测结果)；音频包含pre-roll
+
+        control.stop()时立即结束（reason为"stopped"），已录到的部分全部保留。
+        """
+        try:
+            from gui_utils.vad import Endpointer, get_detector, VAD_CONFIG
+        except ImportError:
+            from vad import Endpointer, get_detector, VAD_CONFIG
+        max_duration = max_duration or VAD_CONFIG["max_duration"]
+        max_samples = int(self.rate * max_duration)
+        if max_samples >= self.ring.capacity:
+            raise ValueError(f"最长时长 {max_duration}秒 超过环形缓冲容量 {self.seconds}秒")
+        keep_silence_ms = (VAD_CONFIG["keep_silence_ms"] if keep_silence_ms is None
+                           else keep_silence_ms)
+
+        start = self.trigger(pre_roll_ms)
+        now = self.position
+        endpointer = Endpointer(get_detector(sample_rate=self.rate), max_duration=max_duration,
+                                **endpoint_options)
+        # 只对触发之后的音频做端点检测，pre-roll部分原样保留
+        for frame in self.frames_from(now):
+            if endpointer.accept(frame):
+                break
+            if control is not None and control.stopped:
+                endpointer.finish(STOPPED)
+                break
+        if not endpointer.ended:
+            endpointer.finish("stream_end")
+        end = now + endpointer.samples
+        if endpointer.reason == "silence":
+            end = now + endpointer.speech_end + self.rate * keep_silence_ms // 1000
+        result = endpointer.result()
+        result["pre_roll"] = (now - start) / self.rate
+        return self.cut(start, end), result
+
+    def stats(self):
+        """返回常驻录音统计信息"""
+        return {
+            "device": self.device,
+            "seconds": self.seconds,
+            "position": self.ring.written,
+            "buffered": (self.ring.written - self.ring.oldest) / self.rate,
+            "bytes_received": self.bytes_received,
+            "restarts": self.restarts,
+            "gaps": self.gaps,
+            "running": self.running,
+            "last_error": None if self.last_error is None else str(self.last_error)
+        }
+
+
+# =============================================================================
+# 共享实例
+# =============================================================================
+
+_daemons = {}
+_daemons_lock = threading.Lock()
+
+
+def get_capture_daemon(pool=None, start=True):
+    """获取（并启动）连接对应的常驻录音；同一设备同时只能被一个arecord打开"""
+    pool = pool or get_pool()
+    with _daemons_lock:
+        daemon = _daemons.get(id(pool))
+        if daemon is None:
+            daemon = CaptureDaemon(pool)
+            _daemons[id(pool)] = daemon
+    if start:
+        daemon.start()
+    return daemon
+
+
+def capture_daemon_running(pool=None):
+    """连接对应的常驻录音是否正在运行（此时录音设备被它占用，录音应从环形缓冲截取）"""
+    pool = pool or get_pool()
+    with _daemons_lock:
+        daemon = _daemons.get(id(pool))
+    return daemon is not None and daemon.running
+
+
+def stop_capture_daemons():
+    """停止所有常驻录音"""
+    with _daemons_lock:
+        daemons = list(_daemons.values())
+        _daemons.clear()
+    for daemon in daemons:
+        daemon.stop()
+
+
+def record_with_preroll(local_path, pool=None, duration=None, use_vad=True, pre_roll_ms=None,
+                        control=None):
+    """从常驻录音截取一段（VAD可用时说完即止，否则录duration秒）写入local_path，返回结果
+
+    结果与vad.record_until_silence一致（reason/speech/duration/saved...），另有pre_roll。
+    control.stop()会提前结束截取。
+    """
+    try:
+        from gui_utils.vad import vad_available
+    except ImportError:
+        from vad import vad_available
+    daemon = get_capture_daemon(pool)
+    if use_vad and vad_available():
+        audio, result = daemon.capture_utterance(pre_roll_ms, max_duration=duration, control=control)
+    else:
+        duration = duration or AUDIO_FORMAT["duration"]
+        audio = daemon.record(duration, pre_roll_ms, control=control)
+        stopped = control is not None and control.stopped
+        result = {"reason": STOPPED if stopped else "duration", "speech": True, "duration": len(audio) / daemon.rate,
+                  "pre_roll": (daemon.pre_roll_ms if pre_roll_ms is None else pre_roll_ms) / 1000}
+    write_wav(local_path, [audio], daemon.rate, daemon.channels)
+    result["saved"] = len(audio) / daemon.rate
+    result["capture"] = daemon.stats()
+    print(f"✓ 已从常驻录音截取 {result['saved']:.2f}秒（含回溯 {result['pre_roll']:.2f}秒）: {local_path}")
+    return result
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程内音频处理与ffmpeg的对照测试
+对sample_audio中的每个WAV分别用ffmpeg和audio_dsp.AudioProcessor处理（参数都来自AUDIO_PROCESS_PARAMS），比较：
+
+    降噪+标准化    放大之前的浮点输出：20ms帧能量包络的平均/最大差（dB）和波形相关系数
+    完整处理链     16位输出的包络差和削顶统计；自动增益（agc）ffmpeg没有，和engine为"ffmpeg"时
+                   一样在ffmpeg之后进程内完成，两边的增益各自计算，这时完整处理链只报告不检查
+    耗时           ffmpeg子进程（含启动、读写文件）与进程内处理，每秒音频的毫秒数
+
+ffmpeg的afftdn输出整体延迟半个窗长，比较前按互相关对齐；afftdn在滤镜链中还会把第一个输出帧
+（即dynaudnorm的第一帧）整体压低nr分贝（ffmpeg分帧带来的启动效应，单独运行afftdn时没有），
+包络比较跳过这一帧。任何一项超出阈值时退出码为1，没有找到ffmpeg时不做比较，退出码为2。
+
+用法:
+    python gui_utils/compare_ffmpeg.py
+    python gui_utils/compare_ffmpeg.py sample_audio/example.wav --output dsp.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gui_utils.audio_dsp import (AudioProcessor, ffmpeg_filter, finish_ffmpeg, frame_size, numpy_steps,
+                                 parse_filter, to_pcm16, AUDIO_PROCESS_PARAMS, CHAIN)
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_audio")
+
+# 包络只比较高于该电平的帧（更安静的帧两边都是被压到底的噪声）
+ENVELOPE_FLOOR_DB = -60
+FRAME_MS = 20
+
+# 进程内处理计时取多次中最快的一次（第一次包含FFT初始化）
+TIMING_RUNS = 3
+
+
+def ffmpeg(args, **kwargs):
+    return subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"] + args,
+                          check=True, capture_output=True, **kwargs)
+
+
+def wav_info(path):
+    """从WAV的fmt块读取 (采样率, 声道数)，也支持WAVE_FORMAT_EXTENSIBLE"""
+    with open(path, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError(f"不是WAV文件: {path}")
+        while True:
+            chunk, size = struct.unpack("<4sI", f.read(8))
+            if chunk == b"fmt ":
+                _, channels, rate = struct.unpack("<HHI", f.read(8))
+                return rate, channels
+            f.seek(size + size % 2, 1)
+
+
+def ffmpeg_float(src, channels, audio_filter=None):
+    """用ffmpeg解码（可选经过滤镜）并以float64取回，形状 (采样数, 声道数)"""
+    args = ["-i", src] + (["-af", audio_filter] if audio_filter else [])
+    out = ffmpeg(args + ["-f", "f64le", "-acodec", "pcm_f64le", "-"]).stdout
+    return np.frombuffer(out, dtype="<f8").reshape(-1, channels)
+
+
+def startup_samples(params, rate):
+    """dynaudnorm第一帧的长度"""
+    if not params.get("normalize"):
+        return 0
+    _, options = parse_filter(params["normalize"])
+    return frame_size(rate, int(options.get("f", options.get("framelen", 500))))
+
+
+def envelope(audio, rate):
+    frame = rate * FRAME_MS // 1000
+    audio = audio[:len(audio) // frame * frame].reshape(-1, frame, audio.shape[1])
+    return 10 * np.log10((audio ** 2).mean(axis=(1, 2)) + 1e-12)
+
+
+def find_lag(reference, delayed, max_lag):
+    """delayed相对reference的延迟（采样数）"""
+    a, b = reference[:, 0], delayed[:, 0]
+    n = 1 << int(np.ceil(np.log2(len(a) + len(b))))
+    corr = np.fft.irfft(np.fft.rfft(b, n) * np.conj(np.fft.rfft(a, n)), n)
+    return int(np.argmax(corr[:max_lag + 1]))
+
+
+def compare(ours, theirs, rate, lag, skip=0):
+    ours, theirs = ours[:len(ours) - lag], theirs[lag:lag + len(ours) - lag]
+    ours, theirs = ours[skip:], theirs[skip:]
+    a, b = envelope(ours, rate), envelope(theirs, rate)
+    mask = np.maximum(a, b) > ENVELOPE_FLOOR_DB
+    diff = np.abs(a - b)[mask] if mask.any() else np.zeros(1)
+    return {
+        "envelope_mean_db": round(float(diff.mean()), 3),
+        "envelope_max_db": round(float(diff.max()), 3),
+        "correlation": round(float(np.corrcoef(ours.ravel(), theirs.ravel())[0, 1]), 5)
+    }
+
+
+def run_file(path, params, workdir):
+    # 用ffmpeg解码（sample_audio中有wave模块读不了的WAVE_FORMAT_EXTENSIBLE多声道文件）
+    rate, channels = wav_info(path)
+    audio = ffmpeg_float(path, channels)
+    duration = len(audio) / rate
+
+    stage = dict(params, amplify=None)
+    processor, full = AudioProcessor(stage), AudioProcessor(params)
+    dsp_seconds = float("inf")
+    for _ in range(TIMING_RUNS):
+        started = time.perf_counter()
+        ours = full.process(audio, rate)
+        dsp_seconds = min(dsp_seconds, time.perf_counter() - started)
+    ours_stage = processor.process(audio, rate).astype(np.float64)
+    ours_pcm = to_pcm16(ours).astype(np.float64) / 32768.0
+
+    theirs_stage = ffmpeg_float(path, channels, ffmpeg_filter(stage))
+    output = os.path.join(workdir, "ffmpeg.wav")
+    started = time.perf_counter()
+    ffmpeg(["-i", path, "-af", ffmpeg_filter(params), output])
+    ffmpeg_seconds = time.perf_counter() - started
+    # 自动增益（agc）ffmpeg没有，与engine为"ffmpeg"时一样在ffmpeg之后进程内完成
+    theirs_metrics = {}
+    theirs_pcm = finish_ffmpeg(ffmpeg_float(output, channels), rate, params, theirs_metrics)
+    theirs_pcm = to_pcm16(theirs_pcm).astype(np.float64) / 32768.0
+
+    lag = find_lag(ours_stage, theirs_stage, rate // 10)
+    skip = startup_samples(params, rate)
+    return {
+        "file": os.path.basename(path),
+        "rate": rate,
+        "channels": channels,
+        "duration_s": round(duration, 3),
+        "lag_samples": lag,
+        "stage": compare(ours_stage, theirs_stage, rate, lag, skip),
+        "full": compare(ours_pcm, theirs_pcm, rate, lag, skip),
+        "metrics": full.metrics,
+        "ffmpeg_metrics": theirs_metrics,
+        # 有agc时两边的增益各自按整段响度计算，ffmpeg开头被压低的一帧会让它的增益偏大
+        "full_checked": not numpy_steps(params),
+        "numpy_ms_per_s": round(dsp_seconds / duration * 1000, 2),
+        "ffmpeg_ms_per_s": round(ffmpeg_seconds / duration * 1000, 2)
+    }
+
+
+def check(entry, args):
+    failures = []
+    if entry["stage"]["envelope_mean_db"] > args.max_mean_db:
+        failures.append("降噪+标准化包络平均差")
+    if entry["stage"]["correlation"] < args.min_correlation:
+        failures.append("降噪+标准化相关系数")
+    if entry["full_checked"] and entry["full"]["envelope_mean_db"] > args.max_mean_db:
+        failures.append("完整处理链包络平均差")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="进程内音频处理与ffmpeg对照")
+    parser.add_argument("files", nargs="*", help="WAV文件，缺省为sample_audio/*.wav")
+    parser.add_argument("--max-mean-db", type=float, default=1.0, help="包络平均差上限（dB）")
+    parser.add_argument("--min-correlation", type=float, default=0.99, help="波形相关系数下限")
+    parser.add_argument("--output", help="JSON报告输出路径")
+    args = parser.parse_args(argv)
+
+    if shutil.which("ffmpeg") is None:
+        print("✗ 没有找到ffmpeg，无法对照（请安装ffmpeg并加入PATH）")
+        return 2
+    params = dict(AUDIO_PROCESS_PARAMS)
+    files = args.files or sorted(glob.glob(os.path.join(SAMPLE_DIR, "*.wav")))
+    print(f"处理链: {', '.join(params[key] for key in CHAIN if params.get(key))}")
+    results, failed = [], 0
+    with tempfile.TemporaryDirectory() as workdir:
+        for path in files:
+            entry = run_file(path, params, workdir)
+            failures = check(entry, args)
+            failed += bool(failures)
+            mark = "✗" if failures else "✓"
+            print(f"{mark} {entry['file']:<18} {entry['rate']}Hz x{entry['channels']}  "
+                  f"包络差 {entry['stage']['envelope_mean_db']:.2f}/{entry['stage']['envelope_max_db']:.2f}dB  "
+                  f"相关 {entry['stage']['correlation']:.4f}  完整链 {entry['full']['envelope_mean_db']:.2f}dB  "
+                  f"削顶 {entry['metrics'].get('clipping', 0):.2%}  延迟 {entry['lag_samples']}  NumPy {entry['numpy_ms_per_s']:.1f}ms/s  "
+                  f"ffmpeg {entry['ffmpeg_ms_per_s']:.1f}ms/s")
+            for failure in failures:
+                print(f"  ✗ 超出阈值: {failure}")
+            entry["failures"] = failures
+            results.append(entry)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"filter": ffmpeg_filter(params), "params": params, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"✓ 报告已写入 {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
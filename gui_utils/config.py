@@ -66,11 +66,34 @@ ASR_PARAMS = {
 # 音频处理配置
 # =============================================================================
 
-# FFmpeg音频处理参数
+# 音频处理参数（ffmpeg滤镜写法）
+# engine为"numpy"时在进程内处理（audio_dsp.py），参数不支持时自动改用ffmpeg；"ffmpeg"时始终调用ffmpeg
+# amplify的agc是自动增益：响度调到target dBFS（RMS），软限幅到limit dBFS以下；
+# 原来的固定放大"volume=1000.0"会让大部分语音削顶
 AUDIO_PROCESS_PARAMS = {
+    "engine": "numpy",
     "denoise": "afftdn=nr=12:nt=w",
     "normalize": "dynaudnorm=f=500:g=15", 
-    "amplify": "volume=1000.0"
+    "amplify": "agc=target=-20:limit=-1"
+}
+
+# 流式处理（边录边处理，audio_dsp.StreamProcessor）
+# dynaudnorm在流式处理中改用frame_ms的帧，只向后看lookahead_frames帧（整段处理要向后看整个高斯窗）
+# 总延迟 = 降噪窗长 + 帧移（约62ms） + (1 + lookahead_frames) * frame_ms + 自动增益分块（20ms）
+AUDIO_STREAM_CONFIG = {
+    "enabled": True,         # 流式录音时边录边处理，录音结束后不用再处理整段
+    "frame_ms": 100,
+    "lookahead_frames": 1
+}
+
+# ffmpeg进程池（仍用ffmpeg处理时，PCM经管道交给预先启动的ffmpeg进程，见ffmpeg_pool.py）
+FFMPEG_POOL_CONFIG = {
+    "enabled": True,         # 关闭时每段录音启动一次ffmpeg并读写文件
+    "workers": 2,            # 同时处理的ffmpeg进程数（每个预先启动一个进程）
+    "queue_size": 8,         # 等待处理的最大任务数
+    "queue_wait": 30,        # 队列满时提交任务的最长等待时间（秒）
+    "job_timeout": 60,       # 单段录音的处理超时（秒）
+    "max_idle": 300          # 预先启动的进程空闲超过该时间后替换（秒）
 }
 
 # 音频格式设置
@@ -81,6 +104,98 @@ AUDIO_FORMAT = {
     "duration": 5  # 录音时长（秒）
 }
 
+# 语音端点检测（silero VAD，说完后自动结束录音）
+VAD_CONFIG = {
+    "enabled": True,
+    "backend": "auto",       # "sherpa_onnx"、"onnxruntime"，auto时优先sherpa_onnx
+    "threshold": 0.5,        # 语音概率阈值
+    "min_speech_ms": 250,    # 连续语音达到该时长才算开始说话
+    "min_silence_ms": 700,   # 说话后连续静音达到该时长即结束录音
+    "max_duration": 10,      # 最长录音时长（秒），界面上的录音时长作为上限时覆盖该值
+    "start_timeout": 5,      # 开始后超过该时间仍未检测到语音则结束（秒），0表示不限
+    "keep_silence_ms": 200   # 保存的录音在语音结束后保留的静音（毫秒）
+}
+
+# 录放音格式协商（查询一次板子声卡的能力并缓存，尽量避免重采样）
+AUDIO_NEGOTIATION_CONFIG = {
+    "enabled": True,
+    "cache": "~/.kos_audio/audio_caps.json",  # 各设备能力缓存
+    "ttl": 7 * 86400,             # 缓存有效期（秒）
+    "capture_device": "hw:0,0",
+    "playback_device": "hw:1,0",
+    "playback_rate": 32000        # 首选播放采样率（TTS音频的采样率），录音以ASR_PARAMS为准
+}
+
+# 实时流式录音（远程arecord把原始PCM写到通道，本地按帧迭代）
+LIVE_CAPTURE_CONFIG = {
+    "device": "hw:0,0",      # 远程录音设备
+    "frame_ms": 20,          # 每帧时长（毫秒）
+    "buffer_ms": 2000,       # 本地最多缓存的音频（毫秒），消费跟不上时丢弃最旧的帧并计为overrun
+    "read_size": 4096        # 单次从通道读取的字节数
+}
+
+# 常驻录音环形缓冲（一直录音，触发时带pre-roll截取；开启后远程录音设备被常驻arecord占用）
+CAPTURE_DAEMON_CONFIG = {
+    "enabled": False,
+    "seconds": 30,           # 环形缓冲保存最近多少秒
+    "pre_roll_ms": 500,      # 触发时往前回溯的时长（毫秒）
+    "restart_backoff": 1.0   # 远程arecord中断后重启的间隔（秒）
+}
+
+# gRPC音频服务（板子上运行kos.sound.SoundService时，录音走一条HTTP/2长连接代替SSH+arecord）
+SOUND_GRPC_CONFIG = {
+    "enabled": False,
+    "host": None,            # 服务地址，None时使用REMOTE_HOST
+    "port": 50051,
+    "sample_rate": 16000,
+    "bit_depth": 16,
+    "channels": 1,
+    "frame_ms": 20,          # 录音流每帧时长（毫秒）
+    "timeout": 5.0           # 非流式调用的超时（秒）
+}
+
+# gRPC音频服务端（gui_utils/sound_server.py，可在板子上代替Rust版本运行，也可作本地测试替身）
+SOUND_SERVER_CONFIG = {
+    "host": "0.0.0.0",
+    "port": 50051,
+    "backend": "alsa",            # "alsa"（arecord/aplay管道）或 "wav"（WAV文件）
+    "capture_device": "hw:0,0",
+    "playback_device": "hw:1,0",
+    "chunk_ms": 20,               # 录音分块时长（毫秒），越小延迟越低、开销越大
+    "wav_source": None,           # wav后端充当麦克风的文件
+    "wav_output_dir": "played"    # wav后端保存播放内容的目录
+}
+
+# 全双工对话（播放回应时麦克风一直在录，用户一开口就打断播放，说完立即交给处理流程）
+DUPLEX_CONFIG = {
+    "onset_ms": 64,               # 连续语音达到该时长即打断播放（同时作为一句话的开始）
+    "min_speech_ms": 250,         # 语音短于该时长（咳嗽、碰撞声）不交给处理流程
+    "playback_threshold": 0.8,    # 播放期间的语音概率阈值（扬声器的声音也会被麦克风录到）
+    "lead_ms": 100,               # 播放数据最多领先实际播放的时长，决定打断后还会响多久
+    "buffer_ms": 100,             # 板子上aplay的设备缓冲时长（毫秒）
+    "chunk_ms": 20                # 每次发送的播放数据时长（毫秒）
+}
+
+# 回声消除（全双工时从麦克风信号中减去机器人自己播放的声音，参考信号为本地的播放音频）
+AEC_CONFIG = {
+    "enabled": True,
+    "block_ms": 10,          # 分块时长（毫秒），录音帧长应是它的整数倍
+    "filter_ms": 200,        # 自适应滤波器长度（毫秒），覆盖回声的拖尾
+    "step": 0.5,             # 自适应步长（0~1，越大收敛越快、越容易受干扰）
+    "copy_ratio": 0.8,       # 后台滤波器误差低于输出滤波器的该比例时复制过来（双讲时输出滤波器不受影响）
+    "window_ms": 200,        # 比较两个滤波器误差的平滑时长（毫秒）
+    "delay_ms": 150,         # 播放到麦克风的初始延迟估计（毫秒），播放开始后自动校准
+    "max_delay_ms": 500      # 延迟估计的搜索范围（毫秒）
+}
+
+# 多机器人（一个进程同时管理多台机器人，共用一个语音识别模型）
+FLEET_CONFIG = {
+    "robots_file": "robots.json",  # 机器人列表：{"机器人id": {"host": ..., "password": ...}}
+    "max_workers": 8,              # 并行录音的线程数
+    "asr_batch_size": 4,           # 同时待识别的多条音频一次批量解码的最大条数
+    "record_dir": "record/fleet"   # 各机器人录音的本地目录（下面按机器人id分子目录）
+}
+
 # =============================================================================
 # 文件路径配置
 # =============================================================================
@@ -88,8 +203,34 @@ AUDIO_FORMAT = {
 # 本地文件路径
 LOCAL_RECORD_DIR = "record"
 
-# 远程文件路径
-REMOTE_RECORD_DIR = "~/record"
+# 远程文件路径（板子上的tmpfs环形目录，避免录音文件持续写满SD卡）
+REMOTE_RECORD_DIR = "/tmp/kos_record"
+
+# 远程音频缓存（按内容哈希存放已上传的音频，重复播放时跳过上传）
+AUDIO_CACHE_CONFIG = {
+    "enabled": True,
+    "remote_dir": "~/.kos_audio_cache",               # 板子上的缓存目录
+    "max_bytes": 64 * 1024 * 1024,                    # 缓存总大小上限，超出时按LRU淘汰
+    "index": "~/.kos_audio/audio_cache.json"          # 本地记录远程缓存内容的索引文件
+}
+
+# 录音文件保留策略
+RETENTION_CONFIG = {
+    # 远程环形目录（REMOTE_RECORD_DIR）
+    "remote_tmpfs_mb": 32,          # 在目录上挂载的tmpfs大小（MB），0表示不挂载直接使用目录
+    "remote_max_bytes": 24 * 1024 * 1024,  # 目录内文件总大小上限，超出时删除最旧的文件
+    "remote_max_age": 3600,         # 远程文件最长保留时间（秒）
+    "cleanup_every": 10,            # 每写入多少个文件批量清理一次
+    # 本地录音目录（LOCAL_RECORD_DIR）
+    "local_max_bytes": 512 * 1024 * 1024,  # 本地录音目录大小上限
+    "local_max_age": 7 * 86400,     # 超过该时间的本地录音移入归档
+    "archive": True,                # True时移入归档（无损压缩），False时直接删除
+    "archive_raw": False,           # 原始录音test_raw_*.wav是否也归档（默认不归档：超出上限时只删除已有处理结果的）
+    "archive_dir": "archive",       # 归档子目录（位于本地录音目录下）
+    "archive_max_bytes": 1024 * 1024 * 1024,  # 归档总大小上限，超出时删除最旧的归档
+    "local_check_interval": 300,    # 本地清理的最短间隔（秒）
+    "keep_latest": 4                # 远程和本地都始终保留最新的几个文件（可能正在使用）
+}
 
 # =============================================================================
 # 网络配置
@@ -98,9 +239,20 @@ REMOTE_RECORD_DIR = "~/record"
 # 文件传输配置
 TRANSFER_CONFIG = {
     "chunk_size": 6000,      # base64传输块大小
+    "buffer_size": 32768,    # 流式传输缓冲区大小（字节）
+    "verify": True,          # 流式传输后校验字节数和MD5
+    # WAV文件使用KPC1无损压缩传输（远程不支持时自动回退）。默认关闭：板子上的编解码是纯Python，
+    # 3秒32kHz录音编解码约0.1秒而压缩比只有约0.7，只有慢速链路上才更快
+    "compress": False,
+    "compress_min_bytes": 262144,  # 打开压缩后，小于该字节数的文件仍然原始传输
+    "compress_codec_bps": 1.5e6,   # 远程编解码速率的初始估计（字节/秒），之后按实测更新
+    "compress_ratio": 0.7,         # 压缩比的初始估计，之后按实测更新
     "timeout": 30,           # 传输超时时间
     "retry_count": 3,        # 重试次数
-    "progress_interval": 10  # 进度显示间隔
+    "progress_interval": 10, # 进度显示间隔
+    "rank_cache": "~/.kos_audio/transfer_rank.json",  # 各主机传输方法测速排名缓存
+    "probe_size": 16384,     # 测速探测文件大小（字节）
+    "probe_ttl": 86400       # 排名有效期（秒），过期后重新探测
 }
 
 # SSH连接配置
@@ -108,4 +260,24 @@ SSH_CONFIG = {
     "timeout": 10,
     "auto_add_host_key": True,
     "strict_host_key_checking": False
-} 
\ No newline at end of file
+}
+
+# SSH连接监护配置（Windows版长连接：探测、断线重连、命令重试）
+SSH_SUPERVISOR_CONFIG = {
+    "keepalive": 5,          # 传输层keepalive间隔（秒）
+    "probe_interval": 2,     # 后台探测间隔（秒）
+    "probe_timeout": 1.5,    # 探测命令超时（秒），超时视为连接已断开
+    "backoff_initial": 0.05, # 首次重连等待（秒），之后按指数退避
+    "backoff_max": 1,        # 重连等待上限（秒），链路恢复后1秒内能重新连上
+    "reconnect_timeout": 1,  # 重连时TCP建连超时（秒）
+    "recover_wait": 15,      # 命令等待重连的最长时间（秒）
+    "retry_count": 2         # 断线后命令最多重试次数
+}
+
+# SSH连接池配置（同一主机的命令复用已认证的连接）
+SSH_POOL_CONFIG = {
+    "keepalive": 15,         # 传输层keepalive间隔（秒）
+    "idle_timeout": 300,     # 空闲连接回收时间（秒）
+    "max_channels": 8,       # 单个连接上同时打开的最大通道数
+    "channel_wait": 30       # 等待空闲通道的超时时间（秒）
+}
\ No newline at end of file
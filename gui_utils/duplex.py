@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全双工对话（barge-in）
+播放和录音同时进行：常驻录音（capture_ring.CaptureDaemon）一直在录，播放通过一个SSH通道边发边播
+（aplay -t raw -）；麦克风上VAD一检测到开口就打断当前播放，等这句话说完立即交给处理流程，
+不必等回应播完才能再说话：
+
+    def on_utterance(audio, result):          # 在会话的工作线程中按顺序调用
+        text = recognizer.transcribe(audio, result["sample_rate"])
+        session.play(tts(text))               # 播放中用户开口时提前返回False
+
+    session = DuplexSession(pool, on_utterance=on_utterance).start()
+
+打断延迟由两部分组成：VAD确认开口（onset_ms）和停止播放。播放数据按实际播放速度发送，最多领先
+lead_ms，板子上aplay的设备缓冲只有buffer_ms；打断时停止发送并给aplay发SIGINT（丢弃缓冲立即退出）。
+扬声器的声音也会被麦克风录到：播放的音频作为参考信号，麦克风帧先经过回声消除（aec.py）再送入VAD，
+交给处理流程的也是消除回声后的音频；播放期间另外使用更高的语音阈值（playback_threshold）。
+"""
+
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+try:
+    from gui_utils.ssh_pool import get_pool, quote_remote_path
+    from gui_utils.live_capture import POLL_INTERVAL, LIVE_CAPTURE_CONFIG
+    from gui_utils.capture_ring import AudioRing, get_capture_daemon
+    from gui_utils.aec import EchoCanceller, ReferenceTrack, AEC_CONFIG
+    from gui_utils.vad import Endpointer, get_detector, VAD_CONFIG
+    from gui_utils.audio_format import alsa_args, read_wav, resample
+    from gui_utils.record_control import stoppable_command, stop_command
+except ImportError:
+    from ssh_pool import get_pool, quote_remote_path
+    from live_capture import POLL_INTERVAL, LIVE_CAPTURE_CONFIG
+    from capture_ring import AudioRing, get_capture_daemon
+    from aec import EchoCanceller, ReferenceTrack, AEC_CONFIG
+    from vad import Endpointer, get_detector, VAD_CONFIG
+    from audio_format import alsa_args, read_wav, resample
+    from record_control import stoppable_command, stop_command
+
+try:
+    from gui_utils.config import DUPLEX_CONFIG, AUDIO_NEGOTIATION_CONFIG, REMOTE_RECORD_DIR
+except ImportError:
+    DUPLEX_CONFIG = {
+        "onset_ms": 64,
+        "min_speech_ms": 250,
+        "playback_threshold": 0.8,
+        "lead_ms": 100,
+        "buffer_ms": 100,
+        "chunk_ms": 20
+    }
+    AUDIO_NEGOTIATION_CONFIG = {"playback_device": "hw:1,0"}
+    REMOTE_RECORD_DIR = "/tmp/kos_record"
+
+# 播放开始后用多长的录音（秒）校准回声延迟
+ALIGN_SECONDS = 1.5
+
+# 默认播放格式（未协商时）
+DEFAULT_PLAYBACK_FORMAT = {"sample_rate": 16000, "channels": 1, "bit_depth": 16}
+
+
+def _exec(pool, cmd):
+    """在单独的通道上执行命令并返回stdout（连接池和SSHSupervisor的接口不同）"""
+    if hasattr(pool, "channel"):
+        return pool.exec_command(cmd, capture_output=True, timeout=5).stdout
+    returncode, stdout, stderr = pool.exec_command(cmd, timeout=5, idempotent=True)
+    return stdout
+
+
+def to_pcm(audio, sample_rate, fmt):
+    """把WAV路径或NumPy音频转换为fmt格式的PCM字节（重采样、声道、位深）"""
+    rate, channels = fmt["sample_rate"], fmt["channels"]
+    if isinstance(audio, str):
+        audio, _ = read_wav(audio, sample_rate=rate, mono=channels == 1)
+    else:
+        audio = np.asarray(audio)
+        if audio.dtype.kind in "iu":
+            audio = audio.astype(np.float32) / float(2 ** (8 * audio.dtype.itemsize - 1))
+        if audio.ndim > 1 and channels == 1:
+            audio = audio.mean(axis=1)
+        if sample_rate and sample_rate != rate:
+            audio = resample(audio, sample_rate, rate)
+    if audio.ndim == 1 and channels > 1:
+        audio = np.repeat(audio[:, None], channels, axis=1)
+    bits = fmt["bit_depth"]
+    scale = float(2 ** (bits - 1))
+    dtype = np.dtype("<i2") if bits == 16 else np.dtype("<i4")
+    return np.clip(np.round(audio * scale), -scale, scale - 1).astype(dtype).tobytes()
+
+
+def to_mono(audio, sample_rate, rate):
+    """把WAV路径或NumPy音频转换为rate采样率的单声道float32（回声消除的参考信号）"""
+    if isinstance(audio, str):
+        audio, _ = read_wav(audio, sample_rate=rate)
+        return audio.astype(np.float32)
+    audio = np.asarray(audio)
+    if audio.dtype.kind in "iu":
+        audio = audio.astype(np.float32) / float(2 ** (8 * audio.dtype.itemsize - 1))
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    if sample_rate and sample_rate != rate:
+        audio = resample(audio, sample_rate, rate)
+    return audio.astype(np.float32)
+
+
+class StreamPlayer:
+    """在一个SSH通道上边发边播，cancel()可以在任意线程随时打断
+
+    pool可以是连接池（有channel()）或任何有get_transport()的对象（如SSHSupervisor）。
+    """
+
+    def __init__(self, pool=None, fmt=None, device=None, lead_ms=None, buffer_ms=None,
+                 chunk_ms=None):
+        self.pool = pool or get_pool()
+        self.fmt = dict(fmt or DEFAULT_PLAYBACK_FORMAT)
+        self.device = device or AUDIO_NEGOTIATION_CONFIG["playback_device"]
+        self.lead = (DUPLEX_CONFIG["lead_ms"] if lead_ms is None else lead_ms) / 1000
+        self.buffer_ms = buffer_ms or DUPLEX_CONFIG["buffer_ms"]
+        self.chunk_ms = chunk_ms or DUPLEX_CONFIG["chunk_ms"]
+        self.pid_path = f"{REMOTE_RECORD_DIR}/.aplay_{os.getpid()}_{id(self):x}.pid"
+
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._chan_ctx = None
+        self._cancelled_at = None
+        self.playing = False
+
+        # 统计
+        self.played = 0
+        self.interrupted = 0
+        self.last_stop_latency = None
+
+    def __repr__(self):
+        return f"StreamPlayer({self.device}, {self.fmt['sample_rate']}Hz)"
+
+    def command(self):
+        """远程播放命令：从stdin读取原始PCM，设备缓冲限制为buffer_ms"""
+        cmd = alsa_args("aplay", self.device, self.fmt) + [
+            "-q", "-t", "raw", "--buffer-time", str(self.buffer_ms * 1000), "-"]
+        return (f"mkdir -p {quote_remote_path(REMOTE_RECORD_DIR)}; "
+                + stoppable_command(cmd, self.pid_path))
+
+    def _open_channel(self):
+        if hasattr(self.pool, "channel"):
+            self._chan_ctx = self.pool.channel()
+            return self._chan_ctx.__enter__()
+        return self.pool.get_transport().open_session()
+
+    def _close_channel(self, chan):
+        ctx, self._chan_ctx = self._chan_ctx, None
+        if ctx is not None:
+            ctx.__exit__(None, None, None)
+        else:
+            chan.close()
+
+    def play(self, audio, sample_rate=None, on_start=None):
+        """播放WAV路径或NumPy音频，播完返回True，被cancel()打断返回False
+
+        同一时间只播放一段；播放开始前已经调用过cancel()的不受影响。开始发送数据时调用on_start()。
+        """
+        data = to_pcm(audio, sample_rate, self.fmt)
+        frame_bytes = self.fmt["channels"] * self.fmt["bit_depth"] // 8
+        bytes_per_second = self.fmt["sample_rate"] * frame_bytes
+        chunk = self.fmt["sample_rate"] * self.chunk_ms // 1000 * frame_bytes
+
+        with self._lock:
+            self._cancel.clear()
+            self.playing = True
+            chan = self._open_channel()
+            try:
+                chan.exec_command(self.command())
+                start = time.monotonic()
+                if on_start is not None:
+                    on_start()
+                for pos in range(0, len(data), chunk):
+                    # 按实际播放速度发送，领先不超过lead秒
+                    wait = start + pos / bytes_per_second - self.lead - time.monotonic()
+                    if wait > 0 and self._cancel.wait(wait):
+                        break
+                    if self._cancel.is_set():
+                        break
+                    chan.sendall(data[pos:pos + chunk])
+                else:
+                    chan.shutdown_write()
+                    # 等待板子上的缓冲播完
+                    while not chan.exit_status_ready():
+                        if self._cancel.wait(POLL_INTERVAL / 5):
+                            break
+                if self._cancel.is_set():
+                    self._stop_remote()
+                    self.interrupted += 1
+                    return False
+                self.played += 1
+                return True
+            finally:
+                self.playing = False
+                self._close_channel(chan)
+
+    def _stop_remote(self):
+        """停止板子上的aplay（丢弃设备缓冲中的数据）"""
+        started = time.monotonic()
+        try:
+            _exec(self.pool, stop_command(self.pid_path))
+        except Exception as e:
+            print(f"⚠ 停止远程播放失败: {e}")
+        self.last_stop_latency = time.monotonic() - self._cancelled_at
+        print(f"✓ 播放已打断（停止远程播放 {time.monotonic() - started:.3f}秒）")
+
+    def cancel(self):
+        """打断当前播放（没有在播放时什么也不做），立即返回"""
+        if self.playing and not self._cancel.is_set():
+            self._cancelled_at = time.monotonic()
+            self._cancel.set()
+
+    def stats(self):
+        return {
+            "played": self.played,
+            "interrupted": self.interrupted,
+            "last_stop_latency": self.last_stop_latency
+        }
+
+
+class DuplexSession:
+    """全双工对话会话：边播边录，开口即打断播放，说完的一句话交给on_utterance(audio, result)
+
+    没有给出on_utterance时说完的话放进队列，用get()取出。result与vad.record_until_silence
+    的结果一致（reason/speech/duration...），另有sample_rate、barge_in（这句话是否打断了播放）。
+    """
+
+    def __init__(self, pool=None, on_utterance=None, playback_format=None, detector=None,
+                 daemon=None, max_duration=None, keep_silence_ms=None, echo_cancel=None,
+                 **endpoint_options):
+        self.pool = pool or get_pool()
+        # 由会话启动的常驻录音在stop()时一起停止，释放录音设备给普通录音
+        self._owns_daemon = False
+        if daemon is None:
+            daemon = get_capture_daemon(self.pool, start=False)
+            self._owns_daemon = not daemon.running
+            daemon.start()
+        self.daemon = daemon
+        self.rate = self.daemon.rate
+        self.player = StreamPlayer(self.pool, playback_format)
+        echo_cancel = AEC_CONFIG["enabled"] if echo_cancel is None else echo_cancel
+        self.aec = EchoCanceller(self.rate) if echo_cancel else None
+        self.reference = ReferenceTrack(self.rate)
+        # 消除回声后的音频，位置与常驻录音对齐（减去_clean_base）
+        self._clean = None
+        self._clean_base = 0
+        self.detector = detector or get_detector(sample_rate=self.rate)
+        self.on_utterance = on_utterance
+        self.max_duration = max_duration or VAD_CONFIG["max_duration"]
+        self.keep_silence_ms = (VAD_CONFIG["keep_silence_ms"] if keep_silence_ms is None
+                                else keep_silence_ms)
+        self.threshold = endpoint_options.pop("threshold", None) or VAD_CONFIG["threshold"]
+        self.endpoint_options = endpoint_options
+
+        self._utterances = queue.Queue()
+        self._stopping = False
+        self._listen_thread = None
+        self._worker_thread = None
+
+        # 统计
+        self.utterances = 0
+        self.barge_ins = 0
+        self.ignored = 0
+        self.last_onset_latency = None
+
+    def __repr__(self):
+        return f"DuplexSession({self.daemon.device}, {self.rate}Hz)"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        """开始监听麦克风"""
+        if self._listen_thread is not None:
+            raise RuntimeError("全双工会话已经启动")
+        self._stopping = False
+        self._pending = queue.Queue()
+        self._listen_thread = threading.Thread(target=self._listen_loop, name="duplex-listen",
+                                               daemon=True)
+        self._listen_thread.start()
+        if self.on_utterance is not None:
+            self._worker_thread = threading.Thread(target=self._worker_loop, name="duplex-worker",
+                                                   daemon=True)
+            self._worker_thread.start()
+        print("✓ 全双工对话已开始")
+        return self
+
+    def stop(self):
+        """停止监听并打断正在进行的播放；常驻录音是本会话启动的则一起停止，否则继续运行"""
+        self._stopping = True
+        self.player.cancel()
+        if self._listen_thread is not None:
+            self._listen_thread.join(timeout=3)
+            self._listen_thread = None
+        if self._worker_thread is not None:
+            self._pending.put(None)
+            self._worker_thread.join(timeout=3)
+            self._worker_thread = None
+        if self._owns_daemon:
+            self.daemon.stop()
+
+    def play(self, audio, sample_rate=None):
+        """播放回应，播完返回True，被用户打断返回False"""
+        if self.aec is None:
+            return self.player.play(audio, sample_rate)
+        reference = to_mono(audio, sample_rate, self.rate)
+        completed = self.player.play(
+            audio, sample_rate, on_start=lambda: self.reference.start(self.daemon.position, reference))
+        if not completed:
+            self.reference.stop(self.daemon.position)
+        return completed
+
+    def get(self, timeout=None):
+        """取出下一句说完的话 (audio, result)，超时返回None（仅在没有on_utterance时使用）"""
+        try:
+            return self._utterances.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    # -------------------------------------------------------------------------
+    # 监听
+    # -------------------------------------------------------------------------
+
+    def _new_endpointer(self):
+        # 起点用较短的onset_ms，开口后马上就能打断播放；一句话的最长时长由监听循环限制
+        return Endpointer(self.detector, threshold=self.threshold,
+                          min_speech_ms=DUPLEX_CONFIG["onset_ms"], max_duration=1e9,
+                          start_timeout=0, **self.endpoint_options)
+
+    def _listen_loop(self):
+        max_samples = int(self.rate * self.max_duration)
+        min_speech = self.rate * DUPLEX_CONFIG["min_speech_ms"] // 1000
+        frame_samples = None
+        if self.aec is not None:
+            # 帧长取回声消除分块的整数倍，不引入额外延迟
+            block = self.aec.block_size
+            frame_samples = max(1, self.rate * LIVE_CAPTURE_CONFIG["frame_ms"] // 1000 // block) * block
+        endpointer = self._new_endpointer()
+        segment = pos = self.daemon.position
+        self._reset_clean(pos)
+        barge_in = False
+        while not self._stopping:
+            for frame in self.daemon.frames_from(pos, frame_samples):
+                if self._stopping:
+                    break
+                frame = self._cancel_echo(frame, pos)
+                pos += len(frame)
+                # 播放期间提高阈值，避免把扬声器的声音当成用户开口
+                endpointer.threshold = (DUPLEX_CONFIG["playback_threshold"] if self.player.playing
+                                        else self.threshold)
+                waiting = endpointer.speech_start is None
+                endpointer.accept(frame)
+                if waiting and endpointer.speech_start is not None:
+                    barge_in = self.player.playing
+                    if barge_in:
+                        self.player.cancel()
+                        self.barge_ins += 1
+                        self.last_onset_latency = (pos - segment - endpointer.speech_start) / self.rate
+                        print(f"✓ 检测到用户开口，打断播放（开口后 {self.last_onset_latency:.3f}秒）")
+                if (not endpointer.ended and endpointer.speech_start is not None
+                        and endpointer.samples - endpointer.speech_start >= max_samples):
+                    endpointer.finish("max_duration")
+                if endpointer.ended:
+                    if endpointer.speech_end - endpointer.speech_start >= min_speech:
+                        self._emit(endpointer, segment, barge_in)
+                    else:
+                        self.ignored += 1
+                    endpointer = self._new_endpointer()
+                    segment = pos
+                    barge_in = False
+            else:
+                # 常驻录音停止或中断：从当前位置重新开始
+                if not self._stopping:
+                    time.sleep(POLL_INTERVAL)
+                    endpointer = self._new_endpointer()
+                    segment = pos = self.daemon.position
+                    self._reset_clean(pos)
+
+    def _reset_clean(self, position):
+        if self.aec is not None:
+            self._clean = AudioRing(self.daemon.ring.capacity)
+            self._clean_base = position
+
+    def _cancel_echo(self, frame, position):
+        """消除一帧麦克风信号中的回声（没有在播放、也没有回声拖尾时原样返回）"""
+        if self.aec is None:
+            return frame
+        reference = self.reference.get(position, len(frame))
+        if reference is None and position >= self.reference.end + self.aec.filter_length:
+            out = frame
+        else:
+            start = self.reference.position
+            if not self.reference.estimated and position - start >= self.rate * ALIGN_SECONDS:
+                # 播放开始一段时间后用录到的回声校准整体延迟
+                delay = self.reference.delay
+                if self.reference.align(self.daemon.cut(start, position), start):
+                    print(f"✓ 回声延迟校准: {self.reference.delay * 1000 / self.rate:.0f}ms")
+                    if abs(self.reference.delay - delay) > self.aec.block_size:
+                        self.aec.reset()
+                reference = self.reference.get(position, len(frame))
+            if reference is None:
+                reference = np.zeros(len(frame), dtype=np.float32)
+            out = self.aec.process(frame, reference)
+        self._clean.write(out)
+        return out
+
+    def _emit(self, endpointer, segment, barge_in):
+        """从环形缓冲截取这句话（带pre-roll）交给处理流程"""
+        pre_roll = self.rate * self.daemon.pre_roll_ms // 1000
+        start = max(segment, segment + endpointer.speech_start - pre_roll)
+        end = min(segment + endpointer.speech_end + self.rate * self.keep_silence_ms // 1000,
+                  segment + endpointer.samples)
+        if self.aec is not None:
+            audio, _ = self._clean.read(start - self._clean_base, end - self._clean_base)
+            audio = audio[:, 0]
+        else:
+            audio = self.daemon.cut(start, end)
+        result = endpointer.result()
+        result["saved"] = len(audio) / self.rate
+        result["sample_rate"] = self.rate
+        result["barge_in"] = barge_in
+        self.utterances += 1
+        print(f"✓ 一句话说完（{result['reason']}）: {result['saved']:.2f}秒"
+              f"{'，打断了播放' if barge_in else ''}")
+        if self.on_utterance is None:
+            self._utterances.put((audio, result))
+        else:
+            self._pending.put((audio, result))
+
+    def _worker_loop(self):
+        """按顺序处理说完的话（处理中播放的回应仍然可以被下一句打断）"""
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            try:
+                self.on_utterance(*item)
+            except Exception as e:
+                print(f"✗ 处理语音出错: {e}")
+
+    def stats(self):
+        return {
+            "utterances": self.utterances,
+            "barge_ins": self.barge_ins,
+            "ignored": self.ignored,
+            "last_onset_latency": self.last_onset_latency,
+            "player": self.player.stats(),
+            "aec": None if self.aec is None else self.aec.stats(),
+            "capture": self.daemon.stats()
+        }
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ffmpeg进程池
+仍然用ffmpeg处理的滤镜图（engine为"ffmpeg"，或AUDIO_PROCESS_PARAMS中有进程内不支持的滤镜）不再为每段
+录音执行一次 subprocess.run(ffmpeg_cmd) 并读写record/下的文件：音频以原始PCM（f32le）经stdin管道
+送给ffmpeg，处理结果从stdout读回。
+
+ffmpeg的afftdn、dynaudnorm等滤镜有内部状态，要读到输入结束才会输出缓冲的最后一段，所以一个ffmpeg
+进程只能处理一段录音：stdin的EOF就是一段录音的边界（分帧），stdout的EOF是结果的边界，输出的采样数
+必须与输入相同。进程池预先用同一个滤镜图启动好ffmpeg，停在等待输入的状态；任务到来时交给一个
+已启动的进程，同时启动下一个补位，启动开销与处理重叠，不在处理路径上：
+
+    pool = get_ffmpeg_pool("afftdn=nr=12:nt=w, dynaudnorm=f=500:g=15", 16000)
+    out = pool.process(audio)        # -1~1的float或int16，单声道一维或 (采样数, 声道数)，返回float32
+    future = pool.submit(audio)      # 队列满时最多等待queue_wait秒，仍然满则抛出FFmpegError
+
+每个工作线程持有一个预先启动的进程，使用前检查进程是否还在运行、空闲是否超过max_idle秒，
+不健康的进程直接替换；处理失败时换一个新进程重试一次。
+"""
+
+import atexit
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+try:
+    from gui_utils.config import FFMPEG_POOL_CONFIG
+except ImportError:
+    FFMPEG_POOL_CONFIG = {
+        "enabled": True,
+        "workers": 2,
+        "queue_size": 8,
+        "queue_wait": 30,
+        "job_timeout": 60,
+        "max_idle": 300
+    }
+
+# 管道中的采样格式（32位浮点，与进程内处理一样不经过16位量化）
+PIPE_FORMAT = "f32le"
+SAMPLE_BYTES = 4
+
+
+class FFmpegError(Exception):
+    """ffmpeg处理失败、超时或进程池队列已满"""
+
+
+class _Worker:
+    """一个已启动、等待stdin输入的ffmpeg进程"""
+
+    def __init__(self, command):
+        self.started = time.monotonic()
+        try:
+            self.proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            raise FFmpegError("没有找到ffmpeg")
+
+    def healthy(self, max_idle):
+        """进程还在等待输入，且空闲没有超过max_idle秒"""
+        if self.proc.poll() is not None:
+            return False
+        return not max_idle or time.monotonic() - self.started < max_idle
+
+    def run(self, data, timeout):
+        """写入一段PCM并关闭stdin，读出全部输出"""
+        try:
+            stdout, stderr = self.proc.communicate(data, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.kill()
+            raise FFmpegError(f"ffmpeg处理超时（{timeout}秒）")
+        except (BrokenPipeError, OSError) as e:
+            self.kill()
+            raise FFmpegError(f"ffmpeg进程已退出: {e}")
+        if self.proc.returncode != 0:
+            # 第一行是出错的原因，后面是逐级失败的提示
+            message = stderr.decode("utf-8", errors="replace").strip().splitlines()
+            raise FFmpegError(f"ffmpeg退出码 {self.proc.returncode}: {message[0] if message else ''}")
+        return stdout
+
+    def kill(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        try:
+            self.proc.communicate(timeout=5)
+        except (subprocess.TimeoutExpired, OSError, ValueError):
+            pass
+
+
+class FFmpegPool:
+    """同一个滤镜图、采样率和声道数的ffmpeg进程池
+
+    workers个工作线程从有界队列（queue_size）中取任务，每个线程持有一个预先启动的ffmpeg进程。
+    """
+
+    def __init__(self, audio_filter, sample_rate=16000, channels=1, workers=None, queue_size=None,
+                 queue_wait=None, job_timeout=None, max_idle=None, ffmpeg="ffmpeg"):
+        self.audio_filter = audio_filter
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.workers = workers or FFMPEG_POOL_CONFIG["workers"]
+        self.queue_wait = FFMPEG_POOL_CONFIG["queue_wait"] if queue_wait is None else queue_wait
+        self.job_timeout = job_timeout or FFMPEG_POOL_CONFIG["job_timeout"]
+        self.max_idle = FFMPEG_POOL_CONFIG["max_idle"] if max_idle is None else max_idle
+        self.command = [ffmpeg, "-hide_banner", "-loglevel", "error",
+                        "-f", PIPE_FORMAT, "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0",
+                        "-af", audio_filter, "-f", PIPE_FORMAT, "pipe:1"]
+        self._jobs = queue.Queue(maxsize=queue_size or FFMPEG_POOL_CONFIG["queue_size"])
+        self._lock = threading.Lock()
+        self._closed = False
+
+        # 统计
+        self.jobs = 0
+        self.failures = 0
+        self.retries = 0
+        self.spawned = 0
+        self.replaced = 0
+        self.busy_seconds = 0.0
+        self.audio_seconds = 0.0
+
+        self._threads = [threading.Thread(target=self._worker_loop, name=f"ffmpeg-pool-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def __repr__(self):
+        return (f"FFmpegPool({self.audio_filter!r}, {self.sample_rate}Hz x{self.channels}, "
+                f"workers={self.workers})")
+
+    def submit(self, audio):
+        """提交一段音频，返回Future，结果为处理后的float32（形状与输入相同）"""
+        if self._closed:
+            raise FFmpegError("ffmpeg进程池已关闭")
+        audio = np.asarray(audio)
+        if audio.dtype == np.int16:
+            samples = audio.astype(np.float32) / 32768.0
+        else:
+            samples = audio.astype(np.float32)
+        if (1 if samples.ndim == 1 else samples.shape[1]) != self.channels:
+            raise ValueError(f"声道数与进程池不符: {samples.shape}，应为 {self.channels} 声道")
+        future = Future()
+        try:
+            self._jobs.put((samples, future), timeout=self.queue_wait)
+        except queue.Full:
+            raise FFmpegError(f"ffmpeg任务队列已满（{self._jobs.maxsize}个），等待{self.queue_wait}秒后放弃")
+        return future
+
+    def process(self, audio, timeout=None):
+        """处理一段音频并等待结果"""
+        return self.submit(audio).result(timeout)
+
+    def close(self):
+        """处理完已提交的任务后结束工作线程和预先启动的进程"""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join(timeout=self.job_timeout)
+
+    def _spawn(self):
+        worker = _Worker(self.command)
+        with self._lock:
+            self.spawned += 1
+        return worker
+
+    def _ready(self, worker):
+        """返回健康的进程：worker不健康（已退出、空闲太久）时换一个新的"""
+        if worker is not None and worker.healthy(self.max_idle):
+            return worker
+        if worker is not None:
+            worker.kill()
+            with self._lock:
+                self.replaced += 1
+        return self._spawn()
+
+    def _worker_loop(self):
+        try:
+            worker = self._spawn()
+        except FFmpegError:
+            worker = None
+        while True:
+            try:
+                job = self._jobs.get(timeout=max(1, self.max_idle / 2) if self.max_idle else None)
+            except queue.Empty:
+                # 空闲时也定期检查，空闲太久的进程提前替换
+                try:
+                    worker = self._ready(worker)
+                except FFmpegError:
+                    worker = None
+                continue
+            if job is None:
+                if worker is not None:
+                    worker.kill()
+                return
+            samples, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                worker = self._ready(worker)
+                result, worker = self._run(worker, samples)
+                future.set_result(result)
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                worker = None
+                future.set_exception(e)
+
+    def _run(self, worker, samples):
+        """在worker上处理，失败时换新进程重试一次；返回 (结果, 预先启动的下一个进程)"""
+        data = np.ascontiguousarray(samples).tobytes()
+        started = time.monotonic()
+        for attempt in range(2):
+            # 先启动补位的进程，它的启动与本段的处理同时进行
+            following = self._spawn()
+            try:
+                output = worker.run(data, self.job_timeout)
+            except FFmpegError:
+                if attempt:
+                    following.kill()
+                    raise
+                with self._lock:
+                    self.retries += 1
+                worker = following
+                continue
+            break
+        frame = SAMPLE_BYTES * self.channels
+        if len(output) % frame or len(output) // frame != len(samples):
+            following.kill()
+            raise FFmpegError(f"ffmpeg输出长度不符: {len(output) // frame} != {len(samples)} 个采样")
+        with self._lock:
+            self.jobs += 1
+            self.busy_seconds += time.monotonic() - started
+            self.audio_seconds += len(samples) / self.sample_rate
+        result = np.frombuffer(output, dtype=np.float32).reshape(samples.shape)
+        return result, following
+
+    def stats(self):
+        with self._lock:
+            return {
+                "filter": self.audio_filter,
+                "format": f"{self.sample_rate}Hz x{self.channels}",
+                "workers": self.workers,
+                "pending": self._jobs.qsize(),
+                "jobs": self.jobs,
+                "failures": self.failures,
+                "retries": self.retries,
+                "spawned": self.spawned,
+                "replaced": self.replaced,
+                "ms_per_audio_second": round(self.busy_seconds / self.audio_seconds * 1000, 2)
+                if self.audio_seconds else None
+            }
+
+
+# =============================================================================
+# 进程池注册表
+# =============================================================================
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_ffmpeg_pool(audio_filter, sample_rate=16000, channels=1, **options):
+    """获取滤镜图、采样率、声道数相同的共享进程池"""
+    key = (audio_filter, sample_rate, channels)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = FFmpegPool(audio_filter, sample_rate, channels, **options)
+            _pools[key] = pool
+        return pool
+
+
+def close_all_pools():
+    """关闭所有ffmpeg进程池"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def pool_stats():
+    """返回所有ffmpeg进程池的统计信息"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+
+atexit.register(close_all_pools)
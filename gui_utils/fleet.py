@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多机器人录音与识别
+一个进程同时管理多台机器人：每台机器人一个会话（自己的SSH连接池、录音、播放队列），按机器人id
+索引，录音在线程池中并行进行，所有会话共用一个已加载的语音识别模型：
+
+    fleet = FleetManager.from_file("robots.json")
+    results = fleet.listen_all()             # 所有机器人同时录一句话并识别
+    fleet.play("robot2", "reply.wav")        # 进入robot2的播放队列，按顺序播放
+
+robots.json 的格式：{"robot1": {"host": "192.168.42.1"}, "robot2": {"host": "192.168.42.2",
+"password": "..."}}，省略的字段使用config.py中的远程设备配置。
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+try:
+    from gui_utils.ssh_pool import get_pool, quote_remote_path
+    from gui_utils.remote_cache import get_audio_cache, aplay_args
+    from gui_utils.remote_batch import RemoteBatch, add_upload
+    from gui_utils.retention import remote_record_path
+    from gui_utils.vad import get_detector, record_until_silence
+    from gui_utils.audio_format import read_wav
+except ImportError:
+    from ssh_pool import get_pool, quote_remote_path
+    from remote_cache import get_audio_cache, aplay_args
+    from remote_batch import RemoteBatch, add_upload
+    from retention import remote_record_path
+    from vad import get_detector, record_until_silence
+    from audio_format import read_wav
+
+try:
+    from gui_utils.config import ASR_PARAMS, FLEET_CONFIG
+except ImportError:
+    ASR_PARAMS = {"sample_rate": 16000}
+    FLEET_CONFIG = {
+        "robots_file": "robots.json",
+        "max_workers": 8,
+        "asr_batch_size": 4,
+        "record_dir": "record/fleet"
+    }
+
+
+# =============================================================================
+# 共享语音识别
+# =============================================================================
+
+class SharedRecognizer:
+    """多个会话共用的语音识别模型
+
+    识别请求进入队列，由一个工作线程处理；同时有多条待识别时，模型支持批量解码
+    （sherpa_onnx的decode_streams）就一次解码一批。
+    """
+
+    def __init__(self, recognizer=None, batch_size=None):
+        if recognizer is None:
+            try:
+                from gui_utils.speech_recognition import create_recognizer
+            except ImportError:
+                from speech_recognition import create_recognizer
+            recognizer = create_recognizer()
+        self.recognizer = recognizer
+        self.asr = getattr(recognizer, "asr", recognizer)
+        self.batch_size = batch_size or FLEET_CONFIG["asr_batch_size"]
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, name="fleet-asr", daemon=True)
+        self._thread.start()
+
+        # 统计
+        self.requests = 0
+        self.batches = 0
+        self.max_batch = 0
+
+    def submit(self, audio, sample_rate=None):
+        """提交识别请求（文件路径、int16或float32数组），返回Future，结果为识别文本"""
+        future = Future()
+        self._queue.put((audio, sample_rate or ASR_PARAMS["sample_rate"], future))
+        return future
+
+    def transcribe(self, audio, sample_rate=None, timeout=None):
+        """识别并等待结果"""
+        return self.submit(audio, sample_rate).result(timeout)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            self._decode(batch)
+
+    def _decode(self, batch):
+        self.requests += len(batch)
+        self.batches += 1
+        self.max_batch = max(self.max_batch, len(batch))
+        recognizer = getattr(self.asr, "_recognizer", None)
+        if len(batch) > 1 and hasattr(recognizer, "decode_streams"):
+            try:
+                streams = []
+                for audio, rate, _ in batch:
+                    stream = recognizer.create_stream()
+                    stream.accept_waveform(rate, _as_float(audio, rate))
+                    streams.append(stream)
+                recognizer.decode_streams(streams)
+                for (_, _, future), stream in zip(batch, streams):
+                    future.set_result(stream.result.text.strip())
+                return
+            except Exception as e:
+                print(f"⚠ 批量识别失败，改为逐条识别: {e}")
+        for audio, rate, future in batch:
+            if future.done():
+                continue
+            try:
+                if not isinstance(audio, str):
+                    audio = _as_float(audio, rate)
+                future.set_result(self.asr.transcribe(audio, rate).strip())
+            except Exception as e:
+                future.set_exception(e)
+
+    def stats(self):
+        return {"requests": self.requests, "batches": self.batches, "max_batch": self.max_batch,
+                "pending": self._queue.qsize()}
+
+
+def _as_float(audio, sample_rate):
+    """识别模型需要的-1~1单声道float32"""
+    if isinstance(audio, str):
+        audio, _ = read_wav(audio, sample_rate)
+        return audio
+    audio = np.asarray(audio)
+    if audio.dtype == np.int16:
+        audio = audio.astype(np.float32) / 32768.0
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    return audio.astype(np.float32, copy=False)
+
+
+# =============================================================================
+# 单台机器人的会话
+# =============================================================================
+
+class RobotSession:
+    """一台机器人的连接、录音和播放队列"""
+
+    def __init__(self, robot_id, host, user=None, password=None, port=None, record_dir=None):
+        self.robot_id = robot_id
+        self.host = host
+        self.user = user
+        self.password = password
+        self.port = port
+        self.pool = get_pool(host, user, password, port)
+        self.record_dir = os.path.join(record_dir or FLEET_CONFIG["record_dir"], str(robot_id))
+        # 每个会话一个带独立状态的VAD检测器，模型与其他会话共享
+        self._detector = None
+        self._record_lock = threading.Lock()
+
+        self._play_queue = queue.Queue()
+        self._play_thread = threading.Thread(target=self._play_worker,
+                                             name=f"fleet-play-{robot_id}", daemon=True)
+        self._play_thread.start()
+
+        # 统计
+        self.utterances = 0
+        self.plays = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_result = None
+
+    def __repr__(self):
+        return f"RobotSession({self.robot_id}, {self.host})"
+
+    @property
+    def detector(self):
+        if self._detector is None:
+            self._detector = get_detector().clone()
+        return self._detector
+
+    def listen(self, max_duration=None, local_path=None):
+        """录一句话（说完即止）写入本地文件，返回端点检测结果（含保存路径path）"""
+        if local_path is None:
+            os.makedirs(self.record_dir, exist_ok=True)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            local_path = os.path.join(self.record_dir, f"{timestamp}.wav")
+        # 同一台机器人的录音设备同时只能被一个arecord打开
+        with self._record_lock:
+            result = record_until_silence(local_path, pool=self.pool, max_duration=max_duration,
+                                          detector=self.detector)
+        result["path"] = local_path
+        self.utterances += 1
+        self.last_result = result
+        return result
+
+    def play(self, local_wav_path, alias=None):
+        """把音频放进播放队列，按入队顺序逐个播放，返回Future（结果为是否成功）"""
+        future = Future()
+        self._play_queue.put((local_wav_path, alias, future))
+        return future
+
+    def _play_worker(self):
+        while True:
+            item = self._play_queue.get()
+            if item is None:
+                return
+            local_wav_path, alias, future = item
+            try:
+                future.set_result(self._play(local_wav_path, alias))
+                self.plays += 1
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+                print(f"✗ [{self.robot_id}] 播放失败: {e}")
+                future.set_result(False)
+
+    def _play(self, local_wav_path, alias=None):
+        cache = get_audio_cache(self.host, self.user, self.password, self.port)
+        if cache is not None:
+            return cache.play(local_wav_path, alias=alias)
+        # 不使用缓存时上传和播放在一次远程执行中完成
+        remote = remote_record_path(os.path.basename(local_wav_path),
+                                    self.host, self.user, self.password, self.port)
+        with open(local_wav_path, "rb") as f:
+            data = f.read()
+        batch = RemoteBatch(self.pool)
+        batch.add(f"mkdir -p {quote_remote_path(os.path.dirname(remote))}", name="mkdir")
+        add_upload(batch, remote, data)
+        batch.add(aplay_args(self.pool) + [remote], name="play")
+        return batch.run().ok
+
+    def close(self):
+        self._play_queue.put(None)
+        self._play_thread.join(timeout=5)
+
+    def stats(self):
+        return {"robot": self.robot_id, "host": self.host, "utterances": self.utterances,
+                "plays": self.plays, "play_queue": self._play_queue.qsize(), "errors": self.errors,
+                "last_error": None if self.last_error is None else str(self.last_error),
+                "ssh": self.pool.stats()}
+
+
+# =============================================================================
+# 机器人组
+# =============================================================================
+
+class FleetManager:
+    """按机器人id管理会话，在线程池中并行录音，所有会话共用一个识别模型
+
+    recognizer可以是SharedRecognizer、speech_recognition中的识别器，或None（第一次识别时加载）。
+    """
+
+    def __init__(self, robots=None, recognizer=None, max_workers=None, record_dir=None):
+        self.record_dir = record_dir
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or FLEET_CONFIG["max_workers"],
+                                            thread_name_prefix="fleet")
+        self._recognizer = (recognizer if recognizer is None or isinstance(recognizer, SharedRecognizer)
+                            else SharedRecognizer(recognizer))
+        self._running = False
+        self._listeners = []
+        # 持续监听的线程（每台机器人一个，不占用线程池，否则超过max_workers的机器人永远轮不到）
+        self._listen_threads = {}
+        for robot_id, options in (robots or {}).items():
+            self.add_robot(robot_id, **options)
+
+    @classmethod
+    def from_file(cls, path=None, **kwargs):
+        """从JSON文件读取机器人列表"""
+        path = path or FLEET_CONFIG["robots_file"]
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    @property
+    def robot_ids(self):
+        with self._lock:
+            return list(self._sessions)
+
+    @property
+    def recognizer(self):
+        """共享的识别模型（第一次使用时加载，整个进程只加载一次）"""
+        with self._lock:
+            if self._recognizer is None:
+                self._recognizer = SharedRecognizer()
+            return self._recognizer
+
+    def add_robot(self, robot_id, host, user=None, password=None, port=None):
+        """添加机器人，返回会话；id已存在时返回原会话"""
+        with self._lock:
+            session = self._sessions.get(robot_id)
+            if session is None:
+                session = RobotSession(robot_id, host, user, password, port, self.record_dir)
+                self._sessions[robot_id] = session
+            return session
+
+    def remove_robot(self, robot_id):
+        with self._lock:
+            session = self._sessions.pop(robot_id, None)
+        if session is not None:
+            session.close()
+
+    def session(self, robot_id):
+        with self._lock:
+            return self._sessions[robot_id]
+
+    # -------------------------------------------------------------------------
+    # 录音与识别
+    # -------------------------------------------------------------------------
+
+    def listen(self, robot_id, max_duration=None, transcribe=True):
+        """让一台机器人录一句话并识别，返回结果字典（robot/text/path/reason/speech...）"""
+        result = self.session(robot_id).listen(max_duration)
+        result["robot"] = robot_id
+        result["text"] = ""
+        if transcribe and result["speech"]:
+            result["text"] = self.recognizer.transcribe(result["path"])
+        return result
+
+    def submit(self, robot_id, max_duration=None, transcribe=True):
+        """在线程池中执行listen，返回Future"""
+        return self._executor.submit(self.listen, robot_id, max_duration, transcribe)
+
+    def listen_all(self, robot_ids=None, max_duration=None, transcribe=True):
+        """所有（或指定的）机器人同时录一句话并识别，返回 {robot_id: 结果}，失败的结果含error"""
+        futures = {robot_id: self.submit(robot_id, max_duration, transcribe)
+                   for robot_id in (robot_ids or self.robot_ids)}
+        results = {}
+        for robot_id, future in futures.items():
+            try:
+                results[robot_id] = future.result()
+            except Exception as e:
+                session = self.session(robot_id)
+                session.errors += 1
+                session.last_error = e
+                results[robot_id] = {"robot": robot_id, "error": str(e), "speech": False, "text": ""}
+        return results
+
+    def play(self, robot_id, local_wav_path, alias=None):
+        """放进该机器人的播放队列，返回Future"""
+        return self.session(robot_id).play(local_wav_path, alias)
+
+    # -------------------------------------------------------------------------
+    # 持续监听
+    # -------------------------------------------------------------------------
+
+    def add_listener(self, func):
+        """注册 func(robot_id, 结果) ，持续监听时每识别出一句话调用一次"""
+        self._listeners.append(func)
+
+    def start(self, robot_ids=None, max_duration=None):
+        """每台机器人在各自的专用线程中循环录音识别，直到stop()；线程池仍留给submit/listen_all"""
+        self._running = True
+        with self._lock:
+            for robot_id in robot_ids or list(self._sessions):
+                thread = self._listen_threads.get(robot_id)
+                if thread is not None and thread.is_alive():
+                    continue
+                thread = threading.Thread(target=self._listen_loop, args=(robot_id, max_duration),
+                                          name=f"fleet-listen-{robot_id}", daemon=True)
+                self._listen_threads[robot_id] = thread
+                thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def _listen_loop(self, robot_id, max_duration):
+        while self._running:
+            try:
+                result = self.listen(robot_id, max_duration)
+            except KeyError:
+                # 机器人已被移除
+                return
+            except Exception as e:
+                session = self.session(robot_id)
+                session.errors += 1
+                session.last_error = e
+                print(f"✗ [{robot_id}] 录音失败: {e}")
+                time.sleep(1)
+                continue
+            if not result["speech"]:
+                continue
+            for func in list(self._listeners):
+                try:
+                    func(robot_id, result)
+                except Exception as e:
+                    print(f"⚠ 监听回调出错: {e}")
+
+    def close(self):
+        """停止监听，关闭所有会话和识别线程"""
+        self.stop()
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+        if self._recognizer is not None:
+            self._recognizer.close()
+
+    def stats(self):
+        return {
+            "robots": [session.stats() for session in list(self._sessions.values())],
+            "asr": None if self._recognizer is None else self._recognizer.stats()
+        }
+
+
+def main():
+    """命令行：所有机器人同时录一句话并打印识别结果"""
+    import argparse
+    parser = argparse.ArgumentParser(description="多机器人同时录音识别")
+    parser.add_argument("--robots", default=None, help="机器人列表JSON文件")
+    parser.add_argument("--seconds", type=float, default=None, help="每句最长时长（秒）")
+    parser.add_argument("--forever", action="store_true", help="持续监听直到Ctrl+C")
+    args = parser.parse_args()
+
+    with FleetManager.from_file(args.robots) as fleet:
+        print(f"✓ 已加载 {len(fleet)} 台机器人: {', '.join(map(str, fleet.robot_ids))}")
+        if args.forever:
+            fleet.add_listener(lambda robot_id, result: print(f"[{robot_id}] {result['text']}"))
+            fleet.start(max_duration=args.seconds)
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+        else:
+            for robot_id, result in fleet.listen_all(max_duration=args.seconds).items():
+                print(f"[{robot_id}] {result.get('error') or result['text'] or '(未检测到语音)'}")
+        print(json.dumps(fleet.stats()["asr"], ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
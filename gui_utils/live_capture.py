@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+实时流式录音
+在一个持久的SSH通道上运行 arecord -t raw，把麦克风的原始PCM直接写到stdout，本地后台线程边收边切成
+固定时长的int16帧放进有界队列，调用方按帧迭代：
+
+    with LiveCapture(pool) as capture:
+        for frame in capture:          # 每帧 frame_ms 毫秒的 np.int16 数组
+            vad.accept(frame)
+
+这样降噪、VAD和语音识别在用户还在说话时就可以开始，不必等录音文件写完再下载。
+消费速度跟不上时丢弃最旧的帧（保持实时性）并计数；板子上arecord自己报告的overrun也会统计。
+"""
+
+import collections
+import re
+import threading
+import time
+import wave
+
+import numpy as np
+
+try:
+    from gui_utils.ssh_pool import get_pool
+    from gui_utils.audio_dsp import stream_writer
+except ImportError:
+    from ssh_pool import get_pool
+    from audio_dsp import stream_writer
+
+try:
+    from gui_utils.config import AUDIO_FORMAT, LIVE_CAPTURE_CONFIG
+except ImportError:
+    AUDIO_FORMAT = {"format": "S16_LE", "rate": 16000, "channels": 1, "duration": 5}
+    LIVE_CAPTURE_CONFIG = {
+        "device": "hw:0,0",
+        "frame_ms": 20,
+        "buffer_ms": 2000,
+        "read_size": 4096
+    }
+
+# 通道读取超时（秒），用于定期检查停止标志和stderr
+POLL_INTERVAL = 0.1
+
+# arecord在stderr中报告的设备缓冲区溢出
+OVERRUN_PATTERN = re.compile(rb"overrun!!!")
+
+# int16，小端（与arecord的S16_LE一致）
+SAMPLE_DTYPE = np.dtype("<i2")
+
+
+class LiveCapture:
+    """远程麦克风的实时PCM帧流
+
+    pool可以是连接池（有channel()）或任何有get_transport()的对象（如SSHSupervisor）。
+    duration为None时一直录到stop()，否则arecord录满duration秒后自行结束。
+    """
+
+    def __init__(self, pool=None, device=None, rate=None, channels=None, frame_ms=None,
+                 buffer_ms=None, duration=None, read_size=None):
+        self.pool = pool or get_pool()
+        self.device = device or LIVE_CAPTURE_CONFIG["device"]
+        self.rate = rate or AUDIO_FORMAT["rate"]
+        self.channels = channels or AUDIO_FORMAT["channels"]
+        self.frame_ms = frame_ms or LIVE_CAPTURE_CONFIG["frame_ms"]
+        self.duration = duration
+        self.read_size = read_size or LIVE_CAPTURE_CONFIG["read_size"]
+
+        self.frame_samples = self.rate * self.frame_ms // 1000
+        self.frame_bytes = self.frame_samples * self.channels * SAMPLE_DTYPE.itemsize
+        buffer_ms = buffer_ms or LIVE_CAPTURE_CONFIG["buffer_ms"]
+        self.max_frames = max(1, buffer_ms // self.frame_ms)
+
+        self._frames = collections.deque()
+        self._cond = threading.Condition()
+        self._chan = None
+        self._chan_ctx = None
+        self._thread = None
+        self._stopping = False
+        self._ended = False
+        self._stderr = bytearray()
+        self.returncode = None
+        self.error = None
+
+        # 统计
+        self.started_at = None
+        self.first_frame_latency = None
+        self.frames_received = 0
+        self.frames_delivered = 0
+        self.overruns = 0
+        self.device_overruns = 0
+        self.max_depth = 0
+        self.bytes_received = 0
+
+    def __repr__(self):
+        return f"LiveCapture({self.device}, {self.rate}Hz, {self.frame_ms}ms)"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def command(self):
+        """远程录音命令：原始PCM输出到stdout"""
+        cmd = (f"exec arecord -q -D {self.device} -f {AUDIO_FORMAT['format']} "
+               f"-r {self.rate} -c {self.channels} -t raw")
+        if self.duration:
+            cmd += f" -d {int(self.duration)}"
+        return cmd + " -"
+
+    # -------------------------------------------------------------------------
+    # 通道
+    # -------------------------------------------------------------------------
+
+    def _open_channel(self):
+        if hasattr(self.pool, "channel"):
+            # 通过连接池打开时占用一个通道名额，结束时归还
+            self._chan_ctx = self.pool.channel()
+            return self._chan_ctx.__enter__()
+        return self.pool.get_transport().open_session()
+
+    def _close_channel(self):
+        chan, ctx = self._chan, self._chan_ctx
+        self._chan = self._chan_ctx = None
+        if ctx is not None:
+            ctx.__exit__(None, None, None)
+        elif chan is not None:
+            chan.close()
+
+    def start(self):
+        """打开通道启动远程arecord，并在后台线程中接收数据"""
+        if self._thread is not None:
+            raise RuntimeError("实时录音已经启动")
+        self._chan = self._open_channel()
+        self._chan.settimeout(POLL_INTERVAL)
+        self._chan.exec_command(self.command())
+        self._chan.shutdown_write()
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._reader_loop, name="live-capture", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止录音：关闭通道（远程arecord写stdout失败后退出）并等待接收线程结束"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    # -------------------------------------------------------------------------
+    # 接收
+    # -------------------------------------------------------------------------
+
+    def _reader_loop(self):
+        """把通道中的字节切成帧放进有界队列，队列满时丢弃最旧的帧"""
+        chan = self._chan
+        pending = bytearray()
+        try:
+            while not self._stopping:
+                self._drain_stderr(chan)
+                try:
+                    data = chan.recv(self.read_size)
+                except TimeoutError:
+                    continue
+                if not data:
+                    break
+                self.bytes_received += len(data)
+                pending += data
+                while len(pending) >= self.frame_bytes:
+                    frame = np.frombuffer(bytes(pending[:self.frame_bytes]), dtype=SAMPLE_DTYPE)
+                    del pending[:self.frame_bytes]
+                    if self.channels > 1:
+                        frame = frame.reshape(-1, self.channels)
+                    self._push(frame)
+            self._drain_stderr(chan)
+            if not self._stopping:
+                self.returncode = chan.recv_exit_status()
+        except Exception as e:
+            if not self._stopping:
+                self.error = e
+        finally:
+            self._close_channel()
+            with self._cond:
+                self._ended = True
+                self._cond.notify_all()
+
+    def _drain_stderr(self, chan):
+        """读取arecord的stderr并统计设备overrun"""
+        while chan.recv_stderr_ready():
+            data = chan.recv_stderr(self.read_size)
+            self.device_overruns += len(OVERRUN_PATTERN.findall(data))
+            self._stderr += data
+
+    def _push(self, frame):
+        with self._cond:
+            if self.first_frame_latency is None:
+                self.first_frame_latency = time.monotonic() - self.started_at
+            if len(self._frames) >= self.max_frames:
+                self._frames.popleft()
+                self.overruns += 1
+            self._frames.append(frame)
+            self.frames_received += 1
+            self.max_depth = max(self.max_depth, len(self._frames))
+            self._cond.notify()
+
+    # -------------------------------------------------------------------------
+    # 读取
+    # -------------------------------------------------------------------------
+
+    def read(self, timeout=None):
+        """取出下一帧；录音已结束且队列为空时返回None，超时抛出TimeoutError"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._frames:
+                if self._ended or self._stopping:
+                    self._raise_if_failed()
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("等待录音数据超时")
+                self._cond.wait(remaining)
+            self.frames_delivered += 1
+            return self._frames.popleft()
+
+    def _raise_if_failed(self):
+        """远程arecord出错结束时抛出RuntimeError（主动stop不算出错）"""
+        if self.error is not None:
+            raise RuntimeError(f"实时录音中断: {self.error}")
+        if self.returncode not in (None, 0):
+            message = bytes(self._stderr).decode("utf-8", errors="replace").strip()
+            raise RuntimeError(f"远程arecord退出码 {self.returncode}: {message}")
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
+
+    @property
+    def stderr(self):
+        return bytes(self._stderr).decode("utf-8", errors="replace")
+
+    def stats(self):
+        """返回录音统计信息"""
+        with self._cond:
+            depth = len(self._frames)
+        return {
+            "device": self.device,
+            "rate": self.rate,
+            "frame_ms": self.frame_ms,
+            "frames_received": self.frames_received,
+            "frames_delivered": self.frames_delivered,
+            "seconds_received": self.frames_received * self.frame_ms / 1000,
+            "bytes_received": self.bytes_received,
+            "queue_depth": depth,
+            "max_depth": self.max_depth,
+            "max_frames": self.max_frames,
+            "overruns": self.overruns,
+            "device_overruns": self.device_overruns,
+            "first_frame_latency": self.first_frame_latency
+        }
+
+
+def write_wav(path, frames, rate=None, channels=None):
+    """把int16帧序列写成WAV文件，返回写入的采样数"""
+    rate = rate or AUDIO_FORMAT["rate"]
+    channels = channels or AUDIO_FORMAT["channels"]
+    samples = 0
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(SAMPLE_DTYPE.itemsize)
+        wav.setframerate(rate)
+        for frame in frames:
+            wav.writeframes(np.ascontiguousarray(frame, dtype=SAMPLE_DTYPE).tobytes())
+            samples += len(frame)
+    return samples
+
+
+def stream_record(duration, local_path, pool=None, on_frame=None, processed_path=None, **options):
+    """流式录音duration秒并写入local_path，每收到一帧调用on_frame(frame)，返回统计信息
+
+    给出processed_path时边录边降噪/标准化（audio_dsp.StreamProcessor），结束时写出处理后的录音。
+    """
+    capture = LiveCapture(pool, duration=duration, **options)
+    writer = stream_writer(processed_path, capture.rate, capture.channels)
+
+    def frames():
+        for frame in capture:
+            if on_frame is not None:
+                on_frame(frame)
+            if writer is not None:
+                writer.write(frame)
+            yield frame
+
+    with capture:
+        write_wav(local_path, frames(), capture.rate, capture.channels)
+    if writer is not None:
+        writer.close()
+    stats = capture.stats()
+    print(f"✓ 流式录音完成: {stats['seconds_received']:.2f}秒, "
+          f"首帧延迟 {stats['first_frame_latency'] or 0:.3f}秒, "
+          f"丢帧 {stats['overruns']}, 设备overrun {stats['device_overruns']}")
+    if writer is not None:
+        stats["processing"] = writer.metrics
+    return stats
+
+
+def main():
+    """命令行：从板子实时录音，打印每秒的电平并保存为WAV"""
+    import argparse
+    parser = argparse.ArgumentParser(description="从远程设备流式录音")
+    parser.add_argument("--seconds", type=int, default=5, help="录音时长（秒）")
+    parser.add_argument("--output", default="live.wav", help="输出WAV文件")
+    parser.add_argument("--device", default=None, help="远程录音设备")
+    args = parser.parse_args()
+
+    levels = []
+
+    def show_level(frame):
+        levels.append(float(np.sqrt(np.mean(frame.astype(np.float32) ** 2))))
+        if len(levels) * LIVE_CAPTURE_CONFIG["frame_ms"] >= 1000:
+            print(f"  电平(RMS): {max(levels):8.1f}")
+            levels.clear()
+
+    stream_record(args.seconds, args.output, device=args.device, on_frame=show_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地SSH服务器替身
+在localhost上用paramiko的ServerInterface模拟板子的SSH服务：支持密码和公钥认证，exec请求交给本地
+sh -c 执行（stdin/stdout/stderr与通道直接对接），用于在没有板子的情况下测试和测速传输代码。
+记录握手次数，并可主动断开所有连接以模拟网络中断。
+"""
+
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+
+try:
+    import paramiko
+    PARAMIKO_AVAILABLE = True
+except ImportError:
+    PARAMIKO_AVAILABLE = False
+
+# 本地进程与通道之间的单次读写大小
+PIPE_CHUNK = 65536
+
+
+class _ServerHandler(paramiko.ServerInterface if PARAMIKO_AVAILABLE else object):
+    """单个连接的认证和通道请求处理"""
+
+    def __init__(self, server):
+        self.server = server
+
+    def get_allowed_auths(self, username):
+        return "password,publickey"
+
+    def check_auth_password(self, username, password):
+        if username == self.server.user and password == self.server.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_auth_publickey(self, username, key):
+        if username == self.server.user and key == self.server.client_key:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.server.run_command,
+                         args=(channel, command.decode("utf-8", errors="replace")),
+                         name="local-sshd-exec", daemon=True).start()
+        return True
+
+
+class LocalSSHServer:
+    """localhost上的SSH服务器替身
+
+    用法::
+
+        with LocalSSHServer() as server:
+            pool = get_pool("127.0.0.1", server.user, server.password, server.port)
+
+    port为0时自动选择空闲端口。client_key_path是可供ssh命令行使用的私钥文件。
+    """
+
+    def __init__(self, user="root", password="milkv", port=0):
+        if not PARAMIKO_AVAILABLE:
+            raise ImportError("本地SSH服务器需要安装paramiko库: pip install paramiko")
+        self.user = user
+        self.password = password
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.client_key = paramiko.RSAKey.generate(2048)
+
+        self._tmpdir = tempfile.mkdtemp(prefix="kos_sshd_")
+        self.client_key_path = os.path.join(self._tmpdir, "id_rsa")
+        self.client_key.write_private_key_file(self.client_key_path)
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("127.0.0.1", port))
+        self._sock.listen(64)
+        self.port = self._sock.getsockname()[1]
+
+        self._lock = threading.Lock()
+        self._transports = []
+        self._running = False
+        self._thread = None
+        self.handshakes = 0
+        self.commands = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        """在后台线程中开始接受连接"""
+        self._running = True
+        self._thread = threading.Thread(target=self._accept_loop, name="local-sshd", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务并断开所有连接"""
+        self._running = False
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+        self.drop_connections()
+        try:
+            os.remove(self.client_key_path)
+            os.rmdir(self._tmpdir)
+        except OSError:
+            pass
+
+    def drop_connections(self):
+        """断开当前所有已建立的连接（模拟网络中断），返回断开的连接数"""
+        with self._lock:
+            transports, self._transports = self._transports, []
+        for transport in transports:
+            transport.close()
+        return len(transports)
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                break
+            # 与板子上的sshd一样关闭Nagle算法，测得的延迟只反映客户端代码
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            with self._lock:
+                self.handshakes += 1
+                self._transports.append(transport)
+            try:
+                transport.start_server(server=_ServerHandler(self))
+            except (paramiko.SSHException, EOFError, OSError):
+                transport.close()
+
+    def run_command(self, channel, command):
+        """在本地shell中执行exec请求，把stdin/stdout/stderr与通道对接，结束后回传退出码"""
+        with self._lock:
+            self.commands += 1
+        proc = subprocess.Popen(["sh", "-c", command], stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        def feed_stdin():
+            try:
+                while True:
+                    data = channel.recv(PIPE_CHUNK)
+                    if not data:
+                        break
+                    proc.stdin.write(data)
+            except (OSError, EOFError):
+                pass
+            finally:
+                try:
+                    proc.stdin.close()
+                except OSError:
+                    pass
+
+        def pump_stderr():
+            try:
+                for data in iter(lambda: proc.stderr.read1(PIPE_CHUNK), b""):
+                    channel.sendall_stderr(data)
+            except (OSError, EOFError):
+                pass
+
+        threading.Thread(target=feed_stdin, daemon=True).start()
+        stderr_thread = threading.Thread(target=pump_stderr, daemon=True)
+        stderr_thread.start()
+        try:
+            for data in iter(lambda: proc.stdout.read1(PIPE_CHUNK), b""):
+                channel.sendall(data)
+            stderr_thread.join()
+            # 被信号杀死时returncode为负数，按shell的习惯回传128+信号值
+            returncode = proc.wait()
+            channel.send_exit_status(returncode if returncode >= 0 else 128 - returncode)
+            channel.shutdown_write()
+        except (OSError, EOFError):
+            proc.kill()
+        finally:
+            channel.close()
+
+    def ssh_config(self, path):
+        """写一份让ssh命令行连接到本服务器的配置文件（公钥认证、跳过主机密钥检查）"""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"Host *\n"
+                    f"    HostName 127.0.0.1\n"
+                    f"    Port {self.port}\n"
+                    f"    User {self.user}\n"
+                    f"    IdentityFile {self.client_key_path}\n"
+                    f"    IdentitiesOnly yes\n"
+                    f"    PasswordAuthentication no\n"
+                    f"    StrictHostKeyChecking no\n"
+                    f"    UserKnownHostsFile /dev/null\n"
+                    f"    LogLevel ERROR\n")
+        return path
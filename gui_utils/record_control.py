@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+提前结束正在进行的录音
+每次录音创建一个RecordingControl传给录音函数，录音函数把“怎么停下来”注册进去（关闭流式通道、
+给远程arecord发SIGINT、调用gRPC的StopRecording……），界面上点停止时调用stop()即可，
+已经录到的部分照常保存并进入后续处理：
+
+    control = RecordingControl()
+    threading.Thread(target=record_remote, args=(5,), kwargs={"control": control}).start()
+    ...
+    control.stop()
+
+固定时长的远程录音用 stoppable_command() 包装：arecord在前台运行并把pid写入文件，
+stop_command() 在另一个通道里按pid发SIGINT（arecord收到SIGINT会写好WAV头再退出）。
+"""
+
+import threading
+import time
+
+try:
+    from gui_utils.ssh_pool import quote_remote_path, join_command
+except ImportError:
+    from ssh_pool import quote_remote_path, join_command
+
+# 录音被手动停止时的结束原因（与VAD的silence/max_duration等并列）
+STOPPED = "stopped"
+
+
+class RecordingControl:
+    """一次录音的停止句柄，线程安全；stop()先于register()调用时，注册的函数立即执行"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handlers = []
+        self._stopped = threading.Event()
+
+    def __repr__(self):
+        return f"RecordingControl(stopped={self.stopped})"
+
+    @property
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def wait(self, timeout=None):
+        """等待stop()，返回是否已停止"""
+        return self._stopped.wait(timeout)
+
+    def register(self, func):
+        """注册停止时调用的函数"""
+        with self._lock:
+            if not self.stopped:
+                self._handlers.append(func)
+                return
+        _call(func)
+
+    def unregister(self, func):
+        with self._lock:
+            if func in self._handlers:
+                self._handlers.remove(func)
+
+    def stop(self):
+        """停止录音（可以重复调用）"""
+        with self._lock:
+            if self.stopped:
+                return
+            self._stopped.set()
+            handlers, self._handlers = self._handlers, []
+        for func in handlers:
+            _call(func)
+
+
+def _call(func):
+    try:
+        func()
+    except Exception as e:
+        print(f"⚠ 停止录音时出错: {e}")
+
+
+def stoppable_command(cmd, pid_path):
+    """把远程录音命令包装成可按pid停止的命令
+
+    命令在前台运行（后台任务在非交互shell中会忽略SIGINT），被stop_command()停止时退出码按0处理。
+    """
+    pid = quote_remote_path(pid_path)
+    flag = quote_remote_path(pid_path + ".stop")
+    return (f"rm -f {flag}; sh -c 'echo $$ > \"$0\"; exec \"$@\"' {pid} {join_command(cmd)}; "
+            f"__rc=$?; [ -f {flag} ] && __rc=0; rm -f {pid} {flag}; exit $__rc")
+
+
+def stop_command(pid_path):
+    """停止stoppable_command()启动的录音，录音进程存在时输出stopped"""
+    pid = quote_remote_path(pid_path)
+    flag = quote_remote_path(pid_path + ".stop")
+    return (f"if [ -s {pid} ]; then touch {flag}; kill -INT $(cat {pid}) 2>/dev/null && echo stopped; fi; true")
+
+
+def remote_stopper(run, pid_path, retries=10, interval=0.2):
+    """生成停止远程录音的函数，run(命令)在另一个通道执行命令并返回stdout
+
+    stop()可能早于远程写入pid文件（批处理还在建目录），这时隔interval秒重试，最多retries次。
+    """
+    def stop():
+        for _ in range(retries):
+            out = run(stop_command(pid_path))
+            if isinstance(out, bytes):
+                out = out.decode("utf-8", errors="replace")
+            if "stopped" in (out or ""):
+                print("✓ 已停止远程录音")
+                return
+            time.sleep(interval)
+        print("⚠ 没有找到正在进行的远程录音")
+    return stop
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+远程命令批处理
+把一次交互中的多个远程步骤（建目录、录音、取回文件、上传、播放……）合成一个shell脚本，
+在一次exec中执行，每个交互只需一次往返：
+
+    batch = RemoteBatch(pool)
+    batch.add(f"mkdir -p {d}", name="mkdir")
+    batch.add(arecord_cmd, name="record")
+    batch.add(f"cat {path}", name="fetch")
+    result = batch.run()
+    wav_bytes = result["fetch"].stdout
+
+每个步骤在子shell中执行（步骤中的exit只结束该步骤），执行后向stdout/stderr各写一个带随机
+标记的分隔行，stdout的分隔行带有该步骤的退出码；脚本最后输出一行汇总所有退出码的结尾。
+本地按标记把输出拆回各个步骤。check=True的步骤失败时跳过后续步骤，脚本本身总是以0退出，
+所以远程退出码非0或缺少结尾说明脚本没有执行完（连接中断、shell被杀死）。
+"""
+
+import hashlib
+import os
+import subprocess
+import sys
+import time
+
+try:
+    from gui_utils.ssh_pool import quote_remote_path
+    from gui_utils.transfer import (
+        TRANSFER_CONFIG, TransferError, checksum_command, parse_checksum_output, check_transfer
+    )
+except ImportError:
+    from ssh_pool import quote_remote_path
+    from transfer import (
+        TRANSFER_CONFIG, TransferError, checksum_command, parse_checksum_output, check_transfer
+    )
+
+# 分隔行前缀：\037(单元分隔符) + 固定字样，后接每批随机生成的标记
+MARKER_PREFIX = b"\x1fKOSB"
+
+
+class BatchError(Exception):
+    """批处理脚本没有完整执行（输出中缺少结尾）"""
+
+
+class StepResult:
+    """单个步骤的执行结果，skipped为True时returncode为None"""
+
+    def __init__(self, name, command, returncode=None, stdout=b"", stderr=b""):
+        self.name = name
+        self.command = command
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def __repr__(self):
+        status = "skipped" if self.skipped else f"rc={self.returncode}"
+        return f"StepResult({self.name}, {status})"
+
+    @property
+    def skipped(self):
+        return self.returncode is None
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    @property
+    def text(self):
+        """stdout按UTF-8解码后的文本"""
+        return self.stdout.decode("utf-8", errors="replace")
+
+    def check(self):
+        """步骤失败或被跳过时抛出subprocess.CalledProcessError"""
+        if not self.ok:
+            raise subprocess.CalledProcessError(
+                -1 if self.skipped else self.returncode, self.command, self.stdout, self.stderr)
+        return self
+
+
+class BatchResult:
+    """整批的执行结果，可按步骤名或序号取出StepResult"""
+
+    def __init__(self, steps, seconds):
+        self.steps = steps
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f"BatchResult({self.steps}, {self.seconds:.3f}s)"
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self.steps[key]
+        for step in self.steps:
+            if step.name == key:
+                return step
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.steps)
+
+    @property
+    def failed(self):
+        """第一个失败的步骤，全部成功时为None"""
+        for step in self.steps:
+            if not step.skipped and not step.ok:
+                return step
+        return None
+
+    @property
+    def ok(self):
+        return all(step.ok for step in self.steps)
+
+    @property
+    def returncodes(self):
+        return [step.returncode for step in self.steps]
+
+    def check(self):
+        """有步骤失败或被跳过时抛出对应步骤的CalledProcessError"""
+        for step in self.steps:
+            step.check()
+        return self
+
+    def echo(self):
+        """把各步骤的输出写到本地终端（与直接执行命令时看到的一致）"""
+        for step in self.steps:
+            if step.stdout:
+                sys.stdout.write(step.text)
+            if step.stderr:
+                sys.stderr.write(step.stderr.decode("utf-8", errors="replace"))
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def pool_runner(pool, timeout=None):
+    """在连接池上执行脚本的runner"""
+    def run(script, input=None):
+        result = pool.exec_command(script, capture_output=True, input=input, timeout=timeout)
+        return result.returncode, result.stdout, result.stderr
+    return run
+
+
+class RemoteBatch:
+    """按顺序组合的一批远程步骤
+
+    target可以是连接池（有exec_command方法），也可以是runner函数 run(脚本, input) ->
+    (退出码, stdout, stderr)。步骤默认从/dev/null读取标准输入；一批中最多一个步骤可以带
+    input数据，它从通道的stdin读取。
+    """
+
+    def __init__(self, target, timeout=None):
+        self._run = pool_runner(target, timeout) if hasattr(target, "exec_command") else target
+        self._steps = []
+        self._input = None
+
+    def __len__(self):
+        return len(self._steps)
+
+    def add(self, cmd, name=None, check=True, input=None):
+        """追加一个步骤，check=True时该步骤失败会跳过后续步骤；返回self以便链式调用"""
+        if input is not None:
+            if self._input is not None:
+                raise ValueError("一批中只能有一个步骤读取标准输入")
+            self._input = input.encode() if isinstance(input, str) else input
+        if isinstance(cmd, (list, tuple)):
+            cmd = " ".join(str(c) for c in cmd)
+        self._steps.append((name or f"step{len(self._steps)}", cmd, check, input is not None))
+        return self
+
+    def script(self, nonce):
+        """生成在远程执行的脚本"""
+        lines = ["__kos_rcs="]
+        for i, (_, cmd, check, reads_stdin) in enumerate(self._steps):
+            redirect = "" if reads_stdin else " < /dev/null"
+            # 命令后换行再闭合子shell，命令末尾的注释不会吞掉右括号
+            lines.append(f"(\n{cmd}\n){redirect}; __kos_rc=$?")
+            lines.append(f"printf '\\037KOSB{nonce}:{i}:%d\\n' $__kos_rc")
+            lines.append(f"printf '\\037KOSB{nonce}:{i}\\n' >&2")
+            lines.append('__kos_rcs="$__kos_rcs $__kos_rc"')
+            if check:
+                lines.append(f"[ $__kos_rc -eq 0 ] || {{ printf '\\037KOSB{nonce}:rc:%s\\n' "
+                             f"\"$__kos_rcs\"; exit 0; }}")
+        lines.append(f"printf '\\037KOSB{nonce}:rc:%s\\n' \"$__kos_rcs\"")
+        lines.append("exit 0")
+        return "\n".join(lines) + "\n"
+
+    def run(self, check=False):
+        """执行整批步骤，返回BatchResult；check=True时有步骤失败则抛出CalledProcessError"""
+        if not self._steps:
+            return BatchResult([], 0.0)
+        nonce = os.urandom(6).hex()
+        start = time.monotonic()
+        returncode, stdout, stderr = self._run(self.script(nonce), self._input)
+        seconds = time.monotonic() - start
+        steps = parse_output(self._steps, nonce, _as_bytes(stdout), _as_bytes(stderr))
+        if steps is None:
+            raise BatchError(f"远程批处理没有执行完 (退出码 {returncode}): "
+                             f"{_as_bytes(stderr)[-200:].decode('utf-8', errors='replace')}")
+        result = BatchResult(steps, seconds)
+        if check:
+            result.check()
+        return result
+
+
+def _as_bytes(data):
+    if data is None:
+        return b""
+    return data.encode("utf-8") if isinstance(data, str) else data
+
+
+def parse_output(steps, nonce, stdout, stderr):
+    """按标记把输出拆成各步骤的结果，缺少结尾时返回None"""
+    marker = MARKER_PREFIX + nonce.encode()
+    out_parts = stdout.split(marker + b":")
+    err_parts = stderr.split(marker + b":")
+
+    # out_parts[0]是第一步的输出，之后每段以 "序号:退出码\n" 或 "rc:..." 开头
+    results = []
+    pending = out_parts[0]
+    finished = False
+    for part in out_parts[1:]:
+        head, newline, rest = part.partition(b"\n")
+        if not newline:
+            # 分隔行本身被截断（连接在输出最后一行时断开）
+            break
+        if head.startswith(b"rc:"):
+            finished = True
+            break
+        index, _, rc = head.partition(b":")
+        try:
+            name, cmd, _, _ = steps[int(index)]
+            returncode = int(rc)
+        except (ValueError, IndexError):
+            break
+        results.append(StepResult(name, cmd, returncode, pending))
+        pending = rest
+    if not finished:
+        return None
+
+    for i, result in enumerate(results):
+        if i < len(err_parts):
+            # 第i+1段以 "序号\n" 开头，第一段没有前缀
+            result.stderr = err_parts[i] if i == 0 else err_parts[i].partition(b"\n")[2]
+    for name, cmd, _, _ in steps[len(results):]:
+        results.append(StepResult(name, cmd))
+    return results
+
+
+def _verify(verify):
+    return TRANSFER_CONFIG.get("verify", True) if verify is None else verify
+
+
+def upload_command(remote_path):
+    """从标准输入写入远程文件的步骤命令（先写临时文件再改名，中断时不留下半个文件）"""
+    quoted = quote_remote_path(remote_path)
+    part = quote_remote_path(remote_path + ".part")
+    return f"cat > {part} && mv -f {part} {quoted}"
+
+
+def verify_command(remote_path, data):
+    """在远程比较文件的字节数和MD5与data是否一致的步骤命令，不一致时退出码为1（远程没有md5sum时只比较字节数）"""
+    quoted = quote_remote_path(remote_path)
+    return (f"[ $(wc -c < {quoted}) -eq {len(data)} ] && "
+            f"{{ ! command -v md5sum > /dev/null 2>&1 || "
+            f"[ \"$(md5sum < {quoted} | cut -d' ' -f1)\" = {hashlib.md5(data).hexdigest()} ]; }} "
+            f"|| {{ echo '上传校验失败: 字节数或MD5不一致' >&2; exit 1; }}")
+
+
+def add_upload(batch, remote_path, data, verify=None):
+    """向批处理追加上传步骤upload，verify时（缺省按TRANSFER_CONFIG["verify"]）紧接着追加校验步骤verify
+
+    校验在远程执行，失败时批处理跳过后续步骤，损坏的文件不会被播放。
+    """
+    batch.add(upload_command(remote_path), name="upload", input=data)
+    if _verify(verify):
+        batch.add(verify_command(remote_path, data), name="verify")
+    return batch
+
+
+def fetch_command(remote_path, verify=None):
+    """把远程文件输出到标准输出的步骤命令
+
+    verify时（缺省按TRANSFER_CONFIG["verify"]）先输出字节数和MD5两行头信息，由save_output()校验。
+    """
+    quoted = quote_remote_path(remote_path)
+    if _verify(verify):
+        return f"{checksum_command(quoted)} && cat {quoted}"
+    return f"cat {quoted}"
+
+
+def save_output(step, local_path, verify=None):
+    """把步骤的标准输出写入本地文件（先写临时文件再替换），返回写入的字节数
+
+    verify须与fetch_command一致：为真时先解析两行头信息，内容的字节数或MD5不一致时抛出TransferError。
+    """
+    step.check()
+    data = step.stdout
+    if _verify(verify):
+        if data.count(b"\n", 0, 256) < 2:
+            raise TransferError("取回的数据缺少校验头")
+        first, second, data = data.split(b"\n", 2)
+        remote_size, remote_md5 = parse_checksum_output([first.decode(), second.decode()])
+        check_transfer(len(data), hashlib.md5(data).hexdigest(), remote_size, remote_md5)
+    tmp_path = local_path + ".part"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, local_path)
+    return len(data)
+
+
+def run_batch(target, commands, check=False):
+    """执行一组命令（字符串、列表或 (名字, 命令) 元组），返回BatchResult"""
+    batch = RemoteBatch(target)
+    for item in commands:
+        if isinstance(item, tuple) and len(item) == 2 and isinstance(item[0], str):
+            batch.add(item[1], name=item[0])
+        else:
+            batch.add(item)
+    return batch.run(check=check)
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+远程音频内容寻址缓存
+按文件内容的SHA-256把音频存放在板子上的缓存目录里（文件名即哈希），本地维护一份远程已有文件的索引，
+按总字节数做LRU淘汰。播放命中缓存的音频时不再上传，直接在远程播放；TTS回复还可以用
+“文本+音色”作为别名，重复的短句连TTS接口都不用再调用。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    from gui_utils.ssh_pool import get_pool, quote_remote_path
+    from gui_utils.transfer import upload_file
+    from gui_utils.remote_batch import RemoteBatch
+    from gui_utils.audio_format import negotiate_alsa, alsa_args, AUDIO_NEGOTIATION_CONFIG
+except ImportError:
+    from ssh_pool import get_pool, quote_remote_path
+    from transfer import upload_file
+    from remote_batch import RemoteBatch
+    from audio_format import negotiate_alsa, alsa_args, AUDIO_NEGOTIATION_CONFIG
+
+try:
+    from gui_utils.config import AUDIO_CACHE_CONFIG
+except ImportError:
+    AUDIO_CACHE_CONFIG = {
+        "enabled": True,
+        "remote_dir": "~/.kos_audio_cache",
+        "max_bytes": 64 * 1024 * 1024,
+        "index": "~/.kos_audio/audio_cache.json"
+    }
+
+# 远程缓存文件不存在时播放命令的退出码（板子重启或文件被外部删除，索引已过期）
+MISSING_EXIT = 44
+
+HASH_CHUNK = 1024 * 1024
+
+
+# 各主机协商得到的aplay参数 {(host, port, user): args}
+_aplay_args = {}
+_aplay_lock = threading.Lock()
+
+
+def aplay_args(pool):
+    """按板子声卡协商的播放格式生成aplay参数（每个主机只协商一次，与audio_control一致）"""
+    key = (pool.host, pool.port, pool.user)
+    with _aplay_lock:
+        args = _aplay_args.get(key)
+    if args is None:
+        formats = negotiate_alsa(pool.host, lambda: RemoteBatch(pool))
+        args = alsa_args("aplay", AUDIO_NEGOTIATION_CONFIG["playback_device"], formats["playback"])
+        with _aplay_lock:
+            _aplay_args[key] = args
+    return list(args)
+
+
+def file_digest(path):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def tts_alias(text, **params):
+    """TTS回复的缓存别名：同样的文本和合成参数得到同一个别名"""
+    items = "&".join(f"{k}={params[k]}" for k in sorted(params))
+    return "tts:" + hashlib.sha256(f"{items}\n{text}".encode("utf-8")).hexdigest()
+
+
+class RemoteAudioCache:
+    """单个远程主机的内容寻址音频缓存
+
+    索引格式 {哈希: {"size", "last_used", "ext"}}，别名表 {别名: 哈希}；
+    两者按主机保存在本地JSON文件中，条目按last_used做LRU淘汰，淘汰的远程文件用一条rm命令批量删除
+    （并入随后那次播放的远程执行，不单独占用一次往返）。
+    """
+
+    def __init__(self, pool, remote_dir=None, max_bytes=None, index_path=None):
+        self.pool = pool
+        self.host_key = f"{pool.user}@{pool.host}:{pool.port}"
+        self.remote_dir = (remote_dir or AUDIO_CACHE_CONFIG["remote_dir"]).rstrip("/")
+        self.max_bytes = max_bytes or AUDIO_CACHE_CONFIG["max_bytes"]
+        self.index_path = os.path.expanduser(index_path or AUDIO_CACHE_CONFIG["index"])
+
+        self._lock = threading.RLock()
+        self._dir_ready = False
+        self._pending_rm = []
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+        self._entries, self._aliases = self._load_index()
+
+    # -------------------------------------------------------------------------
+    # 索引
+    # -------------------------------------------------------------------------
+
+    def _load_index(self):
+        """读取本主机的缓存索引"""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            entry = data.get(self.host_key, {})
+            return entry.get("files", {}), entry.get("aliases", {})
+        except (OSError, ValueError):
+            return {}, {}
+
+    def _save_index(self):
+        """把本主机的索引写回文件（保留其他主机的记录）"""
+        try:
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            data[self.host_key] = {"files": self._entries, "aliases": self._aliases}
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"⚠ 无法写入音频缓存索引: {e}")
+
+    def total_bytes(self):
+        """远程缓存当前占用的字节数"""
+        with self._lock:
+            return sum(entry["size"] for entry in self._entries.values())
+
+    def remote_path(self, digest):
+        """缓存文件在远程的路径"""
+        ext = self._entries.get(digest, {}).get("ext", ".wav")
+        return f"{self.remote_dir}/{digest}{ext}"
+
+    def lookup(self, digest):
+        """查询哈希是否已在远程缓存中，命中时刷新LRU时间并返回远程路径"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            entry["last_used"] = time.time()
+            return self.remote_path(digest)
+
+    def lookup_alias(self, alias):
+        """按别名查询，返回 (哈希, 远程路径)，未命中时返回None"""
+        with self._lock:
+            digest = self._aliases.get(alias)
+            if digest is None:
+                return None
+            remote = self.lookup(digest)
+            if remote is None:
+                # 别名指向的文件已被淘汰
+                del self._aliases[alias]
+                return None
+            return digest, remote
+
+    def invalidate(self, digest):
+        """从索引中移除条目（远程文件已不存在）"""
+        with self._lock:
+            self._entries.pop(digest, None)
+            for alias in [a for a, d in self._aliases.items() if d == digest]:
+                del self._aliases[alias]
+            self._save_index()
+
+    def _evict_for(self, size):
+        """淘汰最久未使用的条目直到能放下size字节，返回被淘汰的远程路径列表"""
+        victims = []
+        total = self.total_bytes()
+        for digest in sorted(self._entries, key=lambda d: self._entries[d]["last_used"]):
+            if total + size <= self.max_bytes:
+                break
+            victims.append(self.remote_path(digest))
+            total -= self._entries[digest]["size"]
+            self.invalidate(digest)
+            self.evictions += 1
+        return victims
+
+    # -------------------------------------------------------------------------
+    # 上传与播放
+    # -------------------------------------------------------------------------
+
+    def _prepare_remote(self, victims):
+        """目录未建立时一条命令完成建目录和删除淘汰文件；目录已存在时淘汰文件留到下一次播放时一并删除"""
+        if self._dir_ready:
+            self._pending_rm.extend(victims)
+            return
+        parts = [f"mkdir -p {quote_remote_path(self.remote_dir)}"]
+        victims = self._pending_rm + victims
+        if victims:
+            parts.append("rm -f " + " ".join(quote_remote_path(p) for p in victims))
+        self.pool.exec_command(" && ".join(parts), check=True)
+        self._pending_rm = []
+        self._dir_ready = True
+
+    def ensure(self, local_path, alias=None, digest=None):
+        """确保本地文件已在远程缓存中，返回 (远程路径, 是否命中)"""
+        digest = digest or file_digest(local_path)
+        with self._lock:
+            remote = self.lookup(digest)
+            if remote is not None:
+                self.hits += 1
+                self.bytes_saved += self._entries[digest]["size"]
+                if alias:
+                    self._aliases[alias] = digest
+                self._save_index()
+                print(f"✓ 音频缓存命中，跳过上传: {digest[:12]}")
+                return remote, True
+
+            self.misses += 1
+            size = os.path.getsize(local_path)
+            self._prepare_remote(self._evict_for(size))
+            ext = os.path.splitext(local_path)[1].lower() or ".wav"
+            remote = f"{self.remote_dir}/{digest}{ext}"
+            try:
+                upload_file(local_path, remote, pool=self.pool)
+            except Exception:
+                # 上传失败的文件不进索引，尽量删掉远程残留
+                try:
+                    self.pool.exec_command(f"rm -f {quote_remote_path(remote)}")
+                except Exception:
+                    pass
+                raise
+            self._entries[digest] = {"size": size, "last_used": time.time(), "ext": ext}
+            if alias:
+                self._aliases[alias] = digest
+            self._save_index()
+            return remote, False
+
+    def play(self, local_path, alias=None, player=None):
+        """通过缓存播放本地音频：命中时直接远程播放，未命中时上传后播放"""
+        digest = file_digest(local_path)
+        remote, hit = self.ensure(local_path, alias=alias, digest=digest)
+        if self._play_remote(remote, player):
+            return True
+        if not hit:
+            return False
+        # 索引过期：远程文件已不存在，重新上传后再试一次
+        print("⚠ 远程缓存文件已不存在，重新上传")
+        self.invalidate(digest)
+        self._dir_ready = False
+        remote, _ = self.ensure(local_path, alias=alias, digest=digest)
+        return self._play_remote(remote, player)
+
+    def play_alias(self, alias, player=None):
+        """按别名直接播放远程缓存中的音频，未命中或远程文件已不存在时返回False"""
+        found = self.lookup_alias(alias)
+        if found is None:
+            return False
+        digest, remote = found
+        try:
+            if not self._play_remote(remote, player):
+                self.invalidate(digest)
+                return False
+        except Exception as e:
+            print(f"⚠ 缓存播放失败: {e}")
+            return False
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += self._entries.get(digest, {}).get("size", 0)
+            self._save_index()
+        print(f"✓ 音频缓存命中（{alias[:16]}），跳过合成和上传")
+        return True
+
+    def _play_remote(self, remote, player=None):
+        """在远程播放缓存文件；文件不存在时返回False，播放命令本身失败时抛出RuntimeError
+
+        待删除的淘汰文件在同一次远程执行中于播放之后删除。
+        """
+        quoted = quote_remote_path(remote)
+        args = player or aplay_args(self.pool)
+        batch = RemoteBatch(self.pool)
+        batch.add(f"test -f {quoted} || exit {MISSING_EXIT}; " + " ".join(args) + f" {quoted}",
+                  name="play", check=False)
+        with self._lock:
+            victims, self._pending_rm = self._pending_rm, []
+        if victims:
+            batch.add("rm -f " + " ".join(quote_remote_path(p) for p in victims),
+                      name="evict", check=False)
+        result = batch.run()
+        play = result["play"]
+        if victims and not result["evict"].ok:
+            with self._lock:
+                self._pending_rm.extend(victims)
+        if play.returncode == MISSING_EXIT:
+            return False
+        if play.returncode != 0:
+            raise RuntimeError(f"远程播放失败 (退出码 {play.returncode}): "
+                               f"{play.stderr.decode('utf-8', errors='replace').strip()}")
+        return True
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            return {
+                "host": self.host_key,
+                "files": len(self._entries),
+                "aliases": len(self._aliases),
+                "bytes": self.total_bytes(),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes_saved": self.bytes_saved,
+                "evictions": self.evictions
+            }
+
+
+# =============================================================================
+# 缓存注册表
+# =============================================================================
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_audio_cache(host=None, user=None, password=None, port=None):
+    """获取指定主机的共享音频缓存，配置中禁用缓存时返回None"""
+    if not AUDIO_CACHE_CONFIG.get("enabled", True):
+        return None
+    pool = get_pool(host, user, password, port)
+    key = (pool.host, pool.port, pool.user)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = RemoteAudioCache(pool)
+            _caches[key] = cache
+        return cache
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量重新处理录音
+调整AUDIO_PROCESS_PARAMS后，把record/下（含子目录）所有原始录音 test_raw_*.wav 重新处理成 test_*.wav。
+录音用多进程（ProcessPoolExecutor）并行处理，默认每个CPU核一个进程，每个进程内NumPy只用单线程。
+
+已经用同一组参数处理过、之后原始录音也没有变化的文件会跳过：每次处理后在录音目录的
+reprocess_manifest.json 中记下参数的哈希和原始录音的修改时间、大小。GUI录音时处理的文件不在
+清单中，第一次批量处理时会重新处理。结束后打印并写出汇总（吞吐量、失败的文件、增益和削顶统计）。
+原始录音默认不会被本地保留策略归档，但录音目录超出大小上限时已有处理结果的最旧原始录音会被删除；
+打开RETENTION_CONFIG["archive_raw"]后改为归档，已归档的原始录音不在这里查找，需先用
+retention.restore_archives() 还原到录音目录。
+
+用法:
+    python gui_utils/reprocess.py
+    python gui_utils/reprocess.py record/fleet --workers 8 --output summary.json
+    python gui_utils/reprocess.py --dry-run       # 只列出需要处理的文件
+    python gui_utils/reprocess.py --force         # 忽略清单，全部重新处理
+"""
+
+import os
+
+# 每个进程单线程，由进程数占满所有核（需在导入NumPy之前设置）
+for _name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_name, "1")
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import io
+import json
+import platform
+import sys
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gui_utils.audio_dsp import process_audio_file, AUDIO_PROCESS_PARAMS, CHAIN
+from gui_utils.config import LOCAL_RECORD_DIR
+
+MANIFEST_NAME = "reprocess_manifest.json"
+SUMMARY_NAME = "reprocess_summary.json"
+
+RAW_PATTERN = "test_raw_*.wav"
+
+# 每处理多少个文件打印一次进度
+PROGRESS_EVERY = 100
+
+
+def params_hash(params):
+    """处理参数的哈希（只取影响输出的键）"""
+    relevant = {key: params.get(key) for key in ["engine"] + CHAIN}
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def processed_name(raw_name):
+    """test_raw_20240101_120000.wav -> test_20240101_120000.wav，其他文件名加 _processed"""
+    if raw_name.startswith("test_raw_"):
+        return "test_" + raw_name[len("test_raw_"):]
+    stem, ext = os.path.splitext(raw_name)
+    return f"{stem}_processed{ext or '.wav'}"
+
+
+def discover(directory, pattern=RAW_PATTERN):
+    """递归查找原始录音，返回 [(原始录音, 输出文件)]（按路径排序）"""
+    clips = []
+    for path in sorted(glob.glob(os.path.join(directory, "**", pattern), recursive=True)):
+        if not os.path.isfile(path):
+            continue
+        clips.append((path, os.path.join(os.path.dirname(path), processed_name(os.path.basename(path)))))
+    return clips
+
+
+def load_manifest(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def is_up_to_date(entry, raw, processed, digest):
+    """输出文件存在、参数相同、原始录音在上次处理后没有变化"""
+    if not entry or entry.get("params") != digest:
+        return False
+    try:
+        raw_stat = os.stat(raw)
+        processed_mtime = os.path.getmtime(processed)
+    except OSError:
+        return False
+    return (entry.get("raw_mtime") == raw_stat.st_mtime and entry.get("raw_size") == raw_stat.st_size
+            and processed_mtime >= raw_stat.st_mtime)
+
+
+def process_clip(raw, processed, params):
+    """在工作进程中处理一段录音，返回结果字典（处理过程的输出收集在log中）"""
+    started, cpu_started = time.perf_counter(), time.process_time()
+    log = io.StringIO()
+    metrics = {}
+    try:
+        with contextlib.redirect_stdout(log):
+            ok = process_audio_file(raw, processed, params, metrics)
+        error = None if ok else (log.getvalue().strip().splitlines() or ["处理失败"])[-1].lstrip("✗⚠ ")
+    except Exception as e:
+        ok, error = False, f"{type(e).__name__}: {e}"
+    result = {
+        "raw": raw,
+        "ok": ok,
+        "error": error,
+        "seconds": time.perf_counter() - started,
+        "cpu_seconds": time.process_time() - cpu_started,
+        "audio_seconds": 0.0,
+        "metrics": metrics
+    }
+    if ok:
+        try:
+            with wave.open(processed, "rb") as wav:
+                result["audio_seconds"] = wav.getnframes() / wav.getframerate()
+        except (wave.Error, EOFError, OSError):
+            pass
+    return result
+
+
+def summarize(results, skipped, wall_seconds, workers, params):
+    done = [r for r in results if r["ok"]]
+    failed = [r for r in results if not r["ok"]]
+    audio_seconds = sum(r["audio_seconds"] for r in done)
+    cpu_seconds = sum(r["cpu_seconds"] for r in results)
+    gains = [r["metrics"]["gain_db"] for r in done if "gain_db" in r["metrics"]]
+    summary = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": workers,
+        "params": {key: params.get(key) for key in ["engine"] + CHAIN},
+        "params_hash": params_hash(params),
+        "processed": len(done),
+        "failed": len(failed),
+        "skipped": skipped,
+        "wall_s": round(wall_seconds, 3),
+        "audio_s": round(audio_seconds, 3),
+        "files_per_s": round(len(results) / wall_seconds, 2) if wall_seconds else None,
+        # 每秒墙钟时间处理的音频秒数
+        "realtime_factor": round(audio_seconds / wall_seconds, 1) if wall_seconds else None,
+        # 各进程的CPU时间之和 / (墙钟时间 * 使用的核数)，接近1说明所有核一直在忙
+        "utilization": round(cpu_seconds / (wall_seconds * min(workers, os.cpu_count() or 1)), 3)
+        if wall_seconds else None,
+        "gain_db": {"min": min(gains), "mean": round(sum(gains) / len(gains), 2), "max": max(gains)}
+        if gains else None,
+        "clipping_files": sum(1 for r in done if r["metrics"].get("clipping", 0) > 0),
+        "input_clipping_files": sum(1 for r in done if r["metrics"].get("input_clipping", 0) > 0),
+        "failures": [{"raw": r["raw"], "error": r["error"]} for r in failed]
+    }
+    return summary
+
+
+def print_summary(summary):
+    print(f"✓ 处理 {summary['processed']} 个，跳过 {summary['skipped']} 个，失败 {summary['failed']} 个，"
+          f"用时 {summary['wall_s']:.1f}秒（{summary['workers']} 个进程）")
+    if summary["processed"]:
+        print(f"  吞吐量 {summary['files_per_s']} 个/秒，音频 {summary['audio_s']:.1f}秒，"
+              f"{summary['realtime_factor']}倍实时，CPU利用率 {summary['utilization']:.0%}")
+    if summary["gain_db"]:
+        gain = summary["gain_db"]
+        print(f"  自动增益 {gain['min']:+.1f} ~ {gain['max']:+.1f}dB（平均 {gain['mean']:+.1f}dB），"
+              f"限幅前会削顶 {summary['clipping_files']} 个，原始录音削顶 {summary['input_clipping_files']} 个")
+    for failure in summary["failures"][:20]:
+        print(f"  ✗ {failure['raw']}: {failure['error']}")
+    if len(summary["failures"]) > 20:
+        print(f"  ... 另有 {len(summary['failures']) - 20} 个失败")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按当前AUDIO_PROCESS_PARAMS批量重新处理录音")
+    parser.add_argument("directory", nargs="?", default=LOCAL_RECORD_DIR, help="录音目录（递归查找）")
+    parser.add_argument("--pattern", default=RAW_PATTERN, help="原始录音的文件名模式")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，缺省为CPU核数")
+    parser.add_argument("--force", action="store_true", help="忽略清单，全部重新处理")
+    parser.add_argument("--dry-run", action="store_true", help="只列出需要处理的文件")
+    parser.add_argument("--output", help=f"汇总JSON输出路径，缺省为录音目录下的{SUMMARY_NAME}")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        print(f"✗ 录音目录不存在: {args.directory}")
+        return 1
+    params = dict(AUDIO_PROCESS_PARAMS)
+    digest = params_hash(params)
+    manifest_path = os.path.join(args.directory, MANIFEST_NAME)
+    manifest = {} if args.force else load_manifest(manifest_path)
+
+    clips = discover(args.directory, args.pattern)
+    pending = [(raw, processed) for raw, processed in clips
+               if not is_up_to_date(manifest.get(os.path.relpath(processed, args.directory)),
+                                    raw, processed, digest)]
+    skipped = len(clips) - len(pending)
+    print(f"找到 {len(clips)} 段录音，{skipped} 段已是最新，需要处理 {len(pending)} 段（参数 {digest}）")
+    if args.dry_run:
+        for raw, processed in pending:
+            print(f"  {raw} -> {processed}")
+        return 0
+
+    workers = max(1, min(args.workers or os.cpu_count() or 1, len(pending) or 1))
+    results = []
+    started = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(process_clip, raw, processed, params): (raw, processed)
+                       for raw, processed in pending}
+            for future in as_completed(futures):
+                raw, processed = futures[future]
+                result = future.result()
+                results.append(result)
+                if result["ok"]:
+                    st = os.stat(raw)
+                    manifest[os.path.relpath(processed, args.directory)] = {
+                        "params": digest, "raw_mtime": st.st_mtime, "raw_size": st.st_size}
+                if len(results) % PROGRESS_EVERY == 0:
+                    print(f"  已完成 {len(results)}/{len(pending)}")
+    finally:
+        # 中途中断时也保存已完成的部分
+        if results:
+            save_manifest(manifest_path, manifest)
+    wall_seconds = time.perf_counter() - started
+
+    summary = summarize(results, skipped, wall_seconds, workers, params)
+    print_summary(summary)
+    output = args.output or os.path.join(args.directory, SUMMARY_NAME)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"✓ 汇总已写入 {output}")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+录音文件保留策略
+远程：录音和待播放文件写到板子上挂载了tmpfs的环形目录（REMOTE_RECORD_DIR），每写入若干个文件后
+在后台用一条命令扫描目录、再用一条rm批量删除超龄或超出总大小的最旧文件，不再写SD卡。
+本地：录音目录中GUI生成的录音文件（LOCAL_PATTERNS）超龄或超出大小上限时按天归档到zip（WAV用KPC1
+无损压缩），归档总量也有上限。原始录音 test_raw_*.wav 是批量重新处理（reprocess.py）的输入，同样计入
+大小上限；默认不归档，超出时只删除已有处理结果（同时间戳的 test_*.wav，在目录或归档中）的最旧原始录音，
+还没处理过的始终保留。打开archive_raw后原始录音和其他文件一起归档，归档中的原始录音需先用
+restore_archives() 还原到录音目录再重新处理。
+目录中的其他文件（如reprocess.py的清单和汇总）不受影响。
+每次清理都会报告回收的字节数和当前占用。
+"""
+
+import fnmatch
+import os
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+try:
+    from gui_utils.ssh_pool import get_pool, quote_remote_path
+    from gui_utils import audio_codec
+except ImportError:
+    from ssh_pool import get_pool, quote_remote_path
+    import audio_codec
+
+try:
+    from gui_utils.config import REMOTE_RECORD_DIR, RETENTION_CONFIG
+except ImportError:
+    REMOTE_RECORD_DIR = "/tmp/kos_record"
+    RETENTION_CONFIG = {
+        "remote_tmpfs_mb": 32,
+        "remote_max_bytes": 24 * 1024 * 1024,
+        "remote_max_age": 3600,
+        "cleanup_every": 10,
+        "local_max_bytes": 512 * 1024 * 1024,
+        "local_max_age": 7 * 86400,
+        "archive": True,
+        "archive_raw": False,
+        "archive_dir": "archive",
+        "archive_max_bytes": 1024 * 1024 * 1024,
+        "local_check_interval": 300,
+        "keep_latest": 4
+    }
+
+# 一条rm命令最多删除的文件数（避免超出远程命令行长度限制）
+RM_BATCH = 200
+
+# 并入批处理时prepare步骤的名字
+PREPARE_STEP = "prepare"
+
+# 归档中KPC1编码文件的后缀
+ARCHIVE_CODEC_SUFFIX = ".kpc1"
+
+# 本地保留策略只处理GUI生成的这些录音文件
+LOCAL_PATTERNS = ("test_raw_*.wav", "test_*.wav", "response_*.wav", "tts_*.wav")
+RAW_PATTERN = "test_raw_*.wav"
+RAW_PREFIX = "test_raw_"
+PROCESSED_PREFIX = "test_"
+
+
+def format_size(size):
+    """把字节数格式化为易读字符串"""
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f} MB"
+    return f"{size / 1024:.1f} KB"
+
+
+def select_victims(files, now, max_bytes, max_age, keep_latest=0, keep=()):
+    """按保留策略选出要清理的文件
+
+    files为 [(mtime, size, name)]，返回 (要清理的文件列表, 保留文件的总字节数)。
+    从新到旧累计大小，超龄或累计超出max_bytes的文件被清理，最新的keep_latest个和名字在keep中的
+    文件始终保留（但计入大小）。
+    """
+    victims = []
+    kept_bytes = 0
+    for index, (mtime, size, name) in enumerate(sorted(files, reverse=True)):
+        protected = index < keep_latest or name in keep
+        expired = bool(max_age) and now - mtime > max_age
+        oversize = bool(max_bytes) and kept_bytes + size > max_bytes
+        if not protected and (expired or oversize):
+            victims.append((mtime, size, name))
+        else:
+            kept_bytes += size
+    return victims, kept_bytes
+
+
+# =============================================================================
+# 远程环形目录
+# =============================================================================
+
+class RemoteRing:
+    """板子上的有界录音目录
+
+    prepare() 创建目录并按配置挂载tmpfs；path() 返回目录中的文件路径并计数，每写入cleanup_every个文件
+    在后台线程执行一次cleanup()。
+    """
+
+    def __init__(self, pool, directory=None, max_bytes=None, max_age=None,
+                 tmpfs_mb=None, cleanup_every=None, keep_latest=None):
+        self.pool = pool
+        self.directory = (directory or REMOTE_RECORD_DIR).rstrip("/")
+        self.max_bytes = max_bytes if max_bytes is not None else RETENTION_CONFIG["remote_max_bytes"]
+        self.max_age = max_age if max_age is not None else RETENTION_CONFIG["remote_max_age"]
+        self.tmpfs_mb = tmpfs_mb if tmpfs_mb is not None else RETENTION_CONFIG["remote_tmpfs_mb"]
+        self.cleanup_every = cleanup_every or RETENTION_CONFIG["cleanup_every"]
+        self.keep_latest = keep_latest if keep_latest is not None else RETENTION_CONFIG["keep_latest"]
+
+        self._lock = threading.Lock()
+        self._prepared = False
+        self._writes = 0
+        self._cleanup_thread = None
+        self.bytes_reclaimed = 0
+        self.files_removed = 0
+        self.last_report = None
+
+    @property
+    def prepared(self):
+        return self._prepared
+
+    def prepare_command(self):
+        """创建目录（并按配置挂载tmpfs）的远程命令，可以单独执行也可以并入批处理"""
+        quoted = quote_remote_path(self.directory)
+        cmd = f"mkdir -p {quoted}"
+        # 只有绝对路径才能在/proc/mounts中确认挂载状态
+        if self.tmpfs_mb and self.directory.startswith("/"):
+            cmd += (f" && if ! grep -q ' {self.directory} tmpfs ' /proc/mounts; then "
+                    f"mount -t tmpfs -o size={int(self.tmpfs_mb)}m kos_record {quoted} "
+                    f"|| echo nomount; fi")
+        return cmd
+
+    def mark_prepared(self, output):
+        """记录prepare_command已成功执行，output为其标准输出"""
+        if "nomount" in output:
+            print(f"⚠ 无法在 {self.directory} 挂载tmpfs，直接使用该目录")
+        self._prepared = True
+
+    def batch_prepare(self, batch):
+        """目录尚未准备时把prepare_command()并入批处理（见remote_batch.py）"""
+        if not self._prepared:
+            batch.add(self.prepare_command(), name=PREPARE_STEP)
+
+    def batch_prepared(self, result):
+        """批处理执行后根据prepare步骤的结果记录目录状态"""
+        try:
+            step = result[PREPARE_STEP]
+        except KeyError:
+            return
+        if step.ok:
+            self.mark_prepared(step.text)
+
+    def prepare(self):
+        """创建远程目录，配置了tmpfs且目录尚未挂载时挂载tmpfs（只执行一次）"""
+        with self._lock:
+            if self._prepared:
+                return
+            result = self.pool.exec_command(self.prepare_command(), check=True, text=True)
+            self.mark_prepared(result.stdout)
+
+    def path(self, name, prepare=True):
+        """返回环形目录中的文件路径，并按写入次数触发批量清理
+
+        prepare=False时不在这里建目录，由调用方把prepare_command()并入自己的批处理。
+        """
+        if prepare:
+            self.prepare()
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.cleanup_every == 0
+        if due:
+            self.cleanup_async()
+        return f"{self.directory}/{name}"
+
+    def scan(self):
+        """一条命令读取目录中的文件列表（修改时间、大小、文件名）、远程当前时间和文件系统占用"""
+        quoted = quote_remote_path(self.directory)
+        cmd = (f"cd {quoted} 2>/dev/null || exit 0; "
+               "for f in *; do [ -f \"$f\" ] && stat -c '%Y %s %n' \"$f\"; done; "
+               "echo ---; date +%s; df -kP . | tail -1")
+        output = self.pool.exec_command(cmd, text=True).stdout
+        files = []
+        now = time.time()
+        fs_used = fs_size = None
+        head, _, tail = output.partition("---\n")
+        for line in head.splitlines():
+            parts = line.split(" ", 2)
+            if len(parts) == 3 and parts[0].isdigit() and parts[1].isdigit():
+                files.append((int(parts[0]), int(parts[1]), parts[2]))
+        tail_lines = tail.split("\n")
+        if tail_lines and tail_lines[0].strip().isdigit():
+            now = int(tail_lines[0].strip())
+        if len(tail_lines) > 1:
+            fields = tail_lines[1].split()
+            if len(fields) >= 4 and fields[1].isdigit() and fields[2].isdigit():
+                fs_size, fs_used = int(fields[1]) * 1024, int(fields[2]) * 1024
+        return files, now, fs_used, fs_size
+
+    def cleanup(self):
+        """扫描并批量删除超龄/超出大小上限的最旧文件，返回清理报告"""
+        self.prepare()
+        files, now, fs_used, fs_size = self.scan()
+        victims, kept_bytes = select_victims(files, now, self.max_bytes, self.max_age,
+                                             self.keep_latest)
+        for i in range(0, len(victims), RM_BATCH):
+            batch = victims[i:i + RM_BATCH]
+            names = " ".join(quote_remote_path(f"{self.directory}/{name}") for _, _, name in batch)
+            self.pool.exec_command(f"rm -f {names}", check=True)
+
+        reclaimed = sum(size for _, size, _ in victims)
+        with self._lock:
+            self.bytes_reclaimed += reclaimed
+            self.files_removed += len(victims)
+        report = {
+            "directory": self.directory,
+            "files_removed": len(victims),
+            "bytes_reclaimed": reclaimed,
+            "files": len(files) - len(victims),
+            "bytes": kept_bytes,
+            "max_bytes": self.max_bytes,
+            "fs_used": None if fs_used is None else max(0, fs_used - reclaimed),
+            "fs_size": fs_size
+        }
+        self.last_report = report
+        print_report("远程环形目录", report)
+        return report
+
+    def cleanup_async(self):
+        """在后台线程中清理，已有清理在进行时直接返回"""
+        with self._lock:
+            if self._cleanup_thread is not None and self._cleanup_thread.is_alive():
+                return
+            self._cleanup_thread = threading.Thread(target=self._cleanup_quietly,
+                                                    name="remote-ring-cleanup", daemon=True)
+            self._cleanup_thread.start()
+
+    def _cleanup_quietly(self):
+        try:
+            self.cleanup()
+        except Exception as e:
+            print(f"✗ 远程录音目录清理失败: {e}")
+
+
+# =============================================================================
+# 本地录音目录
+# =============================================================================
+
+class LocalRetention:
+    """本地录音目录的归档/淘汰策略"""
+
+    def __init__(self, directory, max_bytes=None, max_age=None, archive=None,
+                 archive_dir=None, archive_max_bytes=None, keep_latest=None, archive_raw=None):
+        self.directory = directory
+        self.max_bytes = max_bytes if max_bytes is not None else RETENTION_CONFIG["local_max_bytes"]
+        self.max_age = max_age if max_age is not None else RETENTION_CONFIG["local_max_age"]
+        self.archive = archive if archive is not None else RETENTION_CONFIG["archive"]
+        self.archive_dir = os.path.join(directory, archive_dir or RETENTION_CONFIG["archive_dir"])
+        self.archive_max_bytes = (archive_max_bytes if archive_max_bytes is not None
+                                  else RETENTION_CONFIG["archive_max_bytes"])
+        self.keep_latest = keep_latest if keep_latest is not None else RETENTION_CONFIG["keep_latest"]
+        self.archive_raw = (archive_raw if archive_raw is not None
+                            else RETENTION_CONFIG.get("archive_raw", False))
+
+    def _managed(self, name):
+        """是否由保留策略管理（GUI生成的录音文件，包括原始录音）"""
+        return any(fnmatch.fnmatch(name, pattern) for pattern in LOCAL_PATTERNS)
+
+    def _archived_names(self):
+        """归档中已有的文件名（KPC1编码的按原文件名）"""
+        names = set()
+        for _, _, zip_name in self._list(self.archive_dir, managed_only=False):
+            if not zip_name.endswith(".zip"):
+                continue
+            try:
+                with zipfile.ZipFile(os.path.join(self.archive_dir, zip_name)) as zf:
+                    members = zf.namelist()
+            except (OSError, zipfile.BadZipFile):
+                continue
+            names.update(m[:-len(ARCHIVE_CODEC_SUFFIX)] if m.endswith(ARCHIVE_CODEC_SUFFIX) else m
+                         for m in members)
+        return names
+
+    def _unprocessed_raws(self, files):
+        """还没有处理结果的原始录音（archive_raw关闭时不归档，这些文件删除后就无法再处理）"""
+        if self.archive_raw:
+            return set()
+        raws = [name for _, _, name in files if fnmatch.fnmatch(name, RAW_PATTERN)]
+        if not raws:
+            return set()
+        present = {name for _, _, name in files}
+        outputs = {name: PROCESSED_PREFIX + name[len(RAW_PREFIX):] for name in raws}
+        if not set(outputs.values()) <= present:
+            present |= self._archived_names()
+        return {name for name, output in outputs.items() if output not in present}
+
+    def _list(self, directory, managed_only=True):
+        """列出目录中的普通文件 [(mtime, size, name)]，managed_only时只列出保留策略管理的录音"""
+        files = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and not entry.name.endswith((".part", ".tmp")) \
+                            and (not managed_only or self._managed(entry.name)):
+                        st = entry.stat()
+                        files.append((st.st_mtime, st.st_size, entry.name))
+        except FileNotFoundError:
+            pass
+        return files
+
+    def _archive_file(self, mtime, name):
+        """把文件加入其修改日期对应的zip归档，返回归档增加的字节数"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        day = datetime.fromtimestamp(mtime).strftime("%Y%m%d")
+        zip_path = os.path.join(self.archive_dir, f"record_{day}.zip")
+        before = os.path.getsize(zip_path) if os.path.exists(zip_path) else 0
+        src = os.path.join(self.directory, name)
+        with open(src, "rb") as f:
+            data = f.read()
+        with zipfile.ZipFile(zip_path, "a") as zf:
+            if {name, name + ARCHIVE_CODEC_SUFFIX} & set(zf.namelist()):
+                # 从归档还原过的文件，归档中已有
+                pass
+            elif audio_codec.is_wav(data):
+                # KPC1已经压缩过，zip中直接存储
+                info = zipfile.ZipInfo(name + ARCHIVE_CODEC_SUFFIX,
+                                       date_time=time.localtime(mtime)[:6])
+                zf.writestr(info, audio_codec.encode(data), compress_type=zipfile.ZIP_STORED)
+            else:
+                zf.write(src, name, compress_type=zipfile.ZIP_DEFLATED)
+        return os.path.getsize(zip_path) - before
+
+    def enforce(self):
+        """执行本地保留策略，返回清理报告"""
+        files = self._list(self.directory)
+        victims, kept_bytes = select_victims(files, time.time(), self.max_bytes, self.max_age,
+                                             self.keep_latest, keep=self._unprocessed_raws(files))
+        reclaimed = 0
+        archived = 0
+        for mtime, size, name in victims:
+            # archive_raw关闭时原始录音直接删除（处理结果仍在目录或归档中）
+            to_archive = self.archive and (self.archive_raw or not fnmatch.fnmatch(name, RAW_PATTERN))
+            try:
+                if to_archive:
+                    reclaimed -= self._archive_file(mtime, name)
+                    archived += 1
+                os.remove(os.path.join(self.directory, name))
+                reclaimed += size
+            except OSError as e:
+                print(f"✗ 无法清理本地文件 {name}: {e}")
+
+        # 归档本身也有上限，超出时删除最旧的归档（当天的归档除外）
+        archives = self._list(self.archive_dir, managed_only=False)
+        archive_victims, archive_bytes = select_victims(archives, time.time(),
+                                                        self.archive_max_bytes, 0, 1)
+        for _, size, name in archive_victims:
+            try:
+                os.remove(os.path.join(self.archive_dir, name))
+                reclaimed += size
+            except OSError as e:
+                print(f"✗ 无法删除归档 {name}: {e}")
+
+        report = {
+            "directory": self.directory,
+            "files_removed": len(victims),
+            "files_archived": archived,
+            "archives_removed": len(archive_victims),
+            "bytes_reclaimed": reclaimed,
+            "files": len(files) - len(victims),
+            "bytes": kept_bytes,
+            "max_bytes": self.max_bytes,
+            "archive_bytes": archive_bytes
+        }
+        print_report("本地录音目录", report)
+        return report
+
+
+def restore_archived(zip_path, name, dest_path):
+    """从归档中取出一个文件（KPC1编码的WAV自动还原为原始字节）"""
+    with zipfile.ZipFile(zip_path) as zf:
+        names = set(zf.namelist())
+        if name + ARCHIVE_CODEC_SUFFIX in names:
+            data = audio_codec.decode(zf.read(name + ARCHIVE_CODEC_SUFFIX))
+        else:
+            data = zf.read(name)
+    with open(dest_path, "wb") as f:
+        f.write(data)
+    return dest_path
+
+
+def restore_archives(directory, pattern=RAW_PATTERN, archive_dir=None):
+    """把归档中文件名匹配pattern的文件还原到录音目录（已存在的跳过），返回还原的文件路径列表
+
+    archive_raw打开后原始录音会被归档，重新处理前先还原：
+        python -c "from gui_utils.retention import restore_archives; restore_archives('record')"
+        python gui_utils/reprocess.py
+    """
+    archive_dir = os.path.join(directory, archive_dir or RETENTION_CONFIG["archive_dir"])
+    restored = []
+    try:
+        zip_names = sorted(n for n in os.listdir(archive_dir) if n.endswith(".zip"))
+    except FileNotFoundError:
+        return restored
+    for zip_name in zip_names:
+        zip_path = os.path.join(archive_dir, zip_name)
+        with zipfile.ZipFile(zip_path) as zf:
+            members = zf.namelist()
+        for member in members:
+            name = member[:-len(ARCHIVE_CODEC_SUFFIX)] if member.endswith(ARCHIVE_CODEC_SUFFIX) else member
+            dest = os.path.join(directory, name)
+            if not fnmatch.fnmatch(name, pattern) or os.path.exists(dest):
+                continue
+            restore_archived(zip_path, name, dest)
+            restored.append(dest)
+    print(f"✓ 从归档还原了 {len(restored)} 个文件到 {directory}")
+    return restored
+
+
+def print_report(label, report):
+    """打印清理报告"""
+    line = (f"[清理] {label}: 清理 {report['files_removed']} 个文件，"
+            f"回收 {format_size(max(0, report['bytes_reclaimed']))}，"
+            f"当前 {report['files']} 个文件 {format_size(report['bytes'])}"
+            f" / 上限 {format_size(report['max_bytes'])}")
+    if report.get("fs_size"):
+        line += (f"，文件系统占用 {format_size(report['fs_used'])}"
+                 f" / {format_size(report['fs_size'])}")
+    if report.get("archive_bytes"):
+        line += f"，归档 {format_size(report['archive_bytes'])}"
+    print(line)
+
+
+# =============================================================================
+# 共享实例
+# =============================================================================
+
+_rings = {}
+_rings_lock = threading.Lock()
+_local_checked = {}
+
+
+def get_remote_ring(host=None, user=None, password=None, port=None):
+    """获取指定主机的共享远程环形目录"""
+    pool = get_pool(host, user, password, port)
+    key = (pool.host, pool.port, pool.user)
+    with _rings_lock:
+        ring = _rings.get(key)
+        if ring is None:
+            ring = RemoteRing(pool)
+            _rings[key] = ring
+        return ring
+
+
+def remote_record_path(name, host=None, user=None, password=None, port=None):
+    """远程环形目录中的文件路径；连接池不可用时直接拼接REMOTE_RECORD_DIR"""
+    try:
+        # 目录由随后的录音/播放批处理中的prepare步骤创建，这里不单独执行一次远程命令
+        return get_remote_ring(host, user, password, port).path(name, prepare=False)
+    except Exception as e:
+        print(f"⚠ 远程环形目录不可用: {e}")
+        return f"{REMOTE_RECORD_DIR}/{name}"
+
+
+def enforce_local_retention(directory, force=False, background=False):
+    """对本地录音目录执行保留策略（两次执行之间至少间隔local_check_interval秒）
+
+    background为True时在后台线程执行并返回None，否则返回清理报告（未到间隔时返回None）。
+    """
+    now = time.monotonic()
+    with _rings_lock:
+        last = _local_checked.get(directory)
+        interval = RETENTION_CONFIG.get("local_check_interval", 300)
+        if not force and last is not None and now - last < interval:
+            return None
+        _local_checked[directory] = now
+    if background:
+        threading.Thread(target=_enforce_local, args=(directory,),
+                         name="local-retention", daemon=True).start()
+        return None
+    return _enforce_local(directory)
+
+
+def _enforce_local(directory):
+    try:
+        return LocalRetention(directory).enforce()
+    except Exception as e:
+        print(f"✗ 本地录音目录清理失败: {e}")
+        return None
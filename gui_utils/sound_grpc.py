@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+kos.sound.SoundService 的Python gRPC客户端
+板子上运行SoundService（rust/sound.proto）时，录音和播放都走一条长期复用的HTTP/2连接，
+不再经过SSH + arecord + base64。录音流直接是NumPy帧的异步迭代器，可以接VAD和语音识别：
+
+    client = get_sound_client()
+    async with client.record(duration=5) as stream:
+        async for frame in stream:       # 每帧 frame_ms 毫秒的 np.int16 数组
+            endpointer.accept(frame)
+
+协议代码在第一次使用时由grpc_tools根据rust/sound.proto和rust/kos/common.proto生成到临时目录
+（按proto内容缓存），仓库里不需要提交生成的 *_pb2.py。
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+try:
+    import grpc
+    import grpc.aio
+    GRPC_AVAILABLE = True
+except ImportError:
+    GRPC_AVAILABLE = False
+
+try:
+    from gui_utils.live_capture import write_wav
+    from gui_utils.audio_format import (StreamResampler, choose_format, get_capability_cache,
+                                        ASR_PARAMS)
+    from gui_utils.record_control import STOPPED
+except ImportError:
+    from live_capture import write_wav
+    from record_control import STOPPED
+    from audio_format import StreamResampler, choose_format, get_capability_cache, ASR_PARAMS
+
+try:
+    from gui_utils.config import REMOTE_HOST, SOUND_GRPC_CONFIG
+except ImportError:
+    REMOTE_HOST = "192.168.42.1"
+    SOUND_GRPC_CONFIG = {
+        "enabled": False,
+        "host": None,
+        "port": 50051,
+        "sample_rate": 16000,
+        "bit_depth": 16,
+        "channels": 1,
+        "frame_ms": 20,
+        "timeout": 5.0
+    }
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROTO_DIR = os.path.join(SCRIPT_DIR, '..', 'rust')
+PROTO_FILES = ["sound.proto", os.path.join("kos", "common.proto")]
+
+# 各位深对应的采样类型（小端，与板子上的PCM一致）
+SAMPLE_DTYPES = {16: np.dtype("<i2"), 32: np.dtype("<i4")}
+
+# 连接参数：长连接保活，服务端允许时不因空闲断开
+CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+
+
+class SoundServiceError(Exception):
+    """SoundService返回了错误（响应中的kos.common.Error或ActionResponse失败）"""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+# =============================================================================
+# 协议代码
+# =============================================================================
+
+_protos = None
+_protos_lock = threading.Lock()
+
+
+def load_protos():
+    """生成并导入协议模块，返回 (sound_pb2, sound_pb2_grpc, common_pb2)"""
+    global _protos
+    with _protos_lock:
+        if _protos is None:
+            if not GRPC_AVAILABLE:
+                raise ImportError("gRPC客户端需要安装grpcio: pip install grpcio grpcio-tools")
+            out_dir = _compile_protos()
+            if out_dir not in sys.path:
+                sys.path.insert(0, out_dir)
+            import sound_pb2
+            import sound_pb2_grpc
+            from kos import common_pb2
+            _protos = (sound_pb2, sound_pb2_grpc, common_pb2)
+        return _protos
+
+
+def _compile_protos():
+    """用grpc_tools生成Python代码，输出目录按proto内容的哈希命名，内容不变时直接复用"""
+    digest = hashlib.sha1()
+    for name in PROTO_FILES:
+        with open(os.path.join(PROTO_DIR, name), "rb") as f:
+            digest.update(f.read())
+    out_dir = os.path.join(tempfile.gettempdir(), f"kos_proto_{digest.hexdigest()[:12]}")
+    if os.path.exists(os.path.join(out_dir, "sound_pb2_grpc.py")):
+        return out_dir
+
+    try:
+        from grpc_tools import protoc
+        import grpc_tools
+    except ImportError:
+        raise ImportError("生成协议代码需要安装grpcio-tools: pip install grpcio-tools")
+    tmp_dir = tempfile.mkdtemp(prefix="kos_proto_")
+    os.makedirs(os.path.join(tmp_dir, "kos"), exist_ok=True)
+    open(os.path.join(tmp_dir, "kos", "__init__.py"), "w").close()
+    well_known = os.path.join(os.path.dirname(grpc_tools.__file__), "_proto")
+    args = ["protoc", f"-I{PROTO_DIR}", f"-I{well_known}",
+            f"--python_out={tmp_dir}", f"--grpc_python_out={tmp_dir}"] + PROTO_FILES
+    if protoc.main(args) != 0:
+        raise RuntimeError(f"生成协议代码失败: {' '.join(args)}")
+    try:
+        os.replace(tmp_dir, out_dir)
+    except OSError:
+        # 其他进程已经生成好了
+        pass
+    return out_dir
+
+
+def _check_error(error):
+    """响应中带有kos.common.Error时抛出SoundServiceError"""
+    if error is not None and (error.code or error.message):
+        raise SoundServiceError(error.message or "未知错误", error.code)
+
+
+# =============================================================================
+# 录音流
+# =============================================================================
+
+class RecordStream:
+    """一次RecordAudio调用的帧流
+
+    按帧迭代（np数组，多声道时形状为 (n, channels)），结束或中途退出时取消调用：
+
+        async with client.record() as stream:
+            async for frame in stream:
+                ...
+    """
+
+    def __init__(self, client, call, sample_rate, bit_depth, channels, frame_ms, output_rate=None):
+        self.client = client
+        self.device_rate = sample_rate
+        self.channels = channels
+        self.frame_ms = frame_ms
+        self.dtype = SAMPLE_DTYPES[bit_depth]
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.frame_bytes = self.frame_samples * channels * self.dtype.itemsize
+        self._call = call
+        # 设备格式与需要的采样率不一致时逐帧重采样（输出int16）
+        self._resampler = None
+        self.sample_rate = sample_rate
+        if output_rate and output_rate != sample_rate:
+            self._resampler = StreamResampler(sample_rate, output_rate)
+            self.sample_rate = output_rate
+
+        # 统计
+        self.started_at = time.monotonic()
+        self.first_frame_latency = None
+        self.frames = 0
+        self.bytes_received = 0
+        self.messages = 0
+
+    def __repr__(self):
+        return f"RecordStream({self.sample_rate}Hz, {self.channels}ch, {self.frames} frames)"
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.cancel()
+
+    def __aiter__(self):
+        return self._frames()
+
+    async def _frames(self):
+        """把响应中的字节切成固定长度的帧，最后不足一帧的部分也作为一帧返回"""
+        pending = bytearray()
+        try:
+            async for response in self._call:
+                _check_error(response.error if response.HasField("error") else None)
+                self.messages += 1
+                self.bytes_received += len(response.audio_data)
+                pending += response.audio_data
+                while len(pending) >= self.frame_bytes:
+                    yield self._frame(pending[:self.frame_bytes])
+                    del pending[:self.frame_bytes]
+        except grpc.aio.AioRpcError as e:
+            if e.code() != grpc.StatusCode.CANCELLED:
+                raise
+        usable = len(pending) - len(pending) % (self.channels * self.dtype.itemsize)
+        if usable:
+            yield self._frame(pending[:usable])
+
+    def _frame(self, data):
+        if self.first_frame_latency is None:
+            self.first_frame_latency = time.monotonic() - self.started_at
+        self.frames += 1
+        frame = np.frombuffer(bytes(data), dtype=self.dtype)
+        if self.channels > 1:
+            frame = frame.reshape(-1, self.channels)
+        if self._resampler is not None:
+            if frame.dtype != np.int16:
+                frame = (frame >> (8 * self.dtype.itemsize - 16)).astype(np.int16)
+            frame = self._resampler.process(frame)
+        return frame
+
+    def cancel(self):
+        """取消录音调用（本地立即结束，服务端收到取消后停止录音）"""
+        self._call.cancel()
+
+    async def stop(self):
+        """请求服务端停止录音（StopRecording），已收到的数据仍会迭代完"""
+        await self.client.stop_recording()
+
+    def stats(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "device_rate": self.device_rate,
+            "frames": self.frames,
+            "seconds": self.bytes_received / (self.device_rate * self.channels * self.dtype.itemsize),
+            "messages": self.messages,
+            "bytes_received": self.bytes_received,
+            "first_frame_latency": self.first_frame_latency
+        }
+
+
+# =============================================================================
+# 客户端
+# =============================================================================
+
+class SoundClient:
+    """kos.sound.SoundService 客户端，一个实例复用一个gRPC通道
+
+    通道属于创建它的事件循环，跨事件循环使用请通过get_sound_client()获取各自的实例。
+    """
+
+    def __init__(self, host=None, port=None, sample_rate=None, bit_depth=None, channels=None,
+                 frame_ms=None, timeout=None):
+        self.host = host or SOUND_GRPC_CONFIG["host"] or REMOTE_HOST
+        self.port = port or SOUND_GRPC_CONFIG["port"]
+        self.sample_rate = sample_rate or SOUND_GRPC_CONFIG["sample_rate"]
+        self.bit_depth = bit_depth or SOUND_GRPC_CONFIG["bit_depth"]
+        self.channels = channels or SOUND_GRPC_CONFIG["channels"]
+        self.frame_ms = frame_ms or SOUND_GRPC_CONFIG["frame_ms"]
+        self.timeout = timeout or SOUND_GRPC_CONFIG["timeout"]
+        self.output_rate = None  # 协商后设备格式不是需要的采样率时，录音流重采样到该采样率
+        self.negotiated = False
+        if self.bit_depth not in SAMPLE_DTYPES:
+            raise ValueError(f"不支持的位深: {self.bit_depth}")
+
+        self.sound_pb2, sound_pb2_grpc, self.common_pb2 = load_protos()
+        self._channel = grpc.aio.insecure_channel(f"{self.host}:{self.port}",
+                                                  options=CHANNEL_OPTIONS)
+        self._stub = sound_pb2_grpc.SoundServiceStub(self._channel)
+
+    def __repr__(self):
+        return f"SoundClient({self.host}:{self.port})"
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        await self._channel.close()
+
+    async def wait_ready(self, timeout=None):
+        """等待通道连接就绪，超时抛出asyncio.TimeoutError"""
+        await asyncio.wait_for(self._channel.channel_ready(), timeout or self.timeout)
+
+    def audio_config(self, sample_rate=None, bit_depth=None, channels=None):
+        """生成AudioConfig，缺省参数取客户端的设置"""
+        return self.sound_pb2.AudioConfig(sample_rate=sample_rate or self.sample_rate,
+                                          bit_depth=bit_depth or self.bit_depth,
+                                          channels=channels or self.channels)
+
+    async def get_audio_info(self):
+        """查询板子的录放音能力，返回 {"playback": {...}, "recording": {...}}"""
+        from google.protobuf import empty_pb2
+        response = await self._stub.GetAudioInfo(empty_pb2.Empty(), timeout=self.timeout)
+        _check_error(response.error if response.HasField("error") else None)
+
+        def caps(c):
+            return {"sample_rates": list(c.sample_rates), "bit_depths": list(c.bit_depths),
+                    "channels": list(c.channels), "available": c.available}
+        return {"playback": caps(response.playback), "recording": caps(response.recording)}
+
+    async def negotiate(self, target_rate=None):
+        """按设备能力（每个服务只查询一次GetAudioInfo并缓存）选择录音格式
+
+        设备支持target_rate（缺省为语音识别的采样率）时直接以该采样率录音，否则以最容易转换的
+        格式录音，录音流在本地重采样到target_rate。返回选中的格式。
+        """
+        target_rate = target_rate or ASR_PARAMS["sample_rate"]
+        cache = get_capability_cache()
+        key = f"grpc:{self.host}:{self.port}"
+        caps = cache.get(key)
+        if caps is None:
+            caps = await self.get_audio_info()
+            cache.put(key, caps)
+        recording = caps.get("recording")
+        fmt = choose_format(recording if recording and recording.get("available") else None,
+                            target_rate, self.channels, self.bit_depth)
+        self.sample_rate = fmt["sample_rate"]
+        self.channels = fmt["channels"]
+        if fmt["bit_depth"] in SAMPLE_DTYPES:
+            self.bit_depth = fmt["bit_depth"]
+        self.output_rate = target_rate if fmt["resample"] else None
+        self.negotiated = True
+        return fmt
+
+    def record(self, duration=None, sample_rate=None, bit_depth=None, channels=None,
+               frame_ms=None):
+        """开始录音，返回RecordStream；duration为None时一直录到StopRecording或取消
+
+        协商过格式且没有指定sample_rate时，帧按协商的目标采样率输出。
+        """
+        config = self.audio_config(sample_rate, bit_depth, channels)
+        request = self.sound_pb2.RecordAudioRequest(
+            config=config, duration_ms=int((duration or 0) * 1000))
+        call = self._stub.RecordAudio(request)
+        return RecordStream(self, call, config.sample_rate, config.bit_depth, config.channels,
+                            frame_ms or self.frame_ms,
+                            output_rate=None if sample_rate else self.output_rate)
+
+    async def stop_recording(self):
+        """停止正在进行的录音"""
+        from google.protobuf import empty_pb2
+        response = await self._stub.StopRecording(empty_pb2.Empty(), timeout=self.timeout)
+        self._check_action(response)
+
+    async def play(self, audio, sample_rate=None, bit_depth=None, channels=None, chunk_ms=100):
+        """播放音频：WAV文件路径、PCM字节或NumPy数组，按chunk_ms分块流式发送"""
+        if isinstance(audio, str):
+            import wave
+            with wave.open(audio, "rb") as wav:
+                sample_rate = wav.getframerate()
+                bit_depth = wav.getsampwidth() * 8
+                channels = wav.getnchannels()
+                audio = wav.readframes(wav.getnframes())
+        config = self.audio_config(sample_rate, bit_depth, channels)
+        if isinstance(audio, np.ndarray):
+            audio = np.ascontiguousarray(audio, dtype=SAMPLE_DTYPES[config.bit_depth]).tobytes()
+        chunk = (config.sample_rate * chunk_ms // 1000 * config.channels
+                 * config.bit_depth // 8)
+
+        def requests():
+            yield self.sound_pb2.PlayAudioRequest(config=config, audio_data=audio[:chunk])
+            for pos in range(chunk, len(audio), chunk):
+                yield self.sound_pb2.PlayAudioRequest(audio_data=audio[pos:pos + chunk])
+
+        response = await self._stub.PlayAudio(requests())
+        self._check_action(response)
+
+    def _check_action(self, response):
+        if not response.success:
+            error = response.error if response.HasField("error") else None
+            _check_error(error)
+            raise SoundServiceError("操作失败")
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_sound_client(host=None, port=None):
+    """获取当前事件循环中共享的客户端（同一地址复用同一个通道）"""
+    loop = asyncio.get_running_loop()
+    key = (host, port, id(loop))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = SoundClient(host, port)
+            _clients[key] = client
+        return client
+
+
+# =============================================================================
+# 录音 + VAD + 识别
+# =============================================================================
+
+async def record_until_silence(local_path=None, client=None, max_duration=None, on_frame=None,
+                               keep_silence_ms=None, control=None, **endpoint_options):
+    """通过gRPC录音直到说完，返回 (int16音频, 端点检测结果)；local_path不为空时同时写入WAV
+
+    control.stop()（可以在其他线程调用）通过StopRecording结束录音，reason为"stopped"。
+    """
+    try:
+        from gui_utils.vad import Endpointer, get_detector, VAD_CONFIG
+    except ImportError:
+        from vad import Endpointer, get_detector, VAD_CONFIG
+    client = client or get_sound_client()
+    if not client.negotiated:
+        await client.negotiate()
+    max_duration = max_duration or VAD_CONFIG["max_duration"]
+    keep_silence_ms = VAD_CONFIG["keep_silence_ms"] if keep_silence_ms is None else keep_silence_ms
+    endpointer = Endpointer(get_detector(sample_rate=client.output_rate or client.sample_rate),
+                            max_duration=max_duration, **endpoint_options)
+
+    loop = asyncio.get_running_loop()
+    frames = []
+    async with client.record(duration=max_duration + 1) as stream:
+        def stop():
+            # 服务端停止后录音流正常结束，已发出的数据照常收完
+            asyncio.run_coroutine_threadsafe(stream.stop(), loop)
+        if control is not None:
+            control.register(stop)
+        try:
+            async for frame in stream:
+                frames.append(frame)
+                if on_frame is not None:
+                    on_frame(frame)
+                if endpointer.accept(frame):
+                    break
+        finally:
+            if control is not None:
+                control.unregister(stop)
+    if not endpointer.ended:
+        endpointer.finish(STOPPED if control is not None and control.stopped else "stream_end")
+
+    audio = np.concatenate(frames) if frames else np.zeros(0, dtype=np.int16)
+    if endpointer.reason == "silence":
+        audio = audio[:endpointer.speech_end + stream.sample_rate * keep_silence_ms // 1000]
+    result = endpointer.result()
+    result["saved"] = len(audio) / stream.sample_rate
+    result["sample_rate"] = stream.sample_rate
+    result["capture"] = stream.stats()
+    if local_path:
+        write_wav(local_path, [audio], stream.sample_rate, stream.channels)
+    return audio, result
+
+
+async def transcribe_stream(recognizer, client=None, max_duration=None, **endpoint_options):
+    """录音直到说完并交给语音识别，返回 (识别文本, 端点检测结果)
+
+    recognizer是speech_recognition中的识别器（SpeechRecognizer或ASR），VAD判断说完后立即识别，
+    不经过WAV文件。
+    """
+    audio, result = await record_until_silence(None, client, max_duration, **endpoint_options)
+    if not result["speech"]:
+        return "", result
+    asr = getattr(recognizer, "asr", recognizer)
+    samples = audio.astype(np.float32) / 32768.0
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    text = await asyncio.to_thread(asr.transcribe, samples, result["sample_rate"])
+    return text.strip(), result
+
+
+def record_grpc_vad(local_path, max_duration=None, host=None, port=None, control=None):
+    """同步接口：通过gRPC录音直到说完并写入local_path，返回端点检测结果"""
+    async def run():
+        async with SoundClient(host, port) as client:
+            _, result = await record_until_silence(local_path, client, max_duration,
+                                                   control=control)
+            return result
+    result = asyncio.run(run())
+    print(f"✓ gRPC录音结束（{result['reason']}）: 录制 {result['duration']:.2f}秒, "
+          f"保存 {result['saved']:.2f}秒")
+    return result
+
+
+def main():
+    """命令行：查询音频能力并通过gRPC录音保存为WAV"""
+    import argparse
+    parser = argparse.ArgumentParser(description="通过SoundService录音")
+    parser.add_argument("--host", default=None, help="SoundService地址")
+    parser.add_argument("--port", type=int, default=None, help="SoundService端口")
+    parser.add_argument("--seconds", type=float, default=5, help="录音时长（秒）")
+    parser.add_argument("--output", default="grpc.wav", help="输出WAV文件")
+    args = parser.parse_args()
+
+    async def run():
+        async with SoundClient(args.host, args.port) as client:
+            print(f"音频能力: {await client.get_audio_info()}")
+            async with client.record(duration=args.seconds) as stream:
+                frames = [frame async for frame in stream]
+            write_wav(args.output, frames, stream.sample_rate, stream.channels)
+            stats = stream.stats()
+            print(f"✓ 已保存 {stats['seconds']:.2f}秒 到 {args.output}, "
+                  f"首帧延迟 {stats['first_frame_latency'] or 0:.3f}秒")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+kos.sound.SoundService 的Python gRPC服务端（grpc.aio）
+可以在没有Rust工具链的板子上直接运行，也可以在本地作为测试替身：
+
+    python gui_utils/sound_server.py --backend alsa              # 板子上：arecord/aplay管道
+    python gui_utils/sound_server.py --backend wav --source a.wav  # 本地：WAV文件充当麦克风
+
+录音按chunk_ms切块，每块一读到就发送（不像sound.rs那样录完才写文件）；chunk_ms越小延迟越低，
+消息数和开销越大。PlayAudio边收边写入aplay的标准输入（或WAV文件），StopRecording结束所有
+正在进行的录音。
+"""
+
+import asyncio
+import os
+import time
+import wave
+from datetime import datetime
+
+try:
+    import grpc
+    import grpc.aio
+except ImportError:
+    grpc = None
+
+try:
+    from gui_utils.sound_grpc import load_protos
+except ImportError:
+    from sound_grpc import load_protos
+
+try:
+    from gui_utils.config import SOUND_SERVER_CONFIG
+except ImportError:
+    SOUND_SERVER_CONFIG = {
+        "host": "0.0.0.0",
+        "port": 50051,
+        "backend": "alsa",
+        "capture_device": "hw:0,0",
+        "playback_device": "hw:1,0",
+        "chunk_ms": 20,
+        "wav_source": None,
+        "wav_output_dir": "played"
+    }
+
+# 位深对应的ALSA采样格式
+ALSA_FORMATS = {16: "S16_LE", 32: "S32_LE"}
+
+# ALSA后端报告的能力（板子上的声卡实际支持哪些由arecord/aplay在打开设备时决定）
+ALSA_SAMPLE_RATES = [8000, 16000, 22050, 44100, 48000]
+
+# kos.common.ErrorCode
+ERROR_UNKNOWN = 0
+ERROR_INVALID_ARGUMENT = 2
+ERROR_HARDWARE_FAILURE = 3
+
+
+class BackendError(Exception):
+    """后端无法完成录放音，code为kos.common.ErrorCode"""
+
+    def __init__(self, message, code=ERROR_HARDWARE_FAILURE):
+        super().__init__(message)
+        self.code = code
+
+
+def frame_bytes(config):
+    """AudioConfig每个采样帧（所有声道）的字节数"""
+    return config.channels * config.bit_depth // 8
+
+
+def _check_config(config):
+    if not config.sample_rate or not config.channels or config.bit_depth not in ALSA_FORMATS:
+        raise BackendError(f"不支持的音频格式: {config.sample_rate}Hz {config.bit_depth}bit "
+                           f"{config.channels}ch", ERROR_INVALID_ARGUMENT)
+
+
+# =============================================================================
+# 后端
+# =============================================================================
+
+class AlsaBackend:
+    """通过arecord/aplay子进程的管道录放音"""
+
+    name = "alsa"
+
+    def __init__(self, capture_device=None, playback_device=None):
+        self.capture_device = capture_device or SOUND_SERVER_CONFIG["capture_device"]
+        self.playback_device = playback_device or SOUND_SERVER_CONFIG["playback_device"]
+
+    def capabilities(self):
+        caps = {"sample_rates": ALSA_SAMPLE_RATES, "bit_depths": sorted(ALSA_FORMATS),
+                "channels": [1, 2], "available": True}
+        return caps, dict(caps)
+
+    def _command(self, program, device, config):
+        return [program, "-q", "-D", device, "-f", ALSA_FORMATS[config.bit_depth],
+                "-r", str(config.sample_rate), "-c", str(config.channels), "-t", "raw", "-"]
+
+    async def record(self, config, chunk_bytes):
+        """按chunk_bytes产出arecord输出的原始PCM，调用方停止迭代时结束子进程"""
+        _check_config(config)
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *self._command("arecord", self.capture_device, config),
+                stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE)
+        except OSError as e:
+            raise BackendError(f"无法启动arecord: {e}")
+        try:
+            while True:
+                try:
+                    yield await proc.stdout.readexactly(chunk_bytes)
+                except asyncio.IncompleteReadError as e:
+                    if e.partial:
+                        yield e.partial
+                    break
+            returncode = await proc.wait()
+            if returncode != 0:
+                stderr = (await proc.stderr.read()).decode("utf-8", errors="replace").strip()
+                raise BackendError(f"arecord退出码 {returncode}: {stderr}")
+        finally:
+            if proc.returncode is None:
+                proc.terminate()
+                await proc.wait()
+
+    async def play(self, config, chunks):
+        """把chunks（异步迭代的PCM字节）写入aplay的标准输入，返回播放的字节数"""
+        _check_config(config)
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *self._command("aplay", self.playback_device, config),
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE)
+        except OSError as e:
+            raise BackendError(f"无法启动aplay: {e}")
+        total = 0
+        try:
+            async for data in chunks:
+                proc.stdin.write(data)
+                await proc.stdin.drain()
+                total += len(data)
+            proc.stdin.close()
+            returncode = await proc.wait()
+        except (BrokenPipeError, ConnectionResetError):
+            returncode = await proc.wait()
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+        if returncode != 0:
+            stderr = (await proc.stderr.read()).decode("utf-8", errors="replace").strip()
+            raise BackendError(f"aplay退出码 {returncode}: {stderr}")
+        return total
+
+
+class WavBackend:
+    """WAV文件后端：source充当麦克风（按实时速度发送，放完后是静音），播放写入output_dir"""
+
+    name = "wav"
+
+    def __init__(self, source=None, output_dir=None, realtime=True):
+        self.source = source or SOUND_SERVER_CONFIG["wav_source"]
+        self.output_dir = output_dir or SOUND_SERVER_CONFIG["wav_output_dir"]
+        self.realtime = realtime
+        self.played = []  # 播放生成的文件
+
+        self._pcm = b""
+        self._rate, self._channels, self._bits = 16000, 1, 16
+        if self.source:
+            with wave.open(self.source, "rb") as wav:
+                self._rate = wav.getframerate()
+                self._channels = wav.getnchannels()
+                self._bits = wav.getsampwidth() * 8
+                self._pcm = wav.readframes(wav.getnframes())
+
+    def capabilities(self):
+        recording = {"sample_rates": [self._rate], "bit_depths": [self._bits],
+                     "channels": [self._channels], "available": True}
+        playback = {"sample_rates": ALSA_SAMPLE_RATES, "bit_depths": sorted(ALSA_FORMATS),
+                    "channels": [1, 2], "available": True}
+        return playback, recording
+
+    async def record(self, config, chunk_bytes):
+        _check_config(config)
+        if (config.sample_rate, config.channels, config.bit_depth) != (
+                self._rate, self._channels, self._bits):
+            raise BackendError(f"录音源是 {self._rate}Hz {self._bits}bit {self._channels}ch，"
+                               f"与请求的格式不一致", ERROR_INVALID_ARGUMENT)
+        byte_rate = self._rate * frame_bytes(config)
+        silence = bytes(chunk_bytes)
+        start = time.monotonic()
+        sent = 0
+        while True:
+            data = self._pcm[sent:sent + chunk_bytes]
+            if len(data) < chunk_bytes:
+                data += silence[:chunk_bytes - len(data)]
+            if self.realtime:
+                # 像真实麦克风一样，这一块录满后才能发出
+                delay = start + (sent + chunk_bytes) / byte_rate - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            sent += chunk_bytes
+            yield data
+
+    async def play(self, config, chunks):
+        _check_config(config)
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir,
+                            f"played_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.wav")
+        total = 0
+        with wave.open(path, "wb") as wav:
+            wav.setnchannels(config.channels)
+            wav.setsampwidth(config.bit_depth // 8)
+            wav.setframerate(config.sample_rate)
+            async for data in chunks:
+                wav.writeframes(data)
+                total += len(data)
+        self.played.append(path)
+        return total
+
+
+def create_backend(name=None, **options):
+    """按名字创建后端："alsa" 或 "wav" """
+    name = name or SOUND_SERVER_CONFIG["backend"]
+    if name == "alsa":
+        return AlsaBackend(options.get("capture_device"), options.get("playback_device"))
+    if name == "wav":
+        return WavBackend(options.get("source"), options.get("output_dir"),
+                          options.get("realtime", True))
+    raise ValueError(f"未知的后端: {name}")
+
+
+# =============================================================================
+# 服务
+# =============================================================================
+
+class SoundServicer:
+    """SoundService的实现，录放音交给backend（方法名与sound.proto中的rpc一致）"""
+
+    def __init__(self, backend, chunk_ms=None):
+        self.sound_pb2, _, self.common_pb2 = load_protos()
+        self.backend = backend
+        self.chunk_ms = chunk_ms or SOUND_SERVER_CONFIG["chunk_ms"]
+        self._recordings = set()  # 正在进行的录音的停止事件
+
+        # 统计
+        self.recordings = 0
+        self.chunks_sent = 0
+        self.bytes_played = 0
+
+    def _error(self, e):
+        code = e.code if isinstance(e, BackendError) else ERROR_UNKNOWN
+        return self.common_pb2.Error(code=code, message=str(e))
+
+    async def GetAudioInfo(self, request, context):
+        playback, recording = self.backend.capabilities()
+        return self.sound_pb2.GetAudioInfoResponse(
+            playback=self.sound_pb2.AudioCapabilities(**playback),
+            recording=self.sound_pb2.AudioCapabilities(**recording))
+
+    async def RecordAudio(self, request, context):
+        config = request.config
+        chunk_bytes = max(1, config.sample_rate * self.chunk_ms // 1000) * max(1, frame_bytes(config))
+        # duration_ms为0时一直录到StopRecording或客户端取消
+        limit = request.duration_ms * config.sample_rate // 1000 * frame_bytes(config)
+        stop = asyncio.Event()
+        self._recordings.add(stop)
+        self.recordings += 1
+        sent = 0
+        chunks = self.backend.record(config, chunk_bytes)
+        try:
+            async for data in chunks:
+                if limit and sent + len(data) >= limit:
+                    data = data[:limit - sent]
+                sent += len(data)
+                self.chunks_sent += 1
+                yield self.sound_pb2.RecordAudioResponse(audio_data=data)
+                if stop.is_set() or (limit and sent >= limit):
+                    break
+        except Exception as e:
+            print(f"✗ 录音失败: {e}")
+            yield self.sound_pb2.RecordAudioResponse(error=self._error(e))
+        finally:
+            self._recordings.discard(stop)
+            await chunks.aclose()
+
+    async def StopRecording(self, request, context):
+        for stop in list(self._recordings):
+            stop.set()
+        return self.common_pb2.ActionResponse(success=True)
+
+    async def PlayAudio(self, request_iterator, context):
+        requests = request_iterator.__aiter__()
+        try:
+            first = await requests.__anext__()
+        except StopAsyncIteration:
+            return self.common_pb2.ActionResponse(success=True)
+        if not first.HasField("config"):
+            return self.common_pb2.ActionResponse(success=False, error=self.common_pb2.Error(
+                code=ERROR_INVALID_ARGUMENT, message="第一条消息必须包含config"))
+
+        async def chunks():
+            if first.audio_data:
+                yield first.audio_data
+            async for request in requests:
+                yield request.audio_data
+
+        try:
+            self.bytes_played += await self.backend.play(first.config, chunks())
+        except Exception as e:
+            print(f"✗ 播放失败: {e}")
+            return self.common_pb2.ActionResponse(success=False, error=self._error(e))
+        return self.common_pb2.ActionResponse(success=True)
+
+
+async def start_server(backend=None, host=None, port=None, chunk_ms=None):
+    """启动服务，返回 (server, servicer, 实际端口)；port为0时自动选择空闲端口"""
+    if grpc is None:
+        raise ImportError("gRPC服务需要安装grpcio: pip install grpcio grpcio-tools")
+    _, sound_pb2_grpc, _ = load_protos()
+    host = host or SOUND_SERVER_CONFIG["host"]
+    port = SOUND_SERVER_CONFIG["port"] if port is None else port
+    servicer = SoundServicer(backend or create_backend(), chunk_ms)
+    server = grpc.aio.server()
+    sound_pb2_grpc.add_SoundServiceServicer_to_server(servicer, server)
+    port = server.add_insecure_port(f"{host}:{port}")
+    await server.start()
+    return server, servicer, port
+
+
+def main():
+    """命令行：运行SoundService"""
+    import argparse
+    parser = argparse.ArgumentParser(description="运行kos.sound.SoundService")
+    parser.add_argument("--backend", choices=["alsa", "wav"], default=None, help="录放音后端")
+    parser.add_argument("--host", default=None, help="监听地址")
+    parser.add_argument("--port", type=int, default=None, help="监听端口")
+    parser.add_argument("--chunk-ms", type=int, default=None, help="录音分块时长（毫秒）")
+    parser.add_argument("--capture-device", default=None, help="ALSA录音设备")
+    parser.add_argument("--playback-device", default=None, help="ALSA播放设备")
+    parser.add_argument("--source", default=None, help="wav后端的录音源文件")
+    parser.add_argument("--output-dir", default=None, help="wav后端保存播放内容的目录")
+    args = parser.parse_args()
+
+    async def run():
+        backend = create_backend(args.backend, capture_device=args.capture_device,
+                                 playback_device=args.playback_device, source=args.source,
+                                 output_dir=args.output_dir)
+        server, servicer, port = await start_server(backend, args.host, args.port, args.chunk_ms)
+        print(f"✓ SoundService已启动: 端口 {port}, 后端 {backend.name}, 分块 {servicer.chunk_ms}ms")
+        await server.wait_for_termination()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("服务已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,11 @@ import sys
 import numpy as np
 from typing import Union
 
+try:
+    from gui_utils.audio_format import read_wav
+except ImportError:
+    from audio_format import read_wav
+
 # 模型路径配置 - 使用脚本所在目录的绝对路径
 def get_script_dir():
     """获取当前脚本所在目录"""
@@ -29,16 +34,19 @@ class ASR:
     def transcribe(self, audio: Union[str, np.ndarray], sample_rate=16000) -> str:
         """转录音频为文字"""
         if isinstance(audio, str):
-            # 如果输入是文件路径，使用librosa加载
+            # PCM WAV直接读取，采样率一致时不重采样；其他格式才用librosa加载
             try:
-                import librosa
-                audio, _ = librosa.load(audio, sr=sample_rate)
-            except ImportError:
-                print("错误: 需要安装librosa库: pip install librosa")
-                return ""
-            except Exception as e:
-                print(f"加载音频文件失败: {e}")
-                return ""
+                audio, _ = read_wav(audio, sample_rate)
+            except Exception:
+                try:
+                    import librosa
+                    audio, _ = librosa.load(audio, sr=sample_rate)
+                except ImportError:
+                    print("错误: 需要安装librosa库: pip install librosa")
+                    return ""
+                except Exception as e:
+                    print(f"加载音频文件失败: {e}")
+                    return ""
         
         try:
             s = self._recognizer.create_stream()
@@ -182,8 +190,8 @@ class SpeechRecognizer:
 class MockASR:
     """模拟语音识别器（当真实模型不可用时使用）"""
     
-    def transcribe(self, audio_file: str) -> str:
-        """模拟语音识别"""
+    def transcribe(self, audio: Union[str, np.ndarray], sample_rate=16000) -> str:
+        """模拟语音识别（参数与ParaformerASR.transcribe一致）"""
         import time
         time.sleep(0.5)  # 模拟处理时间
         return "模拟语音识别结果（真实模型未加载）"
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SSH连接池
+按 (主机, 端口, 用户) 复用已认证的paramiko连接，每条命令只在现有连接上打开一个exec通道，
+避免每次执行命令都重新进行TCP握手、密钥交换和密码认证
+"""
+
+import atexit
+import select
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import paramiko
+    PARAMIKO_AVAILABLE = True
+except ImportError:
+    PARAMIKO_AVAILABLE = False
+
+# 导入配置
+try:
+    from gui_utils.config import (
+        REMOTE_USER, REMOTE_HOST, REMOTE_PASSWORD, REMOTE_PORT,
+        SSH_CONFIG, SSH_POOL_CONFIG
+    )
+except ImportError:
+    REMOTE_USER = "root"
+    REMOTE_HOST = "192.168.42.1"
+    REMOTE_PASSWORD = "milkv"
+    REMOTE_PORT = 22
+    SSH_CONFIG = {"timeout": 10}
+    SSH_POOL_CONFIG = {
+        "keepalive": 15,
+        "idle_timeout": 300,
+        "max_channels": 8,
+        "channel_wait": 30
+    }
+
+# 通道读取时的单次接收大小
+RECV_SIZE = 32768
+
+
+def quote_remote_path(path):
+    """为远程shell转义路径，保留开头的 ~/ 以便远程展开家目录"""
+    if path == "~":
+        return path
+    if path.startswith("~/"):
+        return "~/" + shlex.quote(path[2:])
+    return shlex.quote(path)
+
+
+def join_command(cmd):
+    """把命令列表拼接为远程shell命令（与ssh客户端的行为一致，直接以空格连接）"""
+    if isinstance(cmd, (list, tuple)):
+        return " ".join(str(c) for c in cmd)
+    return cmd
+
+
+class SSHConnectionPool:
+    """单个远程主机的SSH连接池
+
+    一个已认证的传输层连接上同时最多打开 max_channels 个通道；连接断开时在下一次
+    取用时自动重连，空闲超过 idle_timeout 秒后由后台线程关闭。
+    """
+
+    def __init__(self, host, user, password, port=22, connect_timeout=None,
+                 keepalive=None, idle_timeout=None, max_channels=None, channel_wait=None):
+        if not PARAMIKO_AVAILABLE:
+            raise ImportError("SSH连接池需要安装paramiko库: pip install paramiko")
+
+        self.host = host
+        self.user = user
+        self.password = password
+        self.port = port
+        self.connect_timeout = connect_timeout or SSH_CONFIG.get("timeout", 10)
+        self.keepalive = keepalive if keepalive is not None else SSH_POOL_CONFIG["keepalive"]
+        self.idle_timeout = idle_timeout if idle_timeout is not None else SSH_POOL_CONFIG["idle_timeout"]
+        self.max_channels = max_channels or SSH_POOL_CONFIG["max_channels"]
+        self.channel_wait = channel_wait if channel_wait is not None else SSH_POOL_CONFIG["channel_wait"]
+
+        self._lock = threading.RLock()
+        self._slots = threading.BoundedSemaphore(self.max_channels)
+        self._client = None
+        self._active = 0
+        self._last_used = time.monotonic()
+
+        # 统计信息
+        self.handshakes = 0
+        self.channels_opened = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return f"SSHConnectionPool({self.user}@{self.host}:{self.port})"
+
+    def _connect(self):
+        """建立新的已认证连接（调用方需持有锁）"""
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(
+            hostname=self.host,
+            port=self.port,
+            username=self.user,
+            password=self.password,
+            timeout=self.connect_timeout,
+            allow_agent=False,
+            look_for_keys=False
+        )
+        transport = client.get_transport()
+        # 命令和小块数据往返很多，关闭Nagle算法避免与延迟ACK叠加出几十毫秒的等待
+        transport.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.keepalive:
+            transport.set_keepalive(self.keepalive)
+        self._client = client
+        self.handshakes += 1
+
+    def _close_client(self):
+        """关闭当前连接（调用方需持有锁）"""
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+            self._client = None
+
+    def is_connected(self):
+        """当前是否持有活动连接"""
+        with self._lock:
+            if self._client is None:
+                return False
+            transport = self._client.get_transport()
+            return transport is not None and transport.is_active()
+
+    def get_transport(self):
+        """获取已认证的传输层，连接不存在或已断开时自动重连"""
+        with self._lock:
+            if not self.is_connected():
+                self._close_client()
+                self._connect()
+            self._last_used = time.monotonic()
+            return self._client.get_transport()
+
+    def reset(self):
+        """丢弃当前连接，下一次取用时重新连接"""
+        with self._lock:
+            self._close_client()
+
+    def close(self):
+        """关闭连接池"""
+        self.reset()
+
+    def evict_if_idle(self):
+        """空闲超时且没有正在使用的通道时关闭连接，返回是否发生回收"""
+        if not self.idle_timeout:
+            return False
+        with self._lock:
+            if self._client is None or self._active > 0:
+                return False
+            if time.monotonic() - self._last_used < self.idle_timeout:
+                return False
+            self._close_client()
+            self.evictions += 1
+            return True
+
+    @contextmanager
+    def channel(self):
+        """在已认证的连接上打开一个会话通道，退出时自动关闭并归还名额"""
+        if not self._slots.acquire(timeout=self.channel_wait):
+            raise TimeoutError(f"{self}: 等待空闲通道超时（上限 {self.max_channels} 个）")
+        chan = None
+        try:
+            with self._lock:
+                self._active += 1
+            try:
+                chan = self.get_transport().open_session(timeout=self.connect_timeout)
+            except (paramiko.SSHException, EOFError, OSError):
+                # 再试一次：get_transport()只在传输层已断开时重连。连接仍然活动时（如对端暂时
+                # 拒绝开通道）不能丢弃它，常驻录音、流式播放等其他通道还在用
+                chan = self.get_transport().open_session(timeout=self.connect_timeout)
+            self.channels_opened += 1
+            yield chan
+        finally:
+            if chan is not None:
+                try:
+                    chan.close()
+                except Exception:
+                    pass
+            with self._lock:
+                self._active -= 1
+                self._last_used = time.monotonic()
+            self._slots.release()
+
+    def exec_command(self, cmd, capture_output=True, check=False, input=None,
+                     timeout=None, text=False):
+        """在连接池上执行远程命令，返回subprocess.CompletedProcess
+
+        cmd可以是字符串或列表（列表按ssh客户端的方式用空格拼接）；不捕获输出时
+        远程的stdout/stderr会直接写到本地终端，与直接运行ssh的效果一致。
+        """
+        cmd_str = join_command(cmd)
+        stdout_parts = []
+        stderr_parts = []
+        with self.channel() as chan:
+            chan.exec_command(cmd_str)
+            if input is not None:
+                if isinstance(input, str):
+                    input = input.encode()
+                chan.sendall(input)
+            chan.shutdown_write()
+            drain_channel(chan, stdout_parts, stderr_parts, timeout, cmd_str)
+            returncode = chan.recv_exit_status()
+
+        stdout = b"".join(stdout_parts)
+        stderr = b"".join(stderr_parts)
+        if not capture_output:
+            _echo_output(stdout, stderr)
+            stdout = stderr = None
+        elif text:
+            stdout = stdout.decode("utf-8", errors="replace")
+            stderr = stderr.decode("utf-8", errors="replace")
+
+        if check and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, stdout, stderr)
+        return subprocess.CompletedProcess(cmd, returncode, stdout, stderr)
+
+    def stats(self):
+        """返回连接池统计信息"""
+        with self._lock:
+            return {
+                "host": f"{self.user}@{self.host}:{self.port}",
+                "connected": self.is_connected(),
+                "active_channels": self._active,
+                "handshakes": self.handshakes,
+                "channels_opened": self.channels_opened,
+                "evictions": self.evictions
+            }
+
+
+def drain_channel(chan, stdout_parts, stderr_parts, timeout, cmd_str):
+    """同时读取通道的stdout和stderr直到远程命令结束，避免任一缓冲区写满导致阻塞"""
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        if chan.recv_ready():
+            stdout_parts.append(chan.recv(RECV_SIZE))
+            continue
+        if chan.recv_stderr_ready():
+            stderr_parts.append(chan.recv_stderr(RECV_SIZE))
+            continue
+        if chan.eof_received or chan.closed:
+            # EOF之前的数据都已进入缓冲区，再确认一次没有残留数据
+            if chan.recv_ready() or chan.recv_stderr_ready():
+                continue
+            break
+        if deadline is not None and time.monotonic() > deadline:
+            raise subprocess.TimeoutExpired(cmd_str, timeout)
+        select.select([chan], [], [], 0.1)
+
+
+def _echo_output(stdout, stderr):
+    """把远程输出写到本地终端"""
+    if stdout:
+        sys.stdout.write(stdout.decode("utf-8", errors="replace"))
+        sys.stdout.flush()
+    if stderr:
+        sys.stderr.write(stderr.decode("utf-8", errors="replace"))
+        sys.stderr.flush()
+
+
+# =============================================================================
+# 连接池注册表
+# =============================================================================
+
+_pools = {}
+_pools_lock = threading.Lock()
+_reaper = None
+
+
+def _reaper_loop():
+    """后台回收空闲连接"""
+    while True:
+        interval = max(1, min(30, SSH_POOL_CONFIG.get("idle_timeout", 300) / 2))
+        time.sleep(interval)
+        with _pools_lock:
+            pools = list(_pools.values())
+        for pool in pools:
+            try:
+                if pool.evict_if_idle():
+                    print(f"✓ 回收空闲SSH连接: {pool.user}@{pool.host}")
+            except Exception as e:
+                print(f"✗ 回收SSH连接失败: {e}")
+
+
+def _start_reaper():
+    """启动空闲连接回收线程（只启动一次）"""
+    global _reaper
+    if _reaper is None and SSH_POOL_CONFIG.get("idle_timeout"):
+        _reaper = threading.Thread(target=_reaper_loop, name="ssh-pool-reaper", daemon=True)
+        _reaper.start()
+
+
+def get_pool(host=None, user=None, password=None, port=None, **options):
+    """获取指定主机的共享连接池，参数缺省时使用配置文件中的远程设备"""
+    host = host or REMOTE_HOST
+    user = user or REMOTE_USER
+    password = REMOTE_PASSWORD if password is None else password
+    port = port or REMOTE_PORT
+    key = (host, port, user)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SSHConnectionPool(host, user, password, port=port, **options)
+            _pools[key] = pool
+        elif password != pool.password:
+            # 密码变化时使用新密码重新认证
+            pool.password = password
+            pool.reset()
+        _start_reaper()
+        return pool
+
+
+def close_all_pools():
+    """关闭所有连接池"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def pool_stats():
+    """返回所有连接池的统计信息"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+
+atexit.register(close_all_pools)
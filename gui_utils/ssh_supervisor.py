@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SSH连接监护
+管理一个长连接的paramiko客户端：传输层keepalive + TCP keepalive，后台线程定期在连接上执行一次探测命令
+确认对端仍然存活；连接断开时按指数退避自动重连，命令因断线失败时等待重连后重试
+（通道未建立就失败的命令总是重试，已开始执行的只有幂等命令才重试）。
+所有重连都在后台线程完成，状态变化通过回调通知界面。
+"""
+
+import socket
+import subprocess
+import threading
+import time
+
+try:
+    import paramiko
+    PARAMIKO_AVAILABLE = True
+except ImportError:
+    PARAMIKO_AVAILABLE = False
+
+try:
+    from gui_utils.ssh_pool import drain_channel, join_command
+except ImportError:
+    from ssh_pool import drain_channel, join_command
+
+try:
+    from gui_utils.config import SSH_CONFIG, SSH_SUPERVISOR_CONFIG
+except ImportError:
+    SSH_CONFIG = {"timeout": 10}
+    SSH_SUPERVISOR_CONFIG = {
+        "keepalive": 5,
+        "probe_interval": 2,
+        "probe_timeout": 1.5,
+        "backoff_initial": 0.05,
+        "backoff_max": 1,
+        "reconnect_timeout": 1,
+        "recover_wait": 15,
+        "retry_count": 2
+    }
+
+# 连接状态
+CONNECTED = "connected"
+RECONNECTING = "reconnecting"
+DISCONNECTED = "disconnected"
+
+# 两次完整探测之间检查传输层线程是否仍然存活的间隔（秒），对端正常关闭连接时能立即发现
+CHECK_INTERVAL = 0.2
+
+# 可以安全重复执行的命令（只读或结果与执行次数无关）
+IDEMPOTENT_COMMANDS = {
+    "echo", "true", "cat", "base64", "ls", "test", "[", "stat", "wc", "md5sum",
+    "mkdir", "rm", "df", "date", "uname", "pwd", "head", "tail", "dd"
+}
+
+
+class ConnectionLost(Exception):
+    """命令执行过程中连接断开"""
+
+
+def is_idempotent(cmd):
+    """粗略判断命令能否安全重试：首个命令在白名单中且不包含追加重定向"""
+    cmd_str = join_command(cmd).strip()
+    if ">>" in cmd_str or not cmd_str:
+        return False
+    for part in cmd_str.replace("&&", ";").replace("||", ";").replace("|", ";").split(";"):
+        words = part.split()
+        if words and words[0].strip("\"'") not in IDEMPOTENT_COMMANDS:
+            return False
+    return True
+
+
+class SSHSupervisor:
+    """单个远程主机的受监护SSH连接
+
+    connect() 建立首次连接并启动后台监护线程；exec_command() 在当前连接上执行命令，
+    断线时等待监护线程重连（最多recover_wait秒）后按规则重试。
+    """
+
+    def __init__(self, host, user, password, port=22, connect_timeout=None,
+                 on_state_change=None, **options):
+        if not PARAMIKO_AVAILABLE:
+            raise ImportError("SSH连接监护需要安装paramiko库: pip install paramiko")
+        config = dict(SSH_SUPERVISOR_CONFIG, **options)
+        self.host = host
+        self.user = user
+        self.password = password
+        self.port = port
+        self.connect_timeout = connect_timeout or SSH_CONFIG.get("timeout", 10)
+        self.keepalive = config["keepalive"]
+        self.probe_interval = config["probe_interval"]
+        self.probe_timeout = config["probe_timeout"]
+        self.backoff_initial = config["backoff_initial"]
+        self.backoff_max = config["backoff_max"]
+        self.reconnect_timeout = config["reconnect_timeout"]
+        self.recover_wait = config["recover_wait"]
+        self.retry_count = config["retry_count"]
+
+        self._client = None
+        self._state = DISCONNECTED
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._listeners = [on_state_change] if on_state_change else []
+        self._down_since = None
+
+        # 统计
+        self.reconnects = 0
+        self.reconnect_attempts = 0
+        self.probes = 0
+        self.probe_failures = 0
+        self.retries = 0
+        self.last_recovery = None
+        self.max_recovery = 0.0
+        self.total_downtime = 0.0
+
+    def __repr__(self):
+        return f"SSHSupervisor({self.user}@{self.host}:{self.port}, {self._state})"
+
+    # -------------------------------------------------------------------------
+    # 状态
+    # -------------------------------------------------------------------------
+
+    @property
+    def state(self):
+        return self._state
+
+    def add_listener(self, func):
+        """注册状态变化回调 func(状态, 统计信息)；回调在后台线程中调用，界面需自行切回主线程"""
+        self._listeners.append(func)
+
+    def _set_state(self, state):
+        """切换状态并通知等待者和回调（调用方需持有_cond）"""
+        if state == self._state:
+            return
+        self._state = state
+        self._cond.notify_all()
+        stats = self._stats_locked()
+        for func in list(self._listeners):
+            try:
+                func(state, stats)
+            except Exception as e:
+                print(f"⚠ SSH状态回调出错: {e}")
+
+    # -------------------------------------------------------------------------
+    # 连接
+    # -------------------------------------------------------------------------
+
+    def _open_client(self, tcp_timeout=None):
+        """建立一个新的已认证连接
+
+        tcp_timeout只限制TCP建连：重连时用较短的值，链路恢复后下一次尝试就能连上，
+        而不是卡在内核的SYN重传上。
+        """
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(
+            hostname=self.host,
+            port=self.port,
+            username=self.user,
+            password=self.password,
+            timeout=tcp_timeout or self.connect_timeout,
+            banner_timeout=self.connect_timeout,
+            auth_timeout=self.connect_timeout,
+            allow_agent=False,
+            look_for_keys=False
+        )
+        transport = client.get_transport()
+        sock = transport.sock
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if self.keepalive:
+            transport.set_keepalive(self.keepalive)
+        return client
+
+    def connect(self):
+        """建立首次连接并启动监护线程，返回是否连接成功（失败时监护线程继续在后台重连）"""
+        with self._cond:
+            self._stopping = False
+        try:
+            client = self._open_client()
+        except Exception as e:
+            print(f"✗ SSH连接失败: {e}")
+            client = None
+        with self._cond:
+            if client is not None:
+                self._client = client
+                self._set_state(CONNECTED)
+            else:
+                self._mark_down_locked()
+        self._start_monitor()
+        return client is not None
+
+    def _start_monitor(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._monitor_loop, name="ssh-supervisor",
+                                            daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """停止监护并关闭连接"""
+        with self._cond:
+            self._stopping = True
+            client, self._client = self._client, None
+            self._set_state(DISCONNECTED)
+        self._wake.set()
+        if client is not None:
+            client.close()
+
+    def _mark_down_locked(self, client=None):
+        """把连接标记为断开并唤醒监护线程（调用方需持有_cond）"""
+        if client is not None and client is not self._client:
+            return  # 这个连接已经被替换过了
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+            self._client = None
+        if self._down_since is None:
+            self._down_since = time.monotonic()
+        if not self._stopping:
+            self._set_state(RECONNECTING)
+        self._wake.set()
+
+    def _monitor_loop(self):
+        """后台监护：连接正常时定期探测，断开时按指数退避重连"""
+        backoff = self.backoff_initial
+        last_probe = time.monotonic()
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                client = self._client
+            if client is None:
+                self.reconnect_attempts += 1
+                try:
+                    new_client = self._open_client(self.reconnect_timeout)
+                except Exception as e:
+                    print(f"⚠ SSH重连失败，{backoff:.2f}秒后重试: {e}")
+                    self._wake.wait(backoff)
+                    self._wake.clear()
+                    backoff = min(backoff * 2, self.backoff_max)
+                    continue
+                with self._cond:
+                    if self._stopping:
+                        new_client.close()
+                        return
+                    self._client = new_client
+                    self._record_recovery()
+                    self._set_state(CONNECTED)
+                print(f"✓ SSH已重连 ({self.last_recovery:.2f}秒)")
+                backoff = self.backoff_initial
+                last_probe = time.monotonic()
+                continue
+
+            if self._wake.wait(min(CHECK_INTERVAL, self.probe_interval)):
+                self._wake.clear()
+                continue
+            transport = client.get_transport()
+            alive = transport is not None and transport.is_active()
+            if alive and time.monotonic() - last_probe >= self.probe_interval:
+                alive = self._probe(client)
+                last_probe = time.monotonic()
+            if not alive:
+                self.probe_failures += 1
+                print("⚠ SSH探测失败，连接已断开，开始重连")
+                with self._cond:
+                    self._mark_down_locked(client)
+
+    def _probe(self, client):
+        """在连接上执行一条空命令确认对端存活"""
+        self.probes += 1
+        try:
+            transport = client.get_transport()
+            if transport is None or not transport.is_active():
+                return False
+            chan = transport.open_session(timeout=self.probe_timeout)
+            try:
+                chan.settimeout(self.probe_timeout)
+                chan.exec_command("true")
+                deadline = time.monotonic() + self.probe_timeout
+                while not chan.exit_status_ready():
+                    if time.monotonic() > deadline:
+                        return False
+                    time.sleep(0.01)
+                return True
+            finally:
+                chan.close()
+        except Exception:
+            return False
+
+    def _record_recovery(self):
+        """记录一次恢复耗时（调用方需持有_cond）"""
+        self.reconnects += 1
+        if self._down_since is not None:
+            elapsed = time.monotonic() - self._down_since
+            self.last_recovery = elapsed
+            self.max_recovery = max(self.max_recovery, elapsed)
+            self.total_downtime += elapsed
+            self._down_since = None
+
+    def wait_connected(self, timeout=None):
+        """等待连接可用，返回当前客户端；超时抛出ConnectionLost"""
+        timeout = self.recover_wait if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._client is None:
+                if self._stopping:
+                    raise ConnectionLost("SSH连接已关闭")
+                if self._thread is None or not self._thread.is_alive():
+                    # 首次连接前或监护线程已退出时由调用方触发重连
+                    self._mark_down_locked()
+                    self._start_monitor()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ConnectionLost(f"等待SSH重连超时 ({timeout}秒)")
+                self._cond.wait(remaining)
+            return self._client
+
+    def get_transport(self):
+        """获取当前可用连接的传输层（断线时等待重连）"""
+        return self.wait_connected().get_transport()
+
+    # -------------------------------------------------------------------------
+    # 命令执行
+    # -------------------------------------------------------------------------
+
+    def exec_command(self, cmd, timeout=None, idempotent=None, input=None):
+        """执行远程命令，返回 (退出码, stdout字节, stderr字节)
+
+        idempotent为None时按命令内容判断；连接在通道建立前断开的命令总会在重连后重试，
+        已开始执行时断开的命令只有幂等时才重试，否则抛出ConnectionLost。连接仍然正常时的
+        错误（开通道被拒绝等）直接抛出，不会断开连接。
+        """
+        cmd_str = join_command(cmd)
+        if idempotent is None:
+            idempotent = is_idempotent(cmd_str)
+        attempt = 0
+        while True:
+            client = self.wait_connected()
+            started = False
+            try:
+                chan = client.get_transport().open_session(timeout=self.connect_timeout)
+            except Exception as e:
+                failure = e
+            else:
+                try:
+                    chan.exec_command(cmd_str)
+                    started = True
+                    if input is not None:
+                        chan.sendall(input.encode() if isinstance(input, str) else input)
+                    chan.shutdown_write()
+                    stdout_parts, stderr_parts = [], []
+                    drain_channel(chan, stdout_parts, stderr_parts, timeout, cmd_str)
+                    # 连接断开时通道被关闭，recv_exit_status返回-1
+                    returncode = chan.recv_exit_status()
+                    if returncode != -1 or client.get_transport().is_active():
+                        return returncode, b"".join(stdout_parts), b"".join(stderr_parts)
+                    failure = ConnectionLost("命令执行期间连接断开")
+                except subprocess.TimeoutExpired:
+                    raise
+                except Exception as e:
+                    failure = e
+                finally:
+                    chan.close()
+
+            transport = client.get_transport()
+            if transport is not None and transport.is_active() and not isinstance(failure, ConnectionLost):
+                # 连接仍然正常（如对端拒绝开通道、输出解码出错）：不能关闭共享的连接，
+                # 常驻录音、流式播放等其他通道还在用，原样抛出
+                raise failure
+            # 连接断开：通知监护线程立即重连
+            with self._cond:
+                self._mark_down_locked(client)
+            attempt += 1
+            if attempt > self.retry_count or (started and not idempotent):
+                raise ConnectionLost(f"SSH连接断开，命令未完成: {cmd_str[:60]} ({failure})")
+            self.retries += 1
+            print(f"⚠ SSH连接断开，重连后重试命令 (第{attempt}次)")
+
+    # -------------------------------------------------------------------------
+    # 统计
+    # -------------------------------------------------------------------------
+
+    def _stats_locked(self):
+        return {
+            "host": f"{self.user}@{self.host}:{self.port}",
+            "state": self._state,
+            "reconnects": self.reconnects,
+            "reconnect_attempts": self.reconnect_attempts,
+            "probes": self.probes,
+            "probe_failures": self.probe_failures,
+            "retries": self.retries,
+            "last_recovery": self.last_recovery,
+            "max_recovery": self.max_recovery,
+            "total_downtime": self.total_downtime
+        }
+
+    def stats(self):
+        """返回监护统计信息（重连次数、恢复耗时等）"""
+        with self._cond:
+            return self._stats_locked()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试KPC1无损压缩编码
+对各种WAV（单声道/多声道、奇数长度、data块后还有其他块、非16位、声明长度超出实际数据）和
+非WAV数据检查：
+1. 本地 encode/decode 往返后与原数据逐字节一致
+2. 板子上用的纯标准库辅助脚本（REMOTE_HELPER_SOURCE，这里用本机python执行）与本地实现互相兼容，
+   编码结果逐字节相同
+
+    python gui_utils/test_audio_codec.py
+"""
+
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+# 添加当前目录到路径，以便导入audio_codec模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from audio_codec import encode, decode, REMOTE_HELPER_SOURCE, MAGIC
+
+
+def make_wav(samples, channels=1, bits=16, rate=16000, extra=b"", data_size=None, tail=b""):
+    """拼一个WAV：extra为fmt和data之间的块，tail为data之后的字节，data_size覆盖声明的data长度"""
+    width = bits // 8
+    fmt = struct.pack("<HHIIHH", 1, channels, rate, rate * channels * width, channels * width, bits)
+    size = len(samples) if data_size is None else data_size
+    body = (b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + extra
+            + b"data" + struct.pack("<I", size) + samples + tail)
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def pcm16(rng, frames, channels):
+    """带低频起伏的随机16位PCM（包含正负满幅，检查差分回绕）"""
+    t = np.arange(frames)[:, None]
+    audio = 12000 * np.sin(t / 40.0 + np.arange(channels)) + rng.normal(0, 800, (frames, channels))
+    audio = np.clip(audio, -32768, 32767).astype("<i2")
+    if frames > 2:
+        audio[1, 0], audio[2, 0] = 32767, -32768
+    return audio.tobytes()
+
+
+def make_cases(rng):
+    """返回 [(名称, 数据)]"""
+    stereo = pcm16(rng, 4000, 2)
+    return [
+        ("单声道16位", make_wav(pcm16(rng, 8000, 1))),
+        ("双声道16位", make_wav(stereo, channels=2)),
+        ("四声道16位", make_wav(pcm16(rng, 3000, 4), channels=4)),
+        ("data末尾不足一帧", make_wav(stereo + b"\x01\x02\x03", channels=2)),
+        ("data后有LIST块", make_wav(pcm16(rng, 1000, 1),
+                                   tail=b"LIST" + struct.pack("<I", 4) + b"INFO")),
+        ("fmt和data之间有其他块", make_wav(pcm16(rng, 1000, 1),
+                                          extra=b"fact" + struct.pack("<I", 4) + b"\0\0\0\0")),
+        ("声明长度超出实际数据", make_wav(pcm16(rng, 1000, 1), data_size=0xFFFFFFFF)),
+        ("空data块", make_wav(b"")),
+        ("只有一帧", make_wav(pcm16(rng, 1, 2), channels=2)),
+        ("24位PCM", make_wav(rng.integers(0, 256, 3000 * 3, dtype=np.uint8).tobytes(), bits=24)),
+        ("截断的WAV头", make_wav(pcm16(rng, 100, 1))[:30]),
+        ("非WAV数据", rng.integers(0, 256, 5000, dtype=np.uint8).tobytes()),
+        ("空数据", b""),
+    ]
+
+
+def run_helper(helper_path, command, data):
+    """用本机python执行辅助脚本（板子上是 python3 helper encode|decode）"""
+    result = subprocess.run([sys.executable, helper_path, command], input=data,
+                            capture_output=True, timeout=60)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode("utf-8", errors="replace").strip())
+    return result.stdout
+
+
+def test_round_trip(cases):
+    """本地编码后解码与原数据逐字节一致"""
+    ok = True
+    for name, data in cases:
+        try:
+            blob = encode(data)
+            passed = blob[:4] == MAGIC and decode(blob) == data
+            detail = f"{len(data)} -> {len(blob)} 字节"
+        except Exception as e:
+            passed, detail = False, f"出错: {e}"
+        ok &= passed
+        print(f"{'✓' if passed else '✗'} {name}: {detail}")
+    return ok
+
+
+def test_remote_helper(cases):
+    """辅助脚本与本地实现互相解码，编码结果逐字节相同"""
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        helper_path = os.path.join(tmp, "kpc1_helper.py")
+        with open(helper_path, "w", encoding="utf-8") as f:
+            f.write(REMOTE_HELPER_SOURCE)
+        for name, data in cases:
+            try:
+                local_blob = encode(data)
+                remote_blob = run_helper(helper_path, "encode", data)
+                same = remote_blob == local_blob
+                decoded_remote = run_helper(helper_path, "decode", local_blob) == data
+                decoded_local = decode(remote_blob) == data
+                passed = same and decoded_remote and decoded_local
+                detail = (f"编码{'相同' if same else '不同'}，脚本解码{'正确' if decoded_remote else '错误'}，"
+                          f"本地解码{'正确' if decoded_local else '错误'}")
+            except Exception as e:
+                passed, detail = False, f"出错: {e}"
+            ok &= passed
+            print(f"{'✓' if passed else '✗'} {name}: {detail}")
+    return ok
+
+
+if __name__ == "__main__":
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    rng = np.random.default_rng(seed)
+    cases = make_cases(rng)
+    print("=" * 50)
+    print(f"测试KPC1编码 (随机种子 {seed})")
+    print("=" * 50)
+
+    results = []
+    for name, test in [("本地往返", test_round_trip), ("远程辅助脚本兼容", test_remote_helper)]:
+        print(f"\n{name}:")
+        results.append(test(cases))
+
+    if all(results):
+        print("\n✓ 全部通过")
+    else:
+        print("\n✗ 有测试失败")
+        sys.exit(1)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试常驻录音的环形缓冲截取
+每个采样的值由它的绝对位置决定，按随机长度写入（包括超过容量的一次写入）后随机截取，检查：
+1. AudioRing.read 返回的数据和实际起始位置正确，已被覆盖的开头被裁掉，预分配的out可用
+2. CaptureDaemon按任意字节边界接收（半个采样留到下次）时，环形缓冲中的采样不错位，
+   trigger/cut按pre-roll回溯截取
+
+不需要连接板子：CaptureDaemon的接收循环由一个假的通道驱动。
+
+    python gui_utils/test_capture_ring.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+# 添加当前目录到路径，以便导入capture_ring模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from capture_ring import AudioRing, CaptureDaemon
+
+RATE = 16000
+
+
+def expected(start, end, channels):
+    """绝对位置[start, end)上的采样值：(位置 * 声道数 + 声道) 按16位回绕"""
+    values = np.arange(start * channels, end * channels, dtype=np.int64).astype(np.uint16)
+    return values.view(np.int16).reshape(-1, channels)
+
+
+def check(name, passed, detail=""):
+    print(f"{'✓' if passed else '✗'} {name}{': ' + detail if detail else ''}")
+    return passed
+
+
+def test_ring_reads(rng):
+    """随机写入、随机截取"""
+    ok = True
+    for capacity, channels in ((1000, 1), (997, 2)):
+        ring = AudioRing(capacity, channels)
+        written = 0
+        errors = 0
+        reads = 0
+        for _ in range(300):
+            n = int(rng.choice([0, 1, int(rng.integers(1, capacity)), capacity, capacity + 123]))
+            data = expected(written, written + n, channels)
+            ring.write(data if channels > 1 or rng.random() < 0.5 else data[:, 0])
+            written += n
+            for _ in range(5):
+                start = int(rng.integers(max(0, written - 2 * capacity), written + 10))
+                end = start + int(rng.integers(0, capacity + 50))
+                out = None
+                if rng.random() < 0.3:
+                    out = np.empty((capacity, channels), dtype=np.int16)
+                audio, actual = ring.read(start, end, out)
+                want_start = max(start, written - capacity, 0)
+                want_end = max(want_start, min(end, written))
+                reads += 1
+                if actual != max(start, ring.oldest) or \
+                        not np.array_equal(audio, expected(want_start, want_end, channels)):
+                    errors += 1
+        ok &= check(f"容量 {capacity} {channels}声道", ring.written == written and errors == 0,
+                    f"写入 {written} 个采样，{reads} 次截取，错误 {errors}")
+
+    ring = AudioRing(100)
+    ring.write(expected(0, 50, 1))
+    try:
+        ring.read(0, 50, np.empty((10, 1), dtype=np.int16))
+        ok &= check("out太小时抛出ValueError", False)
+    except ValueError:
+        ok &= check("out太小时抛出ValueError", True)
+    return ok
+
+
+class FakePool:
+    host = "test"
+
+
+class FakeChannel:
+    """按给定的字节块依次返回数据，之后返回b""（远程arecord结束）"""
+
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+
+    def recv(self, size):
+        return self._chunks.pop(0) if self._chunks else b""
+
+    def recv_stderr_ready(self):
+        return False
+
+
+def split_bytes(rng, data):
+    """把字节切成随机长度的块（经常在一个采样中间断开）"""
+    chunks = []
+    i = 0
+    while i < len(data):
+        n = int(rng.integers(1, 700))
+        chunks.append(data[i:i + n])
+        i += n
+    return chunks
+
+
+def test_daemon_cuts(rng):
+    """接收任意边界的字节后按绝对位置截取"""
+    ok = True
+    for channels in (1, 2):
+        daemon = CaptureDaemon(FakePool(), seconds=1, pre_roll_ms=250, rate=RATE, channels=channels)
+        capacity = daemon.ring.capacity
+        total = int(capacity * 2.5)
+        seen = []
+        daemon.add_listener(lambda samples, position: seen.append((position, len(samples))))
+        daemon._pump(FakeChannel(split_bytes(rng, expected(0, total, channels).tobytes())))
+
+        listener_ok = all(a[0] + a[1] // channels == b[0] for a, b in zip(seen, seen[1:]))
+        ok &= check(f"{channels}声道 接收", daemon.position == total and listener_ok
+                    and daemon.bytes_received == total * 2 * channels,
+                    f"位置 {daemon.position}/{total}，回调 {len(seen)} 次")
+
+        start = daemon.trigger()
+        audio = daemon.cut(start)
+        want = expected(total - RATE // 4, total, channels)
+        ok &= check(f"{channels}声道 pre-roll截取", start == total - RATE // 4
+                    and np.array_equal(audio, want[:, 0] if channels == 1 else want),
+                    f"从 {start} 截取 {len(audio)} 个采样")
+
+        # 开头已被覆盖：从最早仍保留的采样开始
+        audio = daemon.cut(total - capacity - 100, total - capacity + 200)
+        want = expected(total - capacity, total - capacity + 200, channels)
+        ok &= check(f"{channels}声道 开头已覆盖时裁掉", np.array_equal(audio, want[:, 0] if channels == 1 else want),
+                    f"{len(audio)} 个采样")
+
+        ok &= check(f"{channels}声道 pre-roll不超过缓冲", daemon.trigger(pre_roll_ms=5000) == daemon.ring.oldest)
+    return ok
+
+
+if __name__ == "__main__":
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    rng = np.random.default_rng(seed)
+    print("=" * 50)
+    print(f"测试常驻录音环形缓冲 (随机种子 {seed})")
+    print("=" * 50)
+
+    results = []
+    for name, test in [("AudioRing随机读写", test_ring_reads), ("CaptureDaemon截取", test_daemon_cuts)]:
+        print(f"\n{name}:")
+        results.append(test(rng))
+
+    if all(results):
+        print("\n✓ 全部通过")
+    else:
+        print("\n✗ 有测试失败")
+        sys.exit(1)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试远程命令批处理的输出拆分
+用本机的sh代替板子执行批处理脚本（runner形式的target），检查按标记拆回各步骤的stdout/stderr和
+退出码：二进制输出、没有换行结尾的输出、看起来像分隔行的输出、步骤中的exit和行尾注释、
+check步骤失败时跳过后续步骤、标准输入只交给读取它的步骤、输出被截断时抛出BatchError，
+以及上传校验和带校验头的取回。
+
+    python gui_utils/test_remote_batch.py
+"""
+
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+
+# 添加当前目录到路径，以便导入remote_batch模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from remote_batch import (
+    RemoteBatch, BatchError, MARKER_PREFIX, add_upload, verify_command, fetch_command, save_output
+)
+from transfer import TransferError
+
+
+def local_runner(script, input=None):
+    """在本机sh中执行脚本，返回 (退出码, stdout, stderr)"""
+    result = subprocess.run(["sh", "-c", script], input=input or b"", capture_output=True, timeout=60)
+    return result.returncode, result.stdout, result.stderr
+
+
+def truncating_runner(keep):
+    """只返回前keep字节stdout的runner（模拟连接中途断开）"""
+    def run(script, input=None):
+        returncode, stdout, stderr = local_runner(script, input)
+        return -1, stdout[:keep], stderr
+    return run
+
+
+def printf_command(data):
+    """原样输出data的printf命令（每个字节写成八进制转义）"""
+    return "printf '" + "".join("\\%03o" % b for b in data) + "'"
+
+
+def check(name, passed, detail=""):
+    print(f"{'✓' if passed else '✗'} {name}{': ' + detail if detail else ''}")
+    return passed
+
+
+def test_split_output():
+    """各步骤的stdout/stderr和退出码"""
+    binary = bytes(range(256))
+    fake_marker = MARKER_PREFIX + b"000000000000:0:0\n"
+    batch = RemoteBatch(local_runner)
+    batch.add("printf 'hello\\n'; printf 'warn\\n' >&2", name="text")
+    batch.add("printf 'no newline'", name="partial")
+    batch.add(printf_command(binary), name="binary")
+    batch.add(printf_command(fake_marker), name="fake")
+    batch.add("echo before; exit 3", name="exit", check=False)
+    batch.add("echo comment # 行尾注释", name="comment")
+    batch.add("true", name="empty")
+    result = batch.run()
+
+    ok = True
+    ok &= check("普通输出", result["text"].stdout == b"hello\n" and result["text"].stderr == b"warn\n",
+                repr((result["text"].stdout, result["text"].stderr)))
+    ok &= check("没有换行结尾", result["partial"].stdout == b"no newline", repr(result["partial"].stdout))
+    ok &= check("二进制输出", result["binary"].stdout == binary, f"{len(result['binary'].stdout)} 字节")
+    ok &= check("其他批次的分隔行", result["fake"].stdout == fake_marker, repr(result["fake"].stdout))
+    ok &= check("步骤中的exit只结束该步骤",
+                result["exit"].returncode == 3 and result["exit"].stdout == b"before\n"
+                and result["comment"].ok, repr(result.returncodes))
+    ok &= check("行尾注释", result["comment"].stdout == b"comment\n", repr(result["comment"].stdout))
+    ok &= check("空输出", result["empty"].ok and result["empty"].stdout == b"" and result["empty"].stderr == b"")
+    ok &= check("失败步骤", result.failed is result["exit"], repr(result.failed))
+    return ok
+
+
+def test_check_skips():
+    """check=True的步骤失败时跳过后续步骤"""
+    result = (RemoteBatch(local_runner)
+              .add("echo first", name="first")
+              .add("echo oops >&2; false", name="fail")
+              .add("echo never", name="never")
+              .run())
+    ok = check("失败步骤的输出", result["fail"].returncode == 1 and result["fail"].stderr == b"oops\n",
+               repr(result["fail"]))
+    ok &= check("后续步骤被跳过", result["never"].skipped and result["never"].stdout == b"",
+                repr(result["never"]))
+    try:
+        RemoteBatch(local_runner).add("false", name="fail").run(check=True)
+        ok &= check("run(check=True)抛出CalledProcessError", False)
+    except subprocess.CalledProcessError as e:
+        ok &= check("run(check=True)抛出CalledProcessError", e.returncode == 1)
+    return ok
+
+
+def test_stdin():
+    """标准输入只交给带input的步骤，其他步骤读到空"""
+    result = (RemoteBatch(local_runner)
+              .add("cat", name="before")
+              .add("cat", name="reader", input=b"payload\x00\xff")
+              .add("cat", name="after")
+              .run())
+    return check("标准输入", result["before"].stdout == b"" and result["after"].stdout == b""
+                 and result["reader"].stdout == b"payload\x00\xff", repr(result.steps))
+
+
+def test_truncated():
+    """输出在任意位置被截断（包括分隔行和结尾行的中间）时都抛出BatchError"""
+    batch = RemoteBatch(local_runner).add("echo one").add("echo two")
+    full = local_runner(batch.script("abcdef123456"))[1]
+    wrong = {}
+    for keep in range(len(full)):
+        try:
+            RemoteBatch(truncating_runner(keep)).add("echo one").add("echo two").run()
+            wrong[keep] = "没有抛出异常"
+        except BatchError:
+            pass
+        except Exception as e:
+            wrong[keep] = type(e).__name__
+    ok = check(f"截断到 0~{len(full) - 1} 字节", not wrong, str(wrong) if wrong else "都抛出BatchError")
+    result = RemoteBatch(truncating_runner(len(full))).add("echo one").add("echo two").run()
+    ok &= check("完整输出", result.ok and result[1].stdout == b"two\n", repr(result.steps))
+    return ok
+
+
+def test_upload_and_fetch():
+    """上传后在远程校验，取回时带校验头"""
+    data = os.urandom(5000)
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        remote = os.path.join(tmp, "remote dir", "upload.wav")
+        batch = RemoteBatch(local_runner).add(f"mkdir -p '{os.path.dirname(remote)}'", name="mkdir")
+        add_upload(batch, remote, data, verify=True)
+        batch.add("echo played", name="play")
+        result = batch.run()
+        with open(remote, "rb") as f:
+            uploaded = f.read()
+        ok &= check("上传并校验", result.ok and uploaded == data, repr(result.steps))
+
+        # 远程文件与预期不一致时校验失败，后面的播放被跳过
+        other = data[:-1] + bytes([data[-1] ^ 1])
+        result = (RemoteBatch(local_runner)
+                  .add(verify_command(remote, other), name="verify")
+                  .add("echo played", name="play")
+                  .run())
+        ok &= check("MD5不一致时校验失败", result["verify"].returncode == 1 and result["play"].skipped,
+                    repr(result.steps))
+        result = RemoteBatch(local_runner).add(verify_command(remote, data + b"x"), name="verify").run()
+        ok &= check("字节数不一致时校验失败", result["verify"].returncode == 1, repr(result.steps))
+
+        local = os.path.join(tmp, "fetched.wav")
+        result = RemoteBatch(local_runner).add(fetch_command(remote, verify=True), name="fetch").run()
+        size = save_output(result["fetch"], local, verify=True)
+        with open(local, "rb") as f:
+            fetched = f.read()
+        ok &= check("带校验头取回", size == len(data) and fetched == data,
+                    f"{size} 字节 md5 {hashlib.md5(fetched).hexdigest()[:8]}")
+
+        step = result["fetch"]
+        step.stdout = step.stdout[:-1]
+        try:
+            save_output(step, local, verify=True)
+            ok &= check("取回的数据不完整时抛出TransferError", False)
+        except TransferError:
+            ok &= check("取回的数据不完整时抛出TransferError", True)
+    return ok
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("测试远程命令批处理")
+    print("=" * 50)
+
+    results = []
+    for name, test in [("输出拆分", test_split_output), ("check步骤", test_check_skips),
+                       ("标准输入", test_stdin), ("输出截断", test_truncated),
+                       ("上传和取回", test_upload_and_fetch)]:
+        print(f"\n{name}:")
+        results.append(test())
+
+    if all(results):
+        print("\n✓ 全部通过")
+    else:
+        print("\n✗ 有测试失败")
+        sys.exit(1)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试流式音频处理（StreamProcessor / ProcessedWavWriter）
+按随机长度分块送入，检查：
+1. 降噪、固定增益这些流式与整段处理等价的滤镜，输出等于 AudioProcessor.process 的结果延迟latency个采样
+2. 完整处理链（含dynaudnorm和agc，流式版本按设计与整段处理不同）的输出与分块方式无关
+3. ProcessedWavWriter写出的WAV去掉了延迟，与一次性送入整段的流式处理结果一致
+
+    python gui_utils/test_stream_processing.py
+"""
+
+import os
+import sys
+import tempfile
+import wave
+
+import numpy as np
+
+# 添加当前目录到路径，以便导入audio_dsp模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from audio_dsp import AudioProcessor, StreamProcessor, ProcessedWavWriter, to_pcm16, AUDIO_PROCESS_PARAMS
+
+SAMPLE_RATE = 16000
+SECONDS = 3
+# float32逐块计算与整段计算的舍入差异
+TOLERANCE = 1e-5
+
+# 流式版本与整段处理逐采样等价的处理链
+EXACT_CHAINS = [
+    {"engine": "numpy", "denoise": "afftdn=nr=12:nt=w"},
+    {"engine": "numpy", "amplify": "volume=2.0"},
+    {"engine": "numpy", "denoise": "afftdn=nr=12:nt=w", "amplify": "volume=3.0"},
+]
+
+
+def make_audio(rng, channels=1):
+    """合成测试音频：白噪声底噪上叠加几段音调（-1~1的float32）"""
+    n = SAMPLE_RATE * SECONDS
+    t = np.arange(n) / SAMPLE_RATE
+    audio = rng.normal(0, 0.01, (n, channels))
+    for start in (0.3, 1.2, 2.1):
+        burst = (t >= start) & (t < start + 0.5)
+        audio[burst] += 0.3 * np.sin(2 * np.pi * rng.uniform(150, 600) * t[burst])[:, None]
+    audio = audio.astype(np.float32)
+    return audio[:, 0] if channels == 1 else audio
+
+
+def random_chunks(rng, audio):
+    """把audio切成随机长度的块（包括空块和超过一帧的大块）"""
+    chunks = []
+    i = 0
+    while i < len(audio):
+        n = int(rng.choice([0, 1, 7, int(rng.integers(1, 4000))]))
+        chunks.append(audio[i:i + n])
+        i += n
+    return chunks
+
+
+def run_stream(processor, chunks, length):
+    """逐块处理并flush，去掉延迟后返回与输入等长的输出"""
+    out = [processor.process(chunk) for chunk in chunks] + [processor.flush()]
+    latency = processor.latency
+    return np.concatenate(out)[latency:latency + length]
+
+
+def test_matches_batch(rng):
+    """流式输出等于整段处理结果延迟latency个采样"""
+    ok = True
+    for params in EXACT_CHAINS:
+        for channels in (1, 2):
+            audio = make_audio(rng, channels)
+            processor = StreamProcessor(SAMPLE_RATE, channels, params)
+            streamed = run_stream(processor, random_chunks(rng, audio), len(audio))
+            batch = AudioProcessor(params).process(audio, SAMPLE_RATE)
+            error = float(np.abs(streamed - batch).max())
+            passed = streamed.shape == batch.shape and error < TOLERANCE
+            ok &= passed
+            chain = ", ".join(k for k in params if k != "engine")
+            print(f"{'✓' if passed else '✗'} {chain} {channels}声道 latency={processor.latency} "
+                  f"最大误差 {error:.2e}")
+    return ok
+
+
+def test_chunk_invariance(rng):
+    """完整处理链的输出与分块方式无关"""
+    ok = True
+    for channels in (1, 2):
+        audio = make_audio(rng, channels)
+        whole = run_stream(StreamProcessor(SAMPLE_RATE, channels, AUDIO_PROCESS_PARAMS),
+                           [audio], len(audio))
+        for attempt in range(3):
+            processor = StreamProcessor(SAMPLE_RATE, channels, AUDIO_PROCESS_PARAMS)
+            streamed = run_stream(processor, random_chunks(rng, audio), len(audio))
+            error = float(np.abs(streamed - whole).max())
+            passed = streamed.shape == whole.shape and error < TOLERANCE
+            ok &= passed
+            print(f"{'✓' if passed else '✗'} {processor} {channels}声道 第{attempt + 1}次随机分块 "
+                  f"最大误差 {error:.2e}")
+    return ok
+
+
+def read_pcm16(path):
+    with wave.open(path, "rb") as wav:
+        channels = wav.getnchannels()
+        data = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+    return data if channels == 1 else data.reshape(-1, channels)
+
+
+def test_wav_writer(rng):
+    """ProcessedWavWriter随机分块写入，结果与整段送入的流式处理逐采样对齐（允许1个LSB的舍入差异）"""
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for channels in (1, 2):
+            pcm = to_pcm16(make_audio(rng, channels))
+            processor = StreamProcessor(SAMPLE_RATE, channels, AUDIO_PROCESS_PARAMS)
+            expected = run_stream(processor, [pcm], len(pcm))
+            for length in (None, len(pcm) // 2):
+                path = os.path.join(tmp, f"test_{channels}_{length}.wav")
+                writer = ProcessedWavWriter(path, SAMPLE_RATE, channels, AUDIO_PROCESS_PARAMS)
+                for chunk in random_chunks(rng, pcm):
+                    writer.write(chunk)
+                saved = writer.close(length)
+                written = read_pcm16(path)
+                want = expected[:length]
+                diff = int(np.abs(written.astype(np.int32) - want.astype(np.int32)).max())
+                passed = saved == len(want) and written.shape == want.shape and diff <= 1
+                ok &= passed
+                print(f"{'✓' if passed else '✗'} ProcessedWavWriter {channels}声道 "
+                      f"保存 {saved}/{len(pcm)} 个采样，最大差异 {diff} LSB")
+    return ok
+
+
+if __name__ == "__main__":
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    rng = np.random.default_rng(seed)
+    print("=" * 50)
+    print(f"测试流式音频处理 (随机种子 {seed})")
+    print("=" * 50)
+
+    results = []
+    for name, test in [("与整段处理对齐", test_matches_batch),
+                       ("与分块方式无关", test_chunk_invariance),
+                       ("写出WAV", test_wav_writer)]:
+        print(f"\n{name}:")
+        results.append(test(rng))
+
+    if all(results):
+        print("\n✓ 全部通过")
+    else:
+        print("\n✗ 有测试失败")
+        sys.exit(1)
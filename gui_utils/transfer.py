@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+二进制流式文件传输
+在连接池的一个exec通道上直接读写原始字节（上传写入远程 cat 的stdin，下载读取 cat 的stdout），
+不做base64编码也不分块开新会话，传输结束后校验字节数和MD5。
+TRANSFER_CONFIG["compress"]打开且远程支持时，较大的WAV文件使用KPC1无损压缩编码传输（见audio_codec.py）。
+这里的函数是async_remote.AsyncRemoteClient对应异步方法的同步封装。
+"""
+
+try:
+    from gui_utils.ssh_pool import get_pool
+except ImportError:
+    from ssh_pool import get_pool
+
+try:
+    from gui_utils.config import TRANSFER_CONFIG
+except ImportError:
+    TRANSFER_CONFIG = {
+        "buffer_size": 32768,
+        "verify": True,
+        "compress": False,
+        "timeout": 30
+    }
+
+
+class TransferError(Exception):
+    """文件传输失败（远程命令出错或校验不一致）"""
+
+
+def checksum_command(quoted_path):
+    """远程校验命令：输出文件字节数和MD5两行（远程没有md5sum时第二行为 -）"""
+    return (f"wc -c < {quoted_path} && "
+            f"(md5sum {quoted_path} 2>/dev/null || echo -)")
+
+
+def parse_checksum_output(lines):
+    """解析校验命令的输出行，返回 (字节数, md5或None)"""
+    if len(lines) < 2:
+        raise TransferError(f"无法解析远程校验信息: {lines!r}")
+    size = int(lines[0].strip())
+    digest = lines[1].split()[0] if lines[1].strip() else "-"
+    return size, (None if digest == "-" else digest)
+
+
+def check_transfer(expected_size, expected_md5, remote_size, remote_md5):
+    """比较本地与远程的字节数和MD5，不一致时抛出TransferError"""
+    if remote_size != expected_size:
+        raise TransferError(f"字节数不一致: 本地 {expected_size}, 远程 {remote_size}")
+    if remote_md5 is not None and remote_md5 != expected_md5:
+        raise TransferError(f"MD5不一致: 本地 {expected_md5}, 远程 {remote_md5}")
+
+
+def _client(pool):
+    """创建异步客户端（在函数内导入，避免与async_remote循环导入）"""
+    try:
+        from gui_utils.async_remote import AsyncRemoteClient, run_sync
+    except ImportError:
+        from async_remote import AsyncRemoteClient, run_sync
+    return AsyncRemoteClient(pool or get_pool()), run_sync
+
+
+def upload_stream(reader, total, remote_path, pool=None, buffer_size=None,
+                  progress_callback=None, verify=None):
+    """从可读的二进制对象reader流式上传total字节到remote_path（原始字节，不压缩）
+
+    progress_callback(已发送字节数, 总字节数) 在每个缓冲块发送后调用。
+    返回 {"bytes", "wire_bytes", "md5", "codec", "seconds"}，失败时抛出TransferError。
+    """
+    client, run_sync = _client(pool)
+    return run_sync(client.upload_stream(reader, total, remote_path, buffer_size=buffer_size,
+                                         progress_callback=progress_callback, verify=verify))
+
+
+def upload_bytes(data, remote_path, pool=None, buffer_size=None,
+                 progress_callback=None, verify=None, compress=None):
+    """在一个通道上上传内存中的字节，WAV数据在启用压缩且远程支持时压缩传输"""
+    client, run_sync = _client(pool)
+    return run_sync(client.upload_bytes(data, remote_path, buffer_size=buffer_size,
+                                        progress_callback=progress_callback, verify=verify,
+                                        compress=compress))
+
+
+def upload_file(local_path, remote_path, pool=None, buffer_size=None,
+                progress_callback=None, verify=None, compress=None):
+    """在一个通道上流式上传本地文件，WAV文件在启用压缩且远程支持时压缩传输"""
+    client, run_sync = _client(pool)
+    return run_sync(client.upload(local_path, remote_path, buffer_size=buffer_size,
+                                  progress_callback=progress_callback, verify=verify,
+                                  compress=compress))
+
+
+def download_file(remote_path, local_path, pool=None, buffer_size=None,
+                  progress_callback=None, verify=None, compress=None):
+    """在一个通道上流式下载远程文件到local_path
+
+    远程先输出字节数和MD5两行头信息，随后是文件内容（.wav文件启用压缩且远程支持时为KPC1压缩数据）。
+    返回 {"bytes", "wire_bytes", "md5", "codec", "seconds"}，失败时抛出TransferError
+    （不会留下不完整的本地文件）。
+    """
+    client, run_sync = _client(pool)
+    return run_sync(client.download(remote_path, local_path, buffer_size=buffer_size,
+                                    progress_callback=progress_callback, verify=verify,
+                                    compress=compress))
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自适应传输方法选择器
+按主机对已注册的上传/下载方法做一次小文件探测测速，把吞吐量排名持久化到本地缓存文件，
+之后的传输直接使用最快的可用方法；方法失败时自动降级并在下一次传输前重新探测
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    from gui_utils.ssh_pool import quote_remote_path
+    from gui_utils.transfer import checksum_command, parse_checksum_output
+except ImportError:
+    from ssh_pool import quote_remote_path
+    from transfer import checksum_command, parse_checksum_output
+
+try:
+    from gui_utils.config import TRANSFER_CONFIG
+except ImportError:
+    TRANSFER_CONFIG = {
+        "rank_cache": "~/.kos_audio/transfer_rank.json",
+        "probe_size": 16384,
+        "probe_ttl": 86400
+    }
+
+UPLOAD = "upload"
+DOWNLOAD = "download"
+
+# 实际传输的吞吐量以指数滑动平均并入探测结果
+EWMA_ALPHA = 0.3
+
+
+def format_rate(bps):
+    """把字节/秒格式化为易读字符串"""
+    if bps is None:
+        return "-"
+    if bps >= 1024 * 1024:
+        return f"{bps / 1024 / 1024:.2f} MB/s"
+    return f"{bps / 1024:.1f} KB/s"
+
+
+class TransferSelector:
+    """单个主机的传输方法注册表和排名
+
+    上传方法签名为 func(local_path, remote_path) -> bool，下载方法为
+    func(remote_path, local_path) -> bool，与audio_control中的transfer_*函数一致。
+    run_remote(cmd) 执行远程shell命令并返回stdout文本，用于探测时的校验和清理。
+    """
+
+    def __init__(self, host_key, run_remote, cache_path=None, probe_size=None, probe_ttl=None):
+        self.host_key = host_key
+        self.run_remote = run_remote
+        self.cache_path = os.path.expanduser(
+            cache_path or TRANSFER_CONFIG.get("rank_cache", "~/.kos_audio/transfer_rank.json"))
+        self.probe_size = probe_size or TRANSFER_CONFIG.get("probe_size", 16384)
+        self.probe_ttl = probe_ttl if probe_ttl is not None else TRANSFER_CONFIG.get("probe_ttl", 86400)
+
+        self._lock = threading.RLock()
+        self._methods = {UPLOAD: {}, DOWNLOAD: {}}
+        self._order = {UPLOAD: [], DOWNLOAD: []}
+        self._stale = {UPLOAD: False, DOWNLOAD: False}
+        self._ranking = self._load_cache()
+
+    # -------------------------------------------------------------------------
+    # 注册与缓存
+    # -------------------------------------------------------------------------
+
+    def register(self, direction, name, func):
+        """注册传输方法，注册顺序即没有测速数据时的默认顺序"""
+        with self._lock:
+            self._methods[direction][name] = func
+            if name not in self._order[direction]:
+                self._order[direction].append(name)
+
+    def _load_cache(self):
+        """读取本主机的排名缓存"""
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            entry = data.get(self.host_key, {})
+            return {UPLOAD: entry.get(UPLOAD, {}), DOWNLOAD: entry.get(DOWNLOAD, {})}
+        except (OSError, ValueError):
+            return {UPLOAD: {}, DOWNLOAD: {}}
+
+    def _save_cache(self):
+        """把本主机的排名写回缓存文件（保留其他主机的记录）"""
+        try:
+            try:
+                with open(self.cache_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            data[self.host_key] = self._ranking
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"⚠ 无法写入传输排名缓存: {e}")
+
+    # -------------------------------------------------------------------------
+    # 排名
+    # -------------------------------------------------------------------------
+
+    def throughput(self, direction):
+        """返回各方法当前的吞吐量记录 {方法名: 字节/秒或None}"""
+        with self._lock:
+            records = self._ranking[direction]
+            return {name: records.get(name, {}).get("bps") for name in self._order[direction]}
+
+    def ranked_methods(self, direction):
+        """按吞吐量从高到低排列的方法名；失败的方法排在最后，未测速的保持注册顺序"""
+        with self._lock:
+            records = self._ranking[direction]
+
+            def sort_key(name):
+                record = records.get(name, {})
+                ok = record.get("ok", True)
+                bps = record.get("bps") or 0
+                return (not ok, -bps, self._order[direction].index(name))
+
+            return sorted(self._order[direction], key=sort_key)
+
+    def _needs_probe(self, direction):
+        """是否需要（重新）探测"""
+        with self._lock:
+            if self._stale[direction]:
+                return True
+            if not self._order[direction]:
+                return False
+            records = self._ranking[direction]
+            if any(name not in records for name in self._order[direction]):
+                return True
+            probed_at = min(records[name].get("probed_at", 0) for name in self._order[direction])
+            return bool(self.probe_ttl) and time.time() - probed_at > self.probe_ttl
+
+    def log_ranking(self, direction):
+        """打印当前排名及吞吐量"""
+        rates = self.throughput(direction)
+        records = self._ranking[direction]
+        parts = []
+        for name in self.ranked_methods(direction):
+            state = "" if records.get(name, {}).get("ok", True) else "(失败)"
+            parts.append(f"{name} {format_rate(rates.get(name))}{state}")
+        print(f"[传输] {self.host_key} {direction} 排名: " + ", ".join(parts))
+
+    def _record(self, direction, name, ok, bps=None, probed=False):
+        """更新方法的测速/失败记录"""
+        with self._lock:
+            record = self._ranking[direction].setdefault(name, {})
+            record["ok"] = ok
+            if ok and bps:
+                old = record.get("bps")
+                record["bps"] = bps if (probed or not old) else (1 - EWMA_ALPHA) * old + EWMA_ALPHA * bps
+            if probed:
+                record["probed_at"] = time.time()
+            if not ok:
+                record["failures"] = record.get("failures", 0) + 1
+
+    # -------------------------------------------------------------------------
+    # 探测
+    # -------------------------------------------------------------------------
+
+    def _remote_checksum(self, remote_path):
+        """读取远程文件的字节数和MD5"""
+        output = self.run_remote(checksum_command(quote_remote_path(remote_path)))
+        return parse_checksum_output(output.strip().splitlines())
+
+    def probe(self, direction):
+        """用小文件测速所有方法并持久化排名"""
+        payload = os.urandom(self.probe_size)
+        digest = hashlib.md5(payload).hexdigest()
+        remote_probe = f"/tmp/.kos_probe_{os.getpid()}.bin"
+        fd, local_probe = tempfile.mkstemp(suffix=".bin")
+        os.close(fd)
+        print(f"[传输] 探测 {self.host_key} 的{direction}方法 ({self.probe_size} 字节)...")
+        try:
+            with open(local_probe, "wb") as f:
+                f.write(payload)
+            if direction == DOWNLOAD and not self._seed_remote_probe(local_probe, remote_probe):
+                print("✗ 无法在远程准备探测文件，保留原有排名")
+                return
+            for name in list(self._order[direction]):
+                func = self._methods[direction][name]
+                ok, elapsed = self._probe_one(direction, func, local_probe, remote_probe, digest)
+                self._record(direction, name, ok,
+                             bps=self.probe_size / elapsed if ok and elapsed > 0 else None,
+                             probed=True)
+            with self._lock:
+                self._stale[direction] = False
+                self._save_cache()
+            self.log_ranking(direction)
+        finally:
+            os.remove(local_probe)
+            try:
+                self.run_remote(f"rm -f {remote_probe}")
+            except Exception:
+                pass
+
+    def _seed_remote_probe(self, local_probe, remote_probe):
+        """用当前最优的上传方法把探测文件放到远程"""
+        for name in self.ranked_methods(UPLOAD):
+            try:
+                if self._methods[UPLOAD][name](local_probe, remote_probe):
+                    return True
+            except Exception:
+                continue
+        return False
+
+    def _probe_one(self, direction, func, local_probe, remote_probe, digest):
+        """测速单个方法，返回 (是否成功且内容正确, 耗时秒数)"""
+        try:
+            if direction == UPLOAD:
+                start = time.monotonic()
+                ok = func(local_probe, remote_probe)
+                elapsed = time.monotonic() - start
+                if ok:
+                    size, remote_md5 = self._remote_checksum(remote_probe)
+                    ok = size == self.probe_size and remote_md5 in (None, digest)
+                return ok, elapsed
+
+            fd, local_copy = tempfile.mkstemp(suffix=".bin")
+            os.close(fd)
+            try:
+                start = time.monotonic()
+                ok = func(remote_probe, local_copy)
+                elapsed = time.monotonic() - start
+                if ok:
+                    with open(local_copy, "rb") as f:
+                        ok = hashlib.md5(f.read()).hexdigest() == digest
+                return ok, elapsed
+            finally:
+                os.remove(local_copy)
+        except Exception as e:
+            print(f"探测异常: {e}")
+            return False, 0.0
+
+    # -------------------------------------------------------------------------
+    # 传输
+    # -------------------------------------------------------------------------
+
+    def transfer(self, direction, src, dst):
+        """按排名依次尝试各方法完成一次传输，成功返回使用的方法名"""
+        if self._needs_probe(direction):
+            self.probe(direction)
+
+        size_path = src if direction == UPLOAD else None
+        for name in self.ranked_methods(direction):
+            func = self._methods[direction][name]
+            print(f"[传输] 使用方法 {name}")
+            start = time.monotonic()
+            try:
+                ok = func(src, dst)
+            except Exception as e:
+                print(f"方法 {name} 异常: {e}")
+                ok = False
+            elapsed = time.monotonic() - start
+
+            if ok:
+                size = os.path.getsize(size_path or dst)
+                bps = size / elapsed if elapsed > 0 else None
+                self._record(direction, name, True, bps=bps)
+                print(f"[传输] {name} 完成 {size} 字节, {format_rate(bps)}")
+                with self._lock:
+                    self._save_cache()
+                return name
+
+            # 降级：标记失败并在下一次传输前重新探测
+            print(f"[传输] 方法 {name} 失败，降级并安排重新探测")
+            self._record(direction, name, False)
+            with self._lock:
+                self._stale[direction] = True
+                self._save_cache()
+
+        raise Exception("All transfer methods failed")
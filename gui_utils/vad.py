@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+语音端点检测
+用仓库自带的 model/VAD/silero_vad.onnx 对实时录音帧做语音检测：检测到说话后出现足够长的静音就结束录音，
+并设有最长录音时长和“一直没人说话”的超时。大部分指令不到2秒，不必再等满固定的5秒。
+
+推理后端：
+- sherpa_onnx（语音识别已经依赖它）：VoiceActivityDetector逐窗判断是否在说话
+- onnxruntime：直接运行silero模型得到每个窗口的语音概率，自动识别v4（输入h/c）和v5（输入state）两种模型
+"""
+
+import copy
+import math
+import os
+import threading
+
+import numpy as np
+
+try:
+    from gui_utils.live_capture import LiveCapture, write_wav
+    from gui_utils.audio_dsp import stream_writer
+except ImportError:
+    from live_capture import LiveCapture, write_wav
+    from audio_dsp import stream_writer
+
+try:
+    from gui_utils.record_control import STOPPED
+except ImportError:
+    from record_control import STOPPED
+
+try:
+    from gui_utils.config import VAD_CONFIG
+except ImportError:
+    VAD_CONFIG = {
+        "enabled": True,
+        "backend": "auto",
+        "threshold": 0.5,
+        "min_speech_ms": 250,
+        "min_silence_ms": 700,
+        "max_duration": 10,
+        "start_timeout": 5,
+        "keep_silence_ms": 200
+    }
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_VAD_MODEL = os.path.join(SCRIPT_DIR, '../model', 'VAD', 'silero_vad.onnx')
+
+# silero支持的采样率及对应的窗口长度（采样数）
+WINDOW_SIZES = {16000: 512, 8000: 256}
+
+# v5模型每个窗口前需要拼接上一个窗口末尾的这些采样
+CONTEXT_SIZES = {16000: 64, 8000: 32}
+
+# 进入说话状态后，概率低于 threshold - HYSTERESIS 才算静音（与silero官方实现一致）
+HYSTERESIS = 0.15
+
+# 端点状态
+WAITING = "waiting"
+SPEECH = "speech"
+ENDED = "ended"
+
+
+class SileroOnnx:
+    """用onnxruntime直接运行silero VAD模型，返回每个窗口的语音概率"""
+
+    def __init__(self, model_path, sample_rate=16000, num_threads=1):
+        import onnxruntime as ort
+        if sample_rate not in WINDOW_SIZES:
+            raise ValueError(f"silero VAD只支持8000/16000Hz，当前 {sample_rate}")
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        self._session = ort.InferenceSession(model_path, sess_options=options,
+                                             providers=["CPUExecutionProvider"])
+        inputs = {i.name for i in self._session.get_inputs()}
+        self.version = 5 if "state" in inputs else 4
+        self._outputs = [o.name for o in self._session.get_outputs()]
+        self.sample_rate = sample_rate
+        self.window_size = WINDOW_SIZES[sample_rate]
+        self._sr = np.array(sample_rate, dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        """清空循环状态（每段录音开始前调用）"""
+        if self.version == 5:
+            self._state = np.zeros((2, 1, 128), dtype=np.float32)
+            self._context = np.zeros(CONTEXT_SIZES[self.sample_rate], dtype=np.float32)
+        else:
+            self._h = np.zeros((2, 1, 64), dtype=np.float32)
+            self._c = np.zeros((2, 1, 64), dtype=np.float32)
+
+    def __call__(self, window):
+        """window为window_size个float32采样（-1~1），返回语音概率"""
+        if self.version == 5:
+            x = np.concatenate([self._context, window])[np.newaxis, :]
+            out, self._state = self._session.run(
+                self._outputs, {"input": x, "state": self._state, "sr": self._sr})
+            self._context = window[-len(self._context):]
+        else:
+            out, self._h, self._c = self._session.run(
+                self._outputs, {"input": window[np.newaxis, :], "sr": self._sr,
+                                "h": self._h, "c": self._c})
+        return float(np.ravel(out)[0])
+
+    def clone(self):
+        """共享已加载的模型、带独立循环状态的检测器（供多路录音同时使用）"""
+        other = copy.copy(self)
+        other.reset()
+        return other
+
+
+class SileroSherpa:
+    """用sherpa_onnx的VoiceActivityDetector逐窗判断是否在说话（返回1.0/0.0）"""
+
+    def __init__(self, model_path, sample_rate=16000, num_threads=1, threshold=0.5):
+        import sherpa_onnx
+        if sample_rate not in WINDOW_SIZES:
+            raise ValueError(f"silero VAD只支持8000/16000Hz，当前 {sample_rate}")
+        config = sherpa_onnx.VadModelConfig()
+        config.silero_vad.model = model_path
+        config.silero_vad.threshold = threshold
+        # 静音/语音的最短时长由Endpointer控制，这里只做最小的平滑
+        config.silero_vad.min_silence_duration = 0.1
+        config.silero_vad.min_speech_duration = 0.05
+        config.silero_vad.window_size = WINDOW_SIZES[sample_rate]
+        config.sample_rate = sample_rate
+        config.num_threads = num_threads
+        self._config = config
+        self._vad = sherpa_onnx.VoiceActivityDetector(config, buffer_size_in_seconds=30)
+        self.version = None
+        self.sample_rate = sample_rate
+        self.window_size = WINDOW_SIZES[sample_rate]
+
+    def reset(self):
+        self._vad.reset()
+
+    def __call__(self, window):
+        self._vad.accept_waveform(window)
+        speech = self._vad.is_speech_detected()
+        # 端点由Endpointer判断，VAD内部切出的语音段直接丢弃，避免缓冲区增长
+        while not self._vad.empty():
+            self._vad.pop()
+        return 1.0 if speech else 0.0
+
+    def clone(self):
+        """带独立状态的检测器（sherpa_onnx的VAD不能共享状态，需重新创建）"""
+        import sherpa_onnx
+        other = copy.copy(self)
+        other._vad = sherpa_onnx.VoiceActivityDetector(self._config, buffer_size_in_seconds=30)
+        return other
+
+
+def create_detector(backend=None, model_path=None, sample_rate=16000, threshold=None):
+    """按配置创建silero检测器，backend为auto时优先sherpa_onnx，其次onnxruntime"""
+    backend = backend or VAD_CONFIG["backend"]
+    model_path = model_path or DEFAULT_VAD_MODEL
+    threshold = VAD_CONFIG["threshold"] if threshold is None else threshold
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"VAD模型文件不存在: {model_path}")
+    if backend in ("auto", "sherpa_onnx"):
+        try:
+            return SileroSherpa(model_path, sample_rate, threshold=threshold)
+        except ImportError:
+            if backend == "sherpa_onnx":
+                raise ImportError("需要安装sherpa_onnx库: pip install sherpa-onnx")
+    if backend in ("auto", "onnxruntime"):
+        try:
+            return SileroOnnx(model_path, sample_rate)
+        except ImportError:
+            raise ImportError("VAD需要sherpa_onnx或onnxruntime: pip install onnxruntime")
+    raise ValueError(f"不支持的VAD后端: {backend}")
+
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+
+def get_detector(backend=None, model_path=None, sample_rate=16000):
+    """获取共享的检测器（模型只加载一次，使用前由Endpointer重置状态）"""
+    key = (backend or VAD_CONFIG["backend"], model_path, sample_rate)
+    with _detectors_lock:
+        detector = _detectors.get(key)
+        if detector is None:
+            detector = create_detector(backend, model_path, sample_rate)
+            _detectors[key] = detector
+        return detector
+
+
+def vad_available():
+    """VAD模型和推理库是否可用"""
+    if not VAD_CONFIG.get("enabled", True):
+        return False
+    try:
+        get_detector()
+        return True
+    except Exception:
+        return False
+
+
+class Endpointer:
+    """把录音帧按检测器的窗口长度送入VAD，判断一句话何时结束
+
+    accept(frame) 返回是否已到端点；结束原因 reason 为：
+    "silence"（说完后静音足够长）、"max_duration"（达到最长时长）、"no_speech"（超时仍未说话）。
+    时间都以采样数记录，speech_start/speech_end 是语音段在录音中的起止位置。
+    """
+
+    def __init__(self, detector, threshold=None, min_speech_ms=None, min_silence_ms=None,
+                 max_duration=None, start_timeout=None):
+        self.detector = detector
+        rate = detector.sample_rate
+        self.sample_rate = rate
+        self.threshold = VAD_CONFIG["threshold"] if threshold is None else threshold
+        self.min_speech = rate * (min_speech_ms or VAD_CONFIG["min_speech_ms"]) // 1000
+        self.min_silence = rate * (min_silence_ms or VAD_CONFIG["min_silence_ms"]) // 1000
+        self.max_samples = int(rate * (max_duration or VAD_CONFIG["max_duration"]))
+        start_timeout = VAD_CONFIG["start_timeout"] if start_timeout is None else start_timeout
+        self.start_samples = int(rate * start_timeout) if start_timeout else None
+
+        self._window = np.zeros(detector.window_size, dtype=np.float32)
+        self._fill = 0
+        self.reset()
+
+    def reset(self):
+        self.detector.reset()
+        self._fill = 0
+        self.state = WAITING
+        self.reason = None
+        self.samples = 0
+        self.speech_start = None
+        self.speech_end = None
+        self._speech_run = 0
+        self._silence_run = 0
+        self.windows = 0
+        self.max_prob = 0.0
+
+    @property
+    def ended(self):
+        return self.state == ENDED
+
+    def accept(self, frame):
+        """送入一帧int16（或-1~1的float）采样，返回是否已到端点"""
+        if self.state == ENDED:
+            return True
+        samples = np.asarray(frame)
+        if samples.dtype.kind in "iu":
+            samples = samples.astype(np.float32) / 32768.0
+        else:
+            samples = samples.astype(np.float32, copy=False)
+        if samples.ndim > 1:
+            samples = samples.mean(axis=1)
+
+        size = len(self._window)
+        pos = 0
+        while pos < len(samples) and self.state != ENDED:
+            take = min(size - self._fill, len(samples) - pos)
+            self._window[self._fill:self._fill + take] = samples[pos:pos + take]
+            self._fill += take
+            pos += take
+            if self._fill == size:
+                self._fill = 0
+                self._update(self.detector(self._window))
+        return self.state == ENDED
+
+    def _update(self, prob):
+        """根据一个窗口的语音概率推进状态"""
+        size = len(self._window)
+        self.samples += size
+        self.windows += 1
+        self.max_prob = max(self.max_prob, prob)
+        threshold = self.threshold - HYSTERESIS if self.state == SPEECH else self.threshold
+
+        if prob >= threshold:
+            self._silence_run = 0
+            self._speech_run += size
+            if self.state == WAITING and self._speech_run >= self.min_speech:
+                self.state = SPEECH
+                self.speech_start = self.samples - self._speech_run
+            if self.state == SPEECH:
+                self.speech_end = self.samples
+        else:
+            self._speech_run = 0
+            if self.state == SPEECH:
+                self._silence_run += size
+                if self._silence_run >= self.min_silence:
+                    self.finish("silence")
+                    return
+
+        if self.state == WAITING and self.start_samples and self.samples >= self.start_samples:
+            self.finish("no_speech")
+        elif self.samples >= self.max_samples:
+            self.finish("max_duration")
+
+    def finish(self, reason):
+        """以reason结束（录音流提前结束时由调用方调用）"""
+        self.state = ENDED
+        self.reason = reason
+
+    def result(self):
+        """端点检测结果（时间单位：秒）"""
+        rate = self.sample_rate
+        return {
+            "reason": self.reason,
+            "speech": self.speech_start is not None,
+            "duration": self.samples / rate,
+            "speech_start": None if self.speech_start is None else self.speech_start / rate,
+            "speech_end": None if self.speech_end is None else self.speech_end / rate,
+            "max_prob": round(self.max_prob, 3)
+        }
+
+
+def record_until_silence(local_path, pool=None, max_duration=None, on_frame=None,
+                         keep_silence_ms=None, detector=None, control=None, processed_path=None,
+                         **endpoint_options):
+    """流式录音直到说完（或达到最长时长/一直没人说话），写入local_path并返回检测结果
+
+    写入的音频截掉语音结束后多余的静音，只保留keep_silence_ms毫秒。多路录音同时进行时
+    每路传入各自的detector（见clone()），缺省使用共享的检测器。control.stop()会立即结束
+    录音（reason为"stopped"），已录到的音频全部保留。给出processed_path时边录边处理
+    （audio_dsp.StreamProcessor），处理后的录音与local_path等长。
+    """
+    max_duration = max_duration or VAD_CONFIG["max_duration"]
+    keep_silence_ms = VAD_CONFIG["keep_silence_ms"] if keep_silence_ms is None else keep_silence_ms
+    capture = LiveCapture(pool, duration=math.ceil(max_duration) + 1)
+    endpointer = Endpointer(detector or get_detector(sample_rate=capture.rate),
+                            max_duration=max_duration, **endpoint_options)
+    writer = stream_writer(processed_path, capture.rate, capture.channels)
+    frames = []
+    with capture:
+        if control is not None:
+            control.register(capture.stop)
+        try:
+            for frame in capture:
+                frames.append(frame)
+                if on_frame is not None:
+                    on_frame(frame)
+                if writer is not None:
+                    writer.write(frame)
+                if endpointer.accept(frame):
+                    break
+        finally:
+            if control is not None:
+                control.unregister(capture.stop)
+    if not endpointer.ended:
+        # 被手动停止，或远程arecord提前结束
+        endpointer.finish(STOPPED if control is not None and control.stopped else "stream_end")
+
+    audio = np.concatenate(frames) if frames else np.zeros(0, dtype=np.int16)
+    if endpointer.reason == "silence":
+        keep = endpointer.speech_end + capture.rate * keep_silence_ms // 1000
+        audio = audio[:keep]
+    write_wav(local_path, [audio], capture.rate, capture.channels)
+    if writer is not None:
+        writer.close(len(audio))
+
+    result = endpointer.result()
+    result["saved"] = len(audio) / capture.rate
+    result["capture"] = capture.stats()
+    if writer is not None:
+        result["processing"] = writer.metrics
+    reasons = {"silence": "检测到说话结束", "max_duration": "达到最长时长",
+               "no_speech": "未检测到语音", "stream_end": "录音流结束", STOPPED: "手动停止"}
+    print(f"✓ 录音结束（{reasons.get(result['reason'], result['reason'])}）: "
+          f"录制 {result['duration']:.2f}秒, 保存 {result['saved']:.2f}秒")
+    return result